@@ -0,0 +1,285 @@
+"""
+Corpus (many binaries) scanning used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import glob
+import scriptine
+from bdutil import Colors
+from elf import ElfFile, ElfError, ELF_MAGIC
+from cache import cache_key
+from decoder import get_decoder
+from opcodestream import OpcodeStream
+from classify import GadgetClassifier, SemanticCatalog
+from dedup import GadgetCounter, DEFAULT_DEDUP_MEMORY
+import instrument
+from instrument import timer
+
+
+def is_elf(filename):
+    """Check for the ELF magic without mapping the file"""
+    try:
+        binfile = open(filename, "rb")
+        magic = binfile.read(4)
+        binfile.close()
+    except IOError:
+        return False
+    return magic == ELF_MAGIC
+
+
+def expand_targets(targets):
+    """
+    Turn a list of directories, glob patterns, @file-lists and files into
+    a list of ELF files (each one only once, in order of appearance)
+    """
+    candidates = []
+    for target in targets:
+        if target.startswith("@"):
+            listfile = open(target[1:])
+            candidates += [l.strip() for l in listfile.readlines()
+                           if l.strip() != ""]
+            listfile.close()
+        elif os.path.isdir(target):
+            for (dirpath, _dirnames, filenames) in os.walk(target):
+                for name in sorted(filenames):
+                    candidates += [os.path.join(dirpath, name)]
+        elif glob.has_magic(target):
+            candidates += sorted(glob.glob(target))
+        else:
+            candidates += [target]
+
+    seen = set()
+    files = []
+    for cand in candidates:
+        if cand in seen:
+            continue
+        seen.add(cand)
+        if os.path.isfile(cand) and not os.path.islink(cand) and is_elf(cand):
+            files += [cand]
+        elif not os.path.isdir(cand):
+            scriptine.log.info("Skipping %s: no ELF file", cand)
+    return files
+
+
+class FileResult:
+    """
+    Scan results of one binary within a corpus, mode is the decoder mode
+    (32 or 64) of its code. uniq_seqs collects the fingerprints of its
+    sequences until all sections are done, then only their number is
+    kept in unique.
+    """
+    def __init__(self, filename, sections, mode=32):
+        self.filename = filename
+        self.sections = sections
+        self.mode = mode
+        self.sequences = 0
+        self.c3_locations = 0
+        self.uniq_seqs = set()
+        self.unique = 0
+        self.pending = len(sections)
+
+    @property
+    def size(self):
+        """Number of executable bytes"""
+        return sum([sec.size for sec in self.sections])
+
+    def add(self, locations):
+        """
+        Account for the (offset, length) tuples of one section. Only the
+        counts are kept, the locations themselves go to the output sink.
+        """
+        self.sequences += len(locations)
+        self.c3_locations += len(set([off for (off, _length) in locations]))
+
+
+class CorpusScan:
+    """
+    Scans many binaries on one shared ParallelScanner. Files are scheduled
+    by executable size, largest first, so long-running libraries do not
+    end up as stragglers at the end of the run.
+
+    With a GadgetCache, sections scanned before are loaded from the cache
+    instead of being scanned again. terminators is the TerminatorTable the
+    scanner was set up with, None for RET scans.
+
+    Every file is decoded in the mode its ELF header asks for, unless mode
+    (32 or 64) overrides it.
+
+    If the scanner classifies sequences, so does the corpus scan for the
+    sections it loads from the cache, see catalog().
+
+    Completed files are handed to a GadgetCounter (see dedup.py) keeping
+    at most dedup_memory MB of fingerprints in memory, which gives the
+    corpus-wide unique sequences and the number of files each occurs in.
+    """
+    def __init__(self, scanner, numbytes, decoder, cache=None,
+                 terminators=None, mode=None,
+                 dedup_memory=DEFAULT_DEDUP_MEMORY):
+        self.scanner = scanner
+        self.numbytes = numbytes
+        self.decoder = decoder
+        self.cache = cache
+        self.mode = mode
+        self.opcode = "c3"
+        if terminators is not None:
+            self.opcode = terminators.name
+        if scanner.catalog is not None:
+            self.opcode += "+classify"
+        self.results = []
+        self.gadgets = GadgetCounter(dedup_memory)
+        self.__keys = {}
+        # classifiers of cached sections per decoder mode
+        self.__classifiers = {}
+
+    def plan(self, files):
+        """
+        Read the section tables of all files and build the schedule
+        """
+        planned = []
+        for filename in files:
+            try:
+                elf = ElfFile(filename)
+                sections = elf.executable_sections()
+                mode = self.mode or elf.mode
+                elf.close()
+            except ElfError, err:
+                scriptine.log.warn("%s%s%s", Colors.Yellow, err, Colors.Reset)
+                continue
+            if len(sections) == 0:
+                scriptine.log.info("Skipping %s: no executable sections",
+                                   filename)
+                continue
+            planned += [FileResult(filename, sections, mode)]
+
+        planned.sort(key=lambda res: res.size, reverse=True)
+        self.results = planned
+        return planned
+
+    def __lookup(self, res, sidx):
+        """Cached locations of a section, None if it needs scanning"""
+        if self.cache is None:
+            return None
+        profile = instrument.current()
+        if profile is not None:
+            started = timer()
+        elf = ElfFile(res.filename)
+        data = elf.section_data(res.sections[sidx])
+        key = cache_key(data, self.numbytes, self.opcode,
+                        get_decoder(self.decoder.name, res.mode))
+        locations = self.cache.get(key)
+        if locations is not None:
+            ostream = OpcodeStream(data)
+            res.uniq_seqs |= ostream.unique_sequences(locations)
+            if self.scanner.catalog is not None:
+                self.__catalog_cached(ostream, locations, res.mode)
+        elf.close()
+        self.__keys[(res.filename, sidx)] = key
+        if profile is not None:
+            profile.add("cache", timer() - started)
+        return locations
+
+    def __catalog_cached(self, ostream, locations, mode):
+        """Catalog the (already filtered) sequences of a cached section"""
+        classifier = self.__classifiers.get(mode)
+        if classifier is None:
+            classifier = GadgetClassifier(mode)
+            self.__classifiers[mode] = classifier
+        for (offs, length) in locations:
+            classifier.select(classifier.classify(ostream.window(offs,
+                                                                 length)))
+
+    def catalog(self):
+        """
+        SemanticCatalog of all sequences found so far, None if the
+        scanner does not classify
+        """
+        if self.scanner.catalog is None:
+            return None
+        catalog = SemanticCatalog()
+        catalog.merge(self.scanner.catalog)
+        for classifier in self.__classifiers.values():
+            catalog.merge(classifier.catalog)
+        return catalog
+
+    def run(self):
+        """
+        Scan all planned files.
+
+        Yields: (FileResult, Section, locations) as sections complete;
+        cached sections first, then the others in schedule order. The
+        FileResult is complete once its last section has been yielded.
+        """
+        items = []
+        for (fidx, res) in enumerate(self.results):
+            for (sidx, sec) in enumerate(res.sections):
+                locations = self.__lookup(res, sidx)
+                if locations is None:
+                    items += [((fidx, sidx), sec.size, None,
+                               (res.filename, sec.offset), res.mode, None)]
+                else:
+                    res.add(locations)
+                    self.__section_done(res)
+                    yield (res, sec, locations)
+
+        for ((fidx, sidx), locations, uniq_seqs) in \
+                self.scanner.scan_many(items, self.numbytes):
+            res = self.results[fidx]
+            sec = res.sections[sidx]
+            res.add(locations)
+            res.uniq_seqs |= uniq_seqs
+            if self.cache is not None:
+                self.cache.put(self.__keys[(res.filename, sidx)], locations)
+            self.__section_done(res)
+            yield (res, sec, locations)
+
+    def __section_done(self, res):
+        """Hand a file's fingerprints on once its last section is done"""
+        res.pending -= 1
+        if res.pending == 0:
+            res.unique = len(res.uniq_seqs)
+            self.gadgets.add_binary(res.uniq_seqs)
+            res.uniq_seqs = None
+
+    def totals(self, stream=None):
+        """
+        Corpus-wide (sequences, unique sequences, unique locations,
+        histogram of unique sequences by number of files, see
+        GadgetCounter.summarize()), writing the number of files of each
+        unique sequence to stream if given
+        """
+        sequences = 0
+        c3_locs = 0
+        for res in self.results:
+            sequences += res.sequences
+            c3_locs += res.c3_locations
+        (unique, histogram) = self.gadgets.summarize(stream)
+        return (sequences, unique, c3_locs, histogram)
+
+    def close(self):
+        """Remove the temporary files of the deduplication"""
+        self.gadgets.close()
@@ -0,0 +1,262 @@
+"""
+Benchmarks of the scan pipeline used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import re
+import time
+import random
+import binascii
+import resource
+import platform
+from cmd import ReadelfCmd, ObjdumpCmd
+from decoder import get_decoder
+from decodecache import DecodeCache
+from opcodestream import OpcodeStream
+from output import open_sink, FORMATS
+
+# the stages of a benchmark run, in pipeline order
+STAGES = ["readelf", "objdump", "candidates", "decode", "unique", "output"]
+
+# common IA-32 instructions the synthetic code is made of, "?" stands for
+# a random nibble
+INSTRUCTIONS = ["55", "89e5", "5d", "c9", "83ec??", "83c4??", "8b45??",
+                "8945??", "8b55??", "8b4d??", "e8????????", "ff15????????",
+                "31c0", "31d2", "85c0", "39c2", "74??", "75??", "eb??",
+                "01d8", "29c8", "50", "51", "52", "53", "56", "57", "58",
+                "59", "5a", "5b", "5e", "5f", "8d7600", "8d7426??", "90",
+                "0fb6c0", "b8????????", "c744240?????????", "8b0485????????",
+                "40", "48", "f7d8", "d1e0", "c1e8??"]
+RET = "\xc3"
+# synthetic code is built from a pool of pages of this size...
+PAGE_SIZE = 4096
+# ...of at most this many distinct pages (4 MB)
+MAX_POOL_PAGES = 1024
+# the objdump stage parses a listing of at most this many section bytes
+OBJDUMP_LIMIT = 16 * 1024 * 1024
+
+SIZE_UNITS = {"K" : 1024, "M" : 1024 * 1024, "G" : 1024 * 1024 * 1024}
+
+
+def parse_size(text):
+    """Byte count for a size like 4096, 1K, 16M"""
+    text = text.strip().upper()
+    if text and text[-1] in SIZE_UNITS:
+        return int(text[:-1]) * SIZE_UNITS[text[-1]]
+    return int(text)
+
+
+def _instruction(rng, template):
+    """Bytes of an instruction template with its "?" nibbles filled in"""
+    return binascii.unhexlify("".join([c != "?" and c or
+                                       "%x" % rng.randrange(16)
+                                       for c in template]))
+
+
+def _page(rng, density):
+    """
+    PAGE_SIZE bytes of instructions with about density RETs per byte
+    """
+    mean_len = sum([len(t) / 2 for t in INSTRUCTIONS]) / \
+        float(len(INSTRUCTIONS))
+    ret_chance = density * mean_len
+    page = []
+    size = 0
+    while size < PAGE_SIZE:
+        if rng.random() < ret_chance:
+            insn = RET
+        else:
+            insn = _instruction(rng, rng.choice(INSTRUCTIONS))
+        page += [insn]
+        size += len(insn)
+    return "".join(page)[:PAGE_SIZE]
+
+
+def synthetic_text(size, density=0.01, seed=0):
+    """
+    Deterministic synthetic .text contents of size bytes: IA-32 code of
+    common instructions with about density RET (c3) bytes per byte, plus
+    those showing up inside immediates and displacements, as in real
+    code. The same (size, density, seed) always gives the same bytes.
+
+    Big blobs repeat a pool of up to MAX_POOL_PAGES pages in random order,
+    which keeps generating 100 MB cheap.
+    """
+    rng = random.Random(seed)
+    pages = (size + PAGE_SIZE - 1) / PAGE_SIZE
+    pool = [_page(rng, density) for _i in range(min(pages, MAX_POOL_PAGES))]
+    if pages <= len(pool):
+        chosen = pool
+    else:
+        chosen = [rng.choice(pool) for _i in range(pages)]
+    return "".join(chosen)[:size]
+
+
+def readelf_listing(size):
+    """
+    Text of a readelf -S -W listing of sections covering size bytes,
+    one section per 64 KB and every third one executable
+    """
+    count = max(1, size / (64 * 1024))
+    lines = ["There are %d section headers:" % count, "",
+             "Section Headers:",
+             "  [Nr] Name Type Addr Off Size ES Flg Lk Inf Al"]
+    for num in range(count):
+        flags = num % 3 == 0 and "AX" or "WA"
+        lines += ["  [%2d] .sec%d PROGBITS %08x %06x %06x 00 %3s  0   0 16"
+                  % (num, num, 0x8048000 + num * 0x10000, num * 0x10000,
+                     0x10000, flags)]
+    return "\n".join(lines) + "\n"
+
+
+def objdump_listing(data, start=0x8048000):
+    """Text of an objdump -s listing of data loaded at start"""
+    lines = ["", "file format elf32-i386", "",
+             "Contents of section .text:"]
+    for offs in range(0, len(data), 16):
+        chunk = binascii.hexlify(data[offs:offs + 16])
+        words = [chunk[i:i + 8] for i in range(0, len(chunk), 8)]
+        lines += [" %x %-35s  %s" % (start + offs, " ".join(words),
+                                     "." * (len(chunk) / 2))]
+    return "\n".join(lines) + "\n"
+
+
+def peak_rss():
+    """Peak resident set size of this process in KB (on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Benchmark:
+    """
+    Times the stages of the scan pipeline (see STAGES) on a synthetic
+    section of size bytes. Every stage yields a result dict with its
+    duration, throughput in bytes/s and in items/s, where unit tells what
+    the items are (gadgets for the decode, unique and output stages), and
+    the process's peak RSS at its end.
+    """
+    def __init__(self, size, density=0.01, seed=0, numbytes=20):
+        self.size = size
+        self.density = density
+        self.seed = seed
+        self.numbytes = numbytes
+        self.data = synthetic_text(size, density, seed)
+        self.locations = None
+
+    def run(self, stages=None):
+        """Run the given stages (default: all) in pipeline order"""
+        results = []
+        for stage in STAGES:
+            if stages is None or stage in stages:
+                results += getattr(self, "_stage_" + stage)()
+        return results
+
+    def __measure(self, stage, func, size, unit="gadgets"):
+        """Time func(), which returns the number of items it produced"""
+        start = time.time()
+        items = func()
+        elapsed = max(time.time() - start, 1e-9)
+        return {"stage" : stage, "seconds" : elapsed, "bytes" : size,
+                "bytes_per_s" : size / elapsed, "items" : items,
+                "unit" : unit, "items_per_s" : items / elapsed,
+                "peak_rss_kb" : peak_rss()}
+
+    def __parse(self, stage, parser, text, unit):
+        """Time parser.parse_result() on the tool output text"""
+        return self.__measure(stage, lambda: len(parser.parse_result(text)),
+                              len(text), unit)
+
+    def _stage_readelf(self):
+        """ReadelfCmd parsing a section listing"""
+        return [self.__parse("readelf", ReadelfCmd(),
+                             readelf_listing(self.size), "sections")]
+
+    def _stage_objdump(self):
+        """ObjdumpCmd parsing a section dump"""
+        return [self.__parse("objdump", ObjdumpCmd(),
+                             objdump_listing(self.data[:OBJDUMP_LIMIT]),
+                             "bytes")]
+
+    def _stage_candidates(self):
+        """RET candidate discovery as done by find_sequences()"""
+        opcode_re = re.compile(re.escape(RET))
+        def count():
+            found = 0
+            for _match in opcode_re.finditer(self.data):
+                found += 1
+            return found
+        return [self.__measure("candidates", count, self.size,
+                               "candidates")]
+
+    def __find(self):
+        """find_sequences() as a serial scan runs it"""
+        ostream = OpcodeStream(self.data)
+        self.locations = ostream.find_sequences(byte_offs=self.numbytes,
+                                                decoder=get_decoder(),
+                                                progress=False,
+                                                cache=DecodeCache("bench"))
+        return len(self.locations)
+
+    def _stage_decode(self):
+        """Candidate discovery plus decoding of all windows"""
+        return [self.__measure("decode", self.__find, self.size)]
+
+    def _stage_unique(self):
+        """unique_sequences() on the found sequences"""
+        if self.locations is None:
+            self.__find()
+        ostream = OpcodeStream(self.data)
+        return [self.__measure("unique",
+                               lambda: len(ostream.unique_sequences(
+                                   self.locations)),
+                               self.size)]
+
+    def _stage_output(self):
+        """Writing the found sequences in every output format"""
+        if self.locations is None:
+            self.__find()
+        ostream = OpcodeStream(self.data)
+        results = []
+        for fmt in FORMATS:
+            def write():
+                sink = open_sink(fmt, os.devnull)
+                written = 0
+                for _loc in ostream.write_sequences(sink, self.locations,
+                                                    0x8048000, None,
+                                                    ".text"):
+                    written += 1
+                sink.close()
+                return written
+            results += [self.__measure("output-%s" % fmt, write, self.size)]
+        return results
+
+
+def environment():
+    """Description of the machine the benchmarks ran on"""
+    return {"python" : platform.python_version(),
+            "machine" : platform.machine(),
+            "system" : platform.system()}
@@ -0,0 +1,160 @@
+"""
+Persistent gadget cache used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import time
+import zlib
+import array
+import hashlib
+import sqlite3
+from decoder import decoder_tag
+
+DEFAULT_CACHE_FILE = os.path.join("~", ".cache", "ropscan", "gadgets.sqlite")
+# default size bound in MB
+DEFAULT_CACHE_SIZE = 256
+
+
+def cache_key(data, numbytes, opcode, decoder):
+    """
+    Content address of a scan: SHA-256 of the section bytes plus every
+    parameter that influences find_sequences' result
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    return "%s:%d:%s:%s" % (digest, numbytes, opcode, decoder_tag(decoder))
+
+
+def pack_locations(locations):
+    """Serialize (offset, length) tuples into a compressed blob"""
+    flat = array.array("I")
+    for (offset, length) in locations:
+        flat.append(offset)
+        flat.append(length)
+    return zlib.compress(flat.tostring())
+
+
+def unpack_locations(blob):
+    """Inverse of pack_locations()"""
+    flat = array.array("I")
+    flat.fromstring(zlib.decompress(blob))
+    return zip(map(int, flat[0::2]), map(int, flat[1::2]))
+
+
+class GadgetCache:
+    """
+    On-disk (SQLite) cache of find_sequences results with size-bounded
+    LRU eviction
+    """
+    def __init__(self, path=DEFAULT_CACHE_FILE, max_size=DEFAULT_CACHE_SIZE):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_size * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        self.__db = sqlite3.connect(self.path)
+        self.__db.execute("CREATE TABLE IF NOT EXISTS gadgets ("
+                          "  key TEXT PRIMARY KEY,"
+                          "  locations BLOB NOT NULL,"
+                          "  size INTEGER NOT NULL,"
+                          "  last_used REAL NOT NULL,"
+                          "  hits INTEGER NOT NULL DEFAULT 0)")
+        self.__db.execute("CREATE INDEX IF NOT EXISTS gadgets_lru "
+                          "ON gadgets (last_used)")
+        self.__db.commit()
+
+    def get(self, key):
+        """
+        Cached locations for key, None if not cached
+        """
+        row = self.__db.execute("SELECT locations FROM gadgets WHERE key = ?",
+                                (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.__db.execute("UPDATE gadgets SET last_used = ?, hits = hits + 1 "
+                          "WHERE key = ?", (time.time(), key))
+        self.__db.commit()
+        return unpack_locations(str(row[0]))
+
+    def put(self, key, locations):
+        """
+        Store locations for key, evicting old entries if necessary
+        """
+        blob = pack_locations(locations)
+        self.__db.execute("INSERT OR REPLACE INTO gadgets "
+                          "(key, locations, size, last_used) "
+                          "VALUES (?, ?, ?, ?)",
+                          (key, sqlite3.Binary(blob), len(blob), time.time()))
+        self.__db.commit()
+        self.prune()
+
+    def stats(self):
+        """
+        (entries, bytes used, total hits) of the cache
+        """
+        (entries, used, hits) = self.__db.execute(
+            "SELECT COUNT(*), TOTAL(size), TOTAL(hits) FROM gadgets").fetchone()
+        return (entries, int(used), int(hits))
+
+    def prune(self, max_bytes=None):
+        """
+        Evict least recently used entries until the cache holds at most
+        max_bytes (default: the configured bound). Returns the number of
+        evicted entries.
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        (_entries, used, _hits) = self.stats()
+        if used <= max_bytes:
+            return 0
+
+        evict = []
+        for (key, size) in self.__db.execute("SELECT key, size FROM gadgets "
+                                             "ORDER BY last_used ASC"):
+            if used <= max_bytes:
+                break
+            evict += [(key,)]
+            used -= size
+
+        self.__db.executemany("DELETE FROM gadgets WHERE key = ?", evict)
+        self.__db.commit()
+        return len(evict)
+
+    def vacuum(self):
+        """Give the space of evicted entries back to the file system"""
+        self.__db.execute("VACUUM")
+
+    def close(self):
+        """Close the database"""
+        self.__db.close()
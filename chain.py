@@ -0,0 +1,717 @@
+"""
+Gadget chain search used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import re
+import json
+import heapq
+from decoder import get_decoder, DEFAULT_DECODER
+
+"""
+The effect of a gadget is what it does to the registers and to memory
+between being returned to and returning, as a dict:
+
+  address  address of its first byte
+  file     index into the index's file list
+  text     its instructions, e.g. "pop eax; pop ebx; ret"
+  slots    number of stack words it consumes in front of the next
+           gadget's address (pops and stack adjustments)
+  sets     register -> value when it returns, registers not listed keep
+           theirs; a value is an expression [kind, x, addend]:
+             ["const", value, 0]  a constant
+             ["slot", i, addend]  stack word i plus addend
+             ["reg", name, addend] the register's value before plus addend
+           or None if it cannot be told
+  writes   [address, value] expressions of the words it stores
+  syscall  true if it ends in a system call instead of returning
+
+Only gadgets with such a simple effect are indexed: ending in a plain
+ret, without memory reads, pushes, branches or stack pivots, and writing
+memory only at register-relative addresses.
+"""
+
+REGISTERS = {32 : ["eax", "ecx", "edx", "ebx", "esp", "ebp", "esi", "edi"],
+             64 : ["rax", "rcx", "rdx", "rbx", "rsp", "rbp", "rsi", "rdi",
+                   "r8", "r9", "r10", "r11", "r12", "r13", "r14", "r15"]}
+STACK = {32 : "esp", 64 : "rsp"}
+SYSCALLS = frozenset(["syscall", "sysenter"])
+NOPS = frozenset(["nop", "fnop", "cmp", "test", "bt", "lfence", "mfence",
+                  "sfence", "prefetch", "prefetchnta", "prefetcht0",
+                  "prefetcht1", "prefetcht2"])
+# instructions whose only output is their first (register) operand
+CLOBBERS = frozenset(["add", "or", "adc", "sbb", "and", "sub", "xor", "inc",
+                      "dec", "neg", "not", "rol", "ror", "rcl", "rcr", "shl",
+                      "shr", "sal", "sar", "shld", "shrd", "lea", "movzx",
+                      "movsx", "movsxd", "bswap", "bsf", "bsr", "popcnt",
+                      "imul", "mov"])
+MEMORY = re.compile(r"^(?:(byte|word|dword|qword) )?\[(\w+)(?:([+-])0x([0-9a-f]+))?\]$")
+# word size names per mode
+WORD = {32 : "dword", 64 : "qword"}
+# the filler of stack words nothing is popped into
+PADDING = {32 : 0x41414141, 64 : 0x4141414141414141}
+INDEX_VERSION = 1
+
+
+def _aliases(mode):
+    """
+    register name -> (full register, zero-extends), for the full
+    registers and, in 64 bit mode, their 32 bit halves
+    """
+    aliases = dict([(reg, (reg, False)) for reg in REGISTERS[mode]])
+    if mode == 64:
+        for (num, reg) in enumerate(REGISTERS[32]):
+            aliases[reg] = (REGISTERS[64][num], True)
+        for num in range(8, 16):
+            aliases["r%dd" % num] = ("r%d" % num, True)
+    return aliases
+
+
+PARTIALS = {32 : dict([(name, REGISTERS[32][num % 4])
+                       for (num, name) in enumerate(["al", "cl", "dl", "bl",
+                                                     "ah", "ch", "dh",
+                                                     "bh"])]),
+            64 : {}}
+for (_num, _name) in enumerate(["ax", "cx", "dx", "bx", "sp", "bp", "si",
+                                "di"]):
+    PARTIALS[32][_name] = REGISTERS[32][_num]
+    PARTIALS[64][_name] = REGISTERS[64][_num]
+for (_num, _name) in enumerate(["al", "cl", "dl", "bl", "spl", "bpl", "sil",
+                                "dil"]):
+    PARTIALS[64][_name] = REGISTERS[64][_num]
+for _num in range(8, 16):
+    PARTIALS[64]["r%dw" % _num] = "r%d" % _num
+    PARTIALS[64]["r%db" % _num] = "r%d" % _num
+ALIASES = {32 : _aliases(32), 64 : _aliases(64)}
+
+
+class _Unmodeled(Exception):
+    """Raised for gadgets whose effect is not modeled"""
+
+
+class _Effect:
+    """Symbolic execution of a gadget's instructions"""
+    def __init__(self, mode):
+        self.mode = mode
+        self.mask = (1 << mode) - 1
+        self.word = mode / 8
+        self.regs = {}
+        self.slots = 0
+        self.writes = []
+        self.syscall = False
+
+    def value(self, reg):
+        """Expression for the current value of full register reg"""
+        if reg in self.regs:
+            return self.regs[reg]
+        return ("reg", reg, 0)
+
+    def operand(self, text):
+        """Expression for a register or immediate operand"""
+        if text in ALIASES[self.mode]:
+            (reg, zext) = ALIASES[self.mode][text]
+            if zext:
+                # only the low half, nothing to track
+                return None
+            return self.value(reg)
+        if text.startswith("0x"):
+            return ("const", int(text, 16) & self.mask, 0)
+        raise _Unmodeled()
+
+    def add(self, expr, num):
+        """expr plus num, None stays None"""
+        if expr is None:
+            return None
+        if expr[0] == "const":
+            return ("const", (expr[1] + num) & self.mask, 0)
+        return (expr[0], expr[1], (expr[2] + num) & self.mask)
+
+    def set(self, text, expr):
+        """Assign expr to the register operand text"""
+        if text in ALIASES[self.mode]:
+            (reg, zext) = ALIASES[self.mode][text]
+            if reg == STACK[self.mode]:
+                raise _Unmodeled()
+            if zext and (expr is None or expr[0] != "const" or
+                         expr[1] >> 32):
+                expr = None
+            self.regs[reg] = expr
+        elif text in PARTIALS[self.mode]:
+            if PARTIALS[self.mode][text] == STACK[self.mode]:
+                raise _Unmodeled()
+            self.regs[PARTIALS[self.mode][text]] = None
+        else:
+            raise _Unmodeled()
+
+    def step(self, insn):
+        """Apply one instruction in front of the terminator"""
+        mnemonic = insn.mnemonic
+        ops = insn.operands
+        if not insn.valid or insn.prefix or ":" in "".join(ops):
+            raise _Unmodeled()
+        if mnemonic in NOPS:
+            if [op for op in ops if "[" in op]:
+                raise _Unmodeled()
+            return
+        if mnemonic in SYSCALLS or (mnemonic == "int" and ops == ["0x80"]):
+            self.syscall = True
+            return
+        stack = STACK[self.mode]
+        if mnemonic == "pop" and ops[0] in ALIASES[self.mode] and \
+           not ALIASES[self.mode][ops[0]][1] and ops[0] != stack:
+            self.regs[ops[0]] = ("slot", self.slots, 0)
+            self.slots += 1
+            return
+        if mnemonic == "add" and ops[0] == stack and ops[1].startswith("0x"):
+            num = int(ops[1], 16)
+            if num % self.word or num > 0x1000:
+                raise _Unmodeled()
+            self.slots += num / self.word
+            return
+        if len(ops) == 2 and "[" in ops[0]:
+            self.store(mnemonic, ops)
+            return
+        if [op for op in ops if "[" in op] and mnemonic != "lea":
+            raise _Unmodeled()
+        if mnemonic == "mov":
+            self.set(ops[0], self.operand(ops[1]))
+        elif mnemonic in ("xor", "sub") and ops[0] == ops[1]:
+            self.set(ops[0], ("const", 0, 0))
+        elif mnemonic == "xchg" and len(ops) == 2:
+            (first, second) = (self.operand(ops[0]), self.operand(ops[1]))
+            self.set(ops[0], second)
+            self.set(ops[1], first)
+        elif mnemonic in ("inc", "dec") and ops[0] in ALIASES[self.mode]:
+            delta = mnemonic == "inc" and 1 or -1
+            self.set(ops[0], self.add(self.operand(ops[0]), delta))
+        elif mnemonic in ("add", "sub") and ops[0] in ALIASES[self.mode] \
+                and ops[1].startswith("0x"):
+            delta = int(ops[1], 16)
+            if mnemonic == "sub":
+                delta = -delta
+            self.set(ops[0], self.add(self.operand(ops[0]), delta))
+        elif mnemonic in CLOBBERS or mnemonic.startswith("cmov") or \
+                mnemonic.startswith("set"):
+            if len(ops) > 2 or (mnemonic == "imul" and len(ops) < 2):
+                raise _Unmodeled()
+            self.set(ops[0], None)
+        else:
+            raise _Unmodeled()
+
+    def store(self, mnemonic, ops):
+        """A mov of a word to a register-relative address"""
+        match = MEMORY.match(ops[0])
+        if mnemonic != "mov" or match is None:
+            raise _Unmodeled()
+        (size, base, sign, disp) = match.groups()
+        if base not in ALIASES[self.mode] or \
+           ALIASES[self.mode][base][1] or base == STACK[self.mode]:
+            raise _Unmodeled()
+        if ops[1].startswith("0x"):
+            if size != WORD[self.mode]:
+                raise _Unmodeled()
+        elif ops[1] not in ALIASES[self.mode] or \
+                ALIASES[self.mode][ops[1]][1]:
+            raise _Unmodeled()
+        disp = disp and int(disp, 16) or 0
+        if sign == "-":
+            disp = -disp
+        address = self.add(self.value(base), disp)
+        value = self.operand(ops[1])
+        if address is None or value is None:
+            raise _Unmodeled()
+        self.writes += [(address, value)]
+
+    def result(self, text):
+        """The effect dict (see above) without address and file"""
+        sets = dict([(reg, expr and list(expr))
+                     for (reg, expr) in self.regs.items()
+                     if expr != ("reg", reg, 0)])
+        return {"text" : text, "slots" : self.slots, "sets" : sets,
+                "writes" : [[list(addr), list(value)]
+                            for (addr, value) in self.writes],
+                "syscall" : self.syscall}
+
+
+def gadget_effect(decoder, data, mode=32):
+    """
+    Effect (see above, without address and file) of the gadget made of
+    the bytes data, None if it is not modeled
+    """
+    code = bytearray(data)
+    end = len(code)
+    pos = 0
+    insns = []
+    while pos < end:
+        insn = decoder.decode(code, pos, end)
+        insns += [insn]
+        pos = insn.end
+    last = insns[-1]
+    if last.mnemonic != "ret" or last.operands or last.prefix not in \
+       ("", "rep "):
+        return None
+    effect = _Effect(mode)
+    texts = []
+    try:
+        for insn in insns[:-1]:
+            effect.step(insn)
+            texts += [insn.mnemonic + (insn.operands and " " +
+                                       ", ".join(insn.operands) or "")]
+            if effect.syscall:
+                break
+    except _Unmodeled:
+        return None
+    if not effect.syscall:
+        texts += ["ret"]
+    return effect.result("; ".join(texts))
+
+
+def _cost(effect):
+    """Stack words a gadget takes in a chain, then its instructions"""
+    return (effect["slots"] + 1, effect["text"].count(";"))
+
+
+class EffectIndex:
+    """
+    Index of the gadgets of a GadgetDB (see gadgetdb.py) by effect:
+    "pop:<reg>" lists the gadgets loading register reg from the stack,
+    "move:<reg>" those computing it from a register, "const:<reg>:<value>"
+    those setting it to a constant, "write" those storing to memory and
+    "syscall" the system calls (which are filed under no other key). Of
+    gadgets doing the same thing, only the cheapest is kept. Lists are
+    ordered by cost.
+
+    The index is computed once per database and saved next to it, so
+    chain searches only load it.
+    """
+    def __init__(self, mode, files, effects, stamp=None):
+        self.mode = mode
+        self.files = files
+        self.effects = effects
+        self.stamp = stamp
+        self.keys = {}
+        for effect in sorted(effects, key=_cost):
+            for key in self.__keys(effect):
+                if key in self.keys:
+                    self.keys[key] += [effect]
+                else:
+                    self.keys[key] = [effect]
+
+    @staticmethod
+    def __keys(effect):
+        """Index keys of an effect"""
+        if effect["syscall"]:
+            return ["syscall"]
+        keys = []
+        for (reg, expr) in effect["sets"].items():
+            if expr is None:
+                continue
+            if expr[0] == "slot":
+                keys += ["pop:" + reg]
+            elif expr[0] == "reg":
+                keys += ["move:" + reg]
+            else:
+                keys += ["const:%s:%x" % (reg, expr[1])]
+        if effect["writes"]:
+            keys += ["write"]
+        return keys
+
+    def get(self, key):
+        """The effects filed under key, cheapest first"""
+        return self.keys.get(key, [])
+
+    @classmethod
+    def build(cls, gadget_db, mode=None, path=None):
+        """
+        Index the gadgets of gadget_db of mode bit code (default: that of
+        its first section)
+        """
+        if mode is None:
+            mode = gadget_db.modes and gadget_db.modes[0] or 32
+        decoder = get_decoder(DEFAULT_DECODER, mode)
+        files = []
+        file_ids = {}
+        effects = {}
+        seen = {}
+        for gid in xrange(len(gadget_db)):
+            if gadget_db.mode(gid) != mode:
+                continue
+            (address, _length, _section, filename, data) = \
+                gadget_db.gadget(gid)
+            data = str(data)
+            effect = seen.get(data, False)
+            if effect is False:
+                effect = gadget_effect(decoder, data, mode)
+                seen[data] = effect
+            if effect is None:
+                continue
+            known = effects.get(effect["text"])
+            if known is not None and known["address"] <= address:
+                continue
+            if filename not in file_ids:
+                file_ids[filename] = len(files)
+                files += [filename]
+            effect = dict(effect)
+            effect["address"] = address
+            effect["file"] = file_ids[filename]
+            effects[effect["text"]] = effect
+        return cls(mode, files, effects.values(), path and _stamp(path))
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()"""
+        infile = open(path, "rb")
+        try:
+            data = json.load(infile)
+        finally:
+            infile.close()
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError("%s: unknown effect index version" % path)
+        return cls(data["mode"], data["files"], data["effects"],
+                   data["stamp"])
+
+    def save(self, path):
+        """Write the index to path"""
+        outfile = open(path + ".tmp", "wb")
+        json.dump({"version" : INDEX_VERSION, "mode" : self.mode,
+                   "files" : self.files, "stamp" : self.stamp,
+                   "effects" : self.effects}, outfile)
+        outfile.close()
+        os.rename(path + ".tmp", path)
+
+    def current(self, path):
+        """Check if the index was built from the database at path as is"""
+        return self.stamp == _stamp(path)
+
+
+def _stamp(path):
+    """Size and modification time of a file"""
+    info = os.stat(path)
+    return [info.st_size, int(info.st_mtime)]
+
+
+def parse_goal(spec, mode=32):
+    """
+    Goal for a --goal option: comma separated reg=value and
+    [address]=value items, e.g. "eax=0xb,ebx=0x804a000,[0x804a000]=0x6e69622f".
+
+    Returns: (register -> value, list of (address, value))
+    """
+    regs = {}
+    memory = []
+    mask = (1 << mode) - 1
+    for item in spec.split(","):
+        item = item.strip()
+        if item == "":
+            continue
+        if "=" not in item:
+            raise ValueError("Bad goal '%s', use reg=value or "
+                             "[address]=value" % item)
+        (target, value) = [part.strip() for part in item.split("=", 1)]
+        try:
+            value = int(value, 0) & mask
+            if target.startswith("[") and target.endswith("]"):
+                memory += [(int(target[1:-1], 0) & mask, value)]
+                continue
+        except ValueError:
+            raise ValueError("Bad number in goal '%s'" % item)
+        if target not in REGISTERS[mode] or target == STACK[mode]:
+            raise ValueError("Unknown register '%s' for %d bit code" %
+                             (target, mode))
+        regs[target] = value
+    if not regs and not memory:
+        raise ValueError("Empty goal")
+    return (regs, memory)
+
+
+class ChainSearch:
+    """
+    Bounded best-first (A*-like) search for the shortest chain of indexed
+    gadgets reaching a goal (see parse_goal()), optionally followed by a
+    system call.
+
+    A search state holds the known values of the registers that matter
+    for the goal and the memory goals met so far. States are memoized
+    with the cheapest cost they were reached at, so partial chains that
+    end in the same state are only extended once. Only the width
+    cheapest gadgets per index key are tried, chains are at most
+    max_length gadgets long and at most max_states states are expanded.
+    """
+    def __init__(self, index, regs, memory, syscall=False, max_length=8,
+                 max_states=100000, width=6):
+        self.index = index
+        self.mask = (1 << index.mode) - 1
+        self.regs = regs
+        self.memory = memory
+        self.syscall = syscall
+        self.max_length = max_length
+        self.max_states = max_states
+        self.width = width
+        self.expanded = 0
+        self.wanted = self.__wanted()
+        self.actions = [self.__combos(effect)
+                        for effect in self.__actions()]
+        self.estimates = self.__estimates()
+
+    def __loadable(self, expr):
+        """Check if the registers expr depends on can be loaded"""
+        return expr[0] != "reg" or self.index.get("pop:" + expr[1])
+
+    def __wanted(self):
+        """
+        register -> set of values it is useful to load it with: the goal
+        values and what the moves and writes tried need to produce them
+        """
+        wanted = dict([(reg, set([value]))
+                       for (reg, value) in self.regs.items()])
+        def want(expr, value):
+            if expr[0] == "reg":
+                values = wanted.setdefault(expr[1], set())
+                values.add((value - expr[2]) & self.mask)
+        for effect in self.__writes():
+            for (address, value) in effect["writes"]:
+                for (goal_address, goal_value) in self.memory:
+                    want(address, goal_address)
+                    want(value, goal_value)
+        for reg in self.regs:
+            for effect in self.__moves(reg):
+                want(effect["sets"][reg], self.regs[reg])
+        return wanted
+
+    def __writes(self):
+        """The width cheapest writes whose operands can be loaded"""
+        if not self.memory:
+            return []
+        return [effect for effect in self.index.get("write")
+                if [expr for write in effect["writes"] for expr in write
+                    if not self.__loadable(expr)] == []][:self.width]
+
+    def __moves(self, reg):
+        """The width cheapest moves into reg from a loadable register"""
+        return [effect for effect in self.index.get("move:" + reg)
+                if self.__loadable(effect["sets"][reg])][:self.width]
+
+    def __actions(self):
+        """The gadgets worth trying"""
+        actions = {}
+        for (reg, values) in self.wanted.items():
+            effects = self.index.get("pop:" + reg)[:self.width]
+            for value in values:
+                effects += self.index.get("const:%s:%x" % (reg, value))[:2]
+            if reg in self.regs:
+                effects += self.__moves(reg)
+            for effect in effects:
+                actions[effect["text"]] = effect
+        for effect in self.__writes():
+            actions[effect["text"]] = effect
+        return sorted(actions.values(), key=_cost)
+
+    def __eval(self, expr, state, slots):
+        """Value of expr for register values state and stack words slots"""
+        if expr is None:
+            return None
+        if expr[0] == "const":
+            return expr[1]
+        if expr[0] == "slot":
+            base = slots[expr[1]]
+        else:
+            base = state.get(expr[1])
+        if base is None:
+            return None
+        return (base + expr[2]) & self.mask
+
+    def __combos(self, effect):
+        """The (at most 16) ways of filling the stack words of effect"""
+        choices = [set() for _i in range(effect["slots"])]
+        for (reg, expr) in effect["sets"].items():
+            if expr is not None and expr[0] == "slot":
+                for value in self.wanted.get(reg, ()):
+                    choices[expr[1]].add((value - expr[2]) & self.mask)
+        for (address, value) in effect["writes"]:
+            for (goal_address, goal_value) in self.memory:
+                for (expr, goal) in ((address, goal_address),
+                                     (value, goal_value)):
+                    if expr[0] == "slot":
+                        choices[expr[1]].add((goal - expr[2]) & self.mask)
+        combos = [[]]
+        for values in choices:
+            combos = [combo + [value] for combo in combos
+                      for value in sorted(values) or [None]][:16]
+        return (effect, combos, effect["sets"].items())
+
+    def __apply(self, action, state, met):
+        """
+        Yield (slots, new state, new met) for every way of running the
+        gadget of action (see __combos()) in state, except for ways that
+        write to unknown addresses
+        """
+        (effect, combos, sets) = action
+        for slots in combos:
+            met_now = met
+            unsafe = False
+            for (address, value) in effect["writes"]:
+                address = self.__eval(address, state, slots)
+                value = self.__eval(value, state, slots)
+                if address is None:
+                    unsafe = True
+                    break
+                for (num, (goal_address, goal_value)) in \
+                        enumerate(self.memory):
+                    if address == goal_address:
+                        if value == goal_value:
+                            met_now |= 1 << num
+                        else:
+                            met_now &= ~(1 << num)
+            if unsafe:
+                continue
+            new = dict(state)
+            for (reg, expr) in sets:
+                value = self.__eval(expr, state, slots)
+                if value not in self.wanted.get(reg, ()):
+                    new.pop(reg, None)
+                else:
+                    new[reg] = value
+            yield (slots, new, met_now)
+
+    def __done(self, state, met):
+        """Check if state and met reach the goal"""
+        if met != (1 << len(self.memory)) - 1:
+            return False
+        for (reg, value) in self.regs.items():
+            if state.get(reg) != value:
+                return False
+        return True
+
+    def __estimates(self):
+        """
+        Stack words the cheapest gadget(s) meeting each goal on their own
+        take: per goal register and for any memory goal
+        """
+        def words(effect):
+            return effect["slots"] + 1
+        loads = {}
+        for reg in self.wanted:
+            found = [words(effect)
+                     for effect in self.index.get("pop:" + reg)[:1]]
+            loads[reg] = min(found or [0])
+        estimates = {}
+        for (reg, value) in self.regs.items():
+            found = [words(effect) for effect in
+                     self.index.get("pop:" + reg)[:1] +
+                     self.index.get("const:%s:%x" % (reg, value))[:1]]
+            found += [words(effect) + loads[effect["sets"][reg][1]]
+                      for effect in self.__moves(reg)]
+            estimates[reg] = min(found or [1])
+        found = [words(effect) +
+                 sum([loads.get(expr[1], 0) for write in effect["writes"]
+                      for expr in write if expr[0] == "reg"])
+                 for effect in self.__writes()]
+        estimates[None] = min(found or [1])
+        return estimates
+
+    def __missing(self, state, met):
+        """
+        Estimated stack words still needed: the cost of meeting each goal
+        on its own, summed. This overestimates for gadgets meeting several
+        goals at once, trading the shortest chain for a fast search.
+        """
+        missing = sum([self.estimates[reg]
+                       for (reg, value) in self.regs.items()
+                       if state.get(reg) != value])
+        return missing + self.estimates[None] * \
+            (len(self.memory) - bin(met).count("1"))
+
+    def __finish(self, state, met):
+        """A system call gadget keeping the goal, with its slots"""
+        for effect in self.index.get("syscall")[:self.width * 4]:
+            for (slots, new, met_now) in self.__apply(self.__combos(effect),
+                                                      state, met):
+                if self.__done(new, met_now):
+                    return (effect, slots)
+        return None
+
+    def run(self):
+        """
+        Search for a chain. Returns the list of (effect, stack words)
+        steps, None if there is none within the bounds.
+        """
+        start = ({}, 0)
+        queue = [(self.__missing({}, 0), 0, 0, start, [])]
+        best = {}
+        counter = 0
+        while queue and self.expanded < self.max_states:
+            (_estimate, cost, _num, (state, met), steps) = \
+                heapq.heappop(queue)
+            key = (frozenset(state.items()), met)
+            if best.get(key, cost + 1) < cost:
+                continue
+            self.expanded += 1
+            if self.__done(state, met):
+                if not self.syscall:
+                    return steps
+                last = self.__finish(state, met)
+                if last is not None:
+                    return steps + [last]
+            if len(steps) >= self.max_length:
+                continue
+            for action in self.actions:
+                effect = action[0]
+                for (slots, new, met_now) in self.__apply(action, state,
+                                                          met):
+                    new_cost = cost + effect["slots"] + 1
+                    new_key = (frozenset(new.items()), met_now)
+                    if best.get(new_key, new_cost + 1) <= new_cost:
+                        continue
+                    best[new_key] = new_cost
+                    counter += 1
+                    heapq.heappush(queue,
+                                   (new_cost + self.__missing(new, met_now),
+                                    new_cost, counter, (new, met_now),
+                                    steps + [(effect, slots)]))
+        return None
+
+
+def chain_words(index, steps):
+    """
+    The stack words of a chain as (value, comment) tuples, starting with
+    the first gadget's address
+    """
+    words = []
+    padding = PADDING[index.mode]
+    for (effect, slots) in steps:
+        words += [(effect["address"], effect["text"])]
+        names = {}
+        for (reg, expr) in effect["sets"].items():
+            if expr is not None and expr[0] == "slot":
+                names[expr[1]] = reg
+        for (num, value) in enumerate(slots):
+            if value is None:
+                words += [(padding, "padding")]
+            else:
+                words += [(value, names.get(num, "data"))]
+    return words
@@ -0,0 +1,461 @@
+"""
+Semantic gadget classification used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import json
+import binascii
+from decoder import get_decoder, DEFAULT_DECODER
+from decodecache import DEFAULT_DECODE_CACHE_SIZE
+
+"""
+A gadget's class is a tuple (signature, categories, drop reason, bytes):
+
+  signature   its instructions without nops and redundant prefixes, e.g.
+              "pop ebx; pop ebp; ret". Gadgets with the same signature do
+              the same thing.
+  categories  tuple of the CATEGORIES of its instructions in front of the
+              terminator, in order of first appearance
+  drop reason one of DROP_REASONS if the gadget is not worth keeping,
+              else None
+  bytes       the bytes the class was first computed for
+"""
+
+CATEGORIES = ["load-reg", "load-const", "move-reg", "arith", "flags",
+              "mem-read", "mem-write", "push", "stack-adjust",
+              "stack-pivot", "syscall", "branch", "other"]
+DROP_REASONS = ["leave", "privileged", "far", "trap", "invalid"]
+
+STACK_REGS = frozenset(["sp", "esp", "rsp"])
+NOPS = frozenset(["nop", "fnop", "wait", "prefetch", "prefetchnta",
+                  "prefetcht0", "prefetcht1", "prefetcht2", "lfence",
+                  "mfence", "sfence"])
+PRIVILEGED = frozenset(["hlt", "cli", "sti", "in", "out", "insb", "insd",
+                        "insq", "outsb", "outsd", "outsq", "lgdt", "lidt",
+                        "lldt", "ltr", "lmsw", "clts", "invd", "wbinvd",
+                        "invlpg", "rdmsr", "wrmsr", "rdpmc", "sysexit",
+                        "sysret", "rsm", "monitor", "mwait", "xsetbv",
+                        "getsec", "vmcall", "vmlaunch", "vmresume",
+                        "vmxoff", "vmread", "vmwrite", "vmptrld",
+                        "vmptrst"])
+TRAPS = frozenset(["int3", "int1", "into", "ud1", "ud2", "invalid"])
+FAR = frozenset(["retf", "iretd", "iretq"])
+SYSCALLS = frozenset(["syscall", "sysenter"])
+FLAGS_ONLY = frozenset(["cmp", "test", "bt", "ucomiss", "comiss"])
+MOVES = frozenset(["mov", "movzx", "movsx", "movsxd", "xchg", "bswap"])
+ARITH = frozenset(["add", "or", "adc", "sbb", "and", "sub", "xor", "inc",
+                   "dec", "neg", "not", "mul", "imul", "div", "idiv", "rol",
+                   "ror", "rcl", "rcr", "shl", "shr", "sal", "sar", "shld",
+                   "shrd", "lea", "cwde", "cdqe", "cdq", "cqo", "xadd",
+                   "bts", "btr", "btc", "bsf", "bsr", "popcnt"])
+STRING_WRITES = frozenset(["movsb", "movsd", "movsq", "stosb", "stosd",
+                           "stosq"])
+STRING_READS = frozenset(["lodsb", "lodsd", "lodsq", "cmpsb", "cmpsd",
+                          "cmpsq", "scasb", "scasd", "scasq"])
+# prefixes in front of the opcode, see x86.py
+LEGACY_PREFIXES = frozenset([0x26, 0x2e, 0x36, 0x3e, 0x64, 0x65, 0x66, 0x67,
+                             0xf0, 0xf2, 0xf3])
+
+
+def _opcode(code, pos, end, mode):
+    """(opcode byte, following byte) of the instruction at pos"""
+    while pos < end and (code[pos] in LEGACY_PREFIXES or
+                         (mode == 64 and code[pos] & 0xf0 == 0x40)):
+        pos += 1
+    if pos >= end:
+        return (None, None)
+    if pos + 1 >= end:
+        return (code[pos], None)
+    return (code[pos], code[pos + 1])
+
+
+def _is_far(code, pos, end, mode):
+    """Check for a far call or jump (9a, ea, ff /3, ff /5)"""
+    (opcode, modrm) = _opcode(code, pos, end, mode)
+    if opcode in (0x9a, 0xea):
+        return True
+    return opcode == 0xff and modrm is not None and \
+        (modrm >> 3) & 7 in (3, 5)
+
+
+# reason to drop gadgets containing an instruction, by mnemonic
+DROPS = dict([(mnemonic, "privileged") for mnemonic in PRIVILEGED] +
+             [(mnemonic, "far") for mnemonic in FAR] +
+             [(mnemonic, "trap") for mnemonic in TRAPS] +
+             [("leave", "leave"), ("invalid", "invalid")])
+# mnemonic -> kind (nop, pop, push, int, syscall, flags, branch,
+# string-write, string-read, arith, move or other), the part of an
+# instruction's category that does not depend on its operands; filled as
+# mnemonics are seen
+KINDS = {}
+
+
+def _kind(mnemonic):
+    """Kind (see KINDS) of a mnemonic"""
+    kind = KINDS.get(mnemonic)
+    if kind is None:
+        if mnemonic in NOPS:
+            kind = "nop"
+        elif mnemonic in ("pop", "push", "int"):
+            kind = mnemonic
+        elif mnemonic in SYSCALLS:
+            kind = "syscall"
+        elif mnemonic in FLAGS_ONLY:
+            kind = "flags"
+        elif mnemonic[0] == "j" or mnemonic.startswith("loop") or \
+                mnemonic == "call":
+            kind = "branch"
+        elif mnemonic in STRING_WRITES:
+            kind = "string-write"
+        elif mnemonic in STRING_READS:
+            kind = "string-read"
+        elif mnemonic in ARITH:
+            kind = "arith"
+        elif mnemonic in MOVES or mnemonic.startswith("cmov"):
+            kind = "move"
+        else:
+            kind = "other"
+        KINDS[mnemonic] = kind
+    return kind
+
+
+def _normalize(insn, kind, mask):
+    """
+    Instruction text without prefixes that change nothing, and with
+    relative branch targets as "$+disp", which unlike the decoded target
+    does not depend on where the gadget starts. kind is the mnemonic's
+    kind, mask the address mask of the decoder mode.
+    """
+    ops = insn.operands
+    if kind == "branch" and len(ops) == 1 and ops[0].startswith("0x") and \
+       ":" not in ops[0]:
+        disp = (int(ops[0], 16) - insn.end) & mask
+        if disp > mask >> 1:
+            ops = ["$-0x%x" % (mask + 1 - disp)]
+        else:
+            ops = ["$+0x%x" % disp]
+    text = insn.prefix + insn.mnemonic
+    if ops:
+        text += " " + ", ".join(ops)
+    if "ds:" in text:
+        text = text.replace("ds:", "")
+    return text
+
+
+def _category(insn, kind):
+    """
+    Category (see CATEGORIES) of an instruction whose mnemonic is of kind,
+    None for nops
+    """
+    if kind == "nop":
+        return None
+    mnemonic = insn.mnemonic
+    ops = insn.operands
+    if len(ops) == 2 and ((mnemonic in ("xchg", "mov") and ops[0] == ops[1])
+                          or (mnemonic == "lea" and
+                              ops[1] == "[%s]" % ops[0])):
+        # padding like "lea esi, [esi]"
+        return None
+    if kind == "pop":
+        if ops[0] in STACK_REGS:
+            return "stack-pivot"
+        if "[" in ops[0]:
+            return "mem-write"
+        return "load-reg"
+    if kind == "push":
+        return "push"
+    if kind == "syscall" or (kind == "int" and ops == ["0x80"]):
+        return "syscall"
+    if ops and (ops[0] in STACK_REGS or
+                (mnemonic == "xchg" and ops[-1] in STACK_REGS)):
+        if mnemonic in ("add", "sub") and ops[1].startswith("0x"):
+            return "stack-adjust"
+        return "stack-pivot"
+    if kind == "flags" or kind == "branch":
+        return kind
+    if kind == "string-write" or (ops and "[" in ops[0] and
+                                  mnemonic != "lea"):
+        return "mem-write"
+    if kind == "string-read" or (mnemonic != "lea" and
+                                 [op for op in ops[1:] if "[" in op]):
+        return "mem-read"
+    if kind == "arith":
+        return "arith"
+    if kind == "move":
+        if ops and ops[-1].startswith("0x"):
+            return "load-const"
+        return "move-reg"
+    return "other"
+
+
+def _drop_reason(insn, code, pos, end, mode):
+    """Reason (see DROP_REASONS) to drop gadgets containing insn, or None"""
+    mnemonic = insn.mnemonic
+    reason = DROPS.get(mnemonic)
+    if reason is not None:
+        return reason
+    if mnemonic == "mov":
+        if [op for op in insn.operands if op[:2] in ("cr", "dr")]:
+            return "privileged"
+    elif mnemonic in ("call", "jmp") and _is_far(code, pos, end, mode):
+        # only call and jmp decode from 9a, ea, ff /3 and ff /5
+        return "far"
+    return None
+
+
+class SemanticCatalog:
+    """
+    Gadgets deduplicated by signature, with the number of gadgets found
+    per signature and per drop reason
+    """
+    def __init__(self):
+        # signature -> count, signature -> (categories, example bytes)
+        self.counts = {}
+        self.classes = {}
+        self.dropped = {}
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, cls, count=1):
+        """Count a kept gadget of class cls"""
+        signature = cls[0]
+        if signature in self.counts:
+            self.counts[signature] += count
+        else:
+            self.counts[signature] = count
+            self.classes[signature] = (cls[1], cls[3])
+
+    def drop(self, reason, count=1):
+        """Count a dropped gadget"""
+        self.dropped[reason] = self.dropped.get(reason, 0) + count
+
+    def merge(self, other):
+        """Add the counts of another catalog"""
+        for (signature, count) in other.counts.items():
+            (categories, data) = other.classes[signature]
+            self.add((signature, categories, None, data), count)
+        for (reason, count) in other.dropped.items():
+            self.drop(reason, count)
+
+    @property
+    def kept(self):
+        """Number of kept gadgets"""
+        return sum(self.counts.values())
+
+    def category_counts(self):
+        """Unique signatures per category"""
+        counts = dict([(category, 0) for category in CATEGORIES])
+        for (categories, _data) in self.classes.values():
+            for category in categories:
+                counts[category] += 1
+        return counts
+
+    def write(self, path):
+        """
+        Write the catalog as JSON Lines, most frequent signatures first
+        """
+        outfile = open(path, "wb")
+        for (signature, count) in sorted(self.counts.items(),
+                                         key=lambda item: (-item[1],
+                                                           item[0])):
+            (categories, data) = self.classes[signature]
+            outfile.write(json.dumps({"gadget" : signature,
+                                      "categories" : list(categories),
+                                      "count" : count,
+                                      "bytes" : binascii.hexlify(data)},
+                                     sort_keys=True) + "\n")
+        outfile.close()
+
+
+class GadgetClassifier:
+    """
+    Classifies confirmed gadgets of mode (32 or 64) bit code and keeps a
+    SemanticCatalog of them.
+
+    Gadgets ending in the same terminator share their tails, so classes
+    are memoized per suffix: classifying a gadget only looks at the
+    instructions in front of the longest suffix classified before. Inside
+    a GadgetTrie the instructions the scan decoded anyway are reused.
+    """
+    def __init__(self, mode=32, memo_size=DEFAULT_DECODE_CACHE_SIZE):
+        self.mode = mode
+        self.memo_size = memo_size
+        self.decoder = get_decoder(DEFAULT_DECODER, mode)
+        self.catalog = SemanticCatalog()
+        # suffix bytes -> class, instruction bytes -> (text, category, reason)
+        # plain dicts that start over when full: they are looked up once
+        # per gadget, where a DecodeCache would cost more than it saves
+        self.__classes = {}
+        self.__effects = {}
+
+    def classify(self, data):
+        """Class of the gadget consisting of the bytes data"""
+        data = str(data)
+        code = bytearray(data)
+        end = len(data)
+        pos = 0
+        chain = []
+        cls = None
+        while cls is None:
+            suffix = data[pos:end]
+            cls = self.__classes.get(suffix)
+            if cls is None:
+                insn = self.decoder.decode(code, pos, end)
+                chain += [(pos, insn, suffix)]
+                if insn.end >= end:
+                    break
+                pos = insn.end
+
+        for (pos, insn, suffix) in reversed(chain):
+            cls = self.__extend(data, code, pos, end, insn, cls, suffix)
+        return cls
+
+    def filter_trie(self, trie, hits):
+        """
+        Classify the valid (offset, length) tuples of a GadgetTrie whose
+        last byte is at offset, shortest first, so that every gadget
+        extends one classified before. Returns the tuples of the gadgets
+        to keep; all of them are counted in the catalog.
+        """
+        raw = str(trie.code)
+        end = trie.end
+        last = end - 1
+        instruction = trie.instruction
+        classes = self.__classes
+        effects = self.__effects
+        memo_size = self.memo_size
+        catalog = self.catalog
+        counts = catalog.counts
+        dropped = catalog.dropped
+        # byte position -> class of the gadget starting there, starting
+        # with the terminator on its own
+        terminator = raw[trie.root:end]
+        behind = {trie.root : classes.get(terminator) or
+                  self.classify(terminator)}
+        kept = []
+        # the hot loop of a classifying scan: __extend() and the catalog
+        # update are inlined for the common cases
+        for hit in hits:
+            pos = last - hit[1]
+            suffix = raw[pos:end]
+            cls = classes.get(suffix)
+            if cls is None:
+                insn = instruction(pos)
+                following = insn.end
+                tail = behind.get(following)
+                effect = effects.get(raw[pos:following])
+                if tail is None or effect is None:
+                    if tail is None and following < end:
+                        tail = self.classify(raw[following:end])
+                    cls = self.__extend(raw, trie.code, pos, end, insn, tail,
+                                        suffix)
+                else:
+                    (text, category, reason) = effect
+                    (signature, categories, tail_reason, _data) = tail
+                    if text is not None:
+                        signature = text + "; " + signature
+                    if category is not None and category not in categories:
+                        categories = (category,) + categories
+                    cls = (signature, categories, reason or tail_reason,
+                           suffix)
+                    if len(classes) >= memo_size:
+                        classes.clear()
+                    classes[suffix] = cls
+            behind[pos] = cls
+            reason = cls[2]
+            if reason is None:
+                signature = cls[0]
+                if signature in counts:
+                    counts[signature] += 1
+                else:
+                    catalog.add(cls)
+                kept += [hit]
+            else:
+                dropped[reason] = dropped.get(reason, 0) + 1
+        return kept
+
+    def select(self, cls):
+        """
+        Record a gadget of class cls in the catalog. Returns False if the
+        gadget is to be dropped.
+        """
+        if cls[2] is not None:
+            self.catalog.drop(cls[2])
+            return False
+        self.catalog.add(cls)
+        return True
+
+    def take_catalog(self):
+        """Return the catalog collected so far and start a new one"""
+        catalog = self.catalog
+        self.catalog = SemanticCatalog()
+        return catalog
+
+    def __extend(self, raw, code, pos, end, insn, tail, suffix):
+        """
+        Class of the gadget raw[pos:end] = suffix consisting of insn
+        followed by a gadget of class tail (None if insn is the
+        terminator), memoized. code is raw as bytearray.
+        """
+        effect = self.__effects.get(raw[pos:insn.end])
+        if effect is None:
+            effect = self.__effect(code, pos, end, insn)
+        (text, category, reason) = effect
+        if tail is None:
+            if reason == "far":
+                # a selected retf terminator is what the user asked for
+                reason = None
+            cls = (text, (), reason, suffix)
+        else:
+            (signature, categories, tail_reason, _data) = tail
+            if text is not None:
+                signature = text + "; " + signature
+            if category is not None and category not in categories:
+                categories = (category,) + categories
+            cls = (signature, categories, reason or tail_reason, suffix)
+        if len(self.__classes) >= self.memo_size:
+            self.__classes.clear()
+        self.__classes[suffix] = cls
+        return cls
+
+    def __effect(self, code, pos, end, insn):
+        """(text, category, drop reason) of an instruction, memoized"""
+        kind = _kind(insn.mnemonic)
+        category = _category(insn, kind)
+        text = None
+        if category is not None or insn.end >= end:
+            text = _normalize(insn, kind, (1 << self.mode) - 1)
+            if insn.end >= end:
+                # a repeated RET is still a RET
+                text = text.replace("rep ", "")
+        effect = (text, category,
+                  _drop_reason(insn, code, pos, end, self.mode))
+        if len(self.__effects) >= self.memo_size:
+            self.__effects.clear()
+        self.__effects[str(code[pos:insn.end])] = effect
+        return effect
@@ -29,23 +29,28 @@ Commands used by ROPCheck
 #     economic rights: Technische Universitaet Dresden (Germany)
 
 import re
+import binascii
 from bdutil import abstract
 from data import Section
+from elf import ElfError
+from toolpool import ToolPool
 import scriptine
 
 class Cmd:
     """
-    Abstract command class
+    Abstract command class. Commands are run by a ToolPool (see
+    toolpool.py), which hands them their input on stdin and collects
+    their output from stdout.
     """
     def __init__(self):
         pass
 
-    def cmd_str(self):
-        """abstract: return cmd string to execute"""
+    def argv(self):
+        """abstract: return the argument list of the cmd to execute"""
         abstract()
 
     def parse_result(self):
-        """abstract: parse cmd result"""
+        """abstract: parse cmd output"""
         abstract()
 
 
@@ -55,7 +60,8 @@ class ReadelfCmd(Cmd):
     """
     def __init__(self):
         Cmd.__init__(self)
-        # readline formats sections like this:
+        # readelf -W formats sections like this, with 8 (ELF32) or 16
+        # (ELF64) address digits and at least 6 offset and size digits:
         #   [Nr] Name Type Addr Off Size ES Flg Lk Inf Al
         self.section_re = re.compile("(\s*)"            # leading spaces
                                    + "\[([\s\d].*)\]"   # number in brackets
@@ -64,33 +70,30 @@ class ReadelfCmd(Cmd):
                                    + "\s+"              # spaces in between
                                    + "(\w+)"            # type
                                    + "\s+"              # spaces in between
-                                   + "([0-9a-f]{8})"    # start addr
+                                   + "([0-9a-f]{8,16})" # start addr
                                    + "\s+"              # spaces in between
-                                   + "([0-9a-f]{6})"    # offset in file
+                                   + "([0-9a-f]{6,})"   # offset in file
                                    + "\s+"              # spaces in between
-                                   + "([0-9a-f]{6})"    # size
+                                   + "([0-9a-f]{6,})"   # size
                                    + "\s+"              # spaces in between
                                    + "([0-9a-f]{2})"    # ES
                                    + "(.*)")            # rest
 
         self.nondigit_re = re.compile("(\D+)")
 
-    def cmd_str(self, binaryfile, tmpfile):
+    def argv(self, binaryfile):
         """
         Generate call to readelf extracting segment list
         """
-        cmd = "readelf -S %s > %s" % (binaryfile, tmpfile)
-        return cmd
+        return ["readelf", "-S", "-W", binaryfile]
 
 
-    def parse_result(self, tmpfile):
-        """Scan readelf result for start and size of .text segment"""
+    def parse_result(self, output):
+        """Scan readelf output for start and size of .text segment"""
 
         retlist = []
 
-        lines = file(tmpfile).readlines()
-
-        for line in lines:
+        for line in output.splitlines():
             match = self.section_re.match(line.strip())
             if match:
                 name  = match.groups()[2]
@@ -107,6 +110,93 @@ class ReadelfCmd(Cmd):
         return retlist
 
 
+class ReadelfHeaderCmd(Cmd):
+    """
+    readelf call extracting the ELF header's class and machine
+    """
+    def __init__(self):
+        Cmd.__init__(self)
+        self.field_re = re.compile("\s*(Class|Machine):\s+(.*)")
+
+    def argv(self, binaryfile):
+        """
+        Generate call to readelf printing the ELF header
+        """
+        return ["readelf", "-h", binaryfile]
+
+    def parse_result(self, output):
+        """Decoder mode (32 or 64) for the file's code"""
+        fields = {}
+        for line in output.splitlines():
+            match = self.field_re.match(line)
+            if match:
+                fields[match.group(1)] = match.group(2).strip()
+
+        machine = fields.get("Machine", "")
+        if "X86-64" in machine:
+            return 64
+        if "80386" in machine:
+            return 32
+        if fields.get("Class") == "ELF64":
+            return 64
+        return 32
+
+
+class ReadelfSymbolsCmd(Cmd):
+    """
+    readelf call listing the symbol tables, for the function ranges
+    """
+    def __init__(self):
+        Cmd.__init__(self)
+        #   Num: Value Size Type Bind Vis Ndx Name
+        self.symbol_re = re.compile("\s*\d+:\s+([0-9a-f]+)\s+(\w+)\s+FUNC"
+                                    "\s+\w+\s+\w+\s+(\w+)")
+
+    def argv(self, binaryfile):
+        """
+        Generate call to readelf printing all symbols
+        """
+        return ["readelf", "-s", "-W", binaryfile]
+
+    def parse_result(self, output):
+        """(start, end) addresses of all defined, sized function symbols"""
+        ranges = []
+        for line in output.splitlines():
+            match = self.symbol_re.match(line)
+            if match is None or match.group(3) == "UND":
+                continue
+            start = int(match.group(1), 16)
+            # sizes are decimal, large ones hex with 0x
+            size = int(match.group(2), 0)
+            if size > 0:
+                ranges += [(start, start + size)]
+        return ranges
+
+
+class ReadelfFramesCmd(Cmd):
+    """
+    readelf call dumping .eh_frame, for the address ranges of its FDEs
+    """
+    def __init__(self):
+        Cmd.__init__(self)
+        self.fde_re = re.compile(".* FDE .*pc=([0-9a-f]+)\.\.([0-9a-f]+)")
+
+    def argv(self, binaryfile):
+        """
+        Generate call to readelf dumping the call frame information
+        """
+        return ["readelf", "--debug-dump=frames", binaryfile]
+
+    def parse_result(self, output):
+        """(start, end) addresses of all FDEs"""
+        ranges = []
+        for line in output.splitlines():
+            match = self.fde_re.match(line)
+            if match:
+                ranges += [(int(match.group(1), 16), int(match.group(2), 16))]
+        return ranges
+
+
 class ObjdumpCmd(Cmd):
     """
     Objdump command class
@@ -115,24 +205,21 @@ class ObjdumpCmd(Cmd):
         Cmd.__init__(self)
         self.byte4_re = re.compile("([a-f0-9]{2})" + "([a-f0-9][a-f0-9])?"*3)
 
-    def cmd_str(self, start_addr, segment_size, binaryfile, tmpfile):
+    def argv(self, start_addr, segment_size, binaryfile):
         """
         Generate call to objdump extracting bytes between start and start+size
         """
-        cmd = "objdump -s "
-        cmd += "--start-address=0x%08x " % start_addr
-        cmd += "--stop-address=0x%08x " % (start_addr+segment_size)
-        cmd += "%s >%s" % (binaryfile, tmpfile)
-        return cmd
+        return ["objdump", "-s",
+                "--start-address=0x%08x" % start_addr,
+                "--stop-address=0x%08x" % (start_addr+segment_size),
+                binaryfile]
 
 
-    def parse_result(self, tmpfile):
+    def parse_result(self, output):
         """Extract the opcode bytes from objdump's output stream"""
-        stream = []
-
-        tmpf = file(tmpfile)
+        hexdata = []
 
-        for line in tmpf.readlines():
+        for line in output.splitlines():
             _bytes = line.split()
 
             # Strip unneeded output:
@@ -146,34 +233,188 @@ class ObjdumpCmd(Cmd):
             for data in _bytes[1:5]:
                 match = self.byte4_re.match(data)
                 if match:
-                    for byte in match.groups():
-                        if byte != "" and byte is not None:
-                            stream += [byte]
+                    hexdata += [match.group(0)]
                 else: 
                     pass
 
+        return bytearray(binascii.unhexlify("".join(hexdata)))
+
+
+class ToolsReader:
+    """
+    Section reader using readelf/objdump (the shell-tool-based backend).
+    Provides the same interface as elf.ElfFile.
+    """
+    def __init__(self, filename, pool=None):
+        self.filename = filename
+        self.pool = pool or ToolPool(1)
+
+    def __run(self, argv, what):
+        """Output of a tool, raising ElfError if it fails"""
+        (res, output) = self.pool.run(argv)
+        if res != 0:
+            raise ElfError("%s error" % what)
+        return output
+
+    @property
+    def mode(self):
+        """
+        Run readelf -h on the file to find the decoder mode for its code
+        """
+        readelf = ReadelfHeaderCmd()
+        return readelf.parse_result(self.__run(readelf.argv(self.filename),
+                                               "readelf"))
+
+    def executable_sections(self):
+        """
+        Run readelf -S on the file to find the executable sections
+        """
+        readelf = ReadelfCmd()
+        return readelf.parse_result(self.__run(readelf.argv(self.filename),
+                                               "readelf"))
+
+    def function_ranges(self):
+        """
+        Run readelf -s and readelf --debug-dump=frames on the file to find
+        the address ranges of its function symbols and FDEs
+        """
+        ranges = []
+        for readelf in (ReadelfSymbolsCmd(), ReadelfFramesCmd()):
+            ranges += readelf.parse_result(self.__run(
+                readelf.argv(self.filename), "readelf"))
+        ranges.sort()
+        return ranges
+
+    def section_data(self, section):
+        """
+        Use (start, size) to objdump the section and extract its bytes
+        """
+        objdump = ObjdumpCmd()
+        stream = objdump.parse_result(self.__run(
+            objdump.argv(section.start, section.size, self.filename),
+            "objdump"))
+
+        scriptine.log.info("Stream bytes: %d, real size %d", len(stream),
+                           section.size)
+        # we must have extracted all bytes
+        if len(stream) != section.size:
+            raise ElfError("Size mismatch: %d <-> %d" % (len(stream),
+                                                         section.size))
         return stream
 
+    def close(self):
+        """Nothing to release"""
+        pass
+
 
 class UDCLICmd(Cmd):
     """
-    Command for the UDCLI disassembler
+    Command for the UDCLI disassembler, decoding mode (32 or 64) bit code.
+    Windows are piped into udcli as hex text. disassemble_many() decodes
+    many windows in one udcli run, several runs in flight at once.
     """
-    def __init__(self):
+    name = "udcli"
+    version = 1
+
+    def __init__(self, mode=32, pool=None):
         Cmd.__init__(self)
+        if mode not in (32, 64):
+            raise ValueError("Unsupported decoder mode: %s" % mode)
+        self.mode = mode
+        self.pool = pool or ToolPool()
 
-    def cmd_str(self, data, tmpfile):
+    def argv(self, offsets=False):
         """
-        Generate call to UDCLI disassembler
+        Generate call to UDCLI disassembler, reading hex bytes from stdin
+        and printing each instruction's offset if offsets is set
         """
-        cmd = "echo %s |  udcli -x -32 -noff -nohex >%s" % (data, tmpfile)
-        return cmd
+        argv = ["udcli", "-x", "-%d" % self.mode, "-nohex"]
+        if not offsets:
+            argv += ["-noff"]
+        return argv
 
-    def parse_result(self):
+    def parse_result(self, output):
+        """
+        Return the disassembly as a list of instruction strings
+        """
+        return [l.strip() for l in output.splitlines()]
+
+    def parse_batch(self, output, bounds):
+        """
+        Split the output of a run with offsets into the instruction
+        strings of each window, given the (start, end) offsets of the
+        windows in the run's input
         """
-        We don't do anything with the UDCLI result on stdout so far
+        lines = [[] for _bound in bounds]
+        num = 0
+        for line in output.splitlines():
+            fields = line.split(None, 1)
+            if not fields:
+                continue
+            offset = int(fields[0], 16)
+            while num < len(bounds) and offset >= bounds[num][1]:
+                num += 1
+            if num == len(bounds):
+                break
+            if offset >= bounds[num][0]:
+                lines[num] += [len(fields) > 1 and fields[1].strip() or ""]
+        return lines
+
+    def disassemble(self, data):
+        """
+        Disassemble a byte string, one text line per instruction
+        """
+        (res, output) = self.pool.run(self.argv(), _hex(data))
+        if res != 0:
+            print "ERROR: ", " ".join(self.argv()), res
+        return self.parse_result(output)
+
+    def disassemble_many(self, windows):
+        """
+        Disassemble a list of byte strings, returns a list of instruction
+        string lists, the same disassemble() gives for each of them.
+
+        The windows are decoded back to back in as many udcli runs as
+        the pool runs at once, each window followed by BATCH_PADDING nops:
+        an instruction running past the end of its window ends within
+        them, and the nops behind it bring the decoder back in step for
+        the next window. Such an instruction is what ends the window's
+        disassembly either way, truncated or not, so the verdicts on the
+        windows stay the same.
+        """
+        per_run = max(1, (len(windows) + self.pool.size - 1) /
+                      self.pool.size)
+        jobs = []
+        bounds = []
+        for first in range(0, len(windows), per_run):
+            parts = []
+            run_bounds = []
+            offset = 0
+            for window in windows[first:first + per_run]:
+                run_bounds += [(offset, offset + len(window))]
+                parts += [str(window), BATCH_PADDING]
+                offset += len(window) + len(BATCH_PADDING)
+            jobs += [(self.argv(offsets=True), _hex("".join(parts)))]
+            bounds += [run_bounds]
+
+        results = []
+        for ((res, output), run_bounds) in zip(self.pool.map(jobs), bounds):
+            if res != 0:
+                print "ERROR: ", " ".join(self.argv(offsets=True)), res
+            results += self.parse_batch(output, run_bounds)
+        return results
+
+    def cleanup(self):
+        """
+        Nothing to clean up, no temp files are used
         """
         pass
 
 
+# separates windows decoded in one udcli run: longer than any instruction
+BATCH_PADDING = "\x90" * 15
+
 
+def _hex(data):
+    """data as udcli -x input"""
+    return "".join(["%02x " % b for b in bytearray(data)]) + "\n"
@@ -29,14 +29,25 @@ Data used by ROPCheck
 
 from bdutil import Colors
 
+def _hex_or_int(value):
+    """Convert a hex string (or an integer) to an integer"""
+    if isinstance(value, basestring):
+        return int(value, 16)
+    return value
+
+
 class Section:
     """
     Represents a binary section
+
+    start and size are either integers or hex strings as printed by
+    readelf. offset is the section's file offset, if known.
     """
-    def __init__(self, name, start, size):
+    def __init__(self, name, start, size, offset=None):
         self.__name = name
-        self.__start = int(start, 16)
-        self.__size = int(size, 16)
+        self.__start = _hex_or_int(start)
+        self.__size = _hex_or_int(size)
+        self.__offset = offset
 
     def dump(self):
         """
@@ -61,6 +72,11 @@ class Section:
         """Section size"""
         return self.__size
 
+    @property
+    def offset(self):
+        """Section offset in file (None if unknown)"""
+        return self.__offset
+
 
     @property
     def end(self):
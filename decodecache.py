@@ -0,0 +1,138 @@
+"""
+In-memory decode verdict cache used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import glob
+import marshal
+
+# default bound for the number of cached windows
+DEFAULT_DECODE_CACHE_SIZE = 256 * 1024
+
+
+class DecodeCache:
+    """
+    Bounded LRU map from sequence bytes (everything from a candidate start
+    up to and including the terminator) to the sequence's validity. Scans
+    for a TerminatorTable key the bytes together with the terminator's
+    length, as (bytes, length).
+
+    Verdicts depend on the decoder and on the terminator, both are part of
+    the cache's tag. Files written for another tag are ignored on load.
+
+    LRU order is approximated with two generations of plain dicts: new and
+    recently used entries live in the young one, when it is full it
+    becomes the old generation and the previous old one is dropped. This
+    keeps lookups as cheap as a dict lookup, which matters because the
+    native decoder is only a few times slower than that.
+    """
+    def __init__(self, tag, max_entries=DEFAULT_DECODE_CACHE_SIZE):
+        self.tag = tag
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.__young = {}
+        self.__old = {}
+
+    def __len__(self):
+        return len(self.__young) + len(self.__old)
+
+    def get(self, window):
+        """
+        Cached verdict for window, None if unknown
+        """
+        verdict = self.__young.get(window)
+        if verdict is None:
+            verdict = self.__old.get(window)
+            if verdict is None:
+                self.misses += 1
+                return None
+            # recently used again, keep it alive
+            self.put(window, verdict)
+        self.hits += 1
+        return verdict
+
+    def put(self, window, verdict):
+        """
+        Remember the verdict for window, dropping the least recently used
+        generation if the cache is full
+        """
+        self.__young[window] = verdict
+        if len(self.__young) >= (self.max_entries + 1) / 2:
+            self.__old = self.__young
+            self.__young = {}
+
+    def items(self):
+        """All (window, verdict) pairs, least recently used first"""
+        entries = self.__old.copy()
+        entries.update(self.__young)
+        return entries.items()
+
+    def load(self, path):
+        """
+        Warm-start from a file written by save(), plus any per-worker
+        parts of it. Returns the number of loaded entries.
+        """
+        loaded = 0
+        for filename in [path] + self.__parts(path):
+            if not os.path.isfile(filename):
+                continue
+            dumpfile = open(filename, "rb")
+            try:
+                (tag, entries) = marshal.load(dumpfile)
+            except (EOFError, ValueError, TypeError):
+                tag = None
+            dumpfile.close()
+            if tag != self.tag:
+                continue
+            for (window, verdict) in entries:
+                self.put(window, verdict)
+                loaded += 1
+        return loaded
+
+    def save(self, path):
+        """
+        Write all entries to path
+        """
+        dumpfile = open(path + ".tmp", "wb")
+        marshal.dump((self.tag, self.items()), dumpfile)
+        dumpfile.close()
+        os.rename(path + ".tmp", path)
+
+    def merge_parts(self, path):
+        """
+        Fold the per-worker part files (path.<pid>) into this cache and
+        remove them
+        """
+        self.load(path)
+        for filename in self.__parts(path):
+            os.remove(filename)
+
+    def __parts(self, path):
+        """Per-worker part files of path"""
+        return sorted(glob.glob(path + ".[0-9]*"))
@@ -0,0 +1,95 @@
+"""
+Disassembler backends used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+from cmd import UDCLICmd
+from x86 import X86Decoder
+
+# All backends provide disassemble(data) -> list of instruction strings
+DECODERS = { X86Decoder.name : X86Decoder,
+             UDCLICmd.name   : UDCLICmd }
+
+DEFAULT_DECODER = X86Decoder.name
+
+# Fixed corpus for comparing backends: compiler epilogues, prefixed and
+# multi-byte instructions, operands containing C3 and undefined opcodes
+PARITY_CORPUS = [
+    "5dc3",
+    "5b5e5f5dc3",
+    "8b45085dc3",
+    "83c41c5b5e5f5dc3",
+    "8d65f45b5e5f5dc3",
+    "c9c3",
+    "f3c3",
+    "66c3",
+    "b8c3000000c3",
+    "8b80c3000000c3",
+    "e8c3c3c3c3c3",
+    "0fb6c05dc3",
+    "0f1f8000000000c3",
+    "660f1f440000c3",
+    "8d742600c3",
+    "ffe0c3ffd0c3",
+    "c20800c3",
+    "d9e8ddd8c3",
+    "f0ff00c3",
+    "2e8b00c3",
+    "678b00c3",
+    "0f0bc3",
+    "ffffc3",
+    "c4c0c3",
+    "0f3800c1c3",
+    "0f3a0fc108c3",
+    "a1c3c3c3c3c3",
+    "9ac3c3c3c3c3c3c3",
+    "c8c3c3c3c3",
+    "31c0405b5dc3",
+    "06c31fc3",
+    "0ec316c317c3",
+    "ecc3edc3",
+    "eec3efc3",
+    "0fa8c30fa9c3",
+]
+
+
+def get_decoder(name=DEFAULT_DECODER, mode=32):
+    """
+    Instantiate the disassembler backend registered as name, decoding
+    mode (32 or 64) bit code
+    """
+    try:
+        backend = DECODERS[name]
+    except KeyError:
+        raise ValueError("Unknown decoder '%s', use one of: %s" %
+                         (name, ", ".join(sorted(DECODERS.keys()))))
+    return backend(mode=mode)
+
+
+def decoder_tag(decoder):
+    """Backend, version and mode of a decoder, as used in cache keys"""
+    return "%s-%d-x%d" % (decoder.name, decoder.version, decoder.mode)
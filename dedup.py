@@ -0,0 +1,229 @@
+"""
+Corpus-wide gadget deduplication used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import heapq
+import struct
+import hashlib
+import itertools
+import tempfile
+from array import array
+
+# fingerprints are kept in arrays of C unsigned longs, 64 bit wide on
+# 64 bit Unix systems; elsewhere they are cut down to fit
+FINGERPRINT_TYPE = "L"
+FINGERPRINT_BITS = min(64, array(FINGERPRINT_TYPE).itemsize * 8)
+COUNT_TYPE = "I"
+
+# default bound on the fingerprints held in memory, in MB
+DEFAULT_DEDUP_MEMORY = 256
+# entries read from a run file at once
+READ_CHUNK = 65536
+
+
+def fingerprint(data):
+    """
+    Fingerprint of a sequence's bytes: the first FINGERPRINT_BITS bits of
+    their MD5 digest, so it reads like the start of the MD5 hex digest
+    """
+    head = struct.unpack(">Q", hashlib.md5(data).digest()[:8])[0]
+    return head >> (64 - FINGERPRINT_BITS)
+
+
+def _run_entries(fps_path, counts_path):
+    """Yields the (fingerprint, binaries) entries of a run on disk"""
+    fps_file = open(fps_path, "rb")
+    counts_file = open(counts_path, "rb")
+    try:
+        while True:
+            fps = array(FINGERPRINT_TYPE)
+            counts = array(COUNT_TYPE)
+            try:
+                fps.fromfile(fps_file, READ_CHUNK)
+            except EOFError:
+                # a short last chunk still holds what could be read
+                pass
+            if len(fps) == 0:
+                return
+            try:
+                counts.fromfile(counts_file, len(fps))
+            except EOFError:
+                raise IOError("%s: truncated run file" % counts_path)
+            for entry in itertools.izip(fps, counts):
+                yield entry
+    finally:
+        fps_file.close()
+        counts_file.close()
+
+
+def _merged(sources):
+    """
+    Merge streams of (fingerprint, binaries) entries sorted by
+    fingerprint, adding up the binaries of equal fingerprints
+    """
+    current = None
+    total = 0
+    for (fp, count) in heapq.merge(*sources):
+        if fp != current:
+            if current is not None:
+                yield (current, total)
+            current = fp
+            total = 0
+        total += count
+    if current is not None:
+        yield (current, total)
+
+
+class GadgetCounter:
+    """
+    Counts the distinct gadgets of a corpus and how many binaries each
+    one occurs in, by fingerprint (see fingerprint()).
+
+    Each binary's set of fingerprints is added at once. They are kept as
+    sorted arrays, FINGERPRINT_BITS/8 bytes per fingerprint; once they
+    take more than max_memory MB they are merged into a sorted run of
+    (fingerprint, binaries) entries on disk, in tmpdir. results() merges
+    the runs, so memory stays bounded however large the corpus is.
+    """
+    def __init__(self, max_memory=DEFAULT_DEDUP_MEMORY, tmpdir=None):
+        itemsize = array(FINGERPRINT_TYPE).itemsize
+        self.max_entries = max(1, max_memory * 1024 * 1024 / itemsize)
+        self.tmpdir = tmpdir
+        self.binaries = 0
+        self.entries = 0
+        self.__pending = []
+        self.__pending_entries = 0
+        self.__runs = []
+
+    def add_binary(self, fingerprints):
+        """Account for the set of fingerprints found in one binary"""
+        fps = array(FINGERPRINT_TYPE, sorted(fingerprints))
+        self.binaries += 1
+        self.entries += len(fps)
+        self.__pending += [fps]
+        self.__pending_entries += len(fps)
+        if self.__pending_entries > self.max_entries:
+            self.__spill()
+
+    @property
+    def runs(self):
+        """Number of runs written to disk so far"""
+        return len(self.__runs)
+
+    def __pending_sources(self):
+        """Entry streams of the binaries kept in memory"""
+        return [itertools.izip(fps, itertools.repeat(1))
+                for fps in self.__pending]
+
+    def __spill(self):
+        """Merge the binaries kept in memory into a run on disk"""
+        paths = []
+        for suffix in (".fps", ".counts"):
+            (fd, path) = tempfile.mkstemp(prefix="ropscan-dedup-",
+                                          suffix=suffix, dir=self.tmpdir)
+            os.close(fd)
+            paths += [path]
+        self.__runs += [tuple(paths)]
+
+        fps_file = open(paths[0], "wb")
+        counts_file = open(paths[1], "wb")
+        fps = array(FINGERPRINT_TYPE)
+        counts = array(COUNT_TYPE)
+        for (fp, count) in _merged(self.__pending_sources()):
+            fps.append(fp)
+            counts.append(count)
+            if len(fps) == READ_CHUNK:
+                fps.tofile(fps_file)
+                counts.tofile(counts_file)
+                fps = array(FINGERPRINT_TYPE)
+                counts = array(COUNT_TYPE)
+        fps.tofile(fps_file)
+        counts.tofile(counts_file)
+        fps_file.close()
+        counts_file.close()
+        self.__pending = []
+        self.__pending_entries = 0
+
+    def results(self):
+        """
+        Yields: a (fingerprint, binaries) tuple per distinct gadget, in
+        order of fingerprints
+        """
+        sources = [_run_entries(fps, counts) for (fps, counts) in self.__runs]
+        return _merged(sources + self.__pending_sources())
+
+    def summarize(self, stream=None):
+        """
+        Count the distinct gadgets, writing a "fingerprint binaries" line
+        per gadget to stream if given.
+
+        Returns: (number of distinct gadgets, dict mapping a number of
+        binaries to the number of gadgets found in that many binaries)
+        """
+        unique = 0
+        histogram = {}
+        digits = FINGERPRINT_BITS / 4
+        for (fp, count) in self.results():
+            unique += 1
+            histogram[count] = histogram.get(count, 0) + 1
+            if stream is not None:
+                stream.write("%0*x %d\n" % (digits, fp, count))
+        return (unique, histogram)
+
+    def close(self):
+        """Remove the runs on disk"""
+        for paths in self.__runs:
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        self.__runs = []
+        self.__pending = []
+        self.__pending_entries = 0
+
+
+def histogram_buckets(histogram):
+    """
+    Group a histogram of summarize() into power of two ranges of
+    binaries: 1, 2, 3-4, 5-8, ...
+
+    Returns: list of (lowest, highest, gadgets) tuples
+    """
+    buckets = []
+    low = 1
+    high = 1
+    top = max(histogram.keys() or [0])
+    while low <= top:
+        gadgets = sum([num for (count, num) in histogram.items()
+                       if low <= count <= high])
+        if gadgets:
+            buckets += [(low, high, gadgets)]
+        (low, high) = (high + 1, high * 2)
+    return buckets
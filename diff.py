@@ -0,0 +1,268 @@
+"""
+Gadget set comparison used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import heapq
+import tempfile
+from array import array
+from itertools import izip
+from dedup import fingerprint, FINGERPRINT_TYPE
+
+"""
+A gadget is identified by its file, the fingerprint of its bytes (see
+dedup.py) and its start address. Both gadget sets are turned into
+streams of (file, fingerprint, address, gadget id) entries sorted in
+this order, which a single merge pass compares: per file and
+fingerprint, gadgets at the same address are unchanged, the others are
+paired up in address order as relocated, and what is left over was
+added or removed.
+"""
+
+# default bound on the entries of one side held in memory, in MB
+DEFAULT_DIFF_MEMORY = 256
+# bytes an entry takes in a sorted run: four array items
+ENTRY_SIZE = 4 * array(FINGERPRINT_TYPE).itemsize
+# gadgets read from a database, and sorted into a run, at once
+READ_BLOCK = 65536
+# entries read from a run file at once
+READ_CHUNK = 65536
+
+
+def file_ids(old_db, new_db, same_file=False):
+    """
+    Ids to compare the files of two gadget databases by: files are
+    matched by base name, the gadgets of a file without a counterpart
+    can only be added or removed. With same_file, the single files of
+    two databases holding one file each are compared whatever their
+    names.
+
+    Returns: (list of file ids per section of old_db, same for new_db)
+    """
+    if same_file and len(set(old_db.files)) <= 1 and \
+       len(set(new_db.files)) <= 1:
+        return ([0] * len(old_db.files), [0] * len(new_db.files))
+    names = sorted(set([os.path.basename(name or "")
+                        for name in old_db.files + new_db.files]))
+    ids = dict([(name, num) for (num, name) in enumerate(names)])
+    return ([ids[os.path.basename(name or "")] for name in old_db.files],
+            [ids[os.path.basename(name or "")] for name in new_db.files])
+
+
+def _array_entries(run):
+    """
+    Iterator over the (file, fingerprint, address, gadget id) entries of a
+    run held in an array, four items per entry
+    """
+    items = iter(run)
+    return izip(items, items, items, items)
+
+
+def _unpacked(keys):
+    """Yields the entries of a sorted list of packed keys"""
+    for key in keys:
+        yield (key >> 160, (key >> 96) & 0xffffffffffffffff,
+               (key >> 32) & 0xffffffffffffffff, key & 0xffffffff)
+
+
+def _run_entries(path):
+    """Yields the entries of a run on disk"""
+    infile = open(path, "rb")
+    try:
+        while True:
+            chunk = array(FINGERPRINT_TYPE)
+            try:
+                chunk.fromfile(infile, 4 * READ_CHUNK)
+            except EOFError:
+                # a short last chunk still holds what could be read
+                pass
+            if len(chunk) == 0:
+                return
+            for entry in _array_entries(chunk):
+                yield entry
+    finally:
+        infile.close()
+
+
+class SortedGadgets:
+    """
+    The gadgets of a GadgetDB (see gadgetdb.py) as entries sorted by file
+    (see file_ids()), fingerprint and address. Every READ_BLOCK gadgets
+    are sorted into a run held as an array of ENTRY_SIZE bytes per entry;
+    once more than max_memory MB of runs are held, they are merged into a
+    run on disk, in tmpdir. entries() merges all runs, so memory stays
+    bounded however large the database.
+    """
+    def __init__(self, gadget_db, files, max_memory=DEFAULT_DIFF_MEMORY,
+                 tmpdir=None):
+        self.tmpdir = tmpdir
+        self.max_entries = max(1, max_memory * 1024 * 1024 / ENTRY_SIZE)
+        self.__runs = []
+        self.__pending = []
+        self.__pending_entries = 0
+
+        gid = 0
+        while gid < len(gadget_db):
+            # only the entries of one block are held as longs, which sort
+            # faster than tuples
+            keys = []
+            for (sid, start, data) in gadget_db.sequences(gid, READ_BLOCK):
+                keys.append((((files[sid] << 64 | fingerprint(data)) << 64 |
+                              start) << 32) | gid)
+                gid += 1
+            keys.sort()
+            run = array(FINGERPRINT_TYPE)
+            for entry in _unpacked(keys):
+                run.extend(entry)
+            self.__pending += [run]
+            self.__pending_entries += len(keys)
+            if self.__pending_entries >= self.max_entries:
+                self.__spill()
+
+    @property
+    def runs(self):
+        """Number of runs written to disk"""
+        return len(self.__runs)
+
+    def __spill(self):
+        """Merge the runs held in memory into a run on disk"""
+        (fd, path) = tempfile.mkstemp(prefix="ropscan-diff-", suffix=".run",
+                                      dir=self.tmpdir)
+        os.close(fd)
+        self.__runs += [path]
+        outfile = open(path, "wb")
+        chunk = array(FINGERPRINT_TYPE)
+        for entry in heapq.merge(*[_array_entries(run)
+                                   for run in self.__pending]):
+            chunk.extend(entry)
+            if len(chunk) >= 4 * READ_CHUNK:
+                chunk.tofile(outfile)
+                chunk = array(FINGERPRINT_TYPE)
+        chunk.tofile(outfile)
+        outfile.close()
+        self.__pending = []
+        self.__pending_entries = 0
+
+    def entries(self):
+        """
+        Yields: (file, fingerprint, start address, gadget id) per gadget,
+        sorted
+        """
+        sources = [_run_entries(path) for path in self.__runs]
+        return heapq.merge(*(sources + [_array_entries(run)
+                                        for run in self.__pending]))
+
+    def close(self):
+        """Remove the runs on disk"""
+        for path in self.__runs:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.__runs = []
+        self.__pending = []
+        self.__pending_entries = 0
+
+
+def _take_group(entry, entries):
+    """
+    The entries of entry's file and fingerprint, starting with entry,
+    and the entry following them in entries (None at their end)
+    """
+    group = [entry]
+    following = next(entries, None)
+    while following is not None and following[1] == entry[1] and \
+            following[0] == entry[0]:
+        group += [following]
+        following = next(entries, None)
+    return (group, following)
+
+
+def diff_entries(old, new):
+    """
+    Compare two sorted entry streams (see SortedGadgets.entries()).
+
+    Yields: (change, old entry, new entry) tuples, change is one of
+    "unchanged", "relocated", "added" (old entry None) and "removed" (new
+    entry None), by file and fingerprint
+    """
+    old = iter(old)
+    new = iter(new)
+    old_entry = next(old, None)
+    new_entry = next(new, None)
+    while old_entry is not None and new_entry is not None:
+        if old_entry[:2] < new_entry[:2]:
+            yield ("removed", old_entry, None)
+            old_entry = next(old, None)
+        elif new_entry[:2] < old_entry[:2]:
+            yield ("added", None, new_entry)
+            new_entry = next(new, None)
+        else:
+            (old_group, old_entry) = _take_group(old_entry, old)
+            (new_group, new_entry) = _take_group(new_entry, new)
+            if len(old_group) == 1 and len(new_group) == 1:
+                # the common case, a gadget found once in both
+                if old_group[0][2] == new_group[0][2]:
+                    yield ("unchanged", old_group[0], new_group[0])
+                else:
+                    yield ("relocated", old_group[0], new_group[0])
+                continue
+            for change in _diff_group(old_group, new_group):
+                yield change
+    while old_entry is not None:
+        yield ("removed", old_entry, None)
+        old_entry = next(old, None)
+    while new_entry is not None:
+        yield ("added", None, new_entry)
+        new_entry = next(new, None)
+
+
+def _diff_group(old, new):
+    """Compare the entries of one file and fingerprint, sorted by address"""
+    moved_old = []
+    moved_new = []
+    (i, j) = (0, 0)
+    while i < len(old) and j < len(new):
+        if old[i][2] == new[j][2]:
+            yield ("unchanged", old[i], new[j])
+            i += 1
+            j += 1
+        elif old[i][2] < new[j][2]:
+            moved_old += [old[i]]
+            i += 1
+        else:
+            moved_new += [new[j]]
+            j += 1
+    moved_old += old[i:]
+    moved_new += new[j:]
+    for (old_entry, new_entry) in zip(moved_old, moved_new):
+        yield ("relocated", old_entry, new_entry)
+    for old_entry in moved_old[len(moved_new):]:
+        yield ("removed", old_entry, None)
+    for new_entry in moved_new[len(moved_old):]:
+        yield ("added", None, new_entry)
@@ -0,0 +1,371 @@
+"""
+Native ELF reader used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import mmap
+import struct
+from data import Section
+
+ELF_MAGIC   = "\x7fELF"
+ELFCLASS32  = 1
+ELFCLASS64  = 2
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+# e_machine values and the decoder mode for their code
+EM_386    = 3
+EM_X86_64 = 62
+MACHINE_MODES = { EM_386 : 32, EM_X86_64 : 64 }
+
+SHT_SYMTAB     = 2
+SHT_NOBITS     = 8
+SHT_DYNSYM     = 11
+SHF_EXECINSTR  = 0x4
+STT_FUNC       = 2
+SHN_UNDEF      = 0
+ET_CORE        = 4
+PT_LOAD        = 1
+PF_X           = 0x1
+
+# (e_shoff, e_shentsize, e_shnum, e_shstrndx) live at these offsets
+EHDR_FORMAT = { ELFCLASS32 : ("I", 32, "HHH", 46),
+                ELFCLASS64 : ("Q", 40, "HHH", 58) }
+
+# sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size
+SHDR_FORMAT = { ELFCLASS32 : "IIIIII",
+                ELFCLASS64 : "IIQQQQ" }
+
+# (e_phoff, e_phentsize, e_phnum) live at these offsets
+PHDR_TABLE = { ELFCLASS32 : ("I", 28, "HH", 42),
+               ELFCLASS64 : ("Q", 32, "HH", 54) }
+
+# program header format and the positions of p_type, p_flags, p_offset,
+# p_vaddr and p_filesz in it
+PHDR_FORMAT = { ELFCLASS32 : ("IIIIIIII", (0, 6, 1, 2, 4)),
+                ELFCLASS64 : ("IIQQQQQQ", (0, 1, 2, 3, 5)) }
+
+
+# symbol table entries: format and the positions of st_value, st_size,
+# st_info and st_shndx in it
+SYM_FORMAT = { ELFCLASS32 : ("IIIBBH", (1, 2, 3, 5)),
+               ELFCLASS64 : ("IBBHQQ", (4, 5, 1, 3)) }
+
+# DW_EH_PE pointer encodings of .eh_frame: value formats of the low
+# nibble, the high nibble tells what the value is relative to
+DW_EH_PE_omit    = 0xff
+DW_EH_PE_uleb128 = 0x01
+DW_EH_PE_sleb128 = 0x09
+DW_EH_PE_pcrel   = 0x10
+EH_PE_FORMATS = { 0x02 : "H", 0x03 : "I", 0x04 : "Q",
+                  0x0a : "h", 0x0b : "i", 0x0c : "q" }
+
+
+class ElfError(Exception):
+    """
+    Raised for files that are no (supported) ELF files
+    """
+    pass
+
+
+class SectionHeader:
+    """
+    Raw ELF section header
+    """
+    def __init__(self, index, name, shtype, flags, addr, offset, size):
+        self.index = index
+        self.name = name
+        self.type = shtype
+        self.flags = flags
+        self.addr = addr
+        self.offset = offset
+        self.size = size
+
+    @property
+    def executable(self):
+        """Section contains instructions that are present in the file"""
+        return (self.flags & SHF_EXECINSTR) != 0 and self.type != SHT_NOBITS
+
+
+class ElfFile:
+    """
+    Memory-mapped ELF32/ELF64 file. Section contents are handed out as
+    zero-copy views of the mapping.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            self.__file = open(filename, "rb")
+        except (IOError, OSError), err:
+            raise ElfError("%s: %s" % (filename, err.strerror))
+        try:
+            self.__map = mmap.mmap(self.__file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except (mmap.error, ValueError):
+            self.__file.close()
+            raise ElfError("%s: cannot map file" % filename)
+
+        if self.__map[:4] != ELF_MAGIC:
+            self.close()
+            raise ElfError("%s: not an ELF file" % filename)
+
+        self.elfclass = ord(self.__map[4])
+        if self.elfclass not in EHDR_FORMAT:
+            self.close()
+            raise ElfError("%s: unknown ELF class %d" % (filename,
+                                                         self.elfclass))
+
+        if ord(self.__map[5]) == ELFDATA2MSB:
+            self.endian = ">"
+        else:
+            self.endian = "<"
+
+        (self.elftype, self.machine) = self.__unpack("HH", 16)
+        self.__headers = self.__read_section_headers()
+
+    def __unpack(self, fmt, offset):
+        """Unpack fmt at file offset using the file's byte order"""
+        fmt = self.endian + fmt
+        if offset + struct.calcsize(fmt) > len(self.__map):
+            raise ElfError("%s: truncated ELF file" % self.filename)
+        return struct.unpack_from(fmt, self.__map, offset)
+
+    def __read_section_headers(self):
+        """Parse the section header table"""
+        (off_fmt, off_pos, cnt_fmt, cnt_pos) = EHDR_FORMAT[self.elfclass]
+        (shoff,) = self.__unpack(off_fmt, off_pos)
+        (shentsize, shnum, shstrndx) = self.__unpack(cnt_fmt, cnt_pos)
+
+        raw = []
+        for idx in range(shnum):
+            raw += [self.__unpack(SHDR_FORMAT[self.elfclass],
+                                  shoff + idx * shentsize)]
+
+        names = None
+        if shstrndx < len(raw):
+            names = raw[shstrndx]
+
+        headers = []
+        for idx, (name, shtype, flags, addr, offset, size) in enumerate(raw):
+            if names is not None:
+                name = self.__string(names[4] + name)
+            else:
+                name = ""
+            headers += [SectionHeader(idx, name, shtype, flags, addr,
+                                      offset, size)]
+        return headers
+
+    def __string(self, offset):
+        """NUL-terminated string at file offset"""
+        end = self.__map.find("\0", offset)
+        if end < 0:
+            end = len(self.__map)
+        return self.__map[offset:end]
+
+    @property
+    def bits(self):
+        """32 for ELF32, 64 for ELF64 files"""
+        return 32 if self.elfclass == ELFCLASS32 else 64
+
+    @property
+    def mode(self):
+        """
+        Decoder mode (32 or 64) for the file's code, from e_machine, so
+        x32 files count as 64 bit code. Other machines go by ELF class.
+        """
+        return MACHINE_MODES.get(self.machine, self.bits)
+
+    @property
+    def section_headers(self):
+        """All section headers"""
+        return self.__headers
+
+    def executable_sections(self):
+        """
+        Return a Section for every SHF_EXECINSTR section with file contents
+        """
+        retlist = []
+        for hdr in self.__headers:
+            if hdr.executable and hdr.size > 0:
+                retlist += [Section(hdr.name, hdr.addr, hdr.size, hdr.offset)]
+        return retlist
+
+    def executable_segments(self):
+        """
+        Return a Section for every executable PT_LOAD segment with file
+        contents, for files without (useful) section headers such as core
+        dumps
+        """
+        (off_fmt, off_pos, cnt_fmt, cnt_pos) = PHDR_TABLE[self.elfclass]
+        (phoff,) = self.__unpack(off_fmt, off_pos)
+        (phentsize, phnum) = self.__unpack(cnt_fmt, cnt_pos)
+        (fmt, fields) = PHDR_FORMAT[self.elfclass]
+
+        retlist = []
+        for idx in range(phnum):
+            raw = self.__unpack(fmt, phoff + idx * phentsize)
+            (ptype, flags, offset, vaddr, filesz) = [raw[i] for i in fields]
+            if ptype == PT_LOAD and flags & PF_X and filesz > 0:
+                retlist += [Section("load%d" % idx, vaddr, filesz, offset)]
+        return retlist
+
+    def function_ranges(self):
+        """
+        Address ranges (start, end) of the functions the file describes:
+        those of its function symbols (.symtab and .dynsym) and of the FDEs
+        of its .eh_frame, sorted and possibly overlapping
+        """
+        ranges = []
+        (fmt, fields) = SYM_FORMAT[self.elfclass]
+        entsize = struct.calcsize(self.endian + fmt)
+        for hdr in self.__headers:
+            if hdr.type not in (SHT_SYMTAB, SHT_DYNSYM):
+                continue
+            for idx in range(hdr.size / entsize):
+                raw = self.__unpack(fmt, hdr.offset + idx * entsize)
+                (value, size, info, shndx) = [raw[i] for i in fields]
+                if info & 0xf == STT_FUNC and size > 0 and \
+                   shndx != SHN_UNDEF:
+                    ranges += [(value, value + size)]
+        for hdr in self.__headers:
+            if hdr.name == ".eh_frame" and hdr.type != SHT_NOBITS:
+                ranges += self.__fde_ranges(hdr)
+        ranges.sort()
+        return ranges
+
+    def __fde_ranges(self, hdr):
+        """(start, end) address ranges of the FDEs in an .eh_frame"""
+        ranges = []
+        encodings = {}
+        pos = hdr.offset
+        end = min(hdr.offset + hdr.size, len(self.__map))
+        while pos + 4 <= end:
+            (length,) = self.__unpack("I", pos)
+            entry = pos + 4
+            if length == 0:
+                break
+            if length == 0xffffffff:
+                (length,) = self.__unpack("Q", entry)
+                entry += 8
+            following = entry + length
+            if following > end:
+                break
+            (cie_id,) = self.__unpack("I", entry)
+            if cie_id == 0:
+                encodings[pos] = self.__cie_encoding(entry + 4)
+            else:
+                cie = entry - cie_id
+                if cie not in encodings:
+                    encodings[cie] = self.__cie_encoding(cie + 8)
+                encoding = encodings[cie]
+                field = entry + 4
+                (start, field) = self.__eh_pointer(encoding, field, hdr)
+                (size, field) = self.__eh_pointer(encoding & 0x0f, field, hdr)
+                if start is not None and size:
+                    ranges += [(start, start + size)]
+            pos = following
+        return ranges
+
+    def __cie_encoding(self, pos):
+        """FDE pointer encoding of the CIE whose version byte is at pos"""
+        (version,) = self.__unpack("B", pos)
+        augmentation = self.__string(pos + 1)
+        pos += 2 + len(augmentation)
+        if not augmentation.startswith("z"):
+            return 0
+        # code and data alignment factors, return address register
+        (_value, pos) = self.__leb128(pos)
+        (_value, pos) = self.__leb128(pos)
+        if version == 1:
+            pos += 1
+        else:
+            (_value, pos) = self.__leb128(pos)
+        (_length, pos) = self.__leb128(pos)
+        for kind in augmentation[1:]:
+            if kind == "R":
+                return self.__unpack("B", pos)[0]
+            elif kind == "P":
+                (encoding,) = self.__unpack("B", pos)
+                (_value, pos) = self.__eh_pointer(encoding, pos + 1, None)
+            elif kind == "L":
+                pos += 1
+            elif kind not in "SB":
+                break
+        return 0
+
+    def __leb128(self, pos, signed=False):
+        """(value, next position) of the LEB128 number at pos"""
+        value = 0
+        shift = 0
+        while True:
+            (byte,) = self.__unpack("B", pos)
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if byte & 0x80 == 0:
+                break
+        if signed and byte & 0x40:
+            value -= 1 << shift
+        return (value, pos)
+
+    def __eh_pointer(self, encoding, pos, hdr):
+        """
+        (value, next position) of a pointer with a DW_EH_PE encoding at
+        file offset pos of section hdr; the value is None for encodings
+        that cannot be resolved from the file alone
+        """
+        if encoding == DW_EH_PE_omit:
+            return (None, pos)
+        low = encoding & 0x0f
+        if low == DW_EH_PE_uleb128:
+            (value, following) = self.__leb128(pos)
+        elif low == DW_EH_PE_sleb128:
+            (value, following) = self.__leb128(pos, True)
+        else:
+            fmt = EH_PE_FORMATS.get(low, "I" if self.bits == 32 else "Q")
+            (value,) = self.__unpack(fmt, pos)
+            following = pos + struct.calcsize(fmt)
+        high = encoding & 0x70
+        if high == DW_EH_PE_pcrel and hdr is not None:
+            value += hdr.addr + pos - hdr.offset
+        elif high != 0:
+            return (None, following)
+        return (value & ((1 << self.bits) - 1), following)
+
+    def section_data(self, section):
+        """
+        Zero-copy view of the section's bytes
+        """
+        if section.offset + section.size > len(self.__map):
+            raise ElfError("%s: section %s exceeds file size" %
+                           (self.filename, section.name))
+        return buffer(self.__map, section.offset, section.size)
+
+    def close(self):
+        """Unmap and close the file"""
+        self.__map.close()
+        self.__file.close()
@@ -0,0 +1,439 @@
+"""
+On-disk gadget database used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import mmap
+import json
+import zlib
+import array
+import bisect
+import struct
+import binascii
+import tempfile
+from data import Section
+from decoder import get_decoder
+from terminators import terminator_table
+
+"""
+File layout (little endian, every part starts 8-byte aligned):
+
+  header    magic, then (meta size, gadgets, blob size, hash buckets)
+  meta      JSON: section table (file, name, start, size, blob offset,
+            decoder mode), the terminator kinds, maximum sequence length
+            and classify flag of the scan, and the struct formats of the
+            eight columns
+  end       Q[n]  address of the terminator's last byte, the primary
+                  (sorted) order
+  start     Q[n]  address of the first byte
+  blob      Q[n]  offset of the first byte in the byte blob
+  section   H[n]  index into the section table
+  length    H[n]  bytes in front of the terminator's last byte
+  by_start  I[n]  gadget ids sorted by start address
+  buckets   I[b+1] hash index: first entry of every bucket
+  entries   I[n]  hash index: gadget ids grouped by bucket
+  bytes     the section contents the blob offsets point into
+
+Gadget bytes are hashed with CRC-32 into b (a power of two) buckets.
+Version 1 databases lack the column formats in the meta; their blob and
+length columns are I[n] and B[n].
+"""
+
+DB_MAGIC = "ROPDB\x02\x00\x00"
+DB_MAGIC_V1 = "ROPDB\x01\x00\x00"
+DB_HEADER = struct.Struct("<8sQQQQ")
+# struct formats of the columns end to entries
+DB_COLUMNS = "QQQHHIII"
+DB_COLUMNS_V1 = "QQIHBIII"
+# longest sequence the length column holds
+MAX_LENGTH = 0xffff
+
+
+def _align(size):
+    """Round size up to the next multiple of 8"""
+    return (size + 7) & ~7
+
+
+def parse_bytes(text):
+    """
+    Normalize a byte pattern given as hex ("5d c3", "5dc3", "\\x5d\\xc3")
+    into a raw string
+    """
+    hexdigits = text.lower().replace("\\x", "").replace("0x", "")
+    hexdigits = "".join(hexdigits.split())
+    try:
+        return binascii.unhexlify(hexdigits)
+    except TypeError:
+        raise ValueError("Invalid byte pattern '%s'" % text)
+
+
+def bytes_hash(data):
+    """Hash used by the byte-pattern index"""
+    return zlib.crc32(data) & 0xffffffff
+
+
+class _Column:
+    """
+    Read-only sequence view of one fixed-width column of a mapped file,
+    usable with bisect
+    """
+    def __init__(self, buf, offset, fmt, count):
+        self.__buf = buf
+        self.__offset = offset
+        self.__item = struct.Struct("<" + fmt)
+        self.__count = count
+
+    def __len__(self):
+        return self.__count
+
+    def __getitem__(self, idx):
+        if idx < 0 or idx >= self.__count:
+            raise IndexError(idx)
+        return self.__item.unpack_from(self.__buf, self.__offset +
+                                       idx * self.__item.size)[0]
+
+    def values(self, first=0, count=None):
+        """
+        count entries (default: all from first on) at once, much faster
+        than one by one
+        """
+        if count is None:
+            count = self.__count - first
+        count = max(0, min(count, self.__count - first))
+        return struct.unpack_from("<%d%s" % (count, self.__item.format[1:]),
+                                  self.__buf,
+                                  self.__offset + first * self.__item.size)
+
+
+class GadgetDBWriter:
+    """
+    Collects sections and the (offset, length) tuples found in them and
+    writes a gadget database. Per gadget only a few bytes of columns are
+    held in memory; section bytes are spooled to a temporary file.
+    terminators is the TerminatorTable of the scan, None for RET scans.
+    numbytes and classify are the scan's maximum sequence length and
+    whether its sequences were filtered by a GadgetClassifier, regions the
+    policy its candidates were pruned by (see regions.py); a later scan
+    using the database as baseline needs them.
+    """
+    def __init__(self, terminators=None, numbytes=None, classify=False,
+                 regions="all"):
+        if numbytes is not None and numbytes > MAX_LENGTH:
+            raise ValueError("Sequences of up to %d bytes do not fit a "
+                             "gadget database" % numbytes)
+        self.terminators = None
+        if terminators is not None:
+            self.terminators = terminators.name
+        self.numbytes = numbytes
+        self.classify = classify
+        self.regions = regions
+        self.sections = []
+        self.__spool = tempfile.TemporaryFile()
+        self.__blob_size = 0
+        self.__offsets = array.array("I")
+        self.__lengths = array.array("H")
+        self.__sids = array.array("H")
+
+    def __len__(self):
+        return len(self.__offsets)
+
+    def add_section(self, section, data, filename=None, mode=32):
+        """
+        Add a section (see data.py) with its bytes, decoded as mode (32 or
+        64) bit code, returns its id
+        """
+        if len(self.sections) == 0xffff:
+            raise ValueError("Too many sections for one gadget database")
+        if len(data) > 0xffffffff:
+            raise ValueError("Section %s too large for a gadget database" %
+                             section.name)
+        self.sections += [{"file" : filename, "name" : section.name,
+                           "start" : section.start, "size" : len(data),
+                           "blob" : self.__blob_size, "mode" : mode}]
+        self.__spool.write(str(data))
+        self.__blob_size += len(data)
+        return len(self.sections) - 1
+
+    def record(self, sid, locations):
+        """
+        Add the (offset, length) tuples of section sid. locations may be a
+        generator; yields every tuple after recording it.
+        """
+        for (offset, length) in locations:
+            self.__offsets.append(offset)
+            self.__lengths.append(length)
+            self.__sids.append(sid)
+            yield (offset, length)
+
+    def add(self, sid, locations):
+        """Add a list of (offset, length) tuples of section sid"""
+        for _loc in self.record(sid, locations):
+            pass
+
+    def write(self, path):
+        """
+        Sort, index and write the database to path
+        """
+        count = len(self.__offsets)
+        sections = self.sections
+        ends = [sections[self.__sids[i]]["start"] + self.__offsets[i]
+                for i in xrange(count)]
+        order = sorted(xrange(count),
+                       key=lambda i: (ends[i], self.__lengths[i]))
+
+        end_col = [ends[i] for i in order]
+        len_col = [self.__lengths[i] for i in order]
+        sid_col = [self.__sids[i] for i in order]
+        start_col = [end_col[i] - len_col[i] for i in xrange(count)]
+        blob_col = [sections[sid_col[i]]["blob"] +
+                    self.__offsets[order[i]] - len_col[i]
+                    for i in xrange(count)]
+        by_start = sorted(xrange(count), key=lambda i: start_col[i])
+
+        # hash index in CSR layout
+        nbuckets = 1
+        while nbuckets < count:
+            nbuckets *= 2
+        self.__spool.flush()
+        blob = mmap.mmap(self.__spool.fileno(), 0, access=mmap.ACCESS_READ) \
+            if self.__blob_size > 0 else ""
+        hashes = [bytes_hash(blob[blob_col[i]:blob_col[i] + len_col[i] + 1])
+                  % nbuckets for i in xrange(count)]
+        buckets = [0] * (nbuckets + 1)
+        for bucket in hashes:
+            buckets[bucket + 1] += 1
+        for bucket in xrange(nbuckets):
+            buckets[bucket + 1] += buckets[bucket]
+        entries = sorted(xrange(count), key=lambda i: hashes[i])
+
+        meta = json.dumps({"sections" : sections,
+                           "terminators" : self.terminators,
+                           "numbytes" : self.numbytes,
+                           "classify" : self.classify,
+                           "regions" : self.regions,
+                           "columns" : DB_COLUMNS})
+        outfile = open(path + ".tmp", "wb")
+        outfile.write(DB_HEADER.pack(DB_MAGIC, len(meta), count,
+                                     self.__blob_size, nbuckets))
+        outfile.write(meta.ljust(_align(len(meta)), "\0"))
+        for (fmt, column) in zip(DB_COLUMNS,
+                                 [end_col, start_col, blob_col, sid_col,
+                                  len_col, by_start, buckets, entries]):
+            packed = struct.pack("<%d%s" % (len(column), fmt), *column)
+            outfile.write(packed.ljust(_align(len(packed)), "\0"))
+        self.__spool.seek(0)
+        while True:
+            chunk = self.__spool.read(1024 * 1024)
+            if chunk == "":
+                break
+            outfile.write(chunk)
+        outfile.close()
+        if self.__blob_size > 0:
+            blob.close()
+        os.rename(path + ".tmp", path)
+
+    def close(self):
+        """Drop the spooled section bytes"""
+        self.__spool.close()
+
+
+class GadgetDB:
+    """
+    Memory-mapped gadget database written by GadgetDBWriter. Lookups only
+    touch the pages they need, so opening and querying even large
+    databases is cheap.
+    """
+    def __init__(self, path):
+        self.path = path
+        dbfile = open(path, "rb")
+        try:
+            self.__map = mmap.mmap(dbfile.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except (mmap.error, ValueError):
+            dbfile.close()
+            raise ValueError("%s: not a gadget database" % path)
+        dbfile.close()
+
+        if len(self.__map) < DB_HEADER.size:
+            raise ValueError("%s: not a gadget database" % path)
+        (magic, metalen, count, blobsize, nbuckets) = \
+            DB_HEADER.unpack_from(self.__map, 0)
+        if magic not in (DB_MAGIC, DB_MAGIC_V1):
+            raise ValueError("%s: not a gadget database" % path)
+
+        pos = DB_HEADER.size
+        meta = json.loads(self.__map[pos:pos + metalen])
+        pos += _align(metalen)
+        self.sections = [Section(str(sec["name"]), sec["start"], sec["size"])
+                         for sec in meta["sections"]]
+        self.files = [sec["file"] for sec in meta["sections"]]
+        self.modes = [sec.get("mode", 32) for sec in meta["sections"]]
+        self.terminators = None
+        if meta.get("terminators"):
+            self.terminators = str(meta["terminators"])
+        # None for databases written before they were recorded
+        self.numbytes = meta.get("numbytes")
+        self.classify = meta.get("classify", False)
+        self.regions = str(meta.get("regions", "all"))
+        # mode -> (TerminatorTable, decoder)
+        self.__tables = {}
+        self.__blob_offsets = [sec["blob"] for sec in meta["sections"]]
+
+        columns = []
+        formats = str(meta.get("columns", DB_COLUMNS_V1))
+        if len(formats) != 8:
+            raise ValueError("%s: not a gadget database" % path)
+        for (fmt, entries) in zip(formats, [count, count, count, count,
+                                            count, count, nbuckets + 1,
+                                            count]):
+            columns += [_Column(self.__map, pos, fmt, entries)]
+            pos += _align(struct.calcsize("<" + fmt) * entries)
+        (self.__end, self.__start, self.__blob, self.__sid, self.__length,
+         self.__by_start, self.__buckets, self.__entries) = columns
+        self.__bytes = pos
+        self.__nbuckets = nbuckets
+        if pos + blobsize > len(self.__map):
+            raise ValueError("%s: truncated gadget database" % path)
+
+    def __len__(self):
+        return len(self.__end)
+
+    def gadget(self, gid):
+        """
+        Gadget gid as (start address, length, Section, file, bytes)
+        """
+        length = self.__length[gid]
+        offset = self.__bytes + self.__blob[gid]
+        sid = self.__sid[gid]
+        return (self.__start[gid], length, self.sections[sid],
+                self.files[sid], self.__map[offset:offset + length + 1])
+
+    def section_data(self, sid):
+        """Contents of section sid"""
+        offset = self.__bytes + self.__blob_offsets[sid]
+        return self.__map[offset:offset + self.sections[sid].size]
+
+    def section_locations(self):
+        """
+        The gadgets of all sections as (offset, length) tuples relative
+        to their section, in database order, as a list per section id
+        """
+        ends = self.__end.values()
+        sids = self.__sid.values()
+        lengths = self.__length.values()
+        starts = [sec.start for sec in self.sections]
+        locations = [[] for _sec in self.sections]
+        for gid in xrange(len(ends)):
+            sid = sids[gid]
+            locations[sid] += [(ends[gid] - starts[sid], lengths[gid])]
+        return locations
+
+    def locations(self):
+        """
+        (section ids, terminator end addresses, lengths) of all gadgets,
+        each in gadget id order
+        """
+        return (self.__sid.values(), self.__end.values(),
+                self.__length.values())
+
+    def sequences(self, first=0, count=None):
+        """
+        (section id, start address, bytes) of count gadgets (default: all
+        from first on) in gadget id order
+        """
+        sids = self.__sid.values(first, count)
+        starts = self.__start.values(first, count)
+        blobs = self.__blob.values(first, count)
+        lengths = self.__length.values(first, count)
+        base = self.__bytes
+        blob = self.__map
+        return [(sids[i], starts[i],
+                 blob[base + blobs[i]:base + blobs[i] + lengths[i] + 1])
+                for i in xrange(len(sids))]
+
+    def mode(self, gid):
+        """Decoder mode (32 or 64) of gadget gid"""
+        return self.modes[self.__sid[gid]]
+
+    def terminator(self, data, mode=32):
+        """Terminator kind of a gadget given by its bytes and mode"""
+        if self.terminators is None:
+            return "ret"
+        if mode not in self.__tables:
+            self.__tables[mode] = (terminator_table(self.terminators, mode),
+                                   get_decoder(mode=mode))
+        (table, decoder) = self.__tables[mode]
+        return table.kind_of(data, decoder)
+
+    def ending_at(self, address):
+        """
+        Ids of all gadgets whose terminator ends at address (the RET for
+        plain RET scans), shortest first
+        """
+        lo = bisect.bisect_left(self.__end, address)
+        hi = bisect.bisect_right(self.__end, address)
+        return range(lo, hi)
+
+    def starting_at(self, address):
+        """Ids of all gadgets whose first byte is at address"""
+        starts = _StartView(self.__start, self.__by_start)
+        lo = bisect.bisect_left(starts, address)
+        hi = bisect.bisect_right(starts, address)
+        return sorted([self.__by_start[i] for i in range(lo, hi)])
+
+    def with_bytes(self, data):
+        """Ids of all gadgets consisting of exactly the bytes data"""
+        if self.__nbuckets == 0 or len(self) == 0:
+            return []
+        bucket = bytes_hash(data) % self.__nbuckets
+        ret = []
+        for i in xrange(self.__buckets[bucket], self.__buckets[bucket + 1]):
+            gid = self.__entries[i]
+            if self.__length[gid] + 1 != len(data):
+                continue
+            offset = self.__bytes + self.__blob[gid]
+            if self.__map[offset:offset + len(data)] == data:
+                ret += [gid]
+        return sorted(ret)
+
+    def close(self):
+        """Unmap the database"""
+        self.__map.close()
+
+
+class _StartView:
+    """Start addresses in by_start order, for bisect"""
+    def __init__(self, start, by_start):
+        self.__start = start
+        self.__by_start = by_start
+
+    def __len__(self):
+        return len(self.__by_start)
+
+    def __getitem__(self, idx):
+        return self.__start[self.__by_start[idx]]
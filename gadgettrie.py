@@ -0,0 +1,149 @@
+"""
+Backward gadget trie used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+class GadgetTrie:
+    """
+    Backward trie of all instruction sequences ending in one terminator.
+
+    The window holds the bytes in front of the terminator followed by the
+    terminator itself. Every byte position is a node: its instruction is
+    decoded once and links to the node right behind it, so all sequences
+    sharing a suffix share the already validated nodes. A node is valid if
+    its chain of instructions runs into the terminator exactly, without
+    another terminator on the way. This gives the same verdicts as
+    disassembling each window [pos, terminator] on its own.
+
+    Nodes whose instruction runs into or past the terminator are pruned.
+    Bytes that do not decode are not: like udis86 did for the per-window
+    scan, the decoder turns them into an 'invalid' instruction, and the
+    node stays valid if the rest of its chain is. Pruning them here would
+    change the (offset, length) list that scan_section relies on. Scans
+    with a classifier drop these sequences as 'invalid' (see classify.py).
+
+    With a DecodeCache, a node whose bytes up to the terminator have been
+    seen before takes its verdict from the cache without decoding. With a
+    TerminatorTable the same bytes may end in terminators of different
+    lengths with different verdicts, so the key also holds the length.
+
+    Instead of a terminator_str, a TerminatorTable (see terminators.py)
+    may describe the terminators. The window then ends in a terminator of
+    terminator_len bytes, and every instruction matching the table counts
+    as terminator.
+    """
+    def __init__(self, decoder, window, terminator_str, cache=None,
+                 terminators=None, terminator_len=1):
+        self.code = bytearray(window)
+        self.root = len(self.code) - terminator_len
+        self.end = len(self.code)
+        self.decodes = 0
+        self.__decoder = decoder
+        self.__terminator = terminator_str
+        self.__terminators = terminators
+        if terminators is None:
+            self.__head = terminator_str.split()[0]
+        self.__insns = [None] * self.end
+        self.__valid = [False] * self.end
+
+        # the terminator has no successor, everything else links to
+        # already decided nodes behind it
+        if cache is None:
+            for pos in range(self.root, -1, -1):
+                self.__valid[pos] = self.__grow(pos)
+            return
+
+        raw = str(window)
+        for pos in range(self.root, -1, -1):
+            key = raw[pos:]
+            if terminators is not None:
+                key = (key, terminator_len)
+            verdict = cache.get(key)
+            if verdict is None:
+                verdict = self.__grow(pos)
+                cache.put(key, verdict)
+            self.__valid[pos] = verdict
+
+    def __grow(self, pos):
+        """Decode the instruction at pos and decide the node's validity"""
+        insn = self.__decoder.decode(self.code, pos, self.end)
+        self.decodes += 1
+        self.__insns[pos] = insn
+
+        if self.__terminators is not None:
+            if self.__terminators.match(self.code, pos, self.end):
+                # the terminator may only show up as final instruction,
+                # and it has to be the root (plus prefixes)
+                for byte in self.code[pos:self.root]:
+                    if byte not in self.__terminators.prefixes:
+                        return False
+                return insn.end == self.end
+        elif insn.mnemonic == self.__head and str(insn) == self.__terminator:
+            # the terminator may only show up as final instruction
+            return insn.end == self.end
+        if insn.end >= self.end:
+            # ran into (or past) the end without terminating
+            return False
+        return self.__valid[insn.end]
+
+    def accepts(self, length):
+        """
+        Check if the sequence starting length bytes before the terminator
+        is valid
+        """
+        return self.__valid[self.root - length]
+
+    def lengths(self):
+        """
+        All valid sequence lengths, shortest first
+        """
+        return [i for i in range(1, self.root + 1) if self.accepts(i)]
+
+    def instructions(self, length):
+        """
+        The decoded instructions of the sequence starting length bytes
+        before the terminator
+        """
+        ret = []
+        pos = self.root - length
+        while pos < self.end:
+            insn = self.instruction(pos)
+            ret += [insn]
+            pos = insn.end
+        return ret
+
+    def instruction(self, pos):
+        """
+        The decoded instruction at byte position pos of the window
+        """
+        insn = self.__insns[pos]
+        if insn is None:
+            # verdict came from the cache, decode on demand
+            insn = self.__decoder.decode(self.code, pos, self.end)
+            self.__insns[pos] = insn
+        return insn
@@ -0,0 +1,212 @@
+"""
+Incremental rescans against a previous gadget database used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import re
+import instrument
+from regions import covers
+from terminators import MAX_TERMINATOR_LEN
+
+"""
+What a RET candidate at idx yields only depends on the bytes around it:
+the numbytes-1 bytes in front of it the scan decodes (fewer close to the
+section start) and the bytes of the terminator. Each candidate's
+dependency window is therefore a content-defined chunk. If the new
+section has a candidate whose window holds the same bytes as one of the
+baseline's, its sequences are the baseline's moved by the offset delta;
+all other candidates are rescanned. This gives exactly the sequences of
+a full rescan, whether code was changed in place or shifted around.
+"""
+
+
+def candidates(data, numbytes, terminators=None, ranges=None):
+    """
+    Yields (idx, end, key) for every candidate of a scan of data: its
+    position, the offset of its terminator's last byte and the contents
+    of its dependency window together with idx's position in it. With
+    ranges (see regions.py), only candidates within them are scanned.
+    """
+    if terminators is None:
+        pattern = re.compile("\xc3")
+    else:
+        pattern = terminators.pattern
+    size = len(data)
+    for match in pattern.finditer(data):
+        idx = match.start()
+        if idx == 0:
+            # the scan skips these, see OpcodeStream.iter_sequences()
+            continue
+        if ranges is not None and not covers(ranges, idx):
+            continue
+        if terminators is None:
+            (end, high) = (idx, idx + 1)
+        else:
+            found = terminators.match(data, idx, size)
+            if found is None:
+                continue
+            end = idx + found[1] - 1
+            high = min(size, idx + MAX_TERMINATOR_LEN)
+        low = 0
+        if idx > numbytes:
+            low = idx - numbytes + 1
+        yield (idx, end, (data[low:high], idx - low))
+
+
+class Baseline:
+    """
+    A GadgetDB (see gadgetdb.py) of an earlier scan whose sequences are
+    reused for the unchanged parts of sections scanned again. It can only
+    stand in for a scan with the same maximum sequence length and
+    terminators, and not for an unfiltered scan if its sequences were
+    filtered by a classifier. Its candidates must not have been pruned
+    (see regions.py), those of the new scan may be.
+    """
+    def __init__(self, db, numbytes, terminators=None, classify=False):
+        self.db = db
+        self.numbytes = numbytes
+        self.terminators = terminators
+        self.classify = classify
+        self.__locations = None
+
+    def unusable(self):
+        """Reason why the baseline cannot be used, None if it can"""
+        if self.db.numbytes is None:
+            return "it does not record the scan's parameters"
+        if self.db.numbytes != self.numbytes:
+            return "it was scanned with --numbytes=%d" % self.db.numbytes
+        name = "ret"
+        if self.terminators is not None:
+            name = self.terminators.name
+        if (self.db.terminators or "ret") != name:
+            return "it was scanned for other terminators"
+        if self.db.classify and not self.classify:
+            return "its sequences were filtered by --classify"
+        if self.db.regions != "all":
+            return "its candidates were pruned by --regions=%s" % \
+                self.db.regions
+        return None
+
+    def find(self, section, mode, filename=None):
+        """
+        Id of the baseline's section to compare section (of mode bit
+        code) with, preferring one of the same file name; None if there
+        is none
+        """
+        found = None
+        for (sid, sec) in enumerate(self.db.sections):
+            if sec.name != section.name or self.db.modes[sid] != mode:
+                continue
+            basename = self.db.files[sid] and \
+                os.path.basename(self.db.files[sid])
+            if filename is not None and basename == os.path.basename(filename):
+                return sid
+            if found is None:
+                found = sid
+        return found
+
+    def rescan(self, sid, ostream, decoder, cache=None, classifier=None,
+               ranges=None):
+        """
+        Scan the OpcodeStream of a section, reusing the sequences of
+        baseline section sid for every candidate whose window is
+        unchanged. With a GadgetClassifier, reused sequences of an
+        unfiltered baseline are filtered and all are cataloged. With
+        ranges (see regions.py), only the candidates within them count.
+
+        Yields: the (offset, length) tuples a full scan would, in the
+        same order
+        """
+        if self.__locations is None:
+            self.__locations = self.db.section_locations()
+        old = self.db.section_data(sid)
+
+        # sequence lengths per terminator end, shortest first
+        old_lengths = {}
+        for (offset, length) in self.__locations[sid]:
+            if offset in old_lengths:
+                old_lengths[offset] += [length]
+            else:
+                old_lengths[offset] = [length]
+        # window -> terminator end of its candidate; ends shared by two
+        # candidates cannot be told apart, those are rescanned
+        windows = {}
+        owners = {}
+        for (_idx, end, key) in candidates(old, self.numbytes,
+                                           self.terminators):
+            owners[end] = owners.get(end, 0) + 1
+            windows[key] = end
+        for (key, end) in windows.items():
+            if owners[end] > 1:
+                del windows[key]
+
+        profile = instrument.current()
+        reused = 0
+        rescanned = 0
+        pending = None
+        for (idx, end, key) in candidates(ostream.stream, self.numbytes,
+                                          self.terminators, ranges):
+            old_end = windows.get(key)
+            if old_end is None:
+                if pending is None:
+                    pending = idx
+                rescanned += 1
+                continue
+            if pending is not None:
+                for loc in self.__scan(ostream, decoder, pending, idx, cache,
+                                       classifier, ranges):
+                    yield loc
+                pending = None
+            reused += 1
+            for length in old_lengths.get(old_end, []):
+                if classifier is not None and \
+                   not classifier.select(classifier.classify(
+                       ostream.window(end, length))):
+                    continue
+                yield (end, length)
+        if pending is not None:
+            for loc in self.__scan(ostream, decoder, pending, None, cache,
+                                   classifier, ranges):
+                yield loc
+
+        self.reused = reused
+        self.rescanned = rescanned
+        if profile is not None:
+            profile.count("reused candidates", reused)
+            profile.count("rescanned candidates", rescanned)
+
+    def __scan(self, ostream, decoder, start, end, cache, classifier,
+               ranges=None):
+        """Scan the candidates in [start, end) of ostream within ranges"""
+        opcode_str = "ret"
+        return ostream.iter_sequences(byte_offs=self.numbytes,
+                                      opcode_str=opcode_str,
+                                      decoder=decoder, start=start, end=end,
+                                      progress=False, cache=cache,
+                                      terminators=self.terminators,
+                                      classifier=classifier, ranges=ranges)
@@ -0,0 +1,163 @@
+"""
+Phase timers and counters used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import json
+import time
+
+# phases in the order of the scan pipeline, others are listed after them
+PHASES = ["extract", "regions", "cache", "search", "decode", "classify",
+          "dedup", "output"]
+
+# the clock of all timers
+timer = time.time
+
+# the Profile of this process, None while profiling is off
+_profile = None
+
+
+class Profile:
+    """
+    Wall time and number of calls per phase (see PHASES) plus event
+    counters. Profiles of worker processes are merged into the parent's,
+    so phase times are summed over all processes.
+    """
+    def __init__(self):
+        # phase -> [calls, seconds]
+        self.timers = {}
+        self.counters = {}
+        self.started = timer()
+
+    def add(self, phase, seconds, calls=1):
+        """Account seconds spent in calls calls of phase"""
+        entry = self.timers.get(phase)
+        if entry is None:
+            self.timers[phase] = [calls, seconds]
+        else:
+            entry[0] += calls
+            entry[1] += seconds
+
+    def count(self, name, num=1):
+        """Increase counter name by num"""
+        self.counters[name] = self.counters.get(name, 0) + num
+
+    def merge(self, other):
+        """Add the timers and counters of another profile"""
+        for (phase, (calls, seconds)) in other.timers.items():
+            self.add(phase, seconds, calls)
+        for (name, num) in other.counters.items():
+            self.count(name, num)
+
+    def phases(self):
+        """Names of all timed phases in pipeline order"""
+        return [phase for phase in PHASES if phase in self.timers] + \
+            sorted([phase for phase in self.timers if phase not in PHASES])
+
+    def as_dict(self):
+        """Everything recorded, ready for JSON"""
+        return {"wall_seconds" : timer() - self.started,
+                "phases" : dict([(phase, {"calls" : calls,
+                                          "seconds" : seconds})
+                                 for (phase, (calls, seconds))
+                                 in self.timers.items()]),
+                "counters" : self.counters}
+
+    def json(self):
+        """as_dict() as JSON text"""
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def table(self):
+        """Summary table as a list of text lines"""
+        wall = max(timer() - self.started, 1e-9)
+        lines = ["%-12s %12s %10s %7s" % ("Phase", "Calls", "Seconds",
+                                          "Share")]
+        for phase in self.phases():
+            (calls, seconds) = self.timers[phase]
+            lines += ["%-12s %12d %10.3f %6.1f%%" %
+                      (phase, calls, seconds, 100.0 * seconds / wall)]
+        lines += ["%-12s %12s %10.3f" % ("wall", "", wall)]
+        for name in sorted(self.counters):
+            lines += ["%-25s %12d" % (name, self.counters[name])]
+        return lines
+
+
+def enable():
+    """Start profiling this process, returns the new Profile"""
+    global _profile
+    _profile = Profile()
+    return _profile
+
+
+def disable():
+    """Stop profiling this process"""
+    global _profile
+    _profile = None
+
+
+def current():
+    """The Profile of this process, None if profiling is off"""
+    return _profile
+
+
+def take():
+    """
+    Return the Profile recorded so far and start a new one, None if
+    profiling is off. Workers hand their profile to the parent this way.
+    """
+    global _profile
+    profile = _profile
+    if profile is not None:
+        _profile = Profile()
+    return profile
+
+
+class Progress:
+    """
+    Progress line for a stream of size bytes, redrawn at most every
+    interval seconds instead of once per RET candidate
+    """
+    def __init__(self, stream, size, interval=0.25):
+        self.stream = stream
+        self.size = max(size, 1)
+        self.interval = interval
+        self.next_update = 0
+
+    def update(self, pos):
+        """Report that the scan has reached byte pos"""
+        now = timer()
+        if now < self.next_update:
+            return
+        self.next_update = now + self.interval
+        self.stream.write("Position in stream: %02.2f%%\r" %
+                          (100.0 * (pos + 1) / self.size))
+        self.stream.flush()
+
+    def done(self):
+        """Finish the progress line"""
+        self.stream.write("\n")
+        self.stream.flush()
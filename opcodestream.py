@@ -28,48 +28,150 @@ OpcodeStream class used by ROPCheck
 #     economic rights: Technische Universitaet Dresden (Germany)
 
 import scriptine
-import os
-import hashlib
-from cmd import UDCLICmd
-from bdutil import Colors
+import sys
+import re
+import binascii
+import itertools
+from decoder import get_decoder
+from gadgettrie import GadgetTrie
+from output import TextSink
+from dedup import fingerprint
+import instrument
+from instrument import Progress, timer
+
+# number of windows of a block of candidates decided with one
+# disassemble_many() call (see iter_sequences())
+BATCH_WINDOWS = 1 << 16
 
 class OpcodeStream():
     """
     An opcode stream represents a stream of bytes that are scanned for
     valid RET sequences
+
+    The stream is any buffer of raw bytes: a str, a bytearray or a
+    zero-copy buffer() view of a memory-mapped section.
     """
     def __init__(self, bytestream):
         self.stream = bytestream
 
+    def window(self, offset, length):
+        """
+        Zero-copy view of the sequence of length bytes before offset,
+        including the byte at offset.
+        """
+        return buffer(self.stream, offset - length, length + 1)
+
     def find_sequences(self, byte_offs=20,
-                       opcode="c3", opcode_str="ret"):
+                       opcode="c3", opcode_str="ret", decoder=None,
+                       start=0, end=None, progress=True, cache=None,
+                       terminators=None, classifier=None, ranges=None):
         """
         Run through byte stream, find occurences of opcode and check if the
         corresponding disassembly for the last [1, byte_offs] bytes ends with
         a ret instruction.
 
+        See iter_sequences() for the parameters.
+
         Returns: List of (offset, length) tuples representing the valid sequences.
         """
+        return list(self.iter_sequences(byte_offs, opcode, opcode_str,
+                                        decoder, start, end, progress, cache,
+                                        terminators, classifier, ranges))
 
-        tmpfile = "foo.tmp"
-        retlist = []
+
+    def iter_sequences(self, byte_offs=20,
+                       opcode="c3", opcode_str="ret", decoder=None,
+                       start=0, end=None, progress=True, cache=None,
+                       terminators=None, classifier=None, ranges=None):
+        """
+        Generator version of find_sequences(): yields the (offset, length)
+        tuples of the valid sequences as soon as each opcode occurence has
+        been checked, in ascending order of the occurences.
+
+        decoder is the disassembler backend (see decoder.py), the native
+        in-process decoder by default.
+
+        Only occurences within [start, end) are considered, the bytes in
+        front of them are still taken from the whole stream. ranges is an
+        optional sorted list of (start, end) ranges (see regions.py) the
+        occurences must also lie in.
+
+        cache is an optional DecodeCache (see decodecache.py) remembering
+        the verdicts of sequence bytes seen before.
+
+        With a TerminatorTable (see terminators.py) as terminators, all of
+        its terminator kinds are searched for in the same pass instead of
+        opcode; this needs an in-process decoder. offset is then the last
+        byte of a sequence's terminator and length counts all bytes in
+        front of it, so window(offset, length) still covers the sequence.
+
+        With a GadgetClassifier (see classify.py), only the sequences it
+        keeps are yielded, and all of them are added to its catalog.
+
+        External decoders that can decode many windows at once (see
+        UDCLICmd.disassemble_many()) get the windows of whole blocks of
+        candidates, up to BATCH_WINDOWS of them, in a single call; the
+        sequences of a block are yielded once it has been decided.
+
+        The progress line is redrawn a few times per second at most. If
+        profiling is on (see instrument.py), the time spent searching for
+        candidates, deciding their windows and classifying is recorded,
+        not counting the time the consumer takes.
+        """
+        if decoder is None:
+            decoder = get_decoder()
 
         # we need at least one more byte than the C3 instruction,
         # so less than 2 is bad
         if (byte_offs < 2):
             scriptine.log.error("Byte offset (%d) too small.", byte_offs)
-            return retlist
-
-        scriptine.log.log("Scanning byte stream for %s instruction sequences",
-                          opcode)
+            return
+
+        if progress:
+            scriptine.log.log("Scanning byte stream for %s instruction "
+                              "sequences", opcode)
+
+        if end is None:
+            end = len(self.stream)
+
+        if terminators is not None:
+            if not hasattr(decoder, "decode"):
+                raise ValueError("Terminator classes need an in-process "
+                                 "decoder")
+            opcode_re = terminators.pattern
+        else:
+            opcode_re = re.compile(re.escape(binascii.unhexlify(opcode)))
+        batched = terminators is None and \
+            not hasattr(decoder, "decode") and \
+            hasattr(decoder, "disassemble_many")
+        block = []
+        pending = 0
+        found = False
+        profile = instrument.current()
+        if progress:
+            progress = Progress(sys.stdout, len(self.stream))
+        resumed = timer()
+
+        spans = [(start, end)]
+        if ranges is not None:
+            spans = [(max(low, start), min(high, end))
+                     for (low, high) in ranges if high > start and low < end]
 
-        # find first occurence
         try:
-            idx = self.stream.index(opcode)
-            while idx > 0:
-                streampos_str = "Position in stream: %02.2f%%" % \
-                        (100.0 * float(idx+1) / len(self.stream))
-                print streampos_str,
+            for match in itertools.chain(*[opcode_re.finditer(self.stream,
+                                                              low, high)
+                                           for (low, high) in spans]):
+                idx = match.start()
+                found = True
+                # an occurence at the very beginning has no bytes before it
+                if idx == 0:
+                    continue
+
+                if progress:
+                    progress.update(idx)
+                if profile is not None:
+                    searched = timer()
+                    profile.add("search", searched - resumed)
 
                 # if occurence is less than byte_offs bytes into the stream,
                 # adapt the limit
@@ -78,62 +180,199 @@ class OpcodeStream():
                 else:
                     limit = idx+1
 
-                # validity check sequences by disassembling
-                for i in range(1, limit):
-                    # byte string to send to disassembler
-                    byte_data = \
-                        "".join([c+' ' for c in self.stream[idx-i: idx+1]])
-
-                    udcli = UDCLICmd()
-                    cmd = udcli.cmd_str(byte_data, tmpfile)
-                    res = scriptine.shell.sh(cmd)
-                    if res != 0:
-                        print "ERROR: ", cmd, res
-
-                    # sequence is valid, if tmpfile contains opcode_str 
-                    # in the last line
-                    tmpf = file(tmpfile)
-                    lines = [l.strip() for l in tmpf.readlines()]
-
-                    # find first occurrence of RET in disassembly
-                    try:
-                        finishing_idx = lines.index(opcode_str)
-                    except ValueError: # might even have NO ret at all
-                        finishing_idx = -1
-
-                    # -> this sequence is a valid new sequence, iff RET
-                    # only occurs as the final instruction
-                    if finishing_idx == len(lines)-1:
-                        retlist += [(idx, i)]
-
-                try:
-                    idx = self.stream.index(opcode, idx+1)
-                except ValueError:
-                    idx = -1
-
-                # N chars left, 1 up
-                print("\033[%dD\033[A" % len(streampos_str))
-
-            os.remove(tmpfile)
-            print ""
-
-        except ValueError:
-            pass
+                if batched:
+                    block += [(idx, limit)]
+                    pending += limit - 1
+                    if pending >= BATCH_WINDOWS:
+                        for hit in self.__check_block(decoder, block,
+                                                      opcode_str, cache,
+                                                      classifier):
+                            yield hit
+                        block = []
+                        pending = 0
+                    if profile is not None:
+                        resumed = timer()
+                    continue
+
+                trie = None
+                if terminators is not None:
+                    (trie, hits) = self.__check_terminator(decoder, idx,
+                                                           limit, terminators,
+                                                           cache)
+                elif hasattr(decoder, "decode"):
+                    # in-process decoders can grow a backward trie, decoding
+                    # every byte position in front of the RET just once
+                    trie = GadgetTrie(decoder, self.window(idx, limit-1),
+                                      opcode_str, cache)
+                    hits = [(idx, i) for i in trie.lengths()]
+                else:
+                    hits = self.__check_windows(decoder, idx, limit,
+                                                opcode_str, cache)
+
+                if profile is not None:
+                    decided = timer()
+                    profile.add("decode", decided - searched)
+                    profile.count("candidates")
+                    if trie is not None:
+                        profile.count("decoder calls", trie.decodes)
+                    else:
+                        profile.count("windows checked", limit - 1)
+
+                if classifier is not None and hits:
+                    hits = self.__classify(classifier, hits, trie)
+                    if profile is not None:
+                        profile.add("classify", timer() - decided)
+
+                for hit in hits:
+                    yield hit
+                if profile is not None:
+                    resumed = timer()
+            if block:
+                for hit in self.__check_block(decoder, block, opcode_str,
+                                              cache, classifier):
+                    yield hit
+        finally:
+            # also runs if the consumer stops early or is interrupted
+            if found:
+                decoder.cleanup()
+                if progress:
+                    progress.done()
+
+
+    def __check_terminator(self, decoder, idx, limit, terminators, cache):
+        """
+        Grow the trie of the terminator candidate at idx, if there is one,
+        and return it along with its valid (offset, length) tuples
+        """
+        found = terminators.match(self.stream, idx, len(self.stream))
+        if found is None:
+            return (None, [])
+        size = found[1]
+        window = buffer(self.stream, idx - (limit-1), limit-1 + size)
+        trie = GadgetTrie(decoder, window, None, cache, terminators, size)
+        return (trie, [(idx + size-1, i + size-1) for i in trie.lengths()])
+
+
+    def __classify(self, classifier, hits, trie=None):
+        """
+        Classify the valid (offset, length) tuples of one terminator and
+        return those the classifier keeps. The instructions of the trie
+        the tuples come from are reused if there is one.
+        """
+        if trie is not None:
+            return classifier.filter_trie(trie, hits)
+        return [(offset, length) for (offset, length) in hits
+                if classifier.select(classifier.classify(
+                    self.window(offset, length)))]
 
 
+    def __check_windows(self, decoder, idx, limit, opcode_str, cache=None):
+        """
+        Disassemble each window [idx-i, idx] for i in [1, limit) on its own
+        and return the valid (offset, length) tuples.
+        """
+        retlist = []
+        for i in range(1, limit):
+            verdict = None
+            if cache is not None:
+                verdict = cache.get(str(self.window(idx, i)))
+            if verdict is None:
+                verdict = self.__check_window(decoder, self.window(idx, i),
+                                              opcode_str)
+                if cache is not None:
+                    cache.put(str(self.window(idx, i)), verdict)
+            if verdict:
+                retlist += [(idx, i)]
+
         return retlist
 
 
+    def __check_block(self, decoder, block, opcode_str, cache=None,
+                      classifier=None):
+        """
+        Decide the windows of a block of (idx, limit) candidates with one
+        disassemble_many() call and return the valid (offset, length)
+        tuples the classifier keeps, in the order __check_windows() gives
+        them candidate by candidate. Windows in the cache and repeated
+        windows are not decoded again.
+        """
+        profile = instrument.current()
+        if profile is not None:
+            started = timer()
+        verdicts = {}
+        todo = []
+        for (idx, limit) in block:
+            for i in range(1, limit):
+                key = str(self.window(idx, i))
+                if key in verdicts:
+                    continue
+                verdicts[key] = None
+                if cache is not None:
+                    verdicts[key] = cache.get(key)
+                if verdicts[key] is None:
+                    todo += [key]
+
+        for (key, lines) in zip(todo, decoder.disassemble_many(todo)):
+            verdicts[key] = self.__verdict(lines, opcode_str)
+            if cache is not None:
+                cache.put(key, verdicts[key])
+
+        hits = []
+        for (idx, limit) in block:
+            hits += [(idx, i) for i in range(1, limit)
+                     if verdicts[str(self.window(idx, i))]]
+
+        if profile is not None:
+            decided = timer()
+            profile.add("decode", decided - started)
+            profile.count("candidates", len(block))
+            profile.count("windows checked",
+                          sum([limit - 1 for (_idx, limit) in block]))
+            profile.count("windows decoded", len(todo))
+        if classifier is not None and hits:
+            hits = self.__classify(classifier, hits)
+            if profile is not None:
+                profile.add("classify", timer() - decided)
+        return hits
+
+
+    def __check_window(self, decoder, window, opcode_str):
+        """
+        Disassemble a single window and check that it ends in opcode_str
+        """
+        return self.__verdict(decoder.disassemble(window), opcode_str)
+
+
+    def __verdict(self, lines, opcode_str):
+        """
+        Check the disassembly of a window, one line per instruction
+        """
+        # sequence is valid, if the disassembly contains
+        # opcode_str in the last line
+
+        # find first occurrence of RET in disassembly
+        try:
+            finishing_idx = lines.index(opcode_str)
+        except ValueError: # might even have NO ret at all
+            finishing_idx = -1
+
+        # -> this sequence is a valid new sequence, iff RET
+        # only occurs as the final instruction
+        return finishing_idx == len(lines)-1
+
+
     def unique_sequences(self, locations):
         """
         Given a byte stream and a set of locations, determine how
         many unique sequences are within the stream.
+
+        The set holds the 64 bit fingerprints of the sequences (see
+        dedup.py) rather than their bytes, so sets of many sections and
+        binaries stay small and are cheap to hand between processes.
         """
         uniq_seqs = set()
         for (off, length) in locations:
-            seq = "".join(self.stream[off-length:off+1])
-            hsh = hashlib.md5(seq)
-            uniq_seqs.add(hsh.hexdigest())
+            uniq_seqs.add(fingerprint(self.window(off, length)))
 
         return uniq_seqs
 
@@ -144,15 +383,49 @@ class OpcodeStream():
 
         Note: length in (offset, length) means _before_ offset
         """
-        print " ".join(self.stream[offset:offset+length+1]),
+        data = bytearray(self.stream[offset:offset+length+1])
+        print " ".join(["%02x" % b for b in data]),
 
 
-    def dump_locations_with_offset(self, locations, start_offset):
+    def write_sequences(self, sink, locations, start_offset, filename=None,
+                        section=None, terminators=None):
         """
-        Dump all sequences with the correct address offsets
+        Write the sequences at the given (offset, length) pairs to an output
+        sink (see output.py) with the correct addresses. locations may be a
+        generator, every sequence is written as soon as it is produced.
+        With the TerminatorTable of the scan, sequences are tagged with
+        their terminator kind, else they end in RET.
+
+        Yields: the written (offset, length) pairs, so callers can keep
+        statistics without holding on to all of them
         """
+        decoder = None
+        if terminators is not None:
+            decoder = get_decoder(mode=terminators.mode)
+        kind = "ret"
+        profile = instrument.current()
         for (c3_offset, length) in locations:
-            begin = start_offset + c3_offset - length
-            print "0x%08x + %3d:  %s" % (begin, length, Colors.Cyan),
-            self.dump_byte_stream(c3_offset-length, length)
-            print "%s" % (Colors.Reset)
+            if profile is not None:
+                written = timer()
+            window = self.window(c3_offset, length)
+            if terminators is not None:
+                kind = terminators.kind_of(window, decoder)
+            sink.write(start_offset + c3_offset - length, length, window,
+                       filename, section, kind)
+            if profile is not None:
+                profile.add("output", timer() - written)
+            yield (c3_offset, length)
+
+
+    def dump_locations_with_offset(self, locations, start_offset, label=None,
+                                   mode=32):
+        """
+        Dump all sequences with the correct address offsets, each line
+        prefixed with label (e.g., the source file) if given. Addresses
+        are padded to the width of mode (32 or 64) bit addresses.
+        """
+        sink = TextSink(sys.stdout)
+        sink.address_bits = mode
+        for _loc in self.write_sequences(sink, locations, start_offset,
+                                         label):
+            pass
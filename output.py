@@ -0,0 +1,202 @@
+"""
+Gadget output sinks used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import sys
+import csv
+import json
+import struct
+import binascii
+from bdutil import Colors, abstract
+from terminators import KINDS
+
+# write buffer of file sinks
+BUFFER_SIZE = 64 * 1024
+
+# binary format: header, then one record per label change or gadget
+BINARY_MAGIC = "ROPG\x03"
+# 'L', length of the label, label ("file:section")
+BINARY_LABEL = struct.Struct("<cH")
+# 'G', address of the first byte, bytes before the terminator's last
+# byte (--numbytes may exceed 255), terminator kind (index into
+# terminators.KINDS), then the bytes
+BINARY_GADGET = struct.Struct("<cQHB")
+
+FORMATS = ["text", "jsonl", "csv", "binary"]
+
+
+class GadgetSink:
+    """
+    Destination of found sequences. Sequences are written one at a time
+    as the scan confirms them; close() flushes everything written so far.
+    address_bits is the address size of the scanned code (32 or 64).
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+        self.address_bits = 32
+
+    def write(self, address, length, data, filename=None, section=None,
+              terminator="ret"):
+        """
+        Emit one sequence: it starts at address, has length bytes in front
+        of the last byte of its terminator (of the given kind) and data
+        holds all length+1 bytes
+        """
+        abstract()
+
+    def flush(self):
+        """Push buffered output to the destination"""
+        self.stream.flush()
+
+    def close(self):
+        """Flush, and close the destination unless it is stdout"""
+        self.flush()
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+class TextSink(GadgetSink):
+    """
+    The classic colored listing: address, length and bytes per line,
+    terminators other than RET are named at the end
+    """
+    def write(self, address, length, data, filename=None, section=None,
+              terminator="ret"):
+        prefix = ""
+        if filename is not None:
+            prefix = "%s: " % filename
+        suffix = ""
+        if terminator != "ret":
+            suffix = " (%s)" % terminator
+        self.stream.write("%s0x%0*x + %3d:  %s %s %s%s\n" %
+                          (prefix, self.address_bits / 4, address, length,
+                           Colors.Cyan,
+                           " ".join(["%02x" % b for b in bytearray(data)]),
+                           Colors.Reset, suffix))
+        self.count += 1
+
+
+class JsonSink(GadgetSink):
+    """
+    JSON Lines: one object per sequence
+    """
+    def write(self, address, length, data, filename=None, section=None,
+              terminator="ret"):
+        self.stream.write(json.dumps({"file" : filename,
+                                      "section" : section,
+                                      "address" : address,
+                                      "length" : length,
+                                      "terminator" : terminator,
+                                      "bytes" : binascii.hexlify(data)},
+                                     sort_keys=True) + "\n")
+        self.count += 1
+
+
+class CsvSink(GadgetSink):
+    """
+    CSV with a header line, addresses in hex
+    """
+    def __init__(self, stream):
+        GadgetSink.__init__(self, stream)
+        self.__writer = csv.writer(stream)
+        self.__writer.writerow(["file", "section", "address", "length",
+                                "terminator", "bytes"])
+
+    def write(self, address, length, data, filename=None, section=None,
+              terminator="ret"):
+        self.__writer.writerow([filename or "", section or "",
+                                "0x%x" % address, length, terminator,
+                                binascii.hexlify(data)])
+        self.count += 1
+
+
+class BinarySink(GadgetSink):
+    """
+    Compact binary records, see BINARY_* above. Labels are only written
+    when they change.
+    """
+    def __init__(self, stream):
+        GadgetSink.__init__(self, stream)
+        self.__label = None
+        self.stream.write(BINARY_MAGIC)
+
+    def write(self, address, length, data, filename=None, section=None,
+              terminator="ret"):
+        label = "%s:%s" % (filename or "", section or "")
+        if label != self.__label:
+            self.stream.write(BINARY_LABEL.pack("L", len(label)) + label)
+            self.__label = label
+        self.stream.write(BINARY_GADGET.pack("G", address, length,
+                                             KINDS.index(terminator)))
+        self.stream.write(str(data))
+        self.count += 1
+
+
+def read_binary(stream):
+    """
+    Parse a BinarySink file.
+
+    Yields: (filename, section, address, length, data, terminator) tuples
+    """
+    if stream.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError("Not a binary gadget file")
+    (filename, section) = (None, None)
+    while True:
+        kind = stream.read(1)
+        if kind == "":
+            return
+        if kind == "L":
+            (_kind, size) = BINARY_LABEL.unpack(
+                kind + stream.read(BINARY_LABEL.size - 1))
+            (filename, section) = stream.read(size).split(":", 1)
+        elif kind == "G":
+            (_kind, address, length, term) = BINARY_GADGET.unpack(
+                kind + stream.read(BINARY_GADGET.size - 1))
+            yield (filename, section, address, length,
+                   stream.read(length + 1), KINDS[term])
+        else:
+            raise ValueError("Corrupt binary gadget file")
+
+
+SINKS = {"text" : TextSink, "jsonl" : JsonSink, "csv" : CsvSink,
+         "binary" : BinarySink}
+
+
+def open_sink(fmt="text", path=""):
+    """
+    Sink for format fmt writing to path, or to stdout if path is "" or "-"
+    """
+    if fmt not in SINKS:
+        raise ValueError("Unknown format '%s', use one of: %s" %
+                         (fmt, ", ".join(FORMATS)))
+    if path in ("", "-"):
+        stream = sys.stdout
+    else:
+        stream = open(path, "wb", BUFFER_SIZE)
+    return SINKS[fmt](stream)
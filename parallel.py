@@ -0,0 +1,399 @@
+"""
+Parallel section scanning used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import signal
+import itertools
+import multiprocessing
+import multiprocessing.util
+from decoder import get_decoder, decoder_tag
+from decodecache import DecodeCache, DEFAULT_DECODE_CACHE_SIZE
+from terminators import terminator_table, MAX_TERMINATOR_LEN
+from opcodestream import OpcodeStream
+from regions import overlapping
+from classify import GadgetClassifier, SemanticCatalog
+import instrument
+from instrument import timer
+
+# upper bound for the number of RET candidate bytes per work item
+CHUNK_SIZE = 64 * 1024
+
+# settings of a worker process as passed to _init_worker(), and its
+# (decoder, decode cache, terminator table, classifier) per decoder mode
+_worker_config = None
+_worker_contexts = {}
+
+
+def decode_cache_tag(decoder, opcode_str="ret"):
+    """Everything a cached decode verdict depends on"""
+    return "%s:%s" % (decoder_tag(decoder), opcode_str)
+
+
+def decode_cache_file(path, mode=32):
+    """
+    Warm-start file of the decode cache for mode bit code. 32 bit code
+    uses path itself, so existing cache files stay valid.
+    """
+    if mode == 32:
+        return path
+    return "%s.x%d" % (path, mode)
+
+
+def _init_worker(decoder_name, cache_file=None,
+                 cache_size=DEFAULT_DECODE_CACHE_SIZE, pooled=False,
+                 terminators=None, classify=False, profile=False):
+    """
+    Pool initializer. Pool workers leave Ctrl-C to the parent.
+
+    terminators is the name of a TerminatorTable to scan for instead of
+    plain RETs. With classify, sequences are filtered and cataloged by a
+    GadgetClassifier. With profile, pool workers record a Profile (see
+    instrument.py) and hand it back with every chunk. See
+    _worker_context() for the other parameters.
+    """
+    global _worker_config, _worker_contexts
+    _worker_config = (decoder_name, cache_file, cache_size, pooled,
+                      terminators, classify)
+    _worker_contexts = {}
+    if pooled:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if profile:
+            instrument.enable()
+
+
+def _worker_context(mode):
+    """
+    (decoder, decode cache, terminator table, classifier) of the worker
+    for mode bit
+    code, set up on first use: every worker gets its own decoder instance
+    and decode cache, warm-started from the cache file if given. Pool
+    workers write their cache to <cache file>.<pid> when they exit.
+    """
+    context = _worker_contexts.get(mode)
+    if context is not None:
+        return context
+
+    (decoder_name, cache_file, cache_size, pooled, terminators, classify) = \
+        _worker_config
+    table = None
+    tag = "ret"
+    if terminators is not None:
+        table = terminator_table(terminators, mode)
+        tag = table.name
+    decoder = get_decoder(decoder_name, mode)
+    if hasattr(decoder, "pool"):
+        # the workers already run in parallel, one tool each is enough
+        decoder.pool.size = 1
+
+    cache = None
+    if cache_size > 0:
+        cache = DecodeCache(decode_cache_tag(decoder, tag), cache_size)
+        if cache_file:
+            path = decode_cache_file(cache_file, mode)
+            cache.load(path)
+            if pooled:
+                multiprocessing.util.Finalize(
+                    None, cache.save,
+                    args=("%s.%d" % (path, os.getpid()),),
+                    exitpriority=10)
+
+    classifier = None
+    if classify:
+        classifier = GadgetClassifier(mode)
+
+    context = (decoder, cache, table, classifier)
+    _worker_contexts[mode] = context
+    return context
+
+
+def chunk_ranges(size, jobs, chunk_size=CHUNK_SIZE):
+    """
+    Split [0, size) into consecutive (start, end) candidate ranges, at least
+    one per worker for small sections
+    """
+    per_job = (size + jobs - 1) / jobs
+    step = max(1, min(chunk_size, per_job))
+    return [(start, min(start + step, size))
+            for start in range(0, size, step)]
+
+
+def make_chunks(size, numbytes, jobs, data=None, source=None,
+                chunk_size=CHUNK_SIZE, ranges=None):
+    """
+    Cut size bytes of data into work items. Each item carries the bytes of
+    its candidate range plus numbytes+1 bytes of overlap in front, so every
+    sequence ending in the range can be decoded without the rest of the
+    section, and the few bytes behind the range a terminator starting in it
+    may take.
+
+    If source is a (filename, offset) tuple telling where data lives in a
+    file, work items only reference the file and the worker reads the
+    bytes itself.
+
+    ranges are the sorted (start, end) ranges of the candidates to scan
+    (see regions.py), None for all; each item gets those reaching into
+    its candidate range.
+
+    Returns: list of (base, payload, start, end, ranges) tuples, start,
+    end and ranges are relative to base.
+    """
+    chunks = []
+    for (start, end) in chunk_ranges(size, jobs, chunk_size):
+        # one byte more than numbytes keeps limit computation in
+        # find_sequences the same as for a scan of the whole stream
+        base = max(0, start - numbytes - 1)
+        tail = min(size, end + MAX_TERMINATOR_LEN - 1)
+        if source is None:
+            payload = str(buffer(data, base, tail - base))
+        else:
+            payload = (source[0], source[1] + base, tail - base)
+        spans = None
+        if ranges is not None:
+            spans = [(low - base, high - base)
+                     for (low, high) in overlapping(ranges, start, end)]
+        chunks += [(base, payload, start - base, end - base, spans)]
+    return chunks
+
+
+def _chunk_bytes(payload):
+    """The bytes of a work item, read from file if necessary"""
+    if isinstance(payload, tuple):
+        (filename, offset, size) = payload
+        binfile = open(filename, "rb")
+        binfile.seek(offset)
+        data = binfile.read(size)
+        binfile.close()
+        return data
+    return payload
+
+
+def scan_chunk(args):
+    """
+    Worker: scan one chunk of mode bit code. Returns the chunk's key, its
+    (offset, length) tuples in section coordinates, the fingerprints of
+    its unique sequences, the (hits, misses) of the worker's decode cache
+    during this chunk, the SemanticCatalog of the chunk if classifying and
+    the Profile of the chunk if a profiling pool worker.
+    """
+    (key, base, payload, start, end, ranges, numbytes, mode) = args
+    (decoder, cache, table, classifier) = _worker_context(mode)
+    (hits, misses) = (0, 0)
+    if cache is not None:
+        (hits, misses) = (cache.hits, cache.misses)
+
+    profile = instrument.current()
+    if profile is not None:
+        started = timer()
+    ostream = OpcodeStream(_chunk_bytes(payload))
+    if profile is not None:
+        profile.add("extract", timer() - started)
+    locations = ostream.find_sequences(opcode="c3", opcode_str="ret",
+                                       byte_offs=numbytes, decoder=decoder,
+                                       start=start, end=end, progress=False,
+                                       cache=cache, terminators=table,
+                                       classifier=classifier, ranges=ranges)
+    if profile is not None:
+        started = timer()
+    uniq_seqs = ostream.unique_sequences(locations)
+    if profile is not None:
+        profile.add("dedup", timer() - started)
+
+    if cache is not None:
+        hits = cache.hits - hits
+        misses = cache.misses - misses
+    catalog = None
+    if classifier is not None:
+        catalog = classifier.take_catalog()
+    if _worker_config[3]:
+        # in-process scans record into the parent's profile directly
+        profile = instrument.take()
+    return (key, [(base + off, length) for (off, length) in locations],
+            uniq_seqs, (hits, misses), catalog, profile)
+
+
+class ParallelScanner:
+    """
+    Fans the RET candidates of sections out to a process pool. With a
+    single job, everything runs in-process.
+
+    Each process keeps a DecodeCache of cache_size entries (0 disables
+    it) per decoder mode for the whole run. If cache_file is given, the
+    caches start from its contents (see decode_cache_file()) and are
+    written back to it by close().
+
+    terminators names a TerminatorTable (see terminators.py) to scan for
+    instead of plain RETs. With classify, only the sequences a
+    GadgetClassifier (see classify.py) keeps are returned, and the
+    catalogs of all workers are merged into catalog. The profiles of the
+    workers are merged into the parent's if profiling is on.
+    """
+    def __init__(self, jobs, decoder_name, cache_file=None,
+                 cache_size=DEFAULT_DECODE_CACHE_SIZE, terminators=None,
+                 classify=False):
+        self.jobs = jobs
+        self.decoder_name = decoder_name
+        self.cache_file = cache_file
+        self.cache_size = cache_size
+        self.terminators = terminators
+        self.modes = set()
+        self.catalog = None
+        if classify:
+            self.catalog = SemanticCatalog()
+        self.decode_hits = 0
+        self.decode_misses = 0
+        if jobs > 1:
+            self.pool = multiprocessing.Pool(jobs, _init_worker,
+                                             (decoder_name, cache_file,
+                                              cache_size, True, terminators,
+                                              classify,
+                                              instrument.current()
+                                              is not None))
+        else:
+            self.pool = None
+            _init_worker(decoder_name, cache_file, cache_size, False,
+                         terminators, classify)
+
+    def cache_tag(self, mode=32):
+        """Tag of the decode caches for mode bit code"""
+        tag = "ret"
+        if self.terminators is not None:
+            tag = terminator_table(self.terminators, mode).name
+        return decode_cache_tag(get_decoder(self.decoder_name, mode), tag)
+
+    def __work(self, items, numbytes):
+        """
+        Generate the work items for all (key, size, data, source, mode,
+        ranges) items
+        """
+        for (key, size, data, source, mode, ranges) in items:
+            self.modes.add(mode)
+            for chunk in make_chunks(size, numbytes, self.jobs, data,
+                                     source, ranges=ranges):
+                yield (key,) + chunk + (numbytes, mode)
+
+    def stream_many(self, items, numbytes):
+        """
+        Scan a sequence of (key, size, data, source, mode, ranges) items on
+        the shared pool, see make_chunks() for data, source and ranges;
+        mode is the decoder mode (32 or 64) of the item's code. Items are submitted in
+        the given order, so callers put the largest ones first.
+
+        Yields: (key, locations, uniq_seqs) per chunk as soon as it is
+        done, in item and offset order.
+        """
+        if self.pool is None:
+            results = itertools.imap(scan_chunk, self.__work(items, numbytes))
+        else:
+            # imap keeps the chunk order, so merging is a concatenation
+            results = self.pool.imap(scan_chunk, self.__work(items, numbytes))
+
+        for (key, locs, uniq, (hits, misses), catalog, profile) in results:
+            self.decode_hits += hits
+            self.decode_misses += misses
+            if catalog is not None:
+                self.catalog.merge(catalog)
+            if profile is not None and profile is not instrument.current():
+                instrument.current().merge(profile)
+            yield (key, locs, uniq)
+
+    def scan_many(self, items, numbytes):
+        """
+        Like stream_many(), but collects the chunks of each item.
+
+        Yields: (key, locations, uniq_seqs) per item, in item order.
+        """
+        current = None
+        locations = []
+        uniq_seqs = set()
+        for (key, locs, uniq) in self.stream_many(items, numbytes):
+            if key != current and current is not None:
+                yield (current, locations, uniq_seqs)
+                locations = []
+                uniq_seqs = set()
+            current = key
+            locations += locs
+            uniq_seqs |= uniq
+        if current is not None:
+            yield (current, locations, uniq_seqs)
+
+    def stream(self, data, numbytes, source=None, mode=32, ranges=None):
+        """
+        Scan a whole section buffer of mode bit code, only the candidates
+        within ranges if given.
+
+        Yields: the (offset, length) tuples a serial find_sequences run
+        would return, chunk by chunk as the workers finish them.
+        """
+        for (_key, locs, _uniq) in \
+                self.stream_many([(0, len(data), data, source, mode,
+                                   ranges)],
+                                 numbytes):
+            for loc in locs:
+                yield loc
+
+    def scan(self, data, numbytes, source=None, mode=32):
+        """
+        Scan a whole section buffer of mode bit code.
+
+        Returns: (locations, uniq_seqs) exactly as a serial
+        find_sequences/unique_sequences run would produce them.
+        """
+        for (_key, locations, uniq_seqs) in \
+                self.scan_many([(0, len(data), data, source, mode, None)],
+                               numbytes):
+            return (locations, uniq_seqs)
+        return ([], set())
+
+    def abort(self):
+        """Stop the worker processes without waiting for their work"""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def close(self):
+        """
+        Shut down the worker processes and write back the decode cache
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            if self.cache_file and self.cache_size > 0:
+                # the workers left their caches in per-pid part files
+                for mode in self.modes:
+                    path = decode_cache_file(self.cache_file, mode)
+                    merged = DecodeCache(self.cache_tag(mode),
+                                         self.cache_size)
+                    merged.merge_parts(path)
+                    merged.save(path)
+        elif self.cache_file:
+            for (mode, (_decoder, cache, _table, _classifier)) in \
+                    _worker_contexts.items():
+                if cache is not None:
+                    cache.save(decode_cache_file(self.cache_file, mode))
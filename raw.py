@@ -0,0 +1,152 @@
+"""
+Raw memory dump reader used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import mmap
+from data import Section
+
+
+def _number(text):
+    """Integer for a decimal or 0x-prefixed address"""
+    try:
+        return int(text.strip(), 0)
+    except ValueError:
+        raise ValueError("Bad address '%s'" % text)
+
+
+def parse_regions(spec, base=0):
+    """
+    Regions for a --regions option: comma separated start-end or
+    start+size address ranges, each optionally followed by @offset, the
+    file offset of its first byte, which defaults to start - base.
+
+    Returns: list of (name, start, size, offset) tuples
+    """
+    regions = []
+    for item in spec.split(","):
+        if item.strip() == "":
+            continue
+        offset = None
+        if "@" in item:
+            (item, offset) = item.split("@", 1)
+            offset = _number(offset)
+        if "+" in item:
+            (start, size) = item.split("+", 1)
+            (start, size) = (_number(start), _number(size))
+        elif "-" in item:
+            (start, end) = item.split("-", 1)
+            (start, end) = (_number(start), _number(end))
+            size = end - start
+        else:
+            raise ValueError("Bad region '%s', use start-end or "
+                             "start+size" % item)
+        if size <= 0:
+            raise ValueError("Empty region '%s'" % item)
+        if offset is None:
+            offset = start - base
+        regions += [("region%d" % len(regions), start, size, offset)]
+    return regions
+
+
+def parse_maps(path, base=0):
+    """
+    Executable regions of a saved /proc/<pid>/maps file, named after the
+    mapped file. A region's bytes are expected at file offset
+    start - base of the dump, as in a sparse copy of /proc/<pid>/mem.
+
+    Returns: list of (name, start, size, offset) tuples
+    """
+    regions = []
+    for line in open(path):
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+        if "x" not in fields[1]:
+            continue
+        try:
+            (start, end) = [int(addr, 16) for addr in fields[0].split("-")]
+        except ValueError:
+            raise ValueError("%s: bad maps line '%s'" % (path, line.strip()))
+        name = "[anon@%x]" % start
+        if len(fields) > 5:
+            name = os.path.basename(" ".join(fields[5:]))
+        regions += [(name, start, end - start, start - base)]
+    return regions
+
+
+class RawImage:
+    """
+    Memory-mapped raw code dump: a firmware blob, a memory snapshot or
+    any other file without ELF section headers. regions is a list of
+    (name, start, size, offset) tuples; without it the whole file is one
+    region loaded at base. Regions are clipped to the file, those outside
+    of it are listed in skipped. Provides the same interface as
+    elf.ElfFile, so region contents are handed out as zero-copy views of
+    the mapping and never read into memory as a whole.
+    """
+    def __init__(self, filename, regions=None, base=0, mode=32):
+        self.filename = filename
+        self.mode = mode
+        self.skipped = []
+        self.__file = open(filename, "rb")
+        size = os.fstat(self.__file.fileno()).st_size
+        self.__map = None
+        if size > 0:
+            try:
+                self.__map = mmap.mmap(self.__file.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+            except (mmap.error, ValueError):
+                self.__file.close()
+                raise ValueError("%s: cannot map file" % filename)
+
+        if regions is None:
+            regions = [("raw", base, size, 0)]
+        self.__sections = []
+        for (name, start, length, offset) in regions:
+            if offset < 0 or offset >= size:
+                self.skipped += [name]
+                continue
+            length = min(length, size - offset)
+            self.__sections += [Section(name, start, length, offset)]
+
+    def executable_sections(self):
+        """Return a Section for every region within the file"""
+        return list(self.__sections)
+
+    def section_data(self, section):
+        """
+        Zero-copy view of the region's bytes
+        """
+        return buffer(self.__map, section.offset, section.size)
+
+    def close(self):
+        """Unmap and close the file"""
+        if self.__map is not None:
+            self.__map.close()
+        self.__file.close()
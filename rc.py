@@ -32,16 +32,44 @@ used for a return-oriented-programming-based attack.
 # (c) 2010 Bjoern Doebel <doebel@tudos.org>
 #     economic rights: Technische Universitaet Dresden (Germany)
 
-import sys
 import os
+import sys
+import json
+import signal
+import binascii
 
 import scriptine
 import scriptine.shell
 import scriptine.log
+import scriptine.command
 
 from bdutil import Colors
-from cmd import ReadelfCmd, ObjdumpCmd
+from cmd import ToolsReader
+from elf import ElfFile, ElfError, ELF_MAGIC
+from raw import RawImage, parse_regions, parse_maps
+from decoder import get_decoder, DEFAULT_DECODER
 from opcodestream import OpcodeStream
+from parallel import ParallelScanner, decode_cache_tag, decode_cache_file
+from decodecache import DecodeCache, DEFAULT_DECODE_CACHE_SIZE
+from output import TextSink, open_sink
+from gadgetdb import GadgetDB, GadgetDBWriter, parse_bytes
+from incremental import Baseline
+from terminators import terminator_table
+from classify import GadgetClassifier, SemanticCatalog
+from chain import EffectIndex, ChainSearch, parse_goal, chain_words
+from search import InstructionIndex
+from batch import CorpusScan, expand_targets
+from regions import RegionFilter, ranges_tag, DEFAULT_REGIONS
+from diff import SortedGadgets, diff_entries, file_ids, DEFAULT_DIFF_MEMORY
+from dedup import fingerprint, histogram_buckets, DEFAULT_DEDUP_MEMORY
+from dedup import FINGERPRINT_BITS
+from cache import GadgetCache, cache_key
+from cache import DEFAULT_CACHE_FILE, DEFAULT_CACHE_SIZE
+import instrument
+from instrument import timer
+from bench import Benchmark, STAGES, parse_size, synthetic_text, environment
+from server import ScanServer, ServerBusy, submit
+from server import DEFAULT_SOCKET, DEFAULT_QUEUE, DEFAULT_WAIT
 
 
 class CommandChecker():
@@ -52,14 +80,13 @@ class CommandChecker():
         self.prerequisites = [ "udcli", "objdump", "readelf" ]
 
 
-    def prereq_check(self):
+    def prereq_check(self, prereqs=None):
         """Check if all required prerequisites for the shell-tool-based version
-           are available."""
+           are available. Only the native backends are used by default, so
+           callers pass the tools their selected backends need."""
 
-        # prerequisites to check for
-        prereqs = ["udcli",
-                   "objdump",
-                   "readelf"]
+        if prereqs is None:
+            prereqs = self.prerequisites
 
         for pre in prereqs:
             res = scriptine.shell.backtick("which %s" % pre)
@@ -71,108 +98,1263 @@ class CommandChecker():
         return True
 
 
-def scan_section(section, filename, dump, numbytes):
+def scan_section(section, reader, sink, numbytes, decoder, scanner=None,
+                 cache=None, decode_cache=None, filename=None, db=None,
+                 terminators=None, classifier=None, baseline=None,
+                 regions=None, unique=True):
     """
-    Scan a single section
-    """
-    tmpfile = "blub.tmp"
-    section.dump()
-    # use (start, size) to objdump text segment and extract opcode stream
-    objdump = ObjdumpCmd()
-    cmd = objdump.cmd_str(section.start, section.size, filename, tmpfile)
-    res = scriptine.shell.sh(cmd)
-    if res != 0:
-        scriptine.log.error("%sError in objdump%s", Colors.Red,
-                            Colors.Reset)
+    Scan a single section, on scanner's worker pool if given, and write
+    every sequence to sink (see output.py) as soon as it is found. With a
+    GadgetCache, previous results for the same section contents are
+    loaded instead. decode_cache is the DecodeCache of a serial scan,
+    db a GadgetDBWriter recording the section and its sequences.
+    terminators is the TerminatorTable to scan for instead of RET.
+    classifier is the GadgetClassifier filtering the sequences of a
+    serial scan and cataloging those of cached sections. With a Baseline
+    (see incremental.py) holding an earlier version of the section, only
+    the changed parts are scanned again, in this process. With a
+    RegionFilter (see regions.py), only the candidates in the parts of the
+    section it keeps are scanned. Without unique, the sets that grow with
+    the section are not collected.
 
-    stream = objdump.parse_result(tmpfile)
-    if len(stream) == 0:
+    Returns: (number of sequences, set of unique sequence fingerprints
+    (see dedup.py), set of unique C3 offsets), both sets None without
+    unique
+    """
+    if isinstance(sink, TextSink) or sink is None:
+        section.dump()
+    else:
+        # keep machine-readable output clean
+        scriptine.log.log("Section %s @ %08x - %08x", section.name,
+                          section.start, section.start + section.size)
+    profile = instrument.current()
+    if profile is not None:
+        started = timer()
+    data = reader.section_data(section)
+    if profile is not None:
+        profile.add("extract", timer() - started)
+        profile.count("sections")
+        profile.count("section bytes", len(data))
+    if len(data) == 0:
         scriptine.log.error("%sEmpty instruction stream?%s",
                             Colors.Red, Colors.Reset)
 
-    scriptine.log.info("Stream bytes: %d, real size %d", len(stream),
-                       section.size)
-    # we must have extracted all bytes
-    if len(stream) != section.size:
-        print "Size mismatch: %d <-> %d" % (len(stream), section.size)
-        print stream
-        sys.exit(1)
-
-    os.remove(tmpfile)
+    ostream = OpcodeStream(data)
+    ranges = None
+    pruned = None
+    if regions is not None:
+        if profile is not None:
+            started = timer()
+        ranges = regions.ranges(section, data)
+        pruned = regions.count(data, ranges, terminators)
+        if profile is not None:
+            profile.add("regions", timer() - started)
+            profile.count("candidates pruned", pruned[1])
+    locations = None
+    if cache is not None:
+        opcode = "c3"
+        if terminators is not None:
+            opcode = terminators.name
+        if classifier is not None:
+            opcode += "+classify"
+        if ranges is not None:
+            opcode += "+regions=" + ranges_tag(regions.policy, ranges)
+        key = cache_key(data, numbytes, opcode, decoder)
+        if profile is not None:
+            started = timer()
+        locations = cache.get(key)
+        if profile is not None:
+            profile.add("cache", timer() - started)
+    cached = locations is not None
+    old_sid = None
+    if baseline is not None and not cached:
+        old_sid = baseline.find(section, decoder.mode, reader.filename)
 
-    ostream = OpcodeStream(stream)
     # analyze stream
-    locations = ostream.find_sequences(opcode="c3", opcode_str="ret",
-                                       byte_offs=numbytes)
-    scriptine.log.log("Found: %d sequences.", len(locations))
+    if cached:
+        scriptine.log.info("Loaded sequences from cache.")
+    elif old_sid is not None:
+        scriptine.log.info("Rescanning changes against the baseline.")
+        locations = baseline.rescan(old_sid, ostream, decoder, decode_cache,
+                                    classifier, ranges)
+    elif scanner is None:
+        # progress output would garble sequences written to stdout
+        progress = sink is None or sink.stream is not sys.stdout
+        locations = ostream.iter_sequences(opcode="c3", opcode_str="ret",
+                                           byte_offs=numbytes,
+                                           decoder=decoder,
+                                           progress=progress,
+                                           cache=decode_cache,
+                                           terminators=terminators,
+                                           classifier=classifier,
+                                           ranges=ranges)
+    else:
+        source = None
+        if section.offset is not None:
+            # workers read their chunks from the file themselves
+            source = (reader.filename, section.offset)
+        locations = scanner.stream(data, numbytes, source, decoder.mode,
+                                   ranges)
+
+    if sink is not None:
+        locations = ostream.write_sequences(sink, locations, section.start,
+                                            filename, section.name,
+                                            terminators)
+    if db is not None:
+        sid = db.add_section(section, data, reader.filename, decoder.mode)
+        locations = db.record(sid, locations)
+
+    sequences = 0
+    (uniq_seqs, c3_locs) = (None, None)
+    if unique:
+        (uniq_seqs, c3_locs) = (set(), set())
+    found = []
+    for (offs, length) in locations:
+        sequences += 1
+        if unique:
+            if profile is not None:
+                started = timer()
+            uniq_seqs.add(fingerprint(ostream.window(offs, length)))
+            if profile is not None:
+                profile.add("dedup", timer() - started)
+            c3_locs.add(offs)
+        if cached and classifier is not None:
+            classifier.select(classifier.classify(ostream.window(offs,
+                                                                 length)))
+        if cache is not None and not cached:
+            found += [(offs, length)]
+
+    if cache is not None and not cached:
+        cache.put(key, found)
+    scriptine.log.log("Found: %d sequences.", sequences)
+
+    if unique:
+        # check for uniqueness of sequences
+        scriptine.log.log("       %d unique sequences", len(uniq_seqs))
+
+        # get unique locations by creating a set of offsets
+        scriptine.log.log("       %d unique %s locations", len(c3_locs),
+                          "C3" if terminators is None else "terminator")
+    if old_sid is not None:
+        scriptine.log.log("       %d candidates reused, %d rescanned",
+                          baseline.reused, baseline.rescanned)
+    if pruned is not None:
+        scriptine.log.log("       %d of %d candidates pruned", pruned[1],
+                          pruned[0])
+
+    return (sequences, uniq_seqs, c3_locs)
+
+
+def select_terminators(spec, decoder):
+    """
+    TerminatorTable for a --terminators option and the decoder's mode,
+    None for plain RET scans
+    """
+    if spec == "ret":
+        return None
+    table = terminator_table(spec, decoder.mode)
+    if not hasattr(decoder, "decode"):
+        raise ValueError("Terminators other than ret need the native decoder")
+    return table
+
+
+def select_mode(arch):
+    """
+    Decoder mode for an --arch option, None if it is to be taken from
+    each file's ELF header
+    """
+    if arch == "auto":
+        return None
+    if arch in ("32", "64"):
+        return int(arch)
+    raise ValueError("Unknown architecture '%s', use one of: auto, 32, 64" %
+                     arch)
+
+
+def table_name(table):
+    """Name of a TerminatorTable to pass to workers, None for RET scans"""
+    if table is None:
+        return None
+    return table.name
+
+
+def write_db(gadget_db, path):
+    """Write a collected gadget database to path"""
+    scriptine.log.log("Writing %d sequences to gadget database %s",
+                      len(gadget_db), path)
+    gadget_db.write(path)
+    gadget_db.close()
 
-    # check for uniqueness of sequences
-    uniq_seqs = ostream.unique_sequences(locations)
-    scriptine.log.log("       %d unique sequences", len(uniq_seqs))
 
-    # get unique locations by creating a set of offsets
-    c3_locs = set([offs for (offs, length) in locations])
-    scriptine.log.log("       %d unique C3 locations", len(c3_locs))
+def write_catalog(catalog, path):
+    """
+    Report the semantic classes of a run and write them to path if given
+    """
+    scriptine.log.log("Semantically unique gadgets: %d (of %d kept)",
+                      len(catalog), catalog.kept)
+    for (reason, count) in sorted(catalog.dropped.items()):
+        scriptine.log.log("   Dropped (%s): %d", reason, count)
+    for (category, count) in sorted(catalog.category_counts().items()):
+        if count:
+            scriptine.log.info("   %s: %d", category, count)
+    if path != "":
+        catalog.write(path)
+        scriptine.log.log("Wrote gadget catalog to %s", path)
+
+
+def start_profile(spec):
+    """
+    Turn on profiling for a --profile option (table or json), None if it
+    is empty
+    """
+    if spec == "":
+        return None
+    if spec not in ("table", "json"):
+        raise ValueError("Unknown profile format '%s', use table or json" %
+                         spec)
+    return instrument.enable()
+
+
+def report_profile(profile, spec, hits=0, misses=0):
+    """
+    Write a profile to stderr as table or json, with the decode cache's
+    hits and misses
+    """
+    if profile is None:
+        return
+    profile.count("decode cache hits", hits)
+    profile.count("decode cache misses", misses)
+    if spec == "json":
+        sys.stderr.write(profile.json() + "\n")
+        return
+    for line in profile.table():
+        scriptine.log.log("%s", line)
+
 
-    if dump == "yes":
-        ostream.dump_locations_with_offset(locations, section.start)
+def open_baseline(path, numbytes, table, classify):
+    """
+    Baseline for a --baseline option, None if there is none or it cannot
+    stand in for the scan (a full scan is done then)
+    """
+    if path == "":
+        return None
+    try:
+        baseline = Baseline(GadgetDB(path), numbytes, table, classify)
+    except (IOError, ValueError), err:
+        scriptine.log.warn("Ignoring baseline: %s", err)
+        return None
+    reason = baseline.unusable()
+    if reason is not None:
+        scriptine.log.warn("Ignoring baseline %s: %s, doing a full scan.",
+                           path, reason)
+        baseline.db.close()
+        return None
+    return baseline
 
-    return (locations, len(uniq_seqs), len(c3_locs))
+
+def log_decode_cache(hits, misses):
+    """Report the decode cache counters of a run"""
+    lookups = hits + misses
+    if lookups == 0:
+        return
+    scriptine.log.log("Decode cache: %d hits, %d misses (%.1f%% hit rate)",
+                      hits, misses, 100.0 * hits / lookups)
 
 
-def scan_command(filename, dump="yes", numbytes=20):
+def keep(state, key, create):
+    """
+    create() for a one-off run, the object the server's WarmState (see
+    server.py) keeps under key if there is one
+    """
+    if state is None:
+        return create()
+    return state.get(key, create)
+
+
+def tools_present(needed, state=None):
+    """
+    Check for the shell tools a run needs; a server only checks once
+    """
+    key = ("tools",) + tuple(needed)
+    present = keep(state, key, lambda: CommandChecker().prereq_check(needed))
+    if not present and state is not None:
+        state.drop(key)
+    return present
+
+
+def open_decode_cache(tag, size, path, mode):
+    """DecodeCache of a serial scan, started from path if given"""
+    verdicts = DecodeCache(tag, size)
+    if path != "":
+        verdicts.load(decode_cache_file(path, mode))
+    return verdicts
+
+
+def forward(server, command, args):
+    """
+    Run command with args on the scan server (see server.py) listening
+    at server, or at $ROPSCAN_SERVER if server is empty. Exits with the
+    job's status if it failed.
+
+    Returns: False if there is no server to run it on
+    """
+    if server == "":
+        server = os.environ.get("ROPSCAN_SERVER", "")
+    if server == "":
+        return False
+    try:
+        status = submit(server, command, args)
+    except ServerBusy:
+        scriptine.log.warn("Scan server %s stayed busy for %ds, running "
+                           "locally.", server, DEFAULT_WAIT)
+        return False
+    except (ValueError, IOError), err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        sys.exit(1)
+    if status is None:
+        scriptine.log.info("No scan server at %s, running locally.", server)
+        return False
+    if status:
+        sys.exit(status)
+    return True
+
+
+def open_reader(filename, reader):
+    """
+    Open filename with the section reader backend named reader
+    """
+    if reader == "native":
+        return ElfFile(filename)
+    if reader == "tools":
+        return ToolsReader(filename)
+    raise ValueError("Unknown reader '%s', use one of: native, tools" %
+                     reader)
+
+
+def scan_command(filename, dump="yes", numbytes=20, decoder=DEFAULT_DECODER,
+                 reader="native", jobs=1, cache="",
+                 cache_size=DEFAULT_CACHE_SIZE, decode_cache="",
+                 decode_cache_size=DEFAULT_DECODE_CACHE_SIZE, format="text",
+                 output="", db="", terminators="ret", arch="auto",
+                 classify="no", catalog="", profile="", baseline="",
+                 regions=DEFAULT_REGIONS, server=""):
     """
     Shell command: scan binary for C3 instruction sequences
 
     Options:
        filename  -- binary to scan
        dump      -- dump sequences (yes/no), default: yes
+       format    -- sequence format (text/jsonl/csv/binary), default: text
+       output    -- file to write sequences to, default: stdout
+       db        -- gadget database to write, default: none
+       decoder   -- disassembler backend (native/udcli), default: native
+       reader    -- section reader (native/tools), default: native
+       jobs      -- number of worker processes, default: 1
+       cache     -- gadget cache file, default: none
+       cache_size -- gadget cache size bound in MB, default: 256
+       decode_cache -- decode cache warm-start file, default: none
+       decode_cache_size -- decode cache entries (0: off), default: 262144
+       terminators -- gadget terminators (kinds or all), default: ret
+       arch      -- code to decode (auto/32/64), default: auto (ELF header)
+       classify  -- drop useless gadgets, count semantic classes (yes/no),
+                    default: no
+       catalog   -- semantic gadget catalog file to write (implies
+                    classify), default: none
+       profile   -- report phase timings and counters (table/json),
+                    default: none
+       baseline  -- gadget database of an earlier version of the binary,
+                    only changed code is rescanned, default: none
+       regions   -- candidates to scan (all/code/functions), default: all
+       server    -- socket of a scan server to run the scan on, default:
+                    $ROPSCAN_SERVER, if set
+    """
+    args = {"filename" : filename, "dump" : dump, "numbytes" : numbytes,
+            "decoder" : decoder, "reader" : reader, "jobs" : jobs,
+            "cache" : cache, "cache_size" : cache_size,
+            "decode_cache" : decode_cache,
+            "decode_cache_size" : decode_cache_size, "format" : format,
+            "output" : output, "db" : db, "terminators" : terminators,
+            "arch" : arch, "classify" : classify, "catalog" : catalog,
+            "profile" : profile, "baseline" : baseline, "regions" : regions}
+    if forward(server, "scan", args):
+        return
+    scan_file(**args)
+
+
+def scan_file(filename, dump, numbytes, decoder, reader, jobs, cache,
+              cache_size, decode_cache, decode_cache_size, format, output,
+              db, terminators, arch, classify, catalog, profile, baseline,
+              regions=DEFAULT_REGIONS, state=None):
     """
-    tmpfile = "foo.tmp"
+    Scan a binary as scan_command() does, keeping worker pools and caches
+    in the server's WarmState if given
+    """
+    needed = []
+    if reader == "tools":
+        needed += ["readelf", "objdump"]
+    if decoder == "udcli":
+        needed += ["udcli"]
+    if not tools_present(needed, state):
+        scriptine.log.error("Missing shell tool(s) for the selected backends.")
+        return
 
-    # run readelf -S on the file to find the section info
-    readelf = ReadelfCmd()
-    cmd = readelf.cmd_str(filename, tmpfile)
-    res = scriptine.shell.sh(cmd)
-    if res != 0:
-        scriptine.log.error("%sreadelf error%s", Colors.Red,
-                            Colors.Reset)
+    try:
+        mode = select_mode(arch)
+        stats = start_profile(profile)
+        elf = open_reader(filename, reader)
+        the_list = elf.executable_sections()
+        if mode is None:
+            mode = elf.mode
+    except (ValueError, ElfError), err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
         return
 
-    the_list = readelf.parse_result(tmpfile)
-    scriptine.log.log("Found %d executable sections.", len(the_list))
+    scan_reader(elf, the_list, mode, stats, filename, dump, numbytes, decoder,
+                jobs, cache, cache_size, decode_cache, decode_cache_size,
+                format, output, db, terminators, classify, catalog, profile,
+                baseline, regions, state)
+
+
+def scan_reader(elf, the_list, mode, stats, filename, dump, numbytes, decoder,
+                jobs, cache, cache_size, decode_cache, decode_cache_size,
+                format, output, db, terminators, classify, catalog, profile,
+                baseline, regions=DEFAULT_REGIONS, state=None, unique="yes"):
+    """
+    Scan the_list of sections of a section reader (see open_reader()) as
+    scan_command() does, taking its options; closes the reader. Readers
+    without function_ranges() are not pruned by regions. Worker pools and
+    caches are taken from and left in the server's WarmState if given.
+    With unique "no", unique sequences and locations are not counted.
+    """
+    scriptine.log.log("Found %d executable sections (%d bit code).",
+                      len(the_list), mode)
     if (len(the_list) == 0):
-        scriptine.log.error("%sReadelf error: no executable sections found.%s",
+        scriptine.log.error("%sError: no executable sections found.%s",
                             Colors.Red, Colors.Reset)
+        elf.close()
+        return
+
+    sink = None
+    try:
+        disasm = get_decoder(decoder, mode)
+        table = select_terminators(terminators, disasm)
+        if dump == "yes":
+            sink = open_sink(format, output)
+            sink.address_bits = mode
+        region_filter = None
+        if regions != "all":
+            functions = None
+            if hasattr(elf, "function_ranges"):
+                functions = elf.function_ranges()
+            region_filter = RegionFilter(regions, functions, mode)
+    except (ValueError, IOError, ElfError), err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        if sink is not None:
+            sink.close()
+        elf.close()
         return
 
+    classifier = None
+    if classify == "yes" or catalog != "":
+        classifier = GadgetClassifier(mode)
+    scanner = None
+    verdicts = None
+    # counters of kept pools and caches go on from earlier jobs
+    (hits, misses) = (0, 0)
+    if jobs > 1:
+        scanner = keep(state, ("scanner", jobs, decoder, decode_cache,
+                               decode_cache_size, table_name(table),
+                               classifier is not None, stats is not None),
+                       lambda: ParallelScanner(jobs, decoder, decode_cache,
+                                               decode_cache_size,
+                                               table_name(table),
+                                               classifier is not None))
+        (hits, misses) = (scanner.decode_hits, scanner.decode_misses)
+        if scanner.catalog is not None:
+            scanner.catalog = SemanticCatalog()
+    elif decode_cache_size > 0:
+        tag = decode_cache_tag(disasm, table_name(table) or "ret")
+        verdicts = keep(state, ("decode cache", tag, decode_cache_size,
+                                decode_cache, mode),
+                        lambda: open_decode_cache(tag, decode_cache_size,
+                                                  decode_cache, mode))
+        (hits, misses) = (verdicts.hits, verdicts.misses)
+
+    gadget_cache = None
+    if cache != "":
+        gadget_cache = keep(state, ("cache", cache, cache_size),
+                            lambda: GadgetCache(cache, cache_size))
+    old = open_baseline(baseline, numbytes, table, classifier is not None)
+
     global_sequences = 0
-    global_uniq_seqs = 0
+    # sequences found in several sections count once
+    global_uniq_seqs = set()
     global_uniq_locs = 0
+    # the text listing of a single file has no file name prefix
+    label = None
+    if format != "text":
+        label = filename
+    gadget_db = None
+    if db != "":
+        gadget_db = GadgetDBWriter(table, numbytes,
+                                   classify == "yes" or catalog != "",
+                                   regions)
+
+    try:
+        for sec in the_list:
+            try:
+                (seq, uniq_seq, c3_locs) = scan_section(sec, elf, sink,
+                                                        numbytes, disasm,
+                                                        scanner, gadget_cache,
+                                                        verdicts, label,
+                                                        gadget_db, table,
+                                                        classifier, old,
+                                                        region_filter,
+                                                        unique == "yes")
+            except ElfError, err:
+                scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+                sys.exit(1)
+            global_sequences = global_sequences + seq
+            if unique != "yes":
+                continue
+            global_uniq_seqs |= uniq_seq
+            global_uniq_locs = global_uniq_locs + len(c3_locs)
 
-    for sec in the_list:
-        (seq, uniq_seq, uniq_loc) = scan_section(sec, filename, dump, numbytes)
-        global_sequences = global_sequences + len(seq)
-        global_uniq_seqs = global_uniq_seqs + uniq_seq
-        global_uniq_locs = global_uniq_locs + uniq_loc
-
-        if dump:
-            l = set()
-            print "Unique C3 locations:",
-            for (loc, ln) in seq:
-                if not loc in l:
-                    l.add(loc)
+            if dump == "yes" and format == "text":
+                if table is None:
+                    print "Unique C3 locations:",
+                else:
+                    print "Unique terminator locations:",
+                for loc in sorted(c3_locs):
                     print hex(loc + sec.start),
+    except KeyboardInterrupt:
+        if scanner is not None:
+            scanner.abort()
+            if state is not None:
+                state.drop(("scanner", jobs, decoder, decode_cache,
+                            decode_cache_size, table_name(table),
+                            classifier is not None, stats is not None))
+        if sink is not None:
+            sink.close()
+            scriptine.log.warn("Interrupted, %d sequences written.",
+                               sink.count)
+        return
+    if sink is not None:
+        sink.close()
+    if gadget_db is not None:
+        write_db(gadget_db, db)
 
     scriptine.log.log("%s============= FINISHED =============%s",
                       Colors.Cyan, Colors.Reset)
     scriptine.log.log("Overall sequences found: %d", global_sequences)
-    scriptine.log.log("       Unique sequences: %d", global_uniq_seqs)
-    scriptine.log.log("       Unique locations: %d", global_uniq_locs)
+    if unique == "yes":
+        scriptine.log.log("       Unique sequences: %d",
+                          len(global_uniq_seqs))
+        scriptine.log.log("       Unique locations: %d", global_uniq_locs)
+    if region_filter is not None:
+        scriptine.log.log("      Pruned candidates: %d of %d (--regions=%s)",
+                          region_filter.pruned, region_filter.candidates,
+                          regions)
+    if classifier is not None:
+        if scanner is not None:
+            classifier.catalog.merge(scanner.catalog)
+        write_catalog(classifier.catalog, catalog)
+    if scanner is not None:
+        (hits, misses) = (scanner.decode_hits - hits,
+                          scanner.decode_misses - misses)
+        log_decode_cache(hits, misses)
+        if state is None:
+            scanner.close()
+    if verdicts is not None:
+        (hits, misses) = (verdicts.hits - hits, verdicts.misses - misses)
+        log_decode_cache(hits, misses)
+        if decode_cache != "":
+            verdicts.save(decode_cache_file(decode_cache, mode))
+    if gadget_cache is not None and state is None:
+        gadget_cache.close()
+    if old is not None:
+        old.db.close()
+    elf.close()
+    report_profile(stats, profile, hits, misses)
 
-if __name__ == "__main__":
-    if (CommandChecker().prereq_check()):
-        scriptine.run()
+
+def open_raw(filename, base, regions, maps, mode):
+    """
+    Section reader and its sections for scan-raw: the executable PT_LOAD
+    segments of an ELF file (a core dump) unless regions are given, the
+    regions of a raw dump otherwise. mode None takes the mode from the
+    ELF header, or 32 for raw dumps.
+
+    Returns: (reader, sections, mode)
+    """
+    head = open(filename, "rb").read(len(ELF_MAGIC))
+    if head == ELF_MAGIC and regions == "" and maps == "":
+        elf = ElfFile(filename)
+        if mode is None:
+            mode = elf.mode
+        return (elf, elf.executable_segments(), mode)
+
+    base = int(base, 0)
+    ranges = None
+    if regions != "":
+        ranges = parse_regions(regions, base)
+    if maps != "":
+        ranges = (ranges or []) + parse_maps(maps, base)
+    if mode is None:
+        mode = 32
+        scriptine.log.log("Raw dump, decoding 32 bit code (see --arch).")
+    image = RawImage(filename, ranges, base, mode)
+    for name in image.skipped:
+        scriptine.log.warn("Region %s is not in %s, skipped.", name,
+                           filename)
+    return (image, image.executable_sections(), mode)
+
+
+def scan_raw_command(filename, base="0", regions="", maps="", dump="yes",
+                     numbytes=20, decoder=DEFAULT_DECODER, jobs=1, cache="",
+                     cache_size=DEFAULT_CACHE_SIZE, decode_cache="",
+                     decode_cache_size=DEFAULT_DECODE_CACHE_SIZE,
+                     format="text", output="", db="", terminators="ret",
+                     arch="auto", classify="no", catalog="", profile="",
+                     baseline="", unique="no"):
+    """
+    Shell command: scan a raw code dump or core file for C3 instruction
+    sequences
+
+    Options:
+       filename  -- dump to scan
+       base      -- address of the dump's first byte, default: 0
+       regions   -- comma separated start-end or start+size ranges to
+                    scan, each optionally @fileoffset, default: whole file
+       maps      -- saved /proc/<pid>/maps naming the regions to scan,
+                    default: none
+       arch      -- code to decode (auto/32/64), default: auto (ELF header
+                    of core files, 32 otherwise)
+       unique    -- count unique sequences and locations (yes/no),
+                    default: no
+       others    -- as for scan
+    """
+    needed = []
+    if decoder == "udcli":
+        needed += ["udcli"]
+    if not CommandChecker().prereq_check(needed):
+        scriptine.log.error("Missing shell tool(s) for the selected backends.")
+        return
+
+    try:
+        mode = select_mode(arch)
+        stats = start_profile(profile)
+        (image, the_list, mode) = open_raw(filename, base, regions, maps,
+                                           mode)
+    except (ValueError, IOError, ElfError), err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        return
+
+    scan_reader(image, the_list, mode, stats, filename, dump, numbytes,
+                decoder, jobs, cache, cache_size, decode_cache,
+                decode_cache_size, format, output, db, terminators, classify,
+                catalog, profile, baseline, unique=unique)
+
+
+@scriptine.command.fetch_all("targets")
+def scan_many_command(dump="yes", numbytes=20, decoder=DEFAULT_DECODER,
+                      jobs=1, cache="", cache_size=DEFAULT_CACHE_SIZE,
+                      decode_cache="",
+                      decode_cache_size=DEFAULT_DECODE_CACHE_SIZE,
+                      format="text", output="", db="", terminators="ret",
+                      arch="auto", classify="no", catalog="", profile="",
+                      dedup_memory=DEFAULT_DEDUP_MEMORY, uniq_counts="",
+                      targets=None):
+    """
+    Shell command: scan many binaries for C3 instruction sequences on one
+    shared worker pool
+
+    Options:
+       targets   -- directories, glob patterns, files or @file-lists
+       dump      -- dump sequences (yes/no), default: yes
+       format    -- sequence format (text/jsonl/csv/binary), default: text
+       output    -- file to write sequences to, default: stdout
+       db        -- gadget database to write, default: none
+       decoder   -- disassembler backend (native/udcli), default: native
+       jobs      -- number of worker processes, default: 1
+       cache     -- gadget cache file, default: none
+       cache_size -- gadget cache size bound in MB, default: 256
+       decode_cache -- decode cache warm-start file, default: none
+       decode_cache_size -- decode cache entries (0: off), default: 262144
+       terminators -- gadget terminators (kinds or all), default: ret
+       arch      -- code to decode (auto/32/64), default: auto (ELF headers)
+       classify  -- drop useless gadgets, count semantic classes (yes/no),
+                    default: no
+       catalog   -- semantic gadget catalog file to write (implies
+                    classify), default: none
+       profile   -- report phase timings and counters (table/json),
+                    default: none
+       dedup_memory -- MB of sequence fingerprints kept in memory for
+                    corpus-wide deduplication, default: 256
+       uniq_counts -- file to write each unique sequence's fingerprint
+                    and number of files to, default: none
+    """
+    needed = []
+    if decoder == "udcli":
+        needed += ["udcli"]
+    if not CommandChecker().prereq_check(needed):
+        scriptine.log.error("Missing shell tool(s) for the selected backends.")
+        return
+
+    sink = None
+    try:
+        mode = select_mode(arch)
+        stats = start_profile(profile)
+        table = select_terminators(terminators, get_decoder(decoder))
+        if dump == "yes":
+            sink = open_sink(format, output)
+    except (ValueError, IOError), err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        return
+
+    files = expand_targets(targets or [])
+    scriptine.log.log("Found %d ELF files.", len(files))
+
+    gadget_cache = None
+    if cache != "":
+        gadget_cache = GadgetCache(cache, cache_size)
+
+    gadget_db = None
+    if db != "":
+        gadget_db = GadgetDBWriter(table, numbytes,
+                                   classify == "yes" or catalog != "")
+
+    scanner = ParallelScanner(jobs, decoder, decode_cache, decode_cache_size,
+                              table_name(table),
+                              classify == "yes" or catalog != "")
+    corpus = CorpusScan(scanner, numbytes, get_decoder(decoder), gadget_cache,
+                        table, mode, dedup_memory)
+    corpus.plan(files)
+    # terminator tables per decoder mode, for tagging the output
+    tables = {}
+
+    try:
+        for (res, sec, locations) in corpus.run():
+            if sink is None and gadget_db is None:
+                continue
+            if stats is not None:
+                started = timer()
+            elf = ElfFile(res.filename)
+            data = elf.section_data(sec)
+            if stats is not None:
+                stats.add("extract", timer() - started)
+            if sink is not None:
+                if table is not None and res.mode not in tables:
+                    tables[res.mode] = terminator_table(table.name, res.mode)
+                sink.address_bits = res.mode
+                ostream = OpcodeStream(data)
+                for _loc in ostream.write_sequences(sink, locations,
+                                                    sec.start, res.filename,
+                                                    sec.name,
+                                                    tables.get(res.mode)):
+                    pass
+                # per-file results are complete, let consumers see them
+                sink.flush()
+            if gadget_db is not None:
+                gadget_db.add(gadget_db.add_section(sec, data, res.filename,
+                                                    res.mode),
+                              locations)
+            elf.close()
+    except KeyboardInterrupt:
+        scanner.abort()
+        corpus.close()
+        if sink is not None:
+            sink.close()
+            scriptine.log.warn("Interrupted, %d sequences written.",
+                               sink.count)
+        return
+    if sink is not None:
+        sink.close()
+    if gadget_db is not None:
+        write_db(gadget_db, db)
+
+    scanner.close()
+    if gadget_cache is not None:
+        gadget_cache.close()
+
+    scriptine.log.log("%s============= FINISHED =============%s",
+                      Colors.Cyan, Colors.Reset)
+    for res in corpus.results:
+        scriptine.log.log("%s: %d sequences, %d unique, %d locations",
+                          res.filename, res.sequences, res.unique,
+                          res.c3_locations)
+
+    if stats is not None:
+        started = timer()
+    counts = None
+    if uniq_counts != "":
+        counts = open(uniq_counts, "w")
+    (sequences, uniq_seqs, uniq_locs, histogram) = corpus.totals(counts)
+    if counts is not None:
+        counts.close()
+    if stats is not None:
+        stats.add("dedup", timer() - started)
+        stats.count("dedup runs", corpus.gadgets.runs)
+    corpus.close()
+    scriptine.log.log("Files scanned: %d", len(corpus.results))
+    scriptine.log.log("Overall sequences found: %d", sequences)
+    scriptine.log.log("       Unique sequences: %d", uniq_seqs)
+    scriptine.log.log("       Unique locations: %d", uniq_locs)
+    for (low, high, gadgets) in histogram_buckets(histogram):
+        if low == high:
+            scriptine.log.log("       Unique sequences in %d files: %d",
+                              low, gadgets)
+        else:
+            scriptine.log.log("       Unique sequences in %d-%d files: %d",
+                              low, high, gadgets)
+    if uniq_counts != "":
+        scriptine.log.log("Wrote file counts of unique sequences to %s",
+                          uniq_counts)
+    semantic = corpus.catalog()
+    if semantic is not None:
+        write_catalog(semantic, catalog)
+    log_decode_cache(scanner.decode_hits, scanner.decode_misses)
+    report_profile(stats, profile, scanner.decode_hits, scanner.decode_misses)
+
+
+def query_command(db, end="", start="", bytes="", format="text",
+                  server=""):
+    """
+    Shell command: look up sequences in a gadget database
+
+    Options:
+       db        -- gadget database written by scan --db
+       end       -- address of the last byte of the sequences
+       start     -- address of the first byte of the sequences
+       bytes     -- exact sequence bytes in hex, e.g. "5d c3"
+       format    -- output format (text/jsonl/csv/binary), default: text
+       server    -- socket of a scan server to run the query on, default:
+                    $ROPSCAN_SERVER, if set
+    """
+    args = {"db" : db, "end" : end, "start" : start, "bytes" : bytes,
+            "format" : format}
+    if forward(server, "query", args):
+        return
+    query_db(**args)
+
+
+def query_db(db, end, start, bytes, format):
+    """Look up sequences as query_command() does"""
+    try:
+        gadget_db = GadgetDB(db)
+    except (IOError, ValueError), err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        return
+
+    try:
+        gids = None
+        if end != "":
+            gids = set(gadget_db.ending_at(int(end, 0)))
+        if start != "":
+            found = set(gadget_db.starting_at(int(start, 0)))
+            gids = found if gids is None else gids & found
+        if bytes != "":
+            found = set(gadget_db.with_bytes(parse_bytes(bytes)))
+            gids = found if gids is None else gids & found
+    except ValueError, err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        gadget_db.close()
+        return
+    if gids is None:
+        scriptine.log.error("Give at least one of --end, --start, --bytes.")
+        gadget_db.close()
+        return
+
+    sink = open_sink(format)
+    for gid in sorted(gids):
+        (address, length, section, filename, data) = gadget_db.gadget(gid)
+        mode = gadget_db.mode(gid)
+        sink.address_bits = mode
+        sink.write(address, length, data, filename, section.name,
+                   gadget_db.terminator(data, mode))
+    sink.close()
+    scriptine.log.log("%d of %d sequences match.", len(gids), len(gadget_db))
+    gadget_db.close()
+
+
+def load_effect_index(db, path):
+    """
+    EffectIndex of the gadget database db, loaded from path if it is
+    current, else built and saved there
+    """
+    if os.path.exists(path):
+        try:
+            index = EffectIndex.load(path)
+            if index.current(db):
+                return index
+        except (IOError, ValueError), err:
+            scriptine.log.warn("Rebuilding effect index: %s", err)
+    gadget_db = GadgetDB(db)
+    try:
+        started = timer()
+        index = EffectIndex.build(gadget_db, path=db)
+        scriptine.log.log("Indexed %d of %d gadgets by effect in %.2fs.",
+                          len(index.effects), len(gadget_db),
+                          timer() - started)
+    finally:
+        gadget_db.close()
+    try:
+        index.save(path)
+    except IOError, err:
+        scriptine.log.warn("Cannot save effect index: %s", err)
+    return index
+
+
+def chain_command(db, goal="", syscall="no", max_length=8,
+                  max_states=100000, index="", format="text"):
+    """
+    Shell command: search a gadget database for a chain reaching a goal
+
+    Options:
+       db        -- gadget database written by scan --db
+       goal      -- comma separated reg=value and [address]=value items
+       syscall   -- end the chain in a system call (yes/no), default: no
+       max_length -- maximum number of gadgets, default: 8
+       max_states -- maximum number of search states, default: 100000
+       index     -- effect index file, default: <db>.effects
+       format    -- output format (text/json), default: text
+    """
+    if format not in ("text", "json"):
+        scriptine.log.error("Unknown format '%s', use one of: text, json",
+                            format)
+        return
+    try:
+        effects = load_effect_index(db, index or db + ".effects")
+        (regs, memory) = parse_goal(goal, effects.mode)
+    except (IOError, ValueError), err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        return
+
+    started = timer()
+    search = ChainSearch(effects, regs, memory, syscall == "yes",
+                         max_length, max_states)
+    steps = search.run()
+    scriptine.log.log("Searched %d states in %.3fs.", search.expanded,
+                      timer() - started)
+    if steps is None:
+        scriptine.log.error("No chain of at most %d gadgets found.",
+                            max_length)
+        return
+
+    words = chain_words(effects, steps)
+    digits = effects.mode / 4
+    if format == "json":
+        print json.dumps({"goal" : goal, "gadgets" : len(steps),
+                          "words" : [{"value" : value, "comment" : comment}
+                                     for (value, comment) in words]},
+                         sort_keys=True)
+        return
+    for (value, comment) in words:
+        print "0x%0*x  # %s" % (digits, value, comment)
+    scriptine.log.log("%d gadgets, %d bytes.", len(steps),
+                      len(words) * effects.mode / 8)
+
+
+def load_insn_index(db, path):
+    """
+    InstructionIndex of the gadget database db, opened from path if it is
+    current, else built and saved there
+    """
+    if os.path.exists(path):
+        try:
+            index = InstructionIndex(path)
+            if index.current(db):
+                return index
+            index.close()
+        except (IOError, ValueError), err:
+            scriptine.log.warn("Rebuilding instruction index: %s", err)
+    gadget_db = GadgetDB(db)
+    try:
+        started = timer()
+        index = InstructionIndex.build(gadget_db, path)
+        scriptine.log.log("Indexed %d gadgets (%d distinct sequences) by "
+                          "instruction in %.2fs.", index.gadgets,
+                          index.sequences, timer() - started)
+    finally:
+        gadget_db.close()
+    return index
+
+
+def search_command(db, pattern="", limit=0, index="", format="text"):
+    """
+    Shell command: search a gadget database for sequences matching an
+    instruction pattern
+
+    Options:
+       db        -- gadget database written by scan --db
+       pattern   -- instructions separated by semicolons, e.g.
+                    "pop reg; pop reg; ret" or "mov [reg], reg; ...; ret"
+       limit     -- list at most this many sequences, 0: all, default: 0
+       index     -- instruction index file, default: <db>.insns
+       format    -- output format (text/jsonl/csv/binary), default: text
+    """
+    if pattern == "":
+        scriptine.log.error("Give a --pattern.")
+        return
+    try:
+        insns = load_insn_index(db, index or db + ".insns")
+    except (IOError, OSError, ValueError), err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        return
+    try:
+        started = timer()
+        gids = insns.search(pattern)
+        elapsed = timer() - started
+    except ValueError, err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        insns.close()
+        return
+    insns.close()
+
+    gadget_db = GadgetDB(db)
+    sink = open_sink(format)
+    for gid in gids[:limit or len(gids)]:
+        (address, length, section, filename, data) = gadget_db.gadget(gid)
+        mode = gadget_db.mode(gid)
+        sink.address_bits = mode
+        sink.write(address, length, data, filename, section.name,
+                   gadget_db.terminator(data, mode))
+    sink.close()
+    scriptine.log.log("%d of %d sequences match, searched in %.3fs.",
+                      len(gids), len(gadget_db), elapsed)
+    gadget_db.close()
+
+
+def diff_command(old, new, output="", summary_only="no",
+                 diff_memory=DEFAULT_DIFF_MEMORY, same_file="no"):
+    """
+    Shell command: list the gadgets added, removed and relocated between
+    two gadget databases
+
+    Options:
+       old       -- gadget database of the old version
+       new       -- gadget database of the new version
+       output    -- file to write the changes to, default: stdout
+       summary_only -- only write the summary counts (yes/no), default: no
+       diff_memory -- MB of entries per database kept in memory before
+                    sorted runs are written to disk, default: 256
+       same_file -- compare the single files of both databases even if
+                    their names differ (yes/no), default: no
+    """
+    try:
+        old_db = GadgetDB(old)
+        new_db = GadgetDB(new)
+    except (IOError, ValueError), err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        return
+    for (what, old_value, new_value) in [
+            ("--numbytes", old_db.numbytes, new_db.numbytes),
+            ("--terminators", old_db.terminators, new_db.terminators),
+            ("--classify", old_db.classify, new_db.classify),
+            ("--regions", old_db.regions, new_db.regions)]:
+        if old_value != new_value:
+            scriptine.log.warn("The databases were scanned with different "
+                               "%s, gadgets may differ because of it.", what)
+
+    started = timer()
+    (old_files, new_files) = file_ids(old_db, new_db, same_file == "yes")
+    if not set(old_files) & set(new_files):
+        scriptine.log.warn("No file matches by name, gadgets can only be "
+                           "added or removed (see --same-file).")
+    sides = []
+    try:
+        sides += [SortedGadgets(old_db, old_files, diff_memory)]
+        sides += [SortedGadgets(new_db, new_files, diff_memory)]
+        outfile = sys.stdout
+        if output != "":
+            outfile = open(output, "w")
+        counts = dict([(change, 0) for change in
+                       ["unchanged", "added", "removed", "relocated"]])
+        for (change, old_entry, new_entry) in \
+                diff_entries(sides[0].entries(), sides[1].entries()):
+            counts[change] += 1
+            if change == "unchanged" or summary_only == "yes":
+                continue
+            if new_entry is not None:
+                (address, length, section, filename, data) = \
+                    new_db.gadget(new_entry[3])
+            else:
+                (address, length, section, filename, data) = \
+                    old_db.gadget(old_entry[3])
+            record = {"change" : change, "fingerprint" : "%0*x" %
+                      (FINGERPRINT_BITS / 4, (new_entry or old_entry)[1]),
+                      "file" : filename,
+                      "section" : section.name, "address" : address,
+                      "length" : length, "bytes" : binascii.hexlify(data)}
+            if change == "relocated":
+                record["old_address"] = old_entry[2]
+            outfile.write(json.dumps(record, sort_keys=True) + "\n")
+        counts["old"] = len(old_db)
+        counts["new"] = len(new_db)
+        outfile.write(json.dumps({"summary" : counts}, sort_keys=True) + "\n")
+        if output != "":
+            outfile.close()
+    except IOError, err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        return
+    finally:
+        for side in sides:
+            side.close()
+        old_db.close()
+        new_db.close()
+
+    scriptine.log.log("%d gadgets before, %d after: %d unchanged, %d added, "
+                      "%d removed, %d relocated (%.2fs).", counts["old"],
+                      counts["new"], counts["unchanged"], counts["added"],
+                      counts["removed"], counts["relocated"],
+                      timer() - started)
+    if sides[0].runs or sides[1].runs:
+        scriptine.log.log("Sorted in %d runs on disk.",
+                          sides[0].runs + sides[1].runs)
+
+
+def serve_command(socket=DEFAULT_SOCKET, queue=DEFAULT_QUEUE,
+                  memory_cache=64):
+    """
+    Shell command: run a scan server taking scan and query jobs on a
+    Unix socket, keeping worker pools and caches between jobs
+
+    Options:
+       socket    -- socket to listen on,
+                    default: ~/.cache/ropscan/server.sock
+       queue     -- jobs waiting before clients are told to retry,
+                    default: 16
+       memory_cache -- MB of scan results kept in memory for jobs without
+                    --cache (0: none), default: 64
+    """
+    def scan_job(state, **args):
+        """Run a scan job, in the in-memory result cache by default"""
+        if args["cache"] == "" and memory_cache > 0:
+            args["cache"] = ":memory:"
+            args["cache_size"] = memory_cache
+        try:
+            scan_file(state=state, **args)
+        finally:
+            instrument.disable()
+
+    def query_job(_state, **args):
+        """Run a query job"""
+        query_db(**args)
+
+    try:
+        server = ScanServer(socket, {"scan" : scan_job, "query" : query_job},
+                            queue)
+    except (ValueError, EnvironmentError), err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        return
+    # a plain kill shuts the server down cleanly, too
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: sys.exit(0))
+    scriptine.log.log("Serving scan jobs on %s (pid %d).", server.path,
+                      os.getpid())
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+    scriptine.log.log("Served %d jobs.", server.finished)
+
+
+def cache_command(action, cache=DEFAULT_CACHE_FILE,
+                  cache_size=DEFAULT_CACHE_SIZE):
+    """
+    Shell command: inspect (stats) or shrink (prune) the gadget cache
+
+    Options:
+       action    -- stats or prune
+       cache     -- gadget cache file
+       cache_size -- size bound in MB to prune to, default: 256
+    """
+    gadget_cache = GadgetCache(cache, cache_size)
+    if action == "prune":
+        evicted = gadget_cache.prune()
+        gadget_cache.vacuum()
+        scriptine.log.log("Evicted %d entries.", evicted)
+    elif action != "stats":
+        scriptine.log.error("Unknown cache action '%s', use stats or prune.",
+                            action)
+        return
+
+    (entries, used, hits) = gadget_cache.stats()
+    scriptine.log.log("Cache file: %s", gadget_cache.path)
+    scriptine.log.log("   Entries: %d", entries)
+    scriptine.log.log("      Size: %d / %d bytes", used,
+                      gadget_cache.max_bytes)
+    scriptine.log.log("      Hits: %d", hits)
+    gadget_cache.close()
+
+
+def bench_command(sizes="1K,1M", density=0.01, seed=0, numbytes=20,
+                  stages="all", output="", label=""):
+    """
+    Shell command: time the stages of the scan pipeline on synthetic code
+    and print the results as JSON
+
+    Options:
+       sizes     -- comma separated section sizes, e.g. 1K,1M,100M
+       density   -- RET bytes per byte of synthetic code, default: 0.01
+       seed      -- seed of the synthetic code, default: 0
+       numbytes  -- maximum sequence length, default: 20
+       stages    -- comma separated stages or all, default: all
+       output    -- file to write the results to, default: stdout
+       label     -- name of the run (e.g. the commit), default: none
+    """
+    try:
+        byte_sizes = [parse_size(size) for size in sizes.split(",")]
+        selected = None
+        if stages != "all":
+            selected = [stage.strip() for stage in stages.split(",")]
+            unknown = [stage for stage in selected if stage not in STAGES]
+            if unknown:
+                raise ValueError("Unknown stage(s) '%s', use 'all' or any "
+                                 "of: %s" % (",".join(unknown),
+                                             ", ".join(STAGES)))
+    except ValueError, err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        return
+
+    runs = []
+    for size in byte_sizes:
+        scriptine.log.log("Benchmarking %d bytes...", size)
+        bench = Benchmark(size, density, seed, numbytes)
+        runs += [{"size" : size, "density" : density, "seed" : seed,
+                  "numbytes" : numbytes, "stages" : bench.run(selected)}]
+
+    results = json.dumps({"label" : label, "environment" : environment(),
+                          "runs" : runs}, indent=2, sort_keys=True)
+    if output == "":
+        print results
     else:
-        scriptine.log.error(
-            "Missing shell tool(s). No native implementation (yet).")
+        outfile = open(output, "w")
+        outfile.write(results + "\n")
+        outfile.close()
+
+
+def synth_command(filename, size="1M", density=0.01, seed=0):
+    """
+    Shell command: write synthetic code as used by bench to a file
+
+    Options:
+       filename  -- file to write
+       size      -- number of bytes, e.g. 4096, 64K, 100M, default: 1M
+       density   -- RET bytes per byte, default: 0.01
+       seed      -- seed of the synthetic code, default: 0
+    """
+    try:
+        data = synthetic_text(parse_size(size), density, seed)
+    except ValueError, err:
+        scriptine.log.error("%s%s%s", Colors.Red, err, Colors.Reset)
+        return
+    outfile = open(filename, "wb")
+    outfile.write(data)
+    outfile.close()
+    scriptine.log.log("Wrote %d bytes to %s", len(data), filename)
+
+
+if __name__ == "__main__":
+    scriptine.run()
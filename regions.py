@@ -0,0 +1,208 @@
+"""
+Code region map used by ROPCheck to prune RET candidates
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import re
+import sys
+import bisect
+import hashlib
+from decoder import get_decoder, DEFAULT_DECODER
+
+"""
+Policies for the candidates of a section:
+
+  all        every candidate is scanned
+  code       candidates in bytes between known functions that do not
+             decode as code (jump tables, literal pools) are skipped
+  functions  only candidates within known functions are scanned
+
+Functions are known from the symbol tables and the FDEs of .eh_frame
+(see ElfFile.function_ranges()). Sections without any known function
+are scanned completely. The gaps between functions are split at their
+alignment padding, which holds no terminators, and every piece is
+decoded on its own.
+"""
+
+POLICIES = ["all", "code", "functions"]
+DEFAULT_REGIONS = "all"
+
+# instructions compilers and assemblers pad with: nop, int3, xchg ax, ax,
+# the multi-byte nops (0f 1f /0, with operand size and cs prefixes) and
+# the lea esi, [esi] forms of 32 bit code; displacements are zero
+PADDING_INSNS = ["\x90", "\xcc", "\x66+\x90",
+                 "\x66*\x2e?\x0f\x1f(?:\x00|\x40\x00|\x44\x00\x00|"
+                 "\x80\x00{4}|\x84\x00{5})",
+                 "\x8d\x76\x00", "\x8d\x74\x26\x00", "\x8d\xb6\x00{4}",
+                 "\x8d\xbc\x27\x00{4}", "\x89\xf6", "\x8d\x3f"]
+PADDING = re.compile("(?:%s)+" % "|".join(PADDING_INSNS), re.DOTALL)
+# candidates of RET scans, see incremental.candidates()
+RET = re.compile("\xc3")
+# shorter runs of padding instructions are taken for code
+MIN_PADDING = 2
+# gaps between functions larger than this are taken for code unchecked
+MAX_CHECKED_GAP = 16384
+
+
+def merge_ranges(ranges):
+    """Sort (start, end) ranges and merge those overlapping or touching"""
+    merged = []
+    for (start, end) in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged += [(start, end)]
+    return merged
+
+
+def covers(ranges, offset):
+    """Check if one of the sorted, disjoint ranges contains offset"""
+    idx = bisect.bisect_right(ranges, (offset, sys.maxint)) - 1
+    return idx >= 0 and offset < ranges[idx][1]
+
+
+def overlapping(ranges, start, end):
+    """The sorted, disjoint ranges reaching into [start, end)"""
+    first = max(0, bisect.bisect_right(ranges, (start, sys.maxint)) - 1)
+    found = []
+    for (low, high) in ranges[first:]:
+        if low >= end:
+            break
+        if high > start:
+            found += [(low, high)]
+    return found
+
+
+def padding_runs(data, start=0, end=None):
+    """(start, end) offsets of the runs of padding in data[start:end]"""
+    if end is None:
+        end = len(data)
+    return [match.span() for match in PADDING.finditer(data, start, end)
+            if match.end() - match.start() >= MIN_PADDING]
+
+
+def ranges_tag(policy, ranges):
+    """Short text naming a policy and its ranges, for cache keys"""
+    if ranges is None:
+        return policy
+    return "%s:%s" % (policy, hashlib.md5(repr(ranges)).hexdigest()[:16])
+
+
+class RegionFilter:
+    """
+    Decides which parts of the sections of one binary are scanned for
+    candidates under a --regions policy (see POLICIES), given the address
+    ranges of the binary's functions and the decoder mode of its code.
+    Counts the candidates of all sections and those pruned.
+    """
+    def __init__(self, policy, functions=None, mode=32):
+        if policy not in POLICIES:
+            raise ValueError("Unknown region policy '%s', use one of: %s" %
+                             (policy, ", ".join(POLICIES)))
+        self.policy = policy
+        self.functions = merge_ranges(functions or [])
+        self.mode = mode
+        self.candidates = 0
+        self.pruned = 0
+        self.__decoder = None
+
+    def ranges(self, section, data):
+        """
+        Sorted (start, end) offsets of the parts of section, whose bytes
+        are data, to scan for candidates; None for all of it
+        """
+        if self.policy == "all":
+            return None
+        size = len(data)
+        functions = [(max(start, section.start) - section.start,
+                      min(end, section.start + size) - section.start)
+                     for (start, end) in overlapping(self.functions,
+                                                     section.start,
+                                                     section.start + size)]
+        if not functions:
+            return None
+        if self.policy == "functions":
+            return functions
+
+        kept = list(functions)
+        pos = 0
+        for (start, end) in functions + [(size, size)]:
+            if start > pos:
+                kept += [piece for piece in self.__unpadded(data, pos, start)
+                         if self.__code_like(data, piece)]
+            pos = max(pos, end)
+        return merge_ranges(kept)
+
+    def __unpadded(self, data, start, end):
+        """The parts of data[start:end] around its padding runs"""
+        pieces = []
+        pos = start
+        for (low, high) in padding_runs(data, start, end) + [(end, end)]:
+            if low > pos:
+                pieces += [(pos, low)]
+            pos = high
+        return pieces
+
+    def __code_like(self, data, piece):
+        """
+        Check if a piece of a gap between functions decodes as code: no
+        invalid instruction and none running over its end
+        """
+        (start, end) = piece
+        if end - start > MAX_CHECKED_GAP:
+            return True
+        if self.__decoder is None:
+            self.__decoder = get_decoder(DEFAULT_DECODER, self.mode)
+        code = bytearray(data[start:end])
+        pos = 0
+        while pos < len(code):
+            insn = self.__decoder.decode(code, pos)
+            if not insn.valid:
+                return False
+            pos = insn.end
+        return True
+
+    def count(self, data, ranges, terminators=None):
+        """
+        Account for the candidates of a section's data scanned within
+        ranges (see ranges()), those of the TerminatorTable terminators or
+        RETs
+
+        Returns: (number of candidates, number of them pruned)
+        """
+        pattern = RET
+        if terminators is not None:
+            pattern = terminators.pattern
+        total = len(pattern.findall(data))
+        kept = total
+        if ranges is not None:
+            kept = sum([len(pattern.findall(data, start, end))
+                        for (start, end) in ranges])
+        self.candidates += total
+        self.pruned += total - kept
+        return (total, total - kept)
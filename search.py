@@ -0,0 +1,524 @@
+"""
+Instruction pattern search over gadget databases used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import re
+import mmap
+import json
+import array
+import bisect
+import struct
+from decoder import get_decoder, DEFAULT_DECODER
+from x86 import REGS8, REGS8_REX, REGS16, REGS32, REGS64, SEGREGS
+
+"""
+File layout (little endian, every part starts 8-byte aligned):
+
+  header    magic, then (meta size, sequences, tokens, gadgets, keys,
+            postings)
+  meta      JSON: stamp of the gadget database, vocabulary of normalized
+            instructions as [mnemonic, [operands]]
+  seq_first I[s+1] first token of every distinct gadget sequence
+  tokens    I[t]   vocabulary ids of the instructions of all sequences
+  gid_first I[s+1] first entry of every sequence in gids
+  gids      I[n]   gadget ids grouped by sequence
+  keys      Q[k]   n-gram keys, sorted: id << 32 for an instruction,
+                   a << 32 | b + 1 for instruction a followed by b
+  post_first I[k+1] first posting of every key
+  postings  I[p]   sequence ids per key, ascending
+
+Sequences are the distinct (mode, bytes) of the database's gadgets.
+"""
+
+INDEX_MAGIC = "ROPINS\x01\x00"
+INDEX_HEADER = struct.Struct("<8sQQQQQQ")
+
+PREFIXES = ["lock", "rep", "repne", "o16"]
+REGISTER_CLASSES = {
+    "reg8" : set(REGS8 + REGS8_REX),
+    "reg16" : set(REGS16),
+    "reg32" : set(REGS32),
+    "reg64" : set(REGS64),
+    "sreg" : set([reg for reg in SEGREGS if reg is not None]),
+    "st" : set(["st%d" % i for i in range(8)]),
+    "mm" : set(["mm%d" % i for i in range(8)]),
+    "xmm" : set(["xmm%d" % i for i in range(16)]),
+}
+REGISTER_CLASSES["reg"] = REGISTER_CLASSES["reg8"] | \
+    REGISTER_CLASSES["reg16"] | REGISTER_CLASSES["reg32"] | \
+    REGISTER_CLASSES["reg64"]
+# r8 names a register of 64 bit code, so there is no r8 class
+for _bits in (16, 32, 64):
+    REGISTER_CLASSES["r%d" % _bits] = REGISTER_CLASSES["reg%d" % _bits]
+
+# bigram lookups per pattern instruction pair; beyond, unigrams are used
+MAX_PAIRS = 1024
+# constraints this many times larger than the candidates are left to
+# the verification instead of being intersected
+MAX_SPREAD = 32
+
+_SIZE_WORD = re.compile(r"^(byte|word|dword|qword) ")
+_NUMBER = re.compile(r"\b(0x[0-9a-f]+|[0-9]+)\b")
+_MEMORY_PARTS = re.compile(r"([+*-])")
+
+
+def _align(size):
+    """Round size up to the next multiple of 8"""
+    return (size + 7) & ~7
+
+
+def _stamp(path):
+    """Size and modification time of a file"""
+    info = os.stat(path)
+    return [info.st_size, int(info.st_mtime)]
+
+
+def normalize(insn):
+    """
+    Index form of a decoded Instruction: (mnemonic including prefixes,
+    operands), every immediate, displacement and branch target replaced
+    by imm and memory operand sizes left out
+    """
+    operands = tuple([_NUMBER.sub("imm", _SIZE_WORD.sub("", op))
+                      for op in insn.operands])
+    return (insn.prefix + insn.mnemonic, operands)
+
+
+def instruction_text(mnemonic, operands):
+    """Text of a normalized instruction"""
+    if operands:
+        return mnemonic + " " + ", ".join(operands)
+    return mnemonic
+
+
+def _match_atom(pattern, atom):
+    """Match a register, imm or literal inside or outside of brackets"""
+    if pattern == "*":
+        return True
+    if pattern in REGISTER_CLASSES:
+        return atom in REGISTER_CLASSES[pattern]
+    return pattern == atom
+
+
+def _match_operand(pattern, operand):
+    """Match an operand pattern against a normalized operand"""
+    if pattern == "*":
+        return True
+    if pattern == "mem":
+        return "[" in operand
+    if "[" not in pattern:
+        return _match_atom(pattern, operand)
+    if "[" not in operand:
+        return False
+    (segment, inner) = pattern.split("[", 1)
+    (op_segment, op_inner) = operand.split("[", 1)
+    # patterns without a segment override match any
+    if segment and segment != op_segment:
+        return False
+    if inner == "*]":
+        return True
+    parts = _MEMORY_PARTS.split(inner.rstrip("]"))
+    op_parts = _MEMORY_PARTS.split(op_inner.rstrip("]"))
+    if len(parts) != len(op_parts):
+        return False
+    for (part, op_part) in zip(parts, op_parts):
+        if part in "+*-" or op_part in "+*-":
+            if part != op_part:
+                return False
+        elif not _match_atom(part, op_part):
+            return False
+    return True
+
+
+def compile_pattern(text):
+    """
+    Parse an instruction pattern: instructions separated by semicolons,
+    each "*" (any one instruction), "..." (any number of instructions)
+    or a mnemonic (or *) with comma separated operand patterns. Operand
+    patterns are registers, the classes reg, reg8, reg16 (r16), reg32
+    (r32), reg64 (r64), sreg, st, mm and xmm, imm, mem or [*] (any
+    memory operand), * (any operand) or memory operands built from
+    these, e.g. [reg], [reg+imm], [esp+imm].
+
+    Returns: list of "*", "..." or (mnemonic, operand patterns) elements
+    """
+    elements = []
+    for part in text.lower().split(";"):
+        words = part.split()
+        if not words:
+            raise ValueError("Empty instruction in pattern '%s'" % text)
+        if words in (["*"], ["..."]):
+            elements += [words[0]]
+            continue
+        mnemonic = words.pop(0)
+        while mnemonic in PREFIXES and words:
+            mnemonic += " " + words.pop(0)
+        operands = ()
+        if words:
+            operands = tuple([op.strip() for op in
+                              " ".join(words).split(",")])
+            if "" in operands:
+                raise ValueError("Empty operand in '%s'" % part.strip())
+        elements += [(mnemonic, operands)]
+    return elements
+
+
+def _matches(elements, id_sets, tokens):
+    """Check a sequence's vocabulary ids against a compiled pattern"""
+    positions = set([0])
+    for (element, ids) in zip(elements, id_sets):
+        if element == "...":
+            positions = set(range(min(positions), len(tokens) + 1))
+        else:
+            positions = set([pos + 1 for pos in positions
+                             if pos < len(tokens) and
+                             (ids is None or tokens[pos] in ids)])
+            if not positions:
+                return False
+    return len(tokens) in positions
+
+
+class InstructionIndex:
+    """
+    Inverted index of the gadgets of a GadgetDB (see gadgetdb.py) by
+    normalized instructions (see normalize()) and pairs of consecutive
+    instructions, together with the instructions of every distinct
+    gadget sequence. Pattern searches look up the posting lists of the
+    pattern's instructions and pairs, intersect them and only check the
+    remaining sequences against the whole pattern.
+
+    The index is built once per database (see build()) and saved next
+    to it; it is memory-mapped, so opening it only reads the vocabulary.
+    """
+    def __init__(self, path):
+        self.path = path
+        infile = open(path, "rb")
+        try:
+            self.__map = mmap.mmap(infile.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except (mmap.error, ValueError):
+            infile.close()
+            raise ValueError("%s: not an instruction index" % path)
+        infile.close()
+
+        if len(self.__map) < INDEX_HEADER.size:
+            raise ValueError("%s: not an instruction index" % path)
+        (magic, metalen, nseqs, ntokens, ngadgets, nkeys, npostings) = \
+            INDEX_HEADER.unpack_from(self.__map, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError("%s: not an instruction index" % path)
+
+        pos = INDEX_HEADER.size
+        meta = json.loads(self.__map[pos:pos + metalen])
+        pos += _align(metalen)
+        self.stamp = meta["stamp"]
+        self.vocabulary = [(str(mnemonic), tuple([str(op) for op in ops]))
+                           for (mnemonic, ops) in meta["vocabulary"]]
+        self.__by_mnemonic = {}
+        for (tid, (mnemonic, _ops)) in enumerate(self.vocabulary):
+            self.__by_mnemonic.setdefault(mnemonic, []).append(tid)
+
+        self.__columns = {}
+        for (name, fmt, entries) in [("seq_first", "I", nseqs + 1),
+                                     ("tokens", "I", ntokens),
+                                     ("gid_first", "I", nseqs + 1),
+                                     ("gids", "I", ngadgets),
+                                     ("keys", "Q", nkeys),
+                                     ("post_first", "I", nkeys + 1),
+                                     ("postings", "I", npostings)]:
+            size = struct.calcsize("<" + fmt)
+            self.__columns[name] = (pos, fmt, size, entries)
+            end = pos + size * entries
+            pos += _align(size * entries)
+        # indexes written before the postings were padded end unaligned
+        if end > len(self.__map):
+            raise ValueError("%s: truncated instruction index" % path)
+        self.sequences = nseqs
+        self.gadgets = ngadgets
+        self.__keys = _KeyView(self)
+
+    def __slice(self, name, first, count):
+        """count entries of column name, starting at first"""
+        (offset, fmt, size, _entries) = self.__columns[name]
+        return struct.unpack_from("<%d%s" % (count, fmt), self.__map,
+                                  offset + first * size)
+
+    def entry(self, name, idx):
+        """Entry idx of column name"""
+        return self.__slice(name, idx, 1)[0]
+
+    def key_count(self):
+        """Number of n-gram keys"""
+        return self.__columns["keys"][3]
+
+    def tokens(self, seq):
+        """Vocabulary ids of the instructions of sequence seq"""
+        (first, last) = self.__slice("seq_first", seq, 2)
+        return self.__slice("tokens", first, last - first)
+
+    def gadget_ids(self, seq):
+        """Ids of the gadgets consisting of sequence seq"""
+        (first, last) = self.__slice("gid_first", seq, 2)
+        return self.__slice("gids", first, last - first)
+
+    def __posting_range(self, key):
+        """(first, count) of the postings of key, (0, 0) if unknown"""
+        idx = bisect.bisect_left(self.__keys, key)
+        if idx == len(self.__keys) or self.__keys[idx] != key:
+            return (0, 0)
+        (first, last) = self.__slice("post_first", idx, 2)
+        return (first, last - first)
+
+    def matching_ids(self, element):
+        """Vocabulary ids matching a pattern instruction"""
+        (mnemonic, operands) = element
+        if mnemonic == "*":
+            tids = xrange(len(self.vocabulary))
+        else:
+            tids = self.__by_mnemonic.get(mnemonic, [])
+        found = set()
+        for tid in tids:
+            ops = self.vocabulary[tid][1]
+            if len(ops) != len(operands):
+                continue
+            for (pattern, operand) in zip(operands, ops):
+                if not _match_operand(pattern, operand):
+                    break
+            else:
+                found.add(tid)
+        return found
+
+    def __constraints(self, elements, id_sets):
+        """
+        Posting ranges every matching sequence must be in at least one
+        of, one list of ranges per constraint
+        """
+        constraints = []
+        run = []
+        for (element, ids) in zip(elements, id_sets) + [("*", None)]:
+            if ids is not None:
+                run += [ids]
+                continue
+            if len(run) == 1:
+                constraints += [[self.__posting_range(tid << 32)
+                                 for tid in run[0]]]
+            for (first, second) in zip(run, run[1:]):
+                if len(first) * len(second) <= MAX_PAIRS:
+                    constraints += [[self.__posting_range(a << 32 | b + 1)
+                                     for a in first for b in second]]
+                else:
+                    smaller = min(first, second, key=len)
+                    constraints += [[self.__posting_range(tid << 32)
+                                     for tid in smaller]]
+            run = []
+        return constraints
+
+    def search(self, pattern):
+        """
+        Find the sequences matching a pattern (see compile_pattern())
+
+        Returns: list of ids of matching gadgets, ascending
+        """
+        elements = compile_pattern(pattern)
+        id_sets = []
+        for element in elements:
+            if element in ("*", "..."):
+                id_sets += [None]
+                continue
+            ids = self.matching_ids(element)
+            if not ids:
+                return []
+            id_sets += [ids]
+
+        # smallest constraints first, so few postings are read
+        constraints = [(sum([count for (_first, count) in ranges]), ranges)
+                       for ranges in self.__constraints(elements, id_sets)]
+        constraints.sort()
+        candidates = None
+        for (size, ranges) in constraints:
+            if candidates is not None and size > MAX_SPREAD * len(candidates):
+                break
+            found = set()
+            for (first, count) in ranges:
+                if count:
+                    found.update(self.__slice("postings", first, count))
+            if candidates is None:
+                candidates = found
+            else:
+                candidates &= found
+            if not candidates:
+                return []
+        if candidates is None:
+            candidates = xrange(self.sequences)
+
+        gids = []
+        for seq in candidates:
+            if _matches(elements, id_sets, self.tokens(seq)):
+                gids += self.gadget_ids(seq)
+        return sorted(gids)
+
+    def current(self, path):
+        """Check if the index was built from the database at path as is"""
+        return self.stamp == _stamp(path)
+
+    def close(self):
+        """Unmap the index"""
+        self.__map.close()
+
+    @classmethod
+    def build(cls, gadget_db, path, db_path=None):
+        """
+        Decode all gadgets of gadget_db and write their index to path,
+        stamped with the database file db_path (default: its path).
+        Gadgets ending at the same address share the instructions of
+        their common tail, which is decoded only once.
+
+        Returns: the opened InstructionIndex
+        """
+        decoders = {}
+        vocabulary = []
+        vocab_ids = {}
+        seq_ids = {}
+        seq_first = array.array("I", [0])
+        tokens = array.array("I")
+        seq_of = array.array("I")
+        postings = {}
+
+        datas = {}
+        decoded = {}
+        last_end = None
+        (sids, ends, lengths) = gadget_db.locations()
+        for gid in xrange(len(sids)):
+            sid = sids[gid]
+            if sid not in datas:
+                datas[sid] = bytearray(gadget_db.section_data(sid))
+            data = datas[sid]
+            mode = gadget_db.modes[sid]
+            offset = ends[gid] - gadget_db.sections[sid].start
+            length = lengths[gid]
+            key = (mode, str(data[offset - length:offset + 1]))
+            seq = seq_ids.get(key)
+            if seq is not None:
+                seq_of.append(seq)
+                continue
+
+            if ends[gid] != last_end:
+                # tails are shared by the gadgets of one terminator only
+                decoded = {}
+                last_end = ends[gid]
+            if mode not in decoders:
+                decoders[mode] = get_decoder(DEFAULT_DECODER, mode)
+            ids = []
+            pos = offset - length
+            while pos <= offset:
+                step = decoded.get((sid, pos))
+                if step is None:
+                    insn = decoders[mode].decode(data, pos, offset + 1)
+                    form = normalize(insn)
+                    if form not in vocab_ids:
+                        vocab_ids[form] = len(vocabulary)
+                        vocabulary += [form]
+                    step = (vocab_ids[form], pos + max(1, insn.length))
+                    decoded[(sid, pos)] = step
+                ids += [step[0]]
+                pos = step[1]
+
+            seq = len(seq_first) - 1
+            seq_ids[key] = seq
+            seq_of.append(seq)
+            tokens.extend(ids)
+            seq_first.append(len(tokens))
+            grams = set([tid << 32 for tid in ids])
+            grams.update([a << 32 | b + 1 for (a, b) in zip(ids, ids[1:])])
+            for gram in grams:
+                if gram in postings:
+                    postings[gram].append(seq)
+                else:
+                    postings[gram] = array.array("I", [seq])
+
+        nseqs = len(seq_first) - 1
+        # gadget ids grouped by sequence, by counting
+        gid_first = array.array("I", [0] * (nseqs + 1))
+        for seq in seq_of:
+            gid_first[seq + 1] += 1
+        for seq in xrange(nseqs):
+            gid_first[seq + 1] += gid_first[seq]
+        fill = array.array("I", gid_first)
+        gids = array.array("I", [0] * len(seq_of))
+        for (gid, seq) in enumerate(seq_of):
+            gids[fill[seq]] = gid
+            fill[seq] += 1
+
+        keys = sorted(postings.keys())
+        post_first = array.array("I", [0])
+        for key in keys:
+            post_first.append(post_first[-1] + len(postings[key]))
+
+        meta = json.dumps({"stamp" : _stamp(db_path or gadget_db.path),
+                           "vocabulary" : vocabulary})
+        outfile = open(path + ".tmp", "wb")
+        outfile.write(INDEX_HEADER.pack(INDEX_MAGIC, len(meta), nseqs,
+                                        len(tokens), len(seq_of), len(keys),
+                                        post_first[-1]))
+        outfile.write(meta)
+        _pad(outfile, len(meta))
+        for column in (seq_first, tokens, gid_first, gids):
+            outfile.write(column.tostring())
+            _pad(outfile, len(column) * column.itemsize)
+        packed = struct.pack("<%dQ" % len(keys), *keys)
+        outfile.write(packed)
+        _pad(outfile, len(packed))
+        outfile.write(post_first.tostring())
+        _pad(outfile, len(post_first) * post_first.itemsize)
+        for key in keys:
+            outfile.write(postings[key].tostring())
+        _pad(outfile, post_first[-1] * 4)
+        outfile.close()
+        os.rename(path + ".tmp", path)
+        return cls(path)
+
+
+def _pad(outfile, size):
+    """Pad a part of size bytes to the next 8-byte boundary"""
+    outfile.write("\0" * (_align(size) - size))
+
+
+class _KeyView:
+    """The sorted n-gram keys of an index, for bisect"""
+    def __init__(self, index):
+        self.__index = index
+        self.__count = index.key_count()
+
+    def __len__(self):
+        return self.__count
+
+    def __getitem__(self, idx):
+        if idx < 0 or idx >= self.__count:
+            raise IndexError(idx)
+        return self.__index.entry("keys", idx)
@@ -0,0 +1,405 @@
+"""
+Scan server and client used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+"""
+Protocol: the client sends one JSON object per connection, a line
+{"command" : <name>, "args" : {<option> : <value>, ...}, "cwd" : <dir>};
+the job runs in the client's working directory cwd. The server
+answers with JSON lines: {"stream" : "stdout" or "stderr", "data" :
+<base64>} for everything the job writes, then {"exit" : <status>}. A
+server whose queue is full answers {"busy" : <queued jobs>} instead and
+the client retries later. {"command" : "status"} is answered with
+{"status" : {...}} right away.
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import base64
+import socket
+import threading
+import traceback
+import Queue
+import SocketServer
+
+DEFAULT_SOCKET = os.path.join("~", ".cache", "ropscan", "server.sock")
+# jobs waiting for the executor before clients are turned away
+DEFAULT_QUEUE = 16
+# seconds a client retries a busy server before it gives up
+DEFAULT_WAIT = 60
+# output of a job is sent in pieces of at most this many bytes
+REPLY_CHUNK = 65536
+
+
+class ClientGone(Exception):
+    """
+    Raised in a job whose client closed its connection
+    """
+
+
+class ServerBusy(Exception):
+    """
+    Raised by submit() if the server's queue stayed full
+    """
+
+
+class _ReplyStream:
+    """
+    File-like object a job writes its stdout or stderr to, forwarding
+    everything to the client as base64 JSON lines
+    """
+    def __init__(self, job, name):
+        self.job = job
+        self.name = name
+        self.buffer = []
+        self.buffered = 0
+        # set by print statements ending in a comma
+        self.softspace = 0
+
+    def write(self, data):
+        """Queue data for the client, sending full chunks right away"""
+        self.buffer += [data]
+        self.buffered += len(data)
+        if self.buffered >= REPLY_CHUNK:
+            self.flush()
+
+    def writelines(self, lines):
+        """Write a sequence of strings"""
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        """Send everything written so far"""
+        if self.buffered == 0:
+            return
+        data = "".join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        self.job.send({"stream" : self.name,
+                       "data" : base64.b64encode(data)})
+
+    def isatty(self):
+        """Job output never goes to a terminal directly"""
+        return False
+
+
+class _Job:
+    """A request waiting for or being run by the executor"""
+    def __init__(self, command, args, cwd, wfile):
+        self.command = command
+        self.args = args
+        self.cwd = cwd
+        self.wfile = wfile
+        self.status = None
+        self.gone = False
+        self.dropped = False
+        self.done = threading.Event()
+
+    def send(self, message):
+        """Send a JSON line to the client, raises ClientGone if it left"""
+        if self.gone:
+            raise ClientGone()
+        try:
+            self.wfile.write(json.dumps(message) + "\n")
+            self.wfile.flush()
+        except (socket.error, IOError):
+            self.gone = True
+            raise ClientGone()
+
+
+class WarmState:
+    """
+    Objects a scan sets up that the server keeps between jobs: worker
+    pools, decode caches, result caches and tool checks. Only used by the
+    executor thread.
+    """
+    def __init__(self):
+        self.__objects = {}
+
+    def get(self, key, create):
+        """The object kept under key, made by create() the first time"""
+        if key not in self.__objects:
+            self.__objects[key] = create()
+        return self.__objects[key]
+
+    def drop(self, key):
+        """Forget the object kept under key, e.g. after an aborted job"""
+        self.__objects.pop(key, None)
+
+    def close(self):
+        """Close all objects kept that can be closed"""
+        for obj in self.__objects.values():
+            if hasattr(obj, "close"):
+                obj.close()
+        self.__objects = {}
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+    """Reads a request, queues it and waits for the executor"""
+    def handle(self):
+        server = self.server
+        try:
+            request = json.loads(self.rfile.readline())
+            command = request["command"]
+            args = request.get("args", {})
+            cwd = request.get("cwd", "/")
+        except (ValueError, KeyError, TypeError):
+            self.__reply({"error" : "bad request"})
+            return
+
+        if command == "status":
+            self.__reply({"status" : server.status()})
+            return
+        if command not in server.commands:
+            self.__reply({"error" : "unknown command '%s'" % command})
+            return
+
+        job = _Job(command, args, cwd, self.wfile)
+        try:
+            server.jobs.put_nowait(job)
+        except Queue.Full:
+            self.__reply({"busy" : server.jobs.qsize()})
+            return
+        while not job.done.is_set():
+            # waits with a timeout stay interruptible in Python 2
+            job.done.wait(1.0)
+        if job.dropped:
+            self.__reply({"error" : "server shut down"})
+        elif not job.gone:
+            self.__reply({"exit" : job.status})
+
+    def __reply(self, message):
+        """Send a JSON line, ignoring clients that left"""
+        try:
+            self.wfile.write(json.dumps(message) + "\n")
+        except (socket.error, IOError):
+            pass
+
+
+class ScanServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """
+    Serves jobs on a Unix socket. commands maps command names to
+    functions run as function(state, **args) with the job's output as
+    sys.stdout and sys.stderr; their return value is the exit status.
+
+    Connections are served by threads that only queue their job; a
+    single executor thread runs the jobs one after another, keeping the
+    WarmState between them. If more than queue_size jobs are waiting,
+    clients are told the server is busy.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, commands, queue_size=DEFAULT_QUEUE):
+        self.path = os.path.expanduser(path)
+        self.commands = commands
+        self.jobs = Queue.Queue(max(1, queue_size))
+        self.state = WarmState()
+        self.started = time.time()
+        self.finished = 0
+        self.running = None
+        self.__stdout = sys.stdout
+        self.__stderr = sys.stderr
+
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        if os.path.exists(self.path):
+            if status(self.path) is not None:
+                raise ValueError("A server is already listening on %s" %
+                                 self.path)
+            # left over by a server that did not shut down
+            os.remove(self.path)
+        SocketServer.UnixStreamServer.__init__(self, self.path, _Handler)
+
+        self.__executor = threading.Thread(target=self.__execute)
+        self.__executor.daemon = True
+        self.__executor.start()
+
+    def status(self):
+        """Queue and job counters of the server"""
+        return {"queued" : self.jobs.qsize(),
+                "running" : self.running,
+                "finished" : self.finished,
+                "uptime" : int(time.time() - self.started),
+                "pid" : os.getpid()}
+
+    def __execute(self):
+        """Executor thread: run queued jobs one after another"""
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                # the warm state belongs to this thread (SQLite caches)
+                self.state.close()
+                return
+            self.running = job.command
+            job.status = self.__run(job)
+            self.running = None
+            self.finished += 1
+            job.done.set()
+
+    def __run(self, job):
+        """Run a job with its output going to the client"""
+        (stdout, stderr) = (_ReplyStream(job, "stdout"),
+                            _ReplyStream(job, "stderr"))
+        (sys.stdout, sys.stderr) = (stdout, stderr)
+        status = 0
+        try:
+            try:
+                os.chdir(job.cwd)
+                args = dict([(str(key), _native(value))
+                             for (key, value) in job.args.items()])
+                status = self.commands[job.command](self.state, **args)
+            except SystemExit, err:
+                status = err.code
+            except ClientGone:
+                status = None
+            except Exception:
+                status = 1
+                sys.stderr.write(traceback.format_exc())
+            try:
+                if stdout.softspace:
+                    # the newline Python writes when a script exits
+                    stdout.write("\n")
+                stdout.flush()
+                stderr.flush()
+            except ClientGone:
+                pass
+        finally:
+            (sys.stdout, sys.stderr) = (self.__stdout, self.__stderr)
+            os.chdir("/")
+        if job.gone:
+            self.__stderr.write("Client of a %s job left, dropping the "
+                                "warm state.\n" % job.command)
+            self.state.close()
+        return status or 0
+
+    def server_close(self):
+        """
+        Close the socket and remove its file, drop the waiting jobs and
+        stop the executor once the running job is done
+        """
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        try:
+            while True:
+                job = self.jobs.get_nowait()
+                job.dropped = True
+                job.done.set()
+        except Queue.Empty:
+            pass
+        self.jobs.put(None)
+        while self.__executor.is_alive():
+            self.__executor.join(1.0)
+
+
+def _native(value):
+    """JSON option value as a Python 2 str, other values as they are"""
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return value
+
+
+def _connect(path):
+    """Socket connected to the server at path, None if there is none"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(os.path.expanduser(path))
+    except socket.error, err:
+        sock.close()
+        if err.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+    return sock
+
+
+def status(path):
+    """Status of the server listening at path, None if there is none"""
+    sock = _connect(path)
+    if sock is None:
+        return None
+    try:
+        sock.sendall(json.dumps({"command" : "status"}) + "\n")
+        reply = sock.makefile("rb").readline()
+    finally:
+        sock.close()
+    try:
+        return json.loads(reply)["status"]
+    except (ValueError, KeyError):
+        return None
+
+
+def submit(path, command, args, stdout=None, stderr=None,
+           wait=DEFAULT_WAIT):
+    """
+    Run command with args on the server listening at path, in the
+    current working directory, copying the job's output to stdout and
+    stderr (default: sys.stdout and sys.stderr) as it arrives. A busy
+    server is asked again with growing delays for up to wait seconds.
+
+    Returns: the job's exit status, None if no server is listening.
+    Raises ServerBusy if the server stayed busy.
+    """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    streams = {"stdout" : stdout, "stderr" : stderr}
+    deadline = time.time() + wait
+    delay = 0.05
+    while True:
+        sock = _connect(path)
+        if sock is None:
+            return None
+        try:
+            sock.sendall(json.dumps({"command" : command, "args" : args,
+                                     "cwd" : os.getcwd()}) + "\n")
+            replies = sock.makefile("rb")
+            for line in replies:
+                reply = json.loads(line)
+                if "stream" in reply:
+                    stream = streams[reply["stream"]]
+                    stream.write(base64.b64decode(reply["data"]))
+                    stream.flush()
+                elif "exit" in reply:
+                    return reply["exit"]
+                elif "busy" in reply:
+                    break
+                elif "error" in reply:
+                    raise ValueError("Server: %s" % reply["error"])
+            else:
+                raise IOError("Server closed the connection")
+        finally:
+            sock.close()
+        if time.time() + delay > deadline:
+            raise ServerBusy("%s is busy" % path)
+        time.sleep(delay)
+        delay = min(delay * 2, 2.0)
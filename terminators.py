@@ -0,0 +1,203 @@
+"""
+Gadget terminator classes used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import re
+
+# kind -> (first byte, modrm reg field or None, immediate bytes)
+TERMINATORS = {
+    "ret"      : (0xc3, None, 0),
+    "ret-imm"  : (0xc2, None, 2),
+    "retf"     : (0xcb, None, 0),
+    "retf-imm" : (0xca, None, 2),
+    "call"     : (0xff, 2, 0),
+    "jmp"      : (0xff, 4, 0),
+}
+# canonical order, also used for naming terminator sets
+KINDS = ["ret", "ret-imm", "retf", "retf-imm", "call", "jmp"]
+
+# segment overrides in front of a terminator do not change what it does
+PREFIX_SEG = frozenset([0x26, 0x2e, 0x36, 0x3e, 0x64, 0x65])
+# neither does an address size override, unless it changes the modrm
+PREFIX_ADSIZE = 0x67
+TERMINATOR_PREFIXES = PREFIX_SEG | frozenset([PREFIX_ADSIZE])
+# in 64 bit mode, REX prefixes only extend the modrm registers
+PREFIX_REX = frozenset(range(0x40, 0x50))
+TERMINATOR_PREFIXES_64 = TERMINATOR_PREFIXES | PREFIX_REX
+# x86 instructions are at most 15 bytes long
+MAX_TERMINATOR_LEN = 15
+
+
+def _modrm_size(code, pos, end):
+    """
+    Bytes taken by the (32 or 64 bit addressing) modrm byte at pos and the
+    sib byte and displacement following it, None if they run past end
+    """
+    if pos >= end:
+        return None
+    modrm = _byte(code, pos)
+    mod = modrm >> 6
+    rm = modrm & 7
+    size = 1
+    if mod != 3 and rm == 4:
+        if pos + 1 >= end:
+            return None
+        size += 1
+        if mod == 0 and _byte(code, pos + 1) & 7 == 5:
+            size += 4
+    if mod == 0 and rm == 5:
+        size += 4
+    elif mod == 1:
+        size += 1
+    elif mod == 2:
+        size += 4
+    if pos + size > end:
+        return None
+    return size
+
+
+def _byte(code, pos):
+    """Byte at pos of a str, buffer or bytearray"""
+    byte = code[pos]
+    if isinstance(byte, int):
+        return byte
+    return ord(byte)
+
+
+class TerminatorTable:
+    """
+    A set of gadget terminator kinds (see KINDS) with a compiled matcher
+    for all of their first bytes, so a single pass over a stream finds
+    every candidate, plus a byte-indexed table to tell the kinds apart.
+    mode is the decoder mode (32 or 64) the table is used with.
+    """
+    def __init__(self, kinds, mode=32):
+        unknown = [kind for kind in kinds if kind not in TERMINATORS]
+        if unknown or not kinds:
+            raise ValueError("Unknown terminator(s) '%s', use 'all' or "
+                             "any of: %s" % (",".join(unknown),
+                                             ", ".join(KINDS)))
+        self.kinds = [kind for kind in KINDS if kind in kinds]
+        self.name = ",".join(self.kinds)
+        self.mode = mode
+        # bytes that may precede a terminator's opcode
+        self.prefixes = TERMINATOR_PREFIXES
+        if mode == 64:
+            self.prefixes = TERMINATOR_PREFIXES_64
+
+        # first byte -> [(kind, modrm reg, immediate bytes)]
+        self.__table = [None] * 256
+        for kind in self.kinds:
+            (first, reg, imm) = TERMINATORS[kind]
+            if self.__table[first] is None:
+                self.__table[first] = []
+            self.__table[first] += [(kind, reg, imm)]
+        self.pattern = re.compile("[%s]" % "".join(
+            [re.escape(chr(b)) for b in range(256)
+             if self.__table[b] is not None]))
+
+    def match(self, code, pos, end=None):
+        """
+        Terminator starting at code[pos] as (kind, size), None if there is
+        none or it runs past end. Segment and address size prefixes (and
+        REX prefixes in 64 bit mode) are part of the terminator, just as
+        the decoders see them.
+        """
+        if end is None:
+            end = len(code)
+        opcode = pos
+        adsize = False
+        prefixes = self.prefixes
+        while opcode < end and opcode - pos < MAX_TERMINATOR_LEN:
+            byte = _byte(code, opcode)
+            if byte not in prefixes:
+                break
+            if byte == PREFIX_ADSIZE:
+                adsize = True
+            opcode += 1
+        if opcode >= end or opcode - pos >= MAX_TERMINATOR_LEN:
+            return None
+
+        entries = self.__table[_byte(code, opcode)]
+        if entries is None:
+            return None
+        prefixes = opcode - pos
+        for (kind, reg, imm) in entries:
+            if reg is None:
+                if opcode + 1 + imm <= end:
+                    return (kind, prefixes + 1 + imm)
+                continue
+            if adsize and self.mode == 32:
+                # 16 bit addressing, not worth supporting
+                continue
+            if opcode + 1 < end and (_byte(code, opcode + 1) >> 3) & 7 == reg:
+                size = _modrm_size(code, opcode + 1, end)
+                if size is not None:
+                    return (kind, prefixes + 1 + size)
+        return None
+
+    def kind_of(self, data, decoder=None):
+        """
+        Terminator kind of a found sequence given by its bytes. The few
+        ambiguous byte sequences are resolved by decoding the sequence
+        with decoder.
+        """
+        end = len(data)
+        candidates = []
+        for pos in range(max(0, end - MAX_TERMINATOR_LEN), end):
+            found = self.match(data, pos, end)
+            if found is not None and pos + found[1] == end:
+                candidates += [(pos, found[0])]
+        kinds = set([kind for (_pos, kind) in candidates])
+        if len(kinds) <= 1 or decoder is None:
+            if candidates:
+                return candidates[-1][1]
+            return None
+
+        # the sequence's last instruction decides
+        code = bytearray(data)
+        pos = 0
+        while pos < end:
+            insn = decoder.decode(code, pos, end)
+            if insn.end >= end:
+                break
+            pos = insn.end
+        for (start, kind) in candidates:
+            if start == pos:
+                return kind
+        return candidates[-1][1]
+
+
+def terminator_table(spec, mode=32):
+    """
+    TerminatorTable for a comma separated list of kinds or "all"
+    """
+    if spec == "all":
+        return TerminatorTable(KINDS, mode)
+    return TerminatorTable([kind.strip() for kind in spec.split(",")
+                            if kind.strip() != ""], mode)
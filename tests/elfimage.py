@@ -0,0 +1,115 @@
+"""
+Minimal ELF files for the tests
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import struct
+
+# (ELF class, e_machine, header, section header, program header, symbol
+# formats) per bit width
+FORMATS = {32 : (1, 3, "<16sHHIIIIIHHHHHH", "<IIIIIIIIII", "<IIIIIIII",
+                 "<IIIBBH"),
+           64 : (2, 62, "<16sHHIQQQIHHHHHH", "<IIQQQQIIQQ", "<IIQQQQQQ",
+                 "<IBBHQQ")}
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHF_ALLOC_EXEC = 0x6
+PT_LOAD = 1
+PF_R_X = 0x5
+# global function symbols
+STB_GLOBAL_STT_FUNC = 0x12
+
+
+def write_elf(path, sections, bits=64, functions=()):
+    """
+    Write an executable of bits (32 or 64) bit x86 code to path: every
+    (name, address, bytes) of sections is an executable section with a
+    PT_LOAD segment of its own, every (address, size) of functions a
+    function symbol in .symtab
+    """
+    (elfclass, machine, ehdr, shdr, phdr, sym) = FORMATS[bits]
+    (ehdr_size, shdr_size, phdr_size) = [struct.calcsize(fmt)
+                                         for fmt in (ehdr, shdr, phdr)]
+    names = "\0"
+    # (name offset, type, flags, address, data, link, entry size)
+    parts = []
+    for (name, address, data) in sections:
+        parts += [(len(names), SHT_PROGBITS, SHF_ALLOC_EXEC, address, data,
+                   0, 0)]
+        names += name + "\0"
+    symbols = "\0" * struct.calcsize(sym)
+    for (address, size) in functions:
+        if bits == 32:
+            symbols += struct.pack(sym, 0, address, size,
+                                    STB_GLOBAL_STT_FUNC, 0, 1)
+        else:
+            symbols += struct.pack(sym, 0, STB_GLOBAL_STT_FUNC, 0, 1,
+                                    address, size)
+    # section header 0 is empty, .symtab links to the .strtab behind it
+    parts += [(len(names), SHT_SYMTAB, 0, 0, symbols, len(parts) + 2,
+               struct.calcsize(sym))]
+    names += ".symtab\0"
+    parts += [(len(names), SHT_STRTAB, 0, 0, "\0", 0, 0)]
+    names += ".strtab\0"
+    shstrndx = len(parts) + 1
+    parts += [(len(names), SHT_STRTAB, 0, 0, names + ".shstrtab\0", 0, 0)]
+
+    phoff = ehdr_size
+    body = ""
+    section_headers = struct.pack(shdr, *([0] * 10))
+    segments = ""
+    for (name, shtype, flags, address, data, link, entsize) in parts:
+        # all symbols behind the empty first one are global
+        info = 1 if shtype == SHT_SYMTAB else 0
+        body += "\0" * (-(phoff + len(sections) * phdr_size + len(body)) %
+                        16)
+        offset = phoff + len(sections) * phdr_size + len(body)
+        section_headers += struct.pack(shdr, name, shtype, flags, address,
+                                       offset, len(data), link, info, 16,
+                                       entsize)
+        if shtype == SHT_PROGBITS:
+            if bits == 32:
+                segments += struct.pack(phdr, PT_LOAD, offset, address,
+                                        address, len(data), len(data),
+                                        PF_R_X, 16)
+            else:
+                segments += struct.pack(phdr, PT_LOAD, PF_R_X, offset,
+                                        address, address, len(data),
+                                        len(data), 16)
+        body += data
+    body += "\0" * (-(phoff + len(segments) + len(body)) % 16)
+    shoff = phoff + len(segments) + len(body)
+
+    ident = "\x7fELF" + chr(elfclass) + "\x01\x01"
+    header = struct.pack(ehdr, ident, 2, machine, 1, 0, phoff, shoff, 0,
+                         ehdr_size, phdr_size, len(sections), shdr_size,
+                         len(parts) + 1, shstrndx)
+    elffile = open(path, "wb")
+    elffile.write(header + segments + body + section_headers)
+    elffile.close()
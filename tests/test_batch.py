@@ -0,0 +1,123 @@
+"""
+Tests of scanning many binaries
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import os
+import pytest
+from batch import CorpusScan, expand_targets
+from bench import synthetic_text
+from decoder import get_decoder
+from elf import ElfFile
+from opcodestream import OpcodeStream
+from parallel import ParallelScanner
+from elfimage import write_elf
+
+TEXT = synthetic_text(12 * 1024, density=0.02, seed=7)
+
+
+@pytest.fixture
+def corpus(tmpdir):
+    """Binaries of different sizes and modes, plus files to skip"""
+    binaries = tmpdir.mkdir("bin")
+    write_elf(str(binaries.join("small")), [(".text", 0x1000, TEXT[:2000])],
+              32)
+    write_elf(str(binaries.join("large")),
+              [(".text", 0x1000, TEXT), (".init", 0x800, TEXT[5000:6000])],
+              64)
+    write_elf(str(binaries.join("copy")), [(".text", 0x1000, TEXT[:2000])],
+              32)
+    binaries.join("notes.txt").write("no ELF file")
+    os.symlink(str(binaries.join("small")), str(binaries.join("link")))
+    return binaries
+
+
+def _serial(filename):
+    """(section name, locations) per executable section of a file"""
+    elf = ElfFile(filename)
+    found = []
+    for sec in elf.executable_sections():
+        ostream = OpcodeStream(str(elf.section_data(sec)))
+        found += [(sec.name, ostream.find_sequences(
+            byte_offs=20, decoder=get_decoder("native", elf.mode),
+            progress=False))]
+    elf.close()
+    return found
+
+
+def test_expand_targets(corpus):
+    listfile = corpus.join("list")
+    listfile.write("%s\n\n%s\n" % (corpus.join("copy"), corpus.join("large")))
+    files = expand_targets([str(corpus.join("s*")), "@" + str(listfile),
+                            str(corpus)])
+    # each file once, in order of appearance; no symlinks or other files
+    assert files == [str(corpus.join(name))
+                     for name in ("small", "copy", "large")]
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_run(corpus, jobs):
+    files = expand_targets([str(corpus)])
+    scanner = ParallelScanner(jobs, "native")
+    corpus_scan = CorpusScan(scanner, 20, get_decoder("native"))
+    try:
+        planned = corpus_scan.plan(files + [str(corpus.join("notes.txt"))])
+        # largest first, files that cannot be read are left out
+        assert [os.path.basename(res.filename) for res in planned] == \
+            ["large", "copy", "small"]
+        assert [res.mode for res in planned] == [64, 32, 32]
+        found = {}
+        for (res, sec, locations) in corpus_scan.run():
+            found.setdefault(res.filename, []).append((sec.name, locations))
+        (sequences, unique, c3_locs, histogram) = corpus_scan.totals()
+    finally:
+        scanner.close()
+        corpus_scan.close()
+    for filename in files:
+        assert found[filename] == _serial(filename)
+
+    # sequences by the number of files they were found in
+    binaries = {}
+    for filename in files:
+        elf = ElfFile(filename)
+        seqs = set()
+        for ((_name, locations), sec) in zip(_serial(filename),
+                                             elf.executable_sections()):
+            data = str(elf.section_data(sec))
+            seqs |= set([data[offs - length:offs + 1]
+                         for (offs, length) in locations])
+        elf.close()
+        for seq in seqs:
+            binaries[seq] = binaries.get(seq, 0) + 1
+    expected = {}
+    for count in binaries.values():
+        expected[count] = expected.get(count, 0) + 1
+    assert histogram == expected
+    assert unique == len(binaries)
+    assert sequences == sum([len(locations) for filename in files
+                             for (_name, locations) in _serial(filename)])
@@ -0,0 +1,106 @@
+"""
+Tests of the benchmark harness
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import pytest
+import bench
+from bench import synthetic_text, parse_size, readelf_listing, \
+    objdump_listing, Benchmark, STAGES, PAGE_SIZE
+from cmd import ReadelfCmd, ObjdumpCmd
+from decoder import get_decoder
+from opcodestream import OpcodeStream
+from output import FORMATS
+
+
+def test_parse_size():
+    assert [parse_size(text) for text in ["4096", "1K", " 16m", "2G"]] == \
+        [4096, 1024, 16 * 1024 * 1024, 2 * 1024 * 1024 * 1024]
+    with pytest.raises(ValueError):
+        parse_size("1T")
+
+
+def test_synthetic_text():
+    data = synthetic_text(10000, density=0.02, seed=4)
+    assert len(data) == 10000
+    assert data == synthetic_text(10000, density=0.02, seed=4)
+    assert data != synthetic_text(10000, density=0.02, seed=5)
+    # smaller blobs of the same seed start with the same pages
+    assert synthetic_text(5000, density=0.02, seed=4)[:PAGE_SIZE] == \
+        data[:PAGE_SIZE]
+    # RETs of their own plus those in immediates and displacements
+    assert 0.02 < data.count("\xc3") / 10000.0 < 0.04
+    assert synthetic_text(10000, density=0.002, seed=4).count("\xc3") < \
+        data.count("\xc3") / 3
+
+
+def test_synthetic_text_pool(monkeypatch):
+    monkeypatch.setattr(bench, "MAX_POOL_PAGES", 4)
+    size = 20 * PAGE_SIZE
+    data = synthetic_text(size, density=0.01, seed=1)
+    assert len(data) == size
+    pages = set([data[offs:offs + PAGE_SIZE]
+                 for offs in xrange(0, size, PAGE_SIZE)])
+    assert len(pages) <= 4
+
+
+def test_listings():
+    sections = ReadelfCmd().parse_result(readelf_listing(300 * 1024))
+    # one per 64 KB, every third executable
+    assert [(sec.name, sec.start, sec.size) for sec in sections] == \
+        [(".sec0", 0x8048000, 0x10000), (".sec3", 0x8078000, 0x10000)]
+    data = synthetic_text(1000, seed=2)
+    assert str(ObjdumpCmd().parse_result(objdump_listing(data))) == data
+
+
+def test_run():
+    benchmark = Benchmark(8192, density=0.02, seed=1)
+    results = benchmark.run()
+    assert [result["stage"] for result in results] == \
+        STAGES[:-1] + ["output-" + fmt for fmt in FORMATS]
+    items = dict([(result["stage"], result["items"]) for result in results])
+    ostream = OpcodeStream(benchmark.data)
+    locations = ostream.find_sequences(byte_offs=20, decoder=get_decoder(),
+                                       progress=False)
+    assert items["readelf"] == 1
+    assert items["objdump"] == 8192
+    assert items["candidates"] == benchmark.data.count("\xc3")
+    assert items["decode"] == len(locations)
+    assert items["unique"] == len(ostream.unique_sequences(locations))
+    for fmt in FORMATS:
+        assert items["output-" + fmt] == len(locations)
+    for result in results:
+        assert result["seconds"] > 0
+        assert result["items_per_s"] == result["items"] / result["seconds"]
+
+
+def test_run_stages():
+    # unique and output find the sequences themselves if decode did not run
+    results = Benchmark(4096, density=0.02).run(["unique", "readelf"])
+    assert [result["stage"] for result in results] == ["readelf", "unique"]
+    assert results[1]["items"] > 0
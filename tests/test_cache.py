@@ -0,0 +1,111 @@
+"""
+Tests of the gadget cache
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import pytest
+import rc
+from bench import synthetic_text
+from cache import GadgetCache, cache_key, pack_locations, unpack_locations
+from decoder import get_decoder
+from elfimage import write_elf
+
+TEXT = synthetic_text(8 * 1024, density=0.02, seed=3)
+
+
+def test_pack_locations():
+    locations = [(5, 1), (5, 4), (70000, 20), (2 ** 32 - 1, 255)]
+    assert unpack_locations(pack_locations(locations)) == locations
+    assert unpack_locations(pack_locations([])) == []
+
+
+def test_cache_key():
+    decoder = get_decoder("native")
+    key = cache_key(TEXT, 20, "c3", decoder)
+    assert key == cache_key(TEXT, 20, "c3", get_decoder("native"))
+    assert key != cache_key(TEXT[1:], 20, "c3", decoder)
+    assert key != cache_key(TEXT, 21, "c3", decoder)
+    assert key != cache_key(TEXT, 20, "c3+classify", decoder)
+    assert key != cache_key(TEXT, 20, "c3", get_decoder("native", 64))
+
+
+def test_get_put(tmpdir):
+    cache = GadgetCache(str(tmpdir.join("sub", "gadgets.sqlite")))
+    assert cache.get("a") is None
+    cache.put("a", [(1, 1), (3, 2)])
+    assert cache.get("a") == [(1, 1), (3, 2)]
+    (entries, _used, hits) = cache.stats()
+    assert (entries, hits, cache.hits, cache.misses) == (1, 1, 1, 1)
+    cache.close()
+    # entries outlive the process
+    cache = GadgetCache(str(tmpdir.join("sub", "gadgets.sqlite")))
+    assert cache.get("a") == [(1, 1), (3, 2)]
+    cache.close()
+
+
+def test_prune(tmpdir):
+    cache = GadgetCache(str(tmpdir.join("gadgets.sqlite")))
+    for key in ("a", "b", "c"):
+        cache.put(key, [(offs, 1) for offs in xrange(100)])
+    # "a" is the most recently used entry now, "b" the least
+    cache.get("a")
+    (_entries, used, _hits) = cache.stats()
+    assert cache.prune(used - 1) == 1
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.prune(0) == 2
+    assert cache.stats()[0] == 0
+    cache.close()
+
+
+@pytest.mark.parametrize("options", [{}, {"terminators" : "all"},
+                                     {"classify" : "yes"},
+                                     {"regions" : "functions", "jobs" : 2}])
+def test_scan_hit_and_miss(tmpdir, options):
+    binary = str(tmpdir.join("binary"))
+    write_elf(binary, [(".text", 0x1000, TEXT), (".init", 0x800, TEXT[:500])],
+              functions=[(0x1000, 4000), (0x2000, 0x1000)])
+    cache_file = str(tmpdir.join("gadgets.sqlite"))
+    outputs = []
+    for run in ("uncached", "miss", "hit"):
+        output = str(tmpdir.join(run + ".csv"))
+        cache = ""
+        if run != "uncached":
+            cache = cache_file
+        rc.scan_command(binary, format="csv", output=output, cache=cache,
+                        **options)
+        outputs += [open(output).read()]
+    assert outputs[0].count("\n") > 100
+    assert outputs[1] == outputs[0]
+    assert outputs[2] == outputs[0]
+    cache = GadgetCache(cache_file)
+    # both sections were stored by the first cached run, loaded by the
+    # second
+    assert cache.stats()[0] == 2
+    assert cache.stats()[2] == 2
+    cache.close()
@@ -0,0 +1,215 @@
+"""
+Tests of the chain search
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import json
+import pytest
+import rc
+from chain import gadget_effect, EffectIndex, ChainSearch, parse_goal, \
+    chain_words, PADDING
+from data import Section
+from decoder import get_decoder
+from gadgetdb import GadgetDBWriter, GadgetDB
+from opcodestream import OpcodeStream
+
+BASE = 0x8048000
+GADGETS = ["\x58\xc3",              # pop eax; ret
+           "\x5b\x5e\xc3",          # pop ebx; pop esi; ret
+           "\x89\xd9\xc3",          # mov ecx, ebx; ret
+           "\x31\xd2\xc3",          # xor edx, edx; ret
+           "\x42\xc3",              # inc edx; ret
+           "\x89\x43\x04\xc3",      # mov [ebx+0x4], eax; ret
+           "\x83\xc4\x08\xc3",      # add esp, 0x8; ret
+           "\x8b\x03\xc3",          # mov eax, [ebx]; ret
+           "\xcd\x80\xc3"]          # int 0x80; ret
+# gadgets apart from each other
+CODE = "\xcc" * 4 + "\xcc\xcc\xcc\xcc".join(GADGETS)
+JUNK = 0xdeadbeef
+
+
+def test_gadget_effect():
+    decoder = get_decoder("native", 32)
+    assert gadget_effect(decoder, "\x5b\x5e\xc3") == \
+        {"text" : "pop ebx; pop esi; ret", "slots" : 2, "writes" : [],
+         "sets" : {"ebx" : ["slot", 0, 0], "esi" : ["slot", 1, 0]},
+         "syscall" : False}
+    assert gadget_effect(decoder, "\x89\x43\x04\xc3")["writes"] == \
+        [[["reg", "ebx", 4], ["reg", "eax", 0]]]
+    assert gadget_effect(decoder, "\x83\xc0\x05\xc3")["sets"] == \
+        {"eax" : ["reg", "eax", 5]}
+    assert gadget_effect(decoder, "\x83\xc4\x08\xc3")["slots"] == 2
+    assert gadget_effect(decoder, "\xcd\x80\xc3")["syscall"]
+    # memory reads, stack pivots, pushes and other terminators
+    for data in ["\x8b\x03\xc3", "\x5c\xc3", "\x50\xc3", "\xc2\x04\x00"]:
+        assert gadget_effect(decoder, data) is None
+    decoder = get_decoder("native", 64)
+    assert gadget_effect(decoder, "\x31\xc0\xc3", 64)["sets"] == \
+        {"rax" : ["const", 0, 0]}
+    assert gadget_effect(decoder, "\x89\xc7\xc3", 64)["sets"] == \
+        {"rdi" : None}
+
+
+def test_parse_goal():
+    assert parse_goal("eax=0xb, [0x804a000]=0x6e69622f,ebx=-1") == \
+        ({"eax" : 0xb, "ebx" : 0xffffffff}, [(0x804a000, 0x6e69622f)])
+    for spec in ["", "eax", "esp=1", "rax=1", "eax=zz"]:
+        with pytest.raises(ValueError):
+            parse_goal(spec)
+    assert parse_goal("rax=1", 64) == ({"rax" : 1}, [])
+
+
+@pytest.fixture
+def database(tmpdir):
+    path = str(tmpdir.join("gadgets.db"))
+    writer = GadgetDBWriter(numbytes=20)
+    sid = writer.add_section(Section(".text", BASE, len(CODE)), CODE, "prog")
+    writer.add(sid, OpcodeStream(CODE).find_sequences(
+        byte_offs=20, decoder=get_decoder(), progress=False))
+    writer.write(path)
+    writer.close()
+    return path
+
+
+def _run(words):
+    """
+    Run a chain of stack words on an emulator of the instructions in
+    GADGETS. Returns the registers and memory words at the system call or
+    after the last gadget returned.
+    """
+    decoder = get_decoder("native", 32)
+    code = bytearray(CODE)
+    regs = dict([(reg, JUNK) for reg in ("eax", "ebx", "ecx", "edx",
+                                         "esi", "edi", "ebp")])
+    memory = {}
+    stack = list(words)
+
+    def value(op):
+        if op.startswith("0x"):
+            return int(op, 16)
+        return regs[op]
+
+    while stack:
+        pos = stack.pop(0) - BASE
+        assert 0 <= pos < len(code)
+        while True:
+            insn = decoder.decode(code, pos, len(code))
+            (mnemonic, ops) = (insn.mnemonic, insn.operands)
+            pos = insn.end
+            if mnemonic == "ret" and not ops:
+                break
+            elif mnemonic == "int" and ops == ["0x80"]:
+                return (regs, memory)
+            elif mnemonic == "pop":
+                regs[ops[0]] = stack.pop(0)
+            elif mnemonic == "add" and ops[0] == "esp":
+                del stack[:int(ops[1], 16) / 4]
+            elif mnemonic == "mov" and ops[0].startswith("["):
+                (base, disp) = ops[0][1:-1].split("+")
+                memory[regs[base] + int(disp, 16)] = regs[ops[1]]
+            elif mnemonic == "mov":
+                regs[ops[0]] = value(ops[1])
+            elif mnemonic == "xor":
+                regs[ops[0]] ^= value(ops[1])
+            elif mnemonic == "inc":
+                regs[ops[0]] = (regs[ops[0]] + 1) & 0xffffffff
+            else:
+                raise AssertionError("not emulated: %s %s" % (mnemonic,
+                                                              ops))
+    return (regs, memory)
+
+
+@pytest.mark.parametrize("goal,syscall,gadgets", [
+    ("eax=0xb", False, 1),
+    ("edx=0", False, 1),
+    # moved from another register
+    ("ecx=0x804a000", False, 2),
+    ("[0x804a004]=0x6e69622f", False, 3),
+    ("eax=0xb,ebx=0x804a000,ecx=0x804a000,edx=0", True, 5),
+    # the search may trade the shortest chain for speed
+    ("[0x804a004]=0x6e69622f,[0x804a008]=0x68732f,eax=0xb", True, 8)])
+def test_search(database, goal, syscall, gadgets):
+    gadget_db = GadgetDB(database)
+    index = EffectIndex.build(gadget_db)
+    (regs, memory) = parse_goal(goal)
+    steps = ChainSearch(index, regs, memory, syscall).run()
+    assert len(steps) <= gadgets
+    assert steps[-1][0]["syscall"] == syscall
+    words = [value for (value, _comment) in chain_words(index, steps)]
+    (state, stored) = _run(words)
+    for (reg, value) in regs.items():
+        assert state[reg] == value
+    for (address, value) in memory:
+        assert stored[address] == value
+    gadget_db.close()
+
+
+def test_no_chain(database):
+    gadget_db = GadgetDB(database)
+    index = EffectIndex.build(gadget_db)
+    # nothing sets edi
+    assert ChainSearch(index, {"edi" : 1}, []).run() is None
+    (regs, memory) = parse_goal("[0x804a004]=0x6e69622f,eax=0xb")
+    assert ChainSearch(index, regs, memory, max_length=2).run() is None
+    search = ChainSearch(index, regs, memory, max_states=3)
+    assert search.run() is None
+    assert search.expanded == 3
+    gadget_db.close()
+
+
+def test_chain_words(database):
+    gadget_db = GadgetDB(database)
+    index = EffectIndex.build(gadget_db)
+    steps = ChainSearch(index, {"ebx" : 0x1234}, []).run()
+    pop = BASE + CODE.index("\x5b\x5e\xc3")
+    assert chain_words(index, steps) == \
+        [(pop, "pop ebx; pop esi; ret"), (0x1234, "ebx"),
+         (PADDING[32], "padding")]
+    gadget_db.close()
+
+
+def test_index_file(database):
+    gadget_db = GadgetDB(database)
+    index = EffectIndex.build(gadget_db, path=database)
+    gadget_db.close()
+    index.save(database + ".effects")
+    loaded = EffectIndex.load(database + ".effects")
+    assert loaded.current(database)
+    assert (loaded.mode, loaded.files) == (32, ["prog"])
+    assert sorted(loaded.keys) == sorted(index.keys)
+    assert loaded.get("pop:eax")[0]["address"] == BASE + CODE.index("\x58")
+
+
+def test_chain_command(database, capsys):
+    rc.chain_command(database, goal="eax=0xb,edx=0", format="json")
+    result = json.loads(capsys.readouterr()[0])
+    assert result["gadgets"] == 2
+    (state, _stored) = _run([word["value"] for word in result["words"]])
+    assert (state["eax"], state["edx"]) == (0xb, 0)
+    # the index is saved next to the database
+    assert EffectIndex.load(database + ".effects").current(database)
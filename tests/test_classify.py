@@ -0,0 +1,149 @@
+"""
+Tests of the semantic gadget classifier
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import json
+import pytest
+from bench import synthetic_text
+from classify import GadgetClassifier, SemanticCatalog
+from decoder import get_decoder
+from opcodestream import OpcodeStream
+from terminators import terminator_table
+
+# bytes -> (signature, categories, drop reason) of 32 bit code
+CLASSES = {
+    "\x5b\x5d\xc3" : ("pop ebx; pop ebp; ret", ("load-reg",), None),
+    # nops and padding are left out
+    "\x90\x5d\xc3" : ("pop ebp; ret", ("load-reg",), None),
+    "\x8d\x76\x00\x5d\xc3" : ("pop ebp; ret", ("load-reg",), None),
+    "\xf3\xc3" : ("ret", (), None),
+    "\x5c\xc3" : ("pop esp; ret", ("stack-pivot",), None),
+    "\x83\xc4\x10\xc3" : ("add esp, 0x10; ret", ("stack-adjust",), None),
+    "\x89\x03\xc3" : ("mov [ebx], eax; ret", ("mem-write",), None),
+    "\x8b\x03\xc3" : ("mov eax, [ebx]; ret", ("mem-read",), None),
+    "\xb8\x01\x00\x00\x00\xc3" : ("mov eax, 0x1; ret", ("load-const",),
+                                  None),
+    "\xcd\x80\xc3" : ("int 0x80; ret", ("syscall",), None),
+    "\x39\xc3\xc3" : ("cmp ebx, eax; ret", ("flags",), None),
+    "\x50\xc3" : ("push eax; ret", ("push",), None),
+    # branch targets do not depend on the address
+    "\x74\x02\x5d\xc3" : ("jz $+0x2; pop ebp; ret", ("branch", "load-reg"),
+                          None),
+    "\xc9\xc3" : ("leave; ret", ("other",), "leave"),
+    "\xfa\xc3" : ("cli; ret", ("other",), "privileged"),
+    "\x0f\x22\xd8\xc3" : ("mov cr3, eax; ret", ("move-reg",), "privileged"),
+    "\xcc\xc3" : ("int3; ret", ("other",), "trap"),
+    "\xff\x1d\x00\x00\x00\x00\xc3" : ("call [0x0]; ret", ("branch",), "far"),
+    # a selected far return terminator is kept
+    "\xcb" : ("retf", (), None),
+}
+
+CODE = synthetic_text(8 * 1024, density=0.02, seed=7)
+
+
+@pytest.mark.parametrize("data", sorted(CLASSES))
+def test_classify(data):
+    assert GadgetClassifier(32).classify(data)[:3] == CLASSES[data]
+
+
+def test_classify_64():
+    classifier = GadgetClassifier(64)
+    assert classifier.classify("\x5f\xc3")[:3] == \
+        ("pop rdi; ret", ("load-reg",), None)
+    assert classifier.classify("\x48\x89\xe5\xc3")[:3] == \
+        ("mov rbp, rsp; ret", ("move-reg",), None)
+
+
+def test_memoized_suffixes():
+    # classifying gadgets sharing their tails in any order, with memos
+    # that start over all the time, gives the classes of fresh classifiers
+    classifier = GadgetClassifier(32, memo_size=3)
+    for data in sorted(CLASSES, key=len) + sorted(CLASSES, reverse=True):
+        assert classifier.classify(data)[:3] == CLASSES[data]
+
+
+def _scan(mode, spec, classifier=None):
+    table = None
+    if spec is not None:
+        table = terminator_table(spec, mode)
+    return OpcodeStream(CODE).find_sequences(
+        byte_offs=20, decoder=get_decoder("native", mode), progress=False,
+        terminators=table, classifier=classifier)
+
+
+@pytest.mark.parametrize("mode", [32, 64])
+@pytest.mark.parametrize("spec", [None, "all"])
+@pytest.mark.parametrize("memo_size", [5, 100000])
+def test_classifying_scan(mode, spec, memo_size):
+    # the trie of a scan feeds filter_trie(); classifying every gadget of
+    # an unclassified scan on its own must keep and count the same
+    classifier = GadgetClassifier(mode, memo_size)
+    kept = _scan(mode, spec, classifier)
+    found = _scan(mode, spec)
+    single = GadgetClassifier(mode)
+    expected = [(offset, length) for (offset, length) in found
+                if single.select(single.classify(
+                    CODE[offset - length:offset + 1]))]
+    assert 0 < len(kept) < len(found)
+    assert sorted(kept) == sorted(expected)
+    assert classifier.catalog.counts == single.catalog.counts
+    assert classifier.catalog.dropped == single.catalog.dropped
+    assert classifier.catalog.kept + sum(classifier.catalog.dropped.values()) \
+        == len(found)
+
+
+def test_catalog(tmpdir):
+    classifier = GadgetClassifier(32)
+    for data in sorted(CLASSES) + ["\x5b\x5d\xc3", "\x90\x5d\xc3"]:
+        classifier.select(classifier.classify(data))
+    catalog = classifier.take_catalog()
+    assert len(classifier.catalog) == 0
+    assert catalog.counts["pop ebp; ret"] == 3
+    assert catalog.counts["pop ebx; pop ebp; ret"] == 2
+    assert catalog.dropped == {"leave" : 1, "privileged" : 2, "trap" : 1,
+                               "far" : 1}
+    assert catalog.kept == len(CLASSES) + 2 - 5
+    assert catalog.category_counts()["load-reg"] == 3
+
+    merged = SemanticCatalog()
+    merged.merge(catalog)
+    merged.merge(catalog)
+    assert merged.counts == dict([(signature, 2 * count) for
+                                  (signature, count) in
+                                  catalog.counts.items()])
+    assert merged.dropped["privileged"] == 4
+
+    path = str(tmpdir.join("catalog.jsonl"))
+    catalog.write(path)
+    lines = [json.loads(line) for line in open(path)]
+    assert [line["count"] for line in lines] == \
+        sorted(catalog.counts.values(), reverse=True)
+    # with the bytes of the first gadget of the class
+    assert lines[0] == {"gadget" : "pop ebp; ret", "categories" : ["load-reg"],
+                        "count" : 3, "bytes" : "8d76005dc3"}
@@ -0,0 +1,106 @@
+"""
+Tests of the decode cache
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import random
+import pytest
+from decoder import get_decoder
+from decodecache import DecodeCache
+from opcodestream import OpcodeStream
+from terminators import terminator_table, KINDS
+
+# the c3 ending "call [disp32]" is also a ret candidate, whose windows
+# share their bytes with those of the call
+CALL_AND_RET = "\x90" * 5 + "\x5b\x5d\xff\x15\x11\x22\x33\xc3"
+# plenty of terminators of all kinds in front of each other
+NOISE = "".join([chr(random.Random(11).randrange(256)) for _i in xrange(4096)])
+SPECS = KINDS + ["all", "call,ret", "ret-imm,retf-imm"]
+
+
+def _scan(data, mode, spec, cache):
+    """Sequences of a scan of data for the terminators in spec"""
+    table = None
+    if spec != "ret":
+        table = terminator_table(spec, mode)
+    return OpcodeStream(data).find_sequences(
+        byte_offs=20, decoder=get_decoder("native", mode), progress=False,
+        cache=cache, terminators=table)
+
+
+@pytest.mark.parametrize("mode", [32, 64])
+@pytest.mark.parametrize("spec", SPECS)
+def test_cached_scan(mode, spec):
+    data = CALL_AND_RET + NOISE + CALL_AND_RET
+    uncached = _scan(data, mode, spec, None)
+    cache = DecodeCache("test")
+    assert _scan(data, mode, spec, cache) == uncached
+    # verdicts of the first scan decide the second one
+    assert _scan(data, mode, spec, cache) == uncached
+
+
+def test_saved_cache(tmpdir):
+    path = str(tmpdir.join("decode.cache"))
+    data = CALL_AND_RET + NOISE
+    cache = DecodeCache("test")
+    uncached = _scan(data, 32, "all", None)
+    _scan(data, 32, "all", cache)
+    cache.save(path)
+
+    loaded = DecodeCache("test")
+    assert loaded.load(path) == len(cache)
+    assert _scan(data, 32, "all", loaded) == uncached
+    assert loaded.misses == 0
+    # verdicts of another decoder or terminator are not loaded
+    assert DecodeCache("other").load(path) == 0
+
+
+def test_generations():
+    cache = DecodeCache("test", 4)
+    cache.put("a", True)
+    cache.put("b", False)
+    # "a" and "b" are the old generation now
+    assert cache.get("a") is True
+    cache.put("c", True)
+    cache.put("d", True)
+    # used again, "a" survived the old generation "b" was dropped with
+    assert cache.get("a") is True
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_merge_parts(tmpdir):
+    path = str(tmpdir.join("decode.cache"))
+    part = DecodeCache("test")
+    part.put("a", True)
+    part.save(path + ".123")
+    cache = DecodeCache("test")
+    cache.put("b", False)
+    cache.merge_parts(path)
+    assert sorted(cache.items()) == [("a", True), ("b", False)]
+    assert tmpdir.listdir() == []
@@ -0,0 +1,117 @@
+"""
+Tests of the decoder backends against recorded output
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import binascii
+import pytest
+from distutils.spawn import find_executable
+from decoder import get_decoder, PARITY_CORPUS
+from opcodestream import OpcodeStream
+
+# (offset, length) sequences of each parity corpus entry, instruction
+# lengths checked against objdump
+EXPECTED = [
+    ("5dc3", [(1, 1)]),
+    ("5b5e5f5dc3", [(4, 1), (4, 2), (4, 3), (4, 4)]),
+    ("8b45085dc3", [(4, 1), (4, 4)]),
+    ("83c41c5b5e5f5dc3", [(7, 1), (7, 2), (7, 3), (7, 4), (7, 5), (7, 6),
+                          (7, 7)]),
+    ("8d65f45b5e5f5dc3", [(7, 1), (7, 2), (7, 3), (7, 4), (7, 5), (7, 6),
+                          (7, 7)]),
+    ("c9c3", [(1, 1)]),
+    ("f3c3", []),
+    ("66c3", []),
+    ("b8c3000000c3", [(5, 2), (5, 5)]),
+    ("8b80c3000000c3", [(6, 2), (6, 5), (6, 6)]),
+    ("e8c3c3c3c3c3", [(5, 5)]),
+    ("0fb6c05dc3", [(4, 1), (4, 3), (4, 4)]),
+    ("0f1f8000000000c3", [(7, 2), (7, 4), (7, 5), (7, 6), (7, 7)]),
+    ("660f1f440000c3", [(6, 2), (6, 3), (6, 4), (6, 5), (6, 6)]),
+    ("8d742600c3", [(4, 4)]),
+    ("ffe0c3ffd0c3", [(2, 2), (5, 2), (5, 4)]),
+    ("c20800c3", [(3, 2), (3, 3)]),
+    ("d9e8ddd8c3", [(4, 2), (4, 4)]),
+    ("f0ff00c3", [(3, 2), (3, 3)]),
+    ("2e8b00c3", [(3, 2), (3, 3)]),
+    ("678b00c3", [(3, 2), (3, 3)]),
+    ("0f0bc3", [(2, 2)]),
+    ("ffffc3", [(2, 2)]),
+    ("c4c0c3", [(2, 2)]),
+    ("0f3800c1c3", [(4, 2), (4, 4)]),
+    ("0f3a0fc108c3", [(5, 3), (5, 5)]),
+    ("a1c3c3c3c3c3", [(5, 5)]),
+    ("9ac3c3c3c3c3c3c3", [(7, 7)]),
+    ("c8c3c3c3c3", [(4, 4)]),
+    ("31c0405b5dc3", [(5, 1), (5, 2), (5, 3), (5, 4), (5, 5)]),
+    ("06c31fc3", [(1, 1), (3, 1)]),
+    ("0ec316c317c3", [(1, 1), (3, 1), (5, 1)]),
+    ("ecc3edc3", [(1, 1), (3, 1)]),
+    ("eec3efc3", [(1, 1), (3, 1)]),
+    ("0fa8c30fa9c3", [(2, 2), (5, 2), (5, 4)]),
+]
+
+# disassembly (udcli -noff -nohex format) of the corpus entries with
+# fixed-register operands
+LISTINGS = [
+    ("06c31fc3", ["push es", "ret", "pop ds", "ret"]),
+    ("0ec316c317c3", ["push cs", "ret", "push ss", "ret", "pop ss",
+                      "ret"]),
+    ("ecc3edc3", ["in al, dx", "ret", "in eax, dx", "ret"]),
+    ("eec3efc3", ["out dx, al", "ret", "out dx, eax", "ret"]),
+    ("0fa8c30fa9c3", ["push gs", "ret", "pop gs", "ret"]),
+]
+
+
+def test_expected_covers_corpus():
+    assert [entry for (entry, _) in EXPECTED] == PARITY_CORPUS
+
+
+@pytest.mark.parametrize("entry, sequences", EXPECTED)
+def test_sequences(entry, sequences):
+    stream = OpcodeStream(binascii.unhexlify(entry))
+    found = stream.find_sequences(byte_offs=20, decoder=get_decoder("native"),
+                                  progress=False)
+    assert found == sequences
+
+
+@pytest.mark.parametrize("entry, lines", LISTINGS)
+def test_disassemble(entry, lines):
+    decoder = get_decoder("native")
+    assert decoder.disassemble(binascii.unhexlify(entry)) == lines
+
+
+@pytest.mark.skipif(find_executable("udcli") is None,
+                    reason="udcli is not installed")
+@pytest.mark.parametrize("entry", PARITY_CORPUS)
+def test_udcli_parity(entry):
+    stream = OpcodeStream(binascii.unhexlify(entry))
+    (expected, found) = [stream.find_sequences(byte_offs=20,
+                                               decoder=get_decoder(name),
+                                               progress=False)
+                         for name in ("udcli", "native")]
+    assert found == expected
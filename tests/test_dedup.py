@@ -0,0 +1,126 @@
+"""
+Tests of corpus-wide gadget deduplication
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import random
+import hashlib
+import pytest
+import rc
+from bench import synthetic_text
+from dedup import fingerprint, GadgetCounter, histogram_buckets, \
+    FINGERPRINT_BITS
+from elfimage import write_elf
+
+
+def _binaries():
+    """Fingerprint sets of 30 binaries sharing many of their gadgets"""
+    rng = random.Random(21)
+    shared = [fingerprint(str(num)) for num in xrange(2000)]
+    return [set(rng.sample(shared, rng.randrange(1, 500)) +
+                [fingerprint("own %d %d" % (binary, num))
+                 for num in xrange(rng.randrange(50))])
+            for binary in xrange(30)]
+
+
+def _expected(binaries):
+    """fingerprint -> binaries, brute force"""
+    counts = {}
+    for fps in binaries:
+        for fp in fps:
+            counts[fp] = counts.get(fp, 0) + 1
+    return counts
+
+
+def test_fingerprint():
+    assert fingerprint("\x5d\xc3") == \
+        int(hashlib.md5("\x5d\xc3").hexdigest()[:FINGERPRINT_BITS / 4], 16)
+    assert fingerprint(buffer("x\x5d\xc3", 1)) == fingerprint("\x5d\xc3")
+
+
+@pytest.mark.parametrize("max_memory", [0, 256])
+def test_counter(tmpdir, max_memory):
+    binaries = _binaries()
+    counter = GadgetCounter(max_memory, str(tmpdir))
+    for fps in binaries:
+        counter.add_binary(fps)
+    expected = _expected(binaries)
+    assert list(counter.results()) == sorted(expected.items())
+    assert counter.binaries == 30
+    assert counter.entries == sum([len(fps) for fps in binaries])
+    if max_memory == 0:
+        # every binary spilled to a run of its own
+        assert counter.runs == 30
+        assert len(tmpdir.listdir()) == 60
+    else:
+        assert counter.runs == 0
+
+    output = tmpdir.join("counts.txt")
+    stream = open(str(output), "w")
+    (unique, histogram) = counter.summarize(stream)
+    stream.close()
+    assert unique == len(expected)
+    histo = {}
+    for count in expected.values():
+        histo[count] = histo.get(count, 0) + 1
+    assert histogram == histo
+    assert [line.split() for line in output.readlines()] == \
+        [["%0*x" % (FINGERPRINT_BITS / 4, fp), str(count)]
+         for (fp, count) in sorted(expected.items())]
+
+    counter.close()
+    assert tmpdir.listdir() == [output]
+    assert list(counter.results()) == []
+
+
+def test_histogram_buckets():
+    assert histogram_buckets({}) == []
+    assert histogram_buckets({1 : 5, 2 : 1, 3 : 2, 4 : 1, 7 : 3, 20 : 1}) == \
+        [(1, 1, 5), (2, 2, 1), (3, 4, 3), (5, 8, 3), (17, 32, 1)]
+
+
+def test_scan_many(tmpdir):
+    code = synthetic_text(8192, density=0.02, seed=22)
+    paths = []
+    for num in xrange(4):
+        paths += [str(tmpdir.join("prog%d" % num))]
+        write_elf(paths[-1], [(".text", 0x1000, code[num * 1000:
+                                                     num * 1000 + 4000])])
+    results = []
+    for dedup_memory in (0, 256):
+        counts = str(tmpdir.join("counts%d.txt" % dedup_memory))
+        rc.scan_many_command(dump="no", dedup_memory=dedup_memory,
+                             uniq_counts=counts, targets=paths)
+        results += [open(counts).read()]
+    assert results[0] == results[1]
+    histogram = {}
+    for line in results[0].splitlines():
+        count = int(line.split()[1])
+        histogram[count] = histogram.get(count, 0) + 1
+    # the binaries overlap by 3000, 2000 and 1000 bytes
+    assert sorted(histogram) == [1, 2, 3, 4]
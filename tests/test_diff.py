@@ -0,0 +1,94 @@
+"""
+Tests of the gadget database comparison
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+from data import Section
+from gadgetdb import GadgetDBWriter, GadgetDB
+from diff import SortedGadgets, diff_entries, file_ids
+
+CODE = "\x5d\xc3\x5b\xc3\x58\xc3"
+
+
+def _database(path, filename, code, locations):
+    """Write a gadget database of one section of file filename"""
+    writer = GadgetDBWriter(numbytes=20)
+    sid = writer.add_section(Section(".text", 0x1000, len(code)), code,
+                             filename)
+    writer.add(sid, locations)
+    writer.write(path)
+    writer.close()
+    return GadgetDB(path)
+
+
+def _changes(old_db, new_db, same_file=False):
+    """Change per (old gadget id, new gadget id)"""
+    (old_files, new_files) = file_ids(old_db, new_db, same_file)
+    old = SortedGadgets(old_db, old_files)
+    new = SortedGadgets(new_db, new_files)
+    changes = sorted([(old_entry and old_entry[3], new_entry and new_entry[3],
+                       change) for (change, old_entry, new_entry) in
+                      diff_entries(old.entries(), new.entries())])
+    old.close()
+    new.close()
+    return changes
+
+
+def test_files_matched_by_name(tmpdir):
+    old_db = _database(str(tmpdir.join("old.db")), "/old/libfoo.so", CODE,
+                       [(1, 1), (3, 1)])
+    new_db = _database(str(tmpdir.join("new.db")), "/new/libfoo.so",
+                       CODE[2:], [(1, 1), (3, 1)])
+    assert _changes(old_db, new_db) == [(None, 1, "added"),
+                                        (0, None, "removed"),
+                                        (1, 0, "relocated")]
+
+
+def test_files_with_other_names(tmpdir):
+    old_db = _database(str(tmpdir.join("old.db")), "libfoo.so.1", CODE,
+                       [(1, 1)])
+    new_db = _database(str(tmpdir.join("new.db")), "libfoo.so.2", CODE,
+                       [(1, 1)])
+    assert _changes(old_db, new_db) == [(None, 0, "added"),
+                                        (0, None, "removed")]
+    assert _changes(old_db, new_db, True) == [(0, 0, "unchanged")]
+
+
+def test_runs_on_disk(tmpdir, monkeypatch):
+    monkeypatch.setattr("diff.READ_BLOCK", 2)
+    # three entries per MB of memory
+    monkeypatch.setattr("diff.ENTRY_SIZE", 1024 * 1024 / 3)
+    gadget_db = _database(str(tmpdir.join("db")), "libfoo.so", CODE * 3,
+                          [(pos, 1) for pos in xrange(1, 18, 2)])
+    in_memory = SortedGadgets(gadget_db, [0], 10)
+    on_disk = SortedGadgets(gadget_db, [0], 1, str(tmpdir))
+    assert in_memory.runs == 0
+    assert on_disk.runs == 2
+    assert list(on_disk.entries()) == list(in_memory.entries())
+    in_memory.close()
+    on_disk.close()
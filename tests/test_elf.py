@@ -0,0 +1,52 @@
+"""
+Tests of the ELF reader
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import pytest
+import rc
+from elf import ElfFile, ElfError
+
+
+@pytest.mark.parametrize("name", ["missing", "."])
+def test_unreadable(tmpdir, name):
+    with pytest.raises(ElfError):
+        ElfFile(str(tmpdir.join(name)))
+
+
+def test_not_elf(tmpdir):
+    path = tmpdir.join("text")
+    path.write("not an ELF file")
+    with pytest.raises(ElfError):
+        ElfFile(str(path))
+
+
+@pytest.mark.parametrize("name", ["missing", "."])
+def test_scan_unreadable(tmpdir, name):
+    # reported as error, not raised
+    rc.scan_command(str(tmpdir.join(name)), dump="no")
@@ -0,0 +1,222 @@
+"""
+Tests of the gadget database
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import json
+import struct
+import pytest
+from bench import synthetic_text
+from data import Section
+from decoder import get_decoder
+from gadgetdb import GadgetDBWriter, GadgetDB, MAX_LENGTH, DB_HEADER, \
+    DB_MAGIC_V1, DB_COLUMNS_V1, bytes_hash
+from opcodestream import OpcodeStream
+from terminators import terminator_table
+
+# (section, file, mode, bytes)
+SECTIONS = [(Section(".text", 0x401000, 6000), "a", 64,
+             synthetic_text(6000, density=0.02, seed=1)),
+            (Section(".init", 0x400800, 1500), "a", 64,
+             synthetic_text(1500, density=0.02, seed=2)),
+            (Section(".text", 0x8048000, 3000), "b", 32,
+             synthetic_text(3000, density=0.02, seed=1)[:3000])]
+
+
+def _scan(spec=None):
+    """(offset, length) tuples of every section in SECTIONS"""
+    found = []
+    for (_section, _filename, mode, data) in SECTIONS:
+        table = None
+        if spec is not None:
+            table = terminator_table(spec, mode)
+        found += [OpcodeStream(data).find_sequences(
+            byte_offs=20, decoder=get_decoder("native", mode),
+            progress=False, terminators=table)]
+    return found
+
+
+def _gadgets(found):
+    """(start address, length, sid, bytes) of all gadgets, brute force"""
+    gadgets = []
+    for (sid, locations) in enumerate(found):
+        (section, _filename, _mode, data) = SECTIONS[sid]
+        for (offset, length) in locations:
+            gadgets += [(section.start + offset - length, length, sid,
+                         data[offset - length:offset + 1])]
+    return gadgets
+
+
+def _write(path, found, table=None):
+    writer = GadgetDBWriter(table, numbytes=20)
+    for (section, filename, mode, data) in SECTIONS:
+        writer.add_section(section, data, filename, mode)
+    for (sid, locations) in enumerate(found):
+        writer.add(sid, locations)
+    writer.write(path)
+    writer.close()
+
+
+def _write_v1(path, found):
+    """Database in the version 1 layout: narrow columns, no formats"""
+    sections = []
+    blob = ""
+    for (section, filename, _mode, data) in SECTIONS:
+        sections += [{"file" : filename, "name" : section.name,
+                      "start" : section.start, "size" : len(data),
+                      "blob" : len(blob)}]
+        blob += data
+    rows = sorted([(sections[sid]["start"] + offset, length, sid,
+                    sections[sid]["blob"] + offset - length)
+                   for (sid, locations) in enumerate(found)
+                   for (offset, length) in locations])
+    count = len(rows)
+    hashes = [bytes_hash(blob[offset:offset + length + 1]) % 1024
+              for (_end, length, _sid, offset) in rows]
+    buckets = [len([bucket for bucket in hashes if bucket < first])
+               for first in xrange(1025)]
+    columns = [[end for (end, _length, _sid, _blob) in rows],
+               [end - length for (end, length, _sid, _blob) in rows],
+               [offset for (_end, _length, _sid, offset) in rows],
+               [sid for (_end, _length, sid, _blob) in rows],
+               [length for (_end, length, _sid, _blob) in rows],
+               sorted(range(count), key=lambda i: rows[i][0] - rows[i][1]),
+               buckets, sorted(range(count), key=lambda i: hashes[i])]
+    meta = json.dumps({"sections" : sections})
+    outfile = open(path, "wb")
+    outfile.write(DB_HEADER.pack(DB_MAGIC_V1, len(meta), count, len(blob),
+                                 1024))
+    outfile.write(meta.ljust((len(meta) + 7) & ~7, "\0"))
+    for (fmt, column) in zip(DB_COLUMNS_V1, columns):
+        packed = struct.pack("<%d%s" % (len(column), fmt), *column)
+        outfile.write(packed.ljust((len(packed) + 7) & ~7, "\0"))
+    outfile.write(blob)
+    outfile.close()
+
+
+def _section_id(section, filename):
+    """Index of a section of a database in SECTIONS"""
+    return [(sec.name, sec.start, name) for (sec, name, _mode, _data)
+            in SECTIONS].index((section.name, section.start, filename))
+
+
+def _check(gadget_db, found):
+    """Compare every lookup of gadget_db against brute force"""
+    gadgets = _gadgets(found)
+    assert len(gadget_db) == len(gadgets) > 100
+    stored = [(start, length, _section_id(section, filename), data)
+              for (start, length, section, filename, data)
+              in [gadget_db.gadget(gid) for gid in xrange(len(gadget_db))]]
+    assert sorted(stored) == sorted(gadgets)
+    assert gadget_db.section_locations() == \
+        [sorted(locations) for locations in found]
+    assert gadget_db.sequences() == [(sid, start, data) for
+                                     (start, _length, sid, data) in stored]
+    assert gadget_db.sequences(10, 5) == gadget_db.sequences()[10:15]
+    (by_end, by_start, by_bytes) = ({}, {}, {})
+    for (start, length, _sid, data) in gadgets:
+        by_end.setdefault(start + length, []).append((start, length))
+        by_start.setdefault(start, []).append((start, length))
+        by_bytes.setdefault(data, []).append(start)
+    for (start, length, _sid, data) in gadgets:
+        assert sorted([gadget_db.gadget(gid)[:2] for gid
+                       in gadget_db.ending_at(start + length)]) == \
+            sorted(by_end[start + length])
+        assert sorted([gadget_db.gadget(gid)[:2] for gid
+                       in gadget_db.starting_at(start)]) == \
+            sorted(by_start[start])
+        assert sorted([gadget_db.gadget(gid)[0] for gid
+                       in gadget_db.with_bytes(data)]) == \
+            sorted(by_bytes[data])
+    assert gadget_db.ending_at(0) == []
+    assert gadget_db.with_bytes("\xc3\xc3\xc3") == []
+
+
+@pytest.mark.parametrize("spec", [None, "all"])
+def test_round_trip(tmpdir, spec):
+    path = str(tmpdir.join("gadgets.db"))
+    found = _scan(spec)
+    table = None
+    if spec is not None:
+        table = terminator_table(spec, 64)
+    _write(path, found, table)
+    gadget_db = GadgetDB(path)
+    _check(gadget_db, found)
+    assert gadget_db.modes == [64, 64, 32]
+    assert gadget_db.files == ["a", "a", "b"]
+    assert gadget_db.section_data(1) == SECTIONS[1][3]
+    assert gadget_db.numbytes == 20
+    if spec is None:
+        assert gadget_db.terminators is None
+        assert gadget_db.terminator("\x5d\xc3") == "ret"
+    else:
+        assert gadget_db.terminators == table.name
+    gadget_db.close()
+
+
+def test_version_1(tmpdir):
+    path = str(tmpdir.join("v1.db"))
+    found = _scan()
+    _write_v1(path, found)
+    gadget_db = GadgetDB(path)
+    _check(gadget_db, found)
+    # defaults for what version 1 did not record
+    assert gadget_db.modes == [32, 32, 32]
+    assert (gadget_db.terminators, gadget_db.numbytes,
+            gadget_db.classify, gadget_db.regions) == \
+        (None, None, False, "all")
+    gadget_db.close()
+
+
+def test_not_a_database(tmpdir):
+    for content in ["", "ROPDB", "x" * 100]:
+        tmpdir.join("bad.db").write(content)
+        with pytest.raises(ValueError):
+            GadgetDB(str(tmpdir.join("bad.db")))
+
+
+def test_long_sequence(tmpdir):
+    path = str(tmpdir.join("long.db"))
+    code = "\x90" * 300 + "\xc3"
+    writer = GadgetDBWriter(numbytes=400)
+    sid = writer.add_section(Section(".text", 0x1000, len(code)), code,
+                             "test")
+    writer.add(sid, [(300, 300), (300, 1)])
+    writer.write(path)
+    writer.close()
+
+    gadget_db = GadgetDB(path)
+    assert gadget_db.section_locations() == [[(300, 1), (300, 300)]]
+    assert gadget_db.gadget(1)[:2] == (0x1000, 300)
+    assert gadget_db.gadget(1)[4] == code
+    gadget_db.close()
+
+
+def test_numbytes_too_large():
+    with pytest.raises(ValueError):
+        GadgetDBWriter(numbytes=MAX_LENGTH + 1)
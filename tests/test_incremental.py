@@ -0,0 +1,183 @@
+"""
+Tests of incremental rescans against a baseline
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import pytest
+import rc
+from bench import synthetic_text
+from classify import GadgetClassifier
+from data import Section
+from decoder import get_decoder
+from gadgetdb import GadgetDBWriter, GadgetDB
+from incremental import Baseline, candidates
+from opcodestream import OpcodeStream
+from regions import RegionFilter
+from terminators import terminator_table
+from elfimage import write_elf
+
+OLD = synthetic_text(12 * 1024, density=0.02, seed=8)
+PATCH = synthetic_text(300, density=0.05, seed=9)
+# the old code changed in the ways new versions of binaries do
+NEW = {"same" : OLD,
+       "patched" : OLD[:3000] + PATCH + OLD[3300:],
+       "inserted" : OLD[:5000] + PATCH + OLD[5000:],
+       "removed" : OLD[:2000] + OLD[2600:],
+       "shuffled" : OLD[6000:] + PATCH + OLD[:6000],
+       "other" : synthetic_text(12 * 1024, density=0.02, seed=10)}
+
+
+def _table(spec, mode):
+    if spec is None:
+        return None
+    return terminator_table(spec, mode)
+
+
+def _scan(data, mode, spec, classifier=None):
+    return OpcodeStream(data).find_sequences(
+        byte_offs=20, decoder=get_decoder("native", mode), progress=False,
+        terminators=_table(spec, mode), classifier=classifier)
+
+
+def _baseline(path, mode, spec, classify=False):
+    """Baseline of a scan of OLD as section .text"""
+    classifier = None
+    if classify:
+        classifier = GadgetClassifier(mode)
+    writer = GadgetDBWriter(_table(spec, mode), 20, classify)
+    sid = writer.add_section(Section(".text", 0x1000, len(OLD)), OLD, "old",
+                             mode)
+    writer.add(sid, _scan(OLD, mode, spec, classifier))
+    writer.write(path)
+    writer.close()
+    return Baseline(GadgetDB(path), 20, _table(spec, mode), classify)
+
+
+@pytest.mark.parametrize("mode", [32, 64])
+@pytest.mark.parametrize("spec", [None, "all"])
+def test_rescan(tmpdir, mode, spec):
+    baseline = _baseline(str(tmpdir.join("old.db")), mode, spec)
+    assert baseline.unusable() is None
+    decoder = get_decoder("native", mode)
+    for (change, data) in sorted(NEW.items()):
+        found = list(baseline.rescan(0, OpcodeStream(data), decoder))
+        assert found == _scan(data, mode, spec), change
+        total = baseline.reused + baseline.rescanned
+        if change == "same" and spec is None:
+            assert baseline.rescanned == 0
+        elif change == "same":
+            # candidates sharing their terminator's end are rescanned
+            assert baseline.rescanned < total / 20
+        elif change == "other":
+            assert baseline.reused < total / 10
+        else:
+            assert baseline.rescanned < total / 4
+    baseline.db.close()
+
+
+@pytest.mark.parametrize("classify_baseline", [False, True])
+def test_rescan_classified(tmpdir, classify_baseline):
+    baseline = _baseline(str(tmpdir.join("old.db")), 32, "all",
+                         classify_baseline)
+    baseline.classify = True
+    for data in (NEW["inserted"], NEW["other"]):
+        classifier = GadgetClassifier(32)
+        found = list(baseline.rescan(0, OpcodeStream(data),
+                                     get_decoder("native", 32),
+                                     classifier=classifier))
+        expected = GadgetClassifier(32)
+        assert found == _scan(data, 32, "all", expected)
+        assert classifier.catalog.counts == expected.catalog.counts
+        # a classified baseline holds no dropped gadgets to count
+        if not classify_baseline:
+            assert classifier.catalog.dropped == expected.catalog.dropped
+    baseline.db.close()
+
+
+def test_rescan_ranges(tmpdir):
+    baseline = _baseline(str(tmpdir.join("old.db")), 32, None)
+    data = NEW["inserted"]
+    ranges = [(100, 4000), (6000, 9000)]
+    found = list(baseline.rescan(0, OpcodeStream(data),
+                                 get_decoder("native", 32), ranges=ranges))
+    assert found == OpcodeStream(data).find_sequences(
+        byte_offs=20, decoder=get_decoder("native", 32), progress=False,
+        ranges=ranges)
+    baseline.db.close()
+
+
+def test_candidates():
+    data = "\xc3\x90\x90\xc3" + "\x90" * 30 + "\xc2\x08\x00"
+    # the candidate at 0 is skipped as the scan does
+    assert list(candidates(data, 20)) == [(3, 3, ("\xc3\x90\x90\xc3", 3))]
+    table = terminator_table("ret,ret-imm", 32)
+    assert [(idx, end, key[1]) for (idx, end, key)
+            in candidates(data, 20, table)] == [(3, 3, 3), (34, 36, 19)]
+    assert list(candidates(data, 20, ranges=[(10, 20)])) == []
+
+
+def test_unusable(tmpdir):
+    path = str(tmpdir.join("old.db"))
+    _baseline(path, 32, None).db.close()
+    db = GadgetDB(path)
+    assert Baseline(db, 20).unusable() is None
+    assert "numbytes" in Baseline(db, 30).unusable()
+    assert "terminators" in \
+        Baseline(db, 20, terminator_table("all", 32)).unusable()
+    db.close()
+
+    _baseline(path, 32, None, classify=True).db.close()
+    db = GadgetDB(path)
+    assert "classify" in Baseline(db, 20).unusable()
+    assert Baseline(db, 20, classify=True).unusable() is None
+    db.close()
+
+
+@pytest.mark.parametrize("options", [{}, {"terminators" : "all",
+                                          "classify" : "yes"},
+                                     {"regions" : "functions"}])
+def test_scan_command(tmpdir, options):
+    old = str(tmpdir.join("old"))
+    new = str(tmpdir.join("new"))
+    write_elf(old, [(".text", 0x1000, OLD), (".init", 0x8000, OLD[:400])],
+              functions=[(0x1000, 0x1000), (0x3000, 0x800)])
+    write_elf(new, [(".text", 0x1000, NEW["inserted"]),
+                    (".init", 0x8000, OLD[:400])],
+              functions=[(0x1000, 0x1100), (0x3000, 0x900)])
+    baseline = str(tmpdir.join("old.db"))
+    rc.scan_command(old, dump="no", db=baseline,
+                    **dict([item for item in options.items()
+                            if item[0] != "regions"]))
+    outputs = []
+    for use_baseline in ("", baseline):
+        output = str(tmpdir.join("new.csv"))
+        rc.scan_command(new, format="csv", output=output,
+                        baseline=use_baseline, **options)
+        outputs += [open(output).read()]
+    assert outputs[0].count("\n") > 100
+    assert outputs[1] == outputs[0]
@@ -0,0 +1,125 @@
+"""
+Tests of the phase timers and counters
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import json
+import pytest
+import instrument
+import rc
+from bench import synthetic_text
+from elfimage import write_elf
+from instrument import Profile
+
+
+@pytest.fixture(autouse=True)
+def no_profile():
+    yield
+    instrument.disable()
+
+
+def test_profile():
+    profile = Profile()
+    profile.add("output", 1.0)
+    profile.add("decode", 2.0, 10)
+    profile.add("decode", 0.5)
+    profile.add("zzz", 0.25)
+    profile.count("candidates")
+    profile.count("candidates", 4)
+    assert profile.timers == {"output" : [1, 1.0], "decode" : [11, 2.5],
+                              "zzz" : [1, 0.25]}
+    assert profile.counters == {"candidates" : 5}
+    # pipeline order, then the others
+    assert profile.phases() == ["decode", "output", "zzz"]
+
+    other = Profile()
+    other.add("decode", 1.0, 4)
+    other.add("search", 3.0)
+    other.count("candidates", 2)
+    other.count("sections")
+    profile.merge(other)
+    assert profile.timers["decode"] == [15, 3.5]
+    assert profile.timers["search"] == [1, 3.0]
+    assert profile.counters == {"candidates" : 7, "sections" : 1}
+
+    report = json.loads(profile.json())
+    assert report["phases"]["decode"] == {"calls" : 15, "seconds" : 3.5}
+    assert report["counters"] == profile.counters
+    assert report["wall_seconds"] >= 0
+    lines = profile.table()
+    assert [line.split()[0] for line in lines] == \
+        ["Phase", "search", "decode", "output", "zzz", "wall", "candidates",
+         "sections"]
+
+
+def test_take():
+    assert instrument.current() is None
+    assert instrument.take() is None
+    profile = instrument.enable()
+    profile.count("sections")
+    assert instrument.current() is profile
+    assert instrument.take() is profile
+    assert instrument.current() is not profile
+    assert instrument.current().counters == {}
+    instrument.disable()
+    assert instrument.current() is None
+
+
+def _profile(path, capsys, **options):
+    """Counters and phases of a scan of path with --profile=json"""
+    capsys.readouterr()
+    rc.scan_command(path, dump="no", profile="json", **options)
+    err = capsys.readouterr()[1]
+    report = json.loads(err[err.rindex("\n{\n") + 1:])
+    return (report["counters"], report["phases"])
+
+
+def test_scan(tmpdir, capsys):
+    path = str(tmpdir.join("binary"))
+    code = synthetic_text(8192, density=0.02, seed=6)
+    write_elf(path, [(".text", 0x1000, code), (".init", 0x4000, code[:100])])
+    (counters, phases) = _profile(path, capsys)
+    assert counters["sections"] == 2
+    assert counters["section bytes"] == 8292
+    assert counters["candidates"] == code.count("\xc3") + \
+        code[:100].count("\xc3")
+    assert counters["decode cache hits"] + \
+        counters["decode cache misses"] > 0
+    assert phases["extract"]["calls"] == 2
+    assert phases["decode"]["calls"] == counters["candidates"]
+
+    # worker profiles are merged into the parent's
+    (parallel, phases) = _profile(path, capsys, jobs=3)
+    for name in ("sections", "section bytes", "candidates"):
+        assert parallel[name] == counters[name]
+    assert phases["decode"]["calls"] == counters["candidates"]
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        rc.start_profile("xml")
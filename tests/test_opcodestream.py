@@ -0,0 +1,129 @@
+"""
+Tests of block decoding with external decoders
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+from distutils.spawn import find_executable
+import pytest
+import opcodestream
+from bench import synthetic_text
+from classify import GadgetClassifier
+from cmd import UDCLICmd
+from decodecache import DecodeCache
+from decoder import get_decoder
+from opcodestream import OpcodeStream
+
+CODE = synthetic_text(6000, density=0.02, seed=14)
+
+
+class WindowDecoder:
+    """
+    External decoder stand-in: disassembles windows with the native
+    decoder, but only as whole byte strings, one at a time
+    """
+    def __init__(self):
+        self.native = get_decoder("native")
+        self.windows = 0
+
+    def disassemble(self, data):
+        self.windows += 1
+        return self.native.disassemble(str(data))
+
+    def cleanup(self):
+        pass
+
+
+class BlockDecoder(WindowDecoder):
+    """WindowDecoder that also decodes blocks of windows at once"""
+    def __init__(self):
+        WindowDecoder.__init__(self)
+        self.calls = []
+
+    def disassemble_many(self, windows):
+        self.calls += [len(windows)]
+        return [self.disassemble(window) for window in windows]
+
+
+def _scan(decoder, cache=None, classifier=None, ranges=None):
+    return OpcodeStream(CODE).find_sequences(byte_offs=20, decoder=decoder,
+                                             progress=False, cache=cache,
+                                             classifier=classifier,
+                                             ranges=ranges)
+
+
+@pytest.mark.parametrize("block_size", [30, 1000, 1 << 16])
+def test_blocks(monkeypatch, block_size):
+    monkeypatch.setattr(opcodestream, "BATCH_WINDOWS", block_size)
+    expected = _scan(get_decoder("native"))
+    assert len(expected) > 100
+    single = WindowDecoder()
+    assert _scan(single) == expected
+    block = BlockDecoder()
+    assert _scan(block) == expected
+    # repeated windows are decoded once
+    assert block.windows < single.windows
+    # blocks are cut once they hold block_size windows
+    assert max(block.calls) < block_size + 20
+    assert len(block.calls) <= single.windows / block_size + 1
+
+
+def test_cached_blocks():
+    cache = DecodeCache("test")
+    block = BlockDecoder()
+    expected = _scan(block, cache)
+    # the second scan finds all verdicts in the cache
+    block = BlockDecoder()
+    assert _scan(block, cache) == expected
+    assert block.windows == 0
+    assert _scan(WindowDecoder(), cache) == expected
+
+
+def test_classified_blocks(monkeypatch):
+    monkeypatch.setattr(opcodestream, "BATCH_WINDOWS", 500)
+    expected = GadgetClassifier()
+    kept = _scan(get_decoder("native"), classifier=expected)
+    classifier = GadgetClassifier()
+    assert _scan(BlockDecoder(), classifier=classifier) == kept
+    assert classifier.catalog.counts == expected.catalog.counts
+    assert classifier.catalog.dropped == expected.catalog.dropped
+
+
+def test_ranges():
+    ranges = [(100, 2000), (4000, 4500)]
+    assert _scan(BlockDecoder(), ranges=ranges) == \
+        _scan(get_decoder("native"), ranges=ranges)
+
+
+@pytest.mark.skipif(find_executable("udcli") is None,
+                    reason="udcli is not installed")
+def test_udcli_blocks():
+    udcli = UDCLICmd()
+    windows = [CODE[idx - length:idx + 1] for idx in xrange(1, 600)
+               if CODE[idx] == "\xc3" for length in xrange(1, min(idx, 19))]
+    assert udcli.disassemble_many(windows) == \
+        [udcli.disassemble(window) for window in windows]
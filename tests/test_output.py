@@ -0,0 +1,112 @@
+"""
+Tests of the gadget output sinks
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import csv
+import json
+import pytest
+import rc
+from bench import synthetic_text
+from elfimage import write_elf
+from output import open_sink, read_binary, FORMATS
+
+GADGETS = [(0x401000, 1, "\x5d\xc3", "a", ".text", "ret"),
+           (0x401010, 2, "\x5b\x5d\xc3", "a", ".text", "ret"),
+           (0xffffffff81000000, 3, "\x5b\x5d\xc2\x08", "a", ".init",
+            "ret-imm"),
+           (0x2000, 300, "\x90" * 300 + "\xc3", "b", ".text", "ret")]
+
+
+def _write(path, fmt):
+    sink = open_sink(fmt, path)
+    for (address, length, data, filename, section, terminator) in GADGETS:
+        sink.write(address, length, data, filename, section, terminator)
+    sink.close()
+    assert sink.count == len(GADGETS)
+
+
+def test_binary(tmpdir):
+    path = str(tmpdir.join("gadgets.bin"))
+    _write(path, "binary")
+    assert list(read_binary(open(path, "rb"))) == \
+        [(filename, section, address, length, data, terminator)
+         for (address, length, data, filename, section, terminator)
+         in GADGETS]
+
+
+def test_csv(tmpdir):
+    path = str(tmpdir.join("gadgets.csv"))
+    _write(path, "csv")
+    rows = list(csv.reader(open(path)))
+    assert rows[0] == ["file", "section", "address", "length",
+                       "terminator", "bytes"]
+    assert rows[1:] == [[filename, section, "0x%x" % address, str(length),
+                         terminator, data.encode("hex")]
+                        for (address, length, data, filename, section,
+                             terminator) in GADGETS]
+
+
+def test_jsonl(tmpdir):
+    path = str(tmpdir.join("gadgets.jsonl"))
+    _write(path, "jsonl")
+    objects = [json.loads(line) for line in open(path)]
+    assert objects == [{"file" : filename, "section" : section,
+                        "address" : address, "length" : length,
+                        "terminator" : terminator,
+                        "bytes" : data.encode("hex")}
+                       for (address, length, data, filename, section,
+                            terminator) in GADGETS]
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        open_sink("xml")
+
+
+def test_scan_formats_agree(tmpdir):
+    binary = str(tmpdir.join("binary"))
+    code = synthetic_text(2048, 0.02, 9) + "\x90" * 400 + "\xc3"
+    write_elf(binary, [(".text", 0x1000, code)])
+    outputs = {}
+    for fmt in FORMATS:
+        outputs[fmt] = str(tmpdir.join("gadgets." + fmt))
+        rc.scan_command(binary, format=fmt, output=outputs[fmt],
+                        terminators="all", numbytes=300)
+    found = [(int(row["address"], 16), int(row["length"]),
+              row["bytes"].decode("hex"), row["terminator"])
+             for row in csv.DictReader(open(outputs["csv"]))]
+    assert len(found) > 50
+    assert max([length for (_address, length, _data, _term) in found]) > 255
+    assert [(address, length, data, terminator)
+            for (_filename, _section, address, length, data, terminator)
+            in read_binary(open(outputs["binary"], "rb"))] == found
+    assert [(obj["address"], obj["length"], obj["bytes"].decode("hex"),
+             obj["terminator"])
+            for obj in map(json.loads, open(outputs["jsonl"]))] == found
+    assert len(open(outputs["text"]).readlines()) == len(found)
@@ -0,0 +1,116 @@
+"""
+Tests of the parallel scanner
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import pytest
+import rc
+from bench import synthetic_text
+from classify import GadgetClassifier
+from decoder import get_decoder
+from opcodestream import OpcodeStream
+from parallel import ParallelScanner
+from terminators import terminator_table
+from elfimage import write_elf
+
+# cut into one chunk per job
+CODE = synthetic_text(16 * 1024, density=0.02, seed=5)
+
+
+def _serial(data, mode, terminators=None, classifier=None, ranges=None):
+    """(offset, length) tuples and unique sequences of a serial scan"""
+    table = None
+    if terminators is not None:
+        table = terminator_table(terminators, mode)
+    ostream = OpcodeStream(data)
+    locations = ostream.find_sequences(byte_offs=20,
+                                       decoder=get_decoder("native", mode),
+                                       progress=False, terminators=table,
+                                       classifier=classifier, ranges=ranges)
+    return (locations, ostream.unique_sequences(locations))
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+@pytest.mark.parametrize("mode", [32, 64])
+@pytest.mark.parametrize("terminators", [None, "all"])
+def test_scan(jobs, mode, terminators):
+    scanner = ParallelScanner(jobs, "native", cache_size=0,
+                              terminators=terminators)
+    try:
+        found = scanner.scan(CODE, 20, mode=mode)
+    finally:
+        scanner.close()
+    assert found == _serial(CODE, mode, terminators)
+
+
+def test_scan_from_file(tmpdir):
+    path = tmpdir.join("code")
+    path.write("\0" * 100 + CODE, "wb")
+    scanner = ParallelScanner(3, "native")
+    try:
+        found = scanner.scan(CODE, 20, (str(path), 100))
+    finally:
+        scanner.close()
+    assert found == _serial(CODE, 32)
+
+
+def test_stream_ranges():
+    ranges = [(1000, 5000), (8000, 8100), (12000, 16384)]
+    scanner = ParallelScanner(3, "native")
+    try:
+        found = list(scanner.stream(CODE, 20, ranges=ranges))
+    finally:
+        scanner.close()
+    assert found == _serial(CODE, 32, ranges=ranges)[0]
+
+
+def test_classify():
+    scanner = ParallelScanner(3, "native", classify=True)
+    try:
+        found = scanner.scan(CODE, 20)
+    finally:
+        scanner.close()
+    classifier = GadgetClassifier()
+    assert found == _serial(CODE, 32, classifier=classifier)
+    assert scanner.catalog.counts == classifier.catalog.counts
+    assert scanner.catalog.dropped == classifier.catalog.dropped
+
+
+@pytest.mark.parametrize("bits", [32, 64])
+def test_scan_command(tmpdir, bits):
+    path = str(tmpdir.join("binary"))
+    write_elf(path, [(".text", 0x8048000, CODE),
+                     (".init", 0x8040000, CODE[:1000])], bits)
+    outputs = []
+    for jobs in (1, 4):
+        output = str(tmpdir.join("jobs%d.csv" % jobs))
+        rc.scan_command(path, format="csv", output=output, jobs=jobs,
+                        terminators="all")
+        outputs += [open(output).read()]
+    assert outputs[0].count("\n") > 500
+    assert outputs[0] == outputs[1]
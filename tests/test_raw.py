@@ -0,0 +1,126 @@
+"""
+Tests of raw dump scans
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import csv
+import pytest
+import rc
+from bench import synthetic_text
+from raw import parse_regions, parse_maps, RawImage
+from elfimage import write_elf
+
+CODE = synthetic_text(6000, density=0.02, seed=12)
+MAPS = """\
+08048000-0804a000 r-xp 00000000 08:01 1234 /bin/prog
+0804a000-0804b000 rw-p 00002000 08:01 1234 /bin/prog
+b7f00000-b7f01000 r-xp 00000000 00:00 0
+"""
+
+
+def test_parse_regions():
+    assert parse_regions("0x1000-0x1800, 0x2000+0x100@0x40", 0x1000) == \
+        [("region0", 0x1000, 0x800, 0), ("region1", 0x2000, 0x100, 0x40)]
+    for spec in ["0x1000", "0x2000-0x1000", "0x1000+zz"]:
+        with pytest.raises(ValueError):
+            parse_regions(spec)
+
+
+def test_parse_maps(tmpdir):
+    tmpdir.join("maps").write(MAPS)
+    assert parse_maps(str(tmpdir.join("maps")), 0x8000000) == \
+        [("prog", 0x8048000, 0x2000, 0x48000),
+         ("[anon@b7f00000]", 0xb7f00000, 0x1000, 0xb7f00000 - 0x8000000)]
+
+
+def test_image(tmpdir):
+    path = str(tmpdir.join("dump"))
+    open(path, "wb").write(CODE)
+    image = RawImage(path, [("a", 0x100, 0x10, 0x20), ("b", 0, 100, 5990),
+                            ("c", 0, 10, 6000)])
+    assert image.skipped == ["c"]
+    (first, second) = image.executable_sections()
+    assert str(image.section_data(first)) == CODE[0x20:0x30]
+    # clipped to the file
+    assert (second.start, second.size) == (0, 10)
+    assert str(image.section_data(second)) == CODE[5990:]
+    image.close()
+    image = RawImage(path, base=0x400)
+    assert [(sec.name, sec.start, sec.size) for sec in
+            image.executable_sections()] == [("raw", 0x400, 6000)]
+    image.close()
+
+
+def _rows(path):
+    """(address, length, terminator, bytes) of a CSV dump"""
+    return [(row["address"], row["length"], row["terminator"], row["bytes"])
+            for row in csv.DictReader(open(path))]
+
+
+@pytest.mark.parametrize("terminators", ["ret", "all"])
+def test_scan_raw(tmpdir, terminators):
+    elf = str(tmpdir.join("prog"))
+    write_elf(elf, [(".text", 0x8048000, CODE[:4000]),
+                    (".init", 0x8049000, CODE[4000:])], bits=32)
+    rc.scan_command(elf, format="csv", output=str(tmpdir.join("elf.csv")),
+                    terminators=terminators)
+    expected = _rows(str(tmpdir.join("elf.csv")))
+    assert len(expected) > 100
+
+    dump = str(tmpdir.join("dump"))
+    open(dump, "wb").write(CODE[:4000] + "\0" * 96 + CODE[4000:])
+    # a raw dump by its regions, a memory dump by its maps and the ELF
+    # file by its PT_LOAD segments
+    tmpdir.join("maps").write("08048000-08049000 r-xp 0 0 0 prog\n"
+                              "08049000-0804a000 r-xp 0 0 0 prog\n")
+    for (path, options) in [(dump, {"regions" : "0x8048000+4000,"
+                                                "0x8049000+2000",
+                                    "base" : "0x8048000"}),
+                            (dump, {"maps" : str(tmpdir.join("maps")),
+                                    "base" : "0x8048000"}),
+                            (elf, {})]:
+        output = str(tmpdir.join("raw.csv"))
+        rc.scan_raw_command(path, format="csv", output=output,
+                            terminators=terminators, **options)
+        assert _rows(output) == expected
+
+
+def test_unique(tmpdir, capsys):
+    dump = str(tmpdir.join("dump"))
+    open(dump, "wb").write(CODE)
+    output = str(tmpdir.join("raw.csv"))
+    rc.scan_raw_command(dump, format="csv", output=output)
+    sequences = [row[3] for row in _rows(output)]
+    # the sets of unique sequences and locations are only kept when asked
+    # for
+    err = capsys.readouterr()[1]
+    assert "Overall sequences found: %d" % len(sequences) in err
+    assert "nique" not in err
+    rc.scan_raw_command(dump, dump="no", unique="yes")
+    err = capsys.readouterr()[1]
+    assert "Unique sequences: %d" % len(set(sequences)) in err
@@ -0,0 +1,63 @@
+"""
+Tests of the region policies
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+from data import Section
+from regions import RegionFilter
+
+# two functions around a gap of padding, data that does not decode and
+# code, with RETs at offsets 1, 10, 14 and 16
+CODE = ("\x5d\xc3" + "\x90" * 6 + "\xff\xff\xc3" + "\x90\x90" +
+        "\x58\xc3" + "\x5b\xc3")
+SECTION = Section(".text", 0x1000, len(CODE))
+FUNCTIONS = [(0x1000, 0x1002), (0x100f, 0x1011)]
+
+
+def _pruned(policy, functions):
+    """(ranges, (candidates, pruned)) of CODE under policy"""
+    region_filter = RegionFilter(policy, functions, 64)
+    ranges = region_filter.ranges(SECTION, CODE)
+    return (ranges, region_filter.count(CODE, ranges))
+
+
+def test_code_prunes_data_between_functions():
+    (ranges, counts) = _pruned("code", FUNCTIONS)
+    assert ranges == [(0, 2), (13, 17)]
+    assert counts == (4, 1)
+
+
+def test_functions_prunes_gaps():
+    (ranges, counts) = _pruned("functions", FUNCTIONS)
+    assert ranges == [(0, 2), (15, 17)]
+    assert counts == (4, 2)
+
+
+def test_no_functions():
+    assert _pruned("code", []) == (None, (4, 0))
+    assert _pruned("functions", None) == (None, (4, 0))
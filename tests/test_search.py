@@ -0,0 +1,168 @@
+"""
+Tests of the instruction index
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import pytest
+import search
+from bench import synthetic_text
+from data import Section
+from decoder import get_decoder
+from gadgetdb import GadgetDBWriter, GadgetDB
+from opcodestream import OpcodeStream
+from search import InstructionIndex, INDEX_HEADER, compile_pattern, \
+    normalize, _match_operand
+from terminators import terminator_table
+
+PATTERNS = ["ret", "pop r32; ret", "pop reg; pop reg; ret", "*; ret",
+            "*; *; *; ret", "...; ret", "...", "...; pop ebp; ret",
+            "pop *; ...; ret", "...; pop reg; ...", "xor reg, reg; ...",
+            "mov reg, [reg+imm]; ...", "mov [reg+imm], reg; *; ret",
+            "mov [reg-imm], eax; ...", "... ; add esp, imm; ret",
+            "mov eax, [eax*imm+imm]; ...", "call [*]; ...", "* mem, *; ...",
+            "mov *, mem; ...", "* reg, imm; ret", "jz imm; ...; ret",
+            "lea esi, [esi]; *; ...", "push reg; ...; pop reg; ret",
+            "...; call imm", "...; ret imm", "nop; nop; ...",
+            "mov rbp, rsp; ...", "pop r64; ret", "...; leave; ret",
+            "movzx reg, reg8; ...", "frobnicate; ret", "pop eax, ebx; ret"]
+
+
+def _database(path, code, locations):
+    """Write a gadget database of one section holding code"""
+    writer = GadgetDBWriter(numbytes=20)
+    sid = writer.add_section(Section(".text", 0x1000, len(code)), code,
+                             "test")
+    writer.add(sid, locations)
+    writer.write(path)
+    writer.close()
+    return GadgetDB(path)
+
+
+def test_odd_posting_count(tmpdir):
+    path = str(tmpdir.join("odd.db"))
+    gadget_db = _database(path, "\x5d\xc3", [(1, 1)])
+    InstructionIndex.build(gadget_db, path + ".insns").close()
+
+    header = open(path + ".insns", "rb").read(INDEX_HEADER.size)
+    assert INDEX_HEADER.unpack(header)[-1] % 2 == 1
+    assert os.path.getsize(path + ".insns") % 8 == 0
+    index = InstructionIndex(path + ".insns")
+    assert index.search("pop r32; ret") == [0]
+    index.close()
+
+
+def _matches(elements, insns):
+    """Check normalized instructions against a compiled pattern"""
+    if not elements:
+        return not insns
+    (head, rest) = (elements[0], elements[1:])
+    if head == "...":
+        return [num for num in range(len(insns) + 1)
+                if _matches(rest, insns[num:])] != []
+    if not insns:
+        return False
+    if head != "*":
+        (mnemonic, operands) = insns[0]
+        if head[0] not in ("*", mnemonic) or len(head[1]) != len(operands):
+            return False
+        for (pattern, operand) in zip(head[1], operands):
+            if not _match_operand(pattern, operand):
+                return False
+    return _matches(rest, insns[1:])
+
+
+@pytest.fixture(scope="module")
+def index(tmpdir_factory):
+    """Index of a database of 32 and 64 bit sections, all terminators"""
+    tmpdir = tmpdir_factory.mktemp("search")
+    path = str(tmpdir.join("gadgets.db"))
+    writer = GadgetDBWriter(terminator_table("all", 32), numbytes=20)
+    for (mode, seed) in [(32, 31), (64, 32)]:
+        code = synthetic_text(6000, density=0.02, seed=seed)
+        sid = writer.add_section(Section(".text", 0x1000 * seed, len(code)),
+                                 code, "test", mode)
+        writer.add(sid, OpcodeStream(code).find_sequences(
+            byte_offs=20, decoder=get_decoder("native", mode),
+            progress=False, terminators=terminator_table("all", mode)))
+    writer.write(path)
+    writer.close()
+    gadget_db = GadgetDB(path)
+    insn_index = InstructionIndex.build(gadget_db, path + ".insns")
+    # the normalized instructions of every gadget
+    decoders = {32 : get_decoder("native", 32), 64 : get_decoder("native", 64)}
+    gadgets = [[normalize(insn) for insn in decoders[gadget_db.mode(gid)].
+                instructions(str(gadget_db.gadget(gid)[4]))]
+               for gid in xrange(len(gadget_db))]
+    gadget_db.close()
+    yield (insn_index, gadgets)
+    insn_index.close()
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+@pytest.mark.parametrize("limits", [(1024, 32), (1, 1), (1 << 20, 1 << 20)])
+def test_search(index, monkeypatch, pattern, limits):
+    # limits of bigram lookups and intersections only change the way
+    # candidates are found
+    monkeypatch.setattr(search, "MAX_PAIRS", limits[0])
+    monkeypatch.setattr(search, "MAX_SPREAD", limits[1])
+    (insn_index, gadgets) = index
+    elements = compile_pattern(pattern)
+    expected = [gid for (gid, insns) in enumerate(gadgets)
+                if _matches(elements, insns)]
+    assert insn_index.search(pattern) == expected
+
+
+def test_patterns_found(index):
+    (insn_index, gadgets) = index
+    found = [pattern for pattern in PATTERNS if insn_index.search(pattern)]
+    assert len(found) > len(PATTERNS) - 4
+    assert len(insn_index.search("...")) == len(gadgets)
+
+
+def test_compile_pattern():
+    assert compile_pattern("POP  r32 ;*; ...;rep ret; mov [esp+imm], *") == \
+        [("pop", ("r32",)), "*", "...", ("rep ret", ()),
+         ("mov", ("[esp+imm]", "*"))]
+    for pattern in ["", "pop eax;;ret", "mov eax,; ret"]:
+        with pytest.raises(ValueError):
+            compile_pattern(pattern)
+
+
+def test_match_operand():
+    for (pattern, operand) in [("*", "[eax]"), ("mem", "fs:[imm]"),
+                               ("[*]", "[eax*imm+imm]"), ("reg", "al"),
+                               ("r64", "r9"), ("[reg+imm]", "[ebp+imm]"),
+                               ("[reg*imm+imm]", "[eax*imm+imm]"),
+                               ("fs:[*]", "fs:[imm]"), ("[*]", "gs:[eax]"),
+                               ("imm", "imm"), ("xmm", "xmm3")]:
+        assert _match_operand(pattern, operand), (pattern, operand)
+    for (pattern, operand) in [("mem", "eax"), ("[reg]", "[ebp+imm]"),
+                               ("[reg+imm]", "[ebp-imm]"), ("r32", "rax"),
+                               ("fs:[*]", "[imm]"), ("reg", "imm"),
+                               ("[esp+imm]", "[ebp+imm]")]:
+        assert not _match_operand(pattern, operand), (pattern, operand)
@@ -0,0 +1,159 @@
+"""
+Tests of the scan server
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import os
+import sys
+import time
+import threading
+from StringIO import StringIO
+import pytest
+import rc
+from bench import synthetic_text
+from server import ScanServer, ServerBusy, submit, status
+from elfimage import write_elf
+
+
+def _echo(state, text="", status=0, exit=None):
+    """Toy command: writes to both streams, counts its runs in state"""
+    runs = state.get("runs", lambda: [])
+    runs += [text]
+    print text, len(runs)
+    sys.stderr.write(os.getcwd() + "\n")
+    if exit is not None:
+        sys.exit(exit)
+    return status
+
+
+def _fail(_state):
+    raise RuntimeError("broken")
+
+
+@pytest.fixture
+def serve(tmpdir):
+    """Start a server on a socket in tmpdir with commands"""
+    servers = []
+
+    def start(commands, queue_size=4):
+        scan_server = ScanServer(str(tmpdir.join("sock")), commands,
+                                 queue_size)
+        thread = threading.Thread(target=scan_server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        servers.append(scan_server)
+        return scan_server
+    yield start
+    for scan_server in servers:
+        scan_server.shutdown()
+        scan_server.server_close()
+
+
+def _submit(path, command, args, cwd="/"):
+    # the server runs in this process and changes its directory
+    os.chdir(cwd)
+    (stdout, stderr) = (StringIO(), StringIO())
+    result = submit(path, command, args, stdout, stderr, wait=0.5)
+    return (result, stdout.getvalue(), stderr.getvalue())
+
+
+def test_jobs(tmpdir, serve, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    scan_server = serve({"echo" : _echo, "fail" : _fail})
+    path = scan_server.path
+    # jobs run in the directory of their client
+    assert _submit(path, "echo", {"text" : "hello"}, str(tmpdir)) == \
+        (0, "hello 1\n", str(tmpdir) + "\n")
+    # the warm state is kept between jobs
+    assert _submit(path, "echo", {"text" : u"again", "status" : 3}) == \
+        (3, "again 2\n", "/\n")
+    assert _submit(path, "echo", {"exit" : 2})[0] == 2
+    (result, _stdout, stderr) = _submit(path, "fail", {})
+    assert result == 1
+    assert "RuntimeError: broken" in stderr
+    with pytest.raises(ValueError):
+        _submit(path, "nothing", {})
+    info = status(path)
+    assert (info["finished"], info["queued"], info["pid"]) == \
+        (4, 0, os.getpid())
+
+
+def test_busy(serve):
+    started = threading.Event()
+    release = threading.Event()
+
+    def block(_state):
+        started.set()
+        release.wait(10)
+    scan_server = serve({"block" : block}, queue_size=1)
+    path = scan_server.path
+    clients = [threading.Thread(target=submit, args=(path, "block", {},
+                                                     StringIO(), StringIO()))
+               for _num in range(2)]
+    clients[0].start()
+    started.wait(10)
+    # one job running, one waiting, no room for a third
+    clients[1].start()
+    while status(path)["queued"] == 0:
+        time.sleep(0.01)
+    assert status(path)["running"] == "block"
+    with pytest.raises(ServerBusy):
+        submit(path, "block", {}, StringIO(), StringIO(), wait=0.2)
+    release.set()
+    for client in clients:
+        client.join(10)
+    assert status(path)["finished"] == 2
+
+
+def test_no_server(tmpdir, serve):
+    path = str(tmpdir.join("sock"))
+    assert submit(path, "echo", {}) is None
+    assert status(path) is None
+    serve({"echo" : _echo})
+    with pytest.raises(ValueError):
+        ScanServer(path, {})
+
+
+def test_scan(tmpdir, serve, monkeypatch):
+    scan_server = serve({"scan" : lambda state, **args:
+                         rc.scan_file(state=state, **args)})
+    binary = str(tmpdir.join("binary"))
+    write_elf(binary, [(".text", 0x1000, synthetic_text(8192, 0.02, 23))])
+    outputs = []
+    for (where, options) in [("", {}), (scan_server.path, {}),
+                             (scan_server.path, {}),
+                             (scan_server.path, {"jobs" : 2}),
+                             (scan_server.path, {"jobs" : 2})]:
+        output = "out%d.csv" % len(outputs)
+        monkeypatch.chdir(tmpdir)
+        rc.scan_command("binary", format="csv", output=output,
+                        terminators="all", server=where, **options)
+        outputs += [tmpdir.join(output).read()]
+    assert outputs[0].count("\n") > 100
+    assert outputs[1:] == outputs[:1] * 4
+    assert status(scan_server.path)["finished"] == 4
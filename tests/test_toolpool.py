@@ -0,0 +1,67 @@
+"""
+Tests of the external tool pool
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+
+import random
+import pytest
+from toolpool import ToolPool, ToolError
+
+# far more than a pipe buffers
+DATA = "".join([chr(random.Random(3).randrange(256))
+                for _i in xrange(1024)]) * 1024
+
+
+def test_run():
+    pool = ToolPool(1)
+    assert pool.run(["cat"], DATA) == (0, DATA)
+    assert pool.run(["echo", "hello"]) == (0, "hello\n")
+    assert pool.run(["sh", "-c", "cat >/dev/null; exit 3"], DATA) == (3, "")
+    # quits without reading all of its input
+    assert pool.run(["head", "-c", "10"], DATA) == (0, DATA[:10])
+    assert pool.started == 4
+
+
+@pytest.mark.parametrize("size", [1, 3, 16])
+def test_map(size):
+    pool = ToolPool(size)
+    jobs = [(["cat"], DATA[num:num + 200000]) for num in xrange(10)] + \
+        [(["sh", "-c", "sleep 0.0%d; wc -c" % (9 - num)], "x" * num)
+         for num in xrange(10)]
+    results = pool.map(jobs)
+    # in the order of the jobs, whichever finished first
+    assert results == [(0, DATA[num:num + 200000]) for num in xrange(10)] + \
+        [(0, "%d\n" % num) for num in xrange(10)]
+    assert pool.started == 20
+    assert pool.map([]) == []
+
+
+def test_missing_tool():
+    pool = ToolPool(2)
+    with pytest.raises(ToolError):
+        pool.map([(["cat"], DATA), (["no-such-tool-here"], "")])
@@ -0,0 +1,74 @@
+"""
+Tests of the native x86 decoder
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import binascii
+import pytest
+from x86 import X86Decoder
+
+# (mode, bytes, length of each instruction), checked against objdump;
+# fixed-register operands (DX and the segment registers) take no ModRM
+LENGTHS = [
+    (32, "06c3", [1, 1]),
+    (32, "07c3", [1, 1]),
+    (32, "0ec3", [1, 1]),
+    (32, "16c3", [1, 1]),
+    (32, "17c3", [1, 1]),
+    (32, "1ec3", [1, 1]),
+    (32, "1fc3", [1, 1]),
+    (32, "ecc3", [1, 1]),
+    (32, "edc3", [1, 1]),
+    (32, "eec3", [1, 1]),
+    (32, "efc3", [1, 1]),
+    (32, "66edc3", [2, 1]),
+    (32, "0fa0c3", [2, 1]),
+    (32, "0fa1c3", [2, 1]),
+    (32, "0fa8c3", [2, 1]),
+    (32, "0fa9c3", [2, 1]),
+    (32, "e4c3c3", [2, 1]),
+    (32, "d3e0c3", [2, 1]),
+    (64, "ecc3", [1, 1]),
+    (64, "66efc3", [2, 1]),
+    (64, "0fa8c3", [2, 1]),
+    (64, "0fa9c3", [2, 1]),
+    (64, "410fa8c3", [3, 1]),
+]
+
+
+@pytest.mark.parametrize("mode, entry, lengths", LENGTHS)
+def test_lengths(mode, entry, lengths):
+    code = bytearray(binascii.unhexlify(entry))
+    decoder = X86Decoder(mode)
+    found = []
+    pos = 0
+    while pos < len(code):
+        insn = decoder.decode(code, pos)
+        assert insn.valid
+        found += [insn.end - pos]
+        pos = insn.end
+    assert found == lengths
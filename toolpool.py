@@ -0,0 +1,160 @@
+"""
+Pool of external tool processes used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+import os
+import errno
+import select
+import subprocess
+import multiprocessing
+
+# bytes written to a pipe per wakeup: writes of at most PIPE_BUF bytes to
+# a pipe select() reports writable do not block
+WRITE_SIZE = select.PIPE_BUF
+READ_SIZE = 65536
+
+
+def default_size():
+    """Number of tool processes run at once by default: one per CPU"""
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+class ToolError(Exception):
+    """
+    Raised for tools that cannot be started
+    """
+
+
+class _Job:
+    """A running tool: its process, pending input and output so far"""
+    def __init__(self, num, argv, data):
+        self.num = num
+        try:
+            self.process = subprocess.Popen(argv, stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            close_fds=True)
+        except OSError, err:
+            raise ToolError("Cannot run %s: %s" % (argv[0], err.strerror))
+        self.data = data
+        self.written = 0
+        self.output = []
+        if not data:
+            self.process.stdin.close()
+
+    def write(self):
+        """Feed the next piece of input, close stdin after the last"""
+        piece = self.data[self.written:self.written + WRITE_SIZE]
+        try:
+            self.written += os.write(self.process.stdin.fileno(), piece)
+        except OSError, err:
+            if err.errno != errno.EPIPE:
+                raise
+            # the tool quit early, it gets no more input
+            self.written = len(self.data)
+        if self.written >= len(self.data):
+            self.process.stdin.close()
+
+    def read(self):
+        """Collect output, returns False at its end"""
+        piece = os.read(self.process.stdout.fileno(), READ_SIZE)
+        if piece:
+            self.output += [piece]
+            return True
+        self.process.stdout.close()
+        return False
+
+    def result(self):
+        """(exit status, output) of the finished tool"""
+        return (self.process.wait(), "".join(self.output))
+
+
+class ToolPool:
+    """
+    Runs external tools, feeding their input through stdin and collecting
+    their output from stdout, with up to size of them in flight at once.
+    All pipes are served from one select() loop, so tools never block on
+    a full pipe and no temp files are needed.
+    """
+    def __init__(self, size=None):
+        if size is None:
+            size = default_size()
+        self.size = max(1, size)
+        self.started = 0
+
+    def run(self, argv, data=""):
+        """Run one tool on input data, returns (exit status, output)"""
+        return self.map([(argv, data)])[0]
+
+    def map(self, jobs):
+        """
+        Run the (argv, input) tuples of jobs, at most size at a time.
+
+        Returns: list of (exit status, output) tuples in the order of jobs
+        """
+        jobs = list(jobs)
+        results = [None] * len(jobs)
+        running = {}
+        readers = {}
+        writers = {}
+        upcoming = 0
+        try:
+            while upcoming < len(jobs) or running:
+                while upcoming < len(jobs) and len(running) < self.size:
+                    (argv, data) = jobs[upcoming]
+                    job = _Job(upcoming, argv, data)
+                    self.started += 1
+                    running[upcoming] = job
+                    readers[job.process.stdout.fileno()] = job
+                    if data:
+                        writers[job.process.stdin.fileno()] = job
+                    upcoming += 1
+
+                (readable, writable, _error) = select.select(
+                    readers.keys(), writers.keys(), [])
+                for fileno in writable:
+                    job = writers[fileno]
+                    job.write()
+                    if job.process.stdin.closed:
+                        del writers[fileno]
+                for fileno in readable:
+                    if not readers[fileno].read():
+                        del readers[fileno]
+                for job in running.values():
+                    if job.process.stdout.closed and \
+                       job.process.stdin.closed:
+                        del running[job.num]
+                        results[job.num] = job.result()
+        finally:
+            for job in running.values():
+                if job.process.poll() is None:
+                    job.process.kill()
+                    job.process.wait()
+        return results
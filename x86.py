@@ -0,0 +1,994 @@
+"""
+Native x86 instruction decoder used by ROPCheck
+"""
+
+"""
+    DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+                    Version 2, December 2004
+
+ Copyright (C) 2004 Sam Hocevar <sam@hocevar.net>
+
+ Everyone is permitted to copy and distribute verbatim or modified
+ copies of this license document, and changing it is allowed as long
+ as the name is changed.
+
+            DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+   TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+
+  0. You just DO WHAT THE FUCK YOU WANT TO.
+
+  1. This program is free software. It comes without any warranty, to
+     the extent permitted by applicable law. You can redistribute it
+     and/or modify it under the terms of the Do What The Fuck You Want
+     To Public License, Version 2, as published by Sam Hocevar. See
+     http://sam.zoy.org/wtfpl/COPYING for more details.
+"""
+
+# (c) 2010 Bjoern Doebel <doebel@tudos.org>
+#     economic rights: Technische Universitaet Dresden (Germany)
+
+#
+# Opcode tables. Operand specs follow the notation of the Intel manuals:
+#
+#   E? - ModRM r/m operand        G? - ModRM reg operand
+#   M  - ModRM memory-only        S  - segment register (ModRM reg)
+#   C/D- control/debug register   R  - general register (ModRM r/m)
+#   V/W- xmm reg / xmm r/m        P/Q- mmx reg / mmx r/m
+#   I? - immediate                J? - relative branch target
+#   O? - absolute memory offset   Ap - far pointer
+#   Z? - register in opcode bits  everything else is a fixed register
+#
+# Size suffixes: b - byte, w - word, d - dword, q - qword,
+#                v - operand size, z - operand size but at most 32 bit,
+#                s - operand size, but 64 bit by default in 64 bit mode
+#                    (stack operations and near branches)
+#
+
+REGS8  = ["al", "cl", "dl", "bl", "ah", "ch", "dh", "bh"]
+REGS16 = ["ax", "cx", "dx", "bx", "sp", "bp", "si", "di"]
+REGS32 = ["eax", "ecx", "edx", "ebx", "esp", "ebp", "esi", "edi"]
+# 64 bit mode: any REX prefix turns ah..bh into spl..dil, REX.R/X/B
+# extend register numbers to r8..r15
+REGS8_REX = ["al", "cl", "dl", "bl", "spl", "bpl", "sil", "dil"] + \
+            ["r%db" % i for i in range(8, 16)]
+REGS16 += ["r%dw" % i for i in range(8, 16)]
+REGS32 += ["r%dd" % i for i in range(8, 16)]
+REGS64 = ["rax", "rcx", "rdx", "rbx", "rsp", "rbp", "rsi", "rdi"] + \
+         ["r%d" % i for i in range(8, 16)]
+SEGREGS = ["es", "cs", "ss", "ds", "fs", "gs", None, None]
+MODRM16 = ["bx+si", "bx+di", "bp+si", "bp+di", "si", "di", "bp", "bx"]
+
+PREFIX_SEG = { 0x26 : "es", 0x2e : "cs", 0x36 : "ss",
+               0x3e : "ds", 0x64 : "fs", 0x65 : "gs" }
+PREFIX_OPSIZE  = 0x66
+PREFIX_ADSIZE  = 0x67
+PREFIX_LOCK    = 0xf0
+PREFIX_REPNE   = 0xf2
+PREFIX_REP     = 0xf3
+PREFIXES = set(PREFIX_SEG.keys() + [PREFIX_OPSIZE, PREFIX_ADSIZE,
+                                    PREFIX_LOCK, PREFIX_REPNE, PREFIX_REP])
+# 40 - 4f are REX prefixes in 64 bit mode
+REX_W = 0x08
+REX_R = 0x04
+REX_X = 0x02
+REX_B = 0x01
+
+# an x86 instruction may never be longer than this
+MAX_INSN_LEN = 15
+
+JCC = ["jo", "jno", "jb", "jae", "jz", "jnz", "jbe", "ja",
+       "js", "jns", "jp", "jnp", "jl", "jge", "jle", "jg"]
+CC = [j[1:] for j in JCC]
+
+ALU = ["add", "or", "adc", "sbb", "and", "sub", "xor", "cmp"]
+
+GRP1 = [(m, None) for m in ALU]
+GRP2 = [(m, None) for m in ["rol", "ror", "rcl", "rcr",
+                            "shl", "shr", "sal", "sar"]]
+GRP3B = [("test", ("Eb", "Ib")), ("test", ("Eb", "Ib")),
+         ("not", ("Eb",)), ("neg", ("Eb",)), ("mul", ("Eb",)),
+         ("imul", ("Eb",)), ("div", ("Eb",)), ("idiv", ("Eb",))]
+GRP3V = [("test", ("Ev", "Iz")), ("test", ("Ev", "Iz")),
+         ("not", ("Ev",)), ("neg", ("Ev",)), ("mul", ("Ev",)),
+         ("imul", ("Ev",)), ("div", ("Ev",)), ("idiv", ("Ev",))]
+GRP4 = [("inc", ("Eb",)), ("dec", ("Eb",))] + [None] * 6
+GRP5 = [("inc", ("Ev",)), ("dec", ("Ev",)), ("call", ("Es",)),
+        ("call", ("Mp",)), ("jmp", ("Es",)), ("jmp", ("Mp",)),
+        ("push", ("Es",)), None]
+GRP1A = [("pop", ("Es",))] + [None] * 7
+GRP11B = [("mov", ("Eb", "Ib"))] + [None] * 7
+GRP11V = [("mov", ("Ev", "Iz"))] + [None] * 7
+
+
+def _one_byte_table():
+    """Build the primary opcode table"""
+    tab = [None] * 256
+
+    for i, mnem in enumerate(ALU):
+        base = i * 8
+        tab[base + 0] = (mnem, ("Eb", "Gb"))
+        tab[base + 1] = (mnem, ("Ev", "Gv"))
+        tab[base + 2] = (mnem, ("Gb", "Eb"))
+        tab[base + 3] = (mnem, ("Gv", "Ev"))
+        tab[base + 4] = (mnem, ("AL", "Ib"))
+        tab[base + 5] = (mnem, ("eAX", "Iz"))
+
+    tab[0x06] = ("push", ("ES",))
+    tab[0x07] = ("pop", ("ES",))
+    tab[0x0e] = ("push", ("CS",))
+    tab[0x16] = ("push", ("SS",))
+    tab[0x17] = ("pop", ("SS",))
+    tab[0x1e] = ("push", ("DS",))
+    tab[0x1f] = ("pop", ("DS",))
+    tab[0x27] = ("daa", ())
+    tab[0x2f] = ("das", ())
+    tab[0x37] = ("aaa", ())
+    tab[0x3f] = ("aas", ())
+
+    for i in range(8):
+        tab[0x40 + i] = ("inc", ("Zv",))
+        tab[0x48 + i] = ("dec", ("Zv",))
+        tab[0x50 + i] = ("push", ("Zs",))
+        tab[0x58 + i] = ("pop", ("Zs",))
+        tab[0xb0 + i] = ("mov", ("Zb", "Ib"))
+        tab[0xb8 + i] = ("mov", ("Zv", "Iv"))
+
+    tab[0x60] = ("pushad", ())
+    tab[0x61] = ("popad", ())
+    tab[0x62] = ("bound", ("Gv", "M"))
+    tab[0x63] = ("arpl", ("Ew", "Gw"))
+    tab[0x68] = ("push", ("Iz",))
+    tab[0x69] = ("imul", ("Gv", "Ev", "Iz"))
+    tab[0x6a] = ("push", ("Ib",))
+    tab[0x6b] = ("imul", ("Gv", "Ev", "Ib"))
+    tab[0x6c] = ("insb", ())
+    tab[0x6d] = ("insd", ())
+    tab[0x6e] = ("outsb", ())
+    tab[0x6f] = ("outsd", ())
+
+    for i, mnem in enumerate(JCC):
+        tab[0x70 + i] = (mnem, ("Jb",))
+
+    tab[0x80] = ("/", GRP1, ("Eb", "Ib"))
+    tab[0x81] = ("/", GRP1, ("Ev", "Iz"))
+    tab[0x82] = ("/", GRP1, ("Eb", "Ib"))
+    tab[0x83] = ("/", GRP1, ("Ev", "Ib"))
+    tab[0x84] = ("test", ("Eb", "Gb"))
+    tab[0x85] = ("test", ("Ev", "Gv"))
+    tab[0x86] = ("xchg", ("Eb", "Gb"))
+    tab[0x87] = ("xchg", ("Ev", "Gv"))
+    tab[0x88] = ("mov", ("Eb", "Gb"))
+    tab[0x89] = ("mov", ("Ev", "Gv"))
+    tab[0x8a] = ("mov", ("Gb", "Eb"))
+    tab[0x8b] = ("mov", ("Gv", "Ev"))
+    tab[0x8c] = ("mov", ("Ev", "Sw"))
+    tab[0x8d] = ("lea", ("Gv", "M"))
+    tab[0x8e] = ("mov", ("Sw", "Ew"))
+    tab[0x8f] = ("/", GRP1A, None)
+
+    tab[0x90] = ("nop", ())
+    for i in range(1, 8):
+        tab[0x90 + i] = ("xchg", ("Zv", "eAX"))
+    tab[0x98] = ("cwde", ())
+    tab[0x99] = ("cdq", ())
+    tab[0x9a] = ("call", ("Ap",))
+    tab[0x9b] = ("wait", ())
+    tab[0x9c] = ("pushfd", ())
+    tab[0x9d] = ("popfd", ())
+    tab[0x9e] = ("sahf", ())
+    tab[0x9f] = ("lahf", ())
+
+    tab[0xa0] = ("mov", ("AL", "Ob"))
+    tab[0xa1] = ("mov", ("eAX", "Ov"))
+    tab[0xa2] = ("mov", ("Ob", "AL"))
+    tab[0xa3] = ("mov", ("Ov", "eAX"))
+    tab[0xa4] = ("movsb", ())
+    tab[0xa5] = ("movsd", ())
+    tab[0xa6] = ("cmpsb", ())
+    tab[0xa7] = ("cmpsd", ())
+    tab[0xa8] = ("test", ("AL", "Ib"))
+    tab[0xa9] = ("test", ("eAX", "Iz"))
+    tab[0xaa] = ("stosb", ())
+    tab[0xab] = ("stosd", ())
+    tab[0xac] = ("lodsb", ())
+    tab[0xad] = ("lodsd", ())
+    tab[0xae] = ("scasb", ())
+    tab[0xaf] = ("scasd", ())
+
+    tab[0xc0] = ("/", GRP2, ("Eb", "Ib"))
+    tab[0xc1] = ("/", GRP2, ("Ev", "Ib"))
+    tab[0xc2] = ("ret", ("Iw",))
+    tab[0xc3] = ("ret", ())
+    tab[0xc4] = ("les", ("Gz", "Mp"))
+    tab[0xc5] = ("lds", ("Gz", "Mp"))
+    tab[0xc6] = ("/", GRP11B, None)
+    tab[0xc7] = ("/", GRP11V, None)
+    tab[0xc8] = ("enter", ("Iw", "Ib"))
+    tab[0xc9] = ("leave", ())
+    tab[0xca] = ("retf", ("Iw",))
+    tab[0xcb] = ("retf", ())
+    tab[0xcc] = ("int3", ())
+    tab[0xcd] = ("int", ("Ib",))
+    tab[0xce] = ("into", ())
+    tab[0xcf] = ("iretd", ())
+
+    tab[0xd0] = ("/", GRP2, ("Eb", "I1"))
+    tab[0xd1] = ("/", GRP2, ("Ev", "I1"))
+    tab[0xd2] = ("/", GRP2, ("Eb", "CL"))
+    tab[0xd3] = ("/", GRP2, ("Ev", "CL"))
+    tab[0xd4] = ("aam", ("Ib",))
+    tab[0xd5] = ("aad", ("Ib",))
+    tab[0xd6] = ("salc", ())
+    tab[0xd7] = ("xlatb", ())
+    for i in range(8):
+        tab[0xd8 + i] = ("fpu", None)
+
+    tab[0xe0] = ("loopnz", ("Jb",))
+    tab[0xe1] = ("loope", ("Jb",))
+    tab[0xe2] = ("loop", ("Jb",))
+    tab[0xe3] = ("jecxz", ("Jb",))
+    tab[0xe4] = ("in", ("AL", "Ib"))
+    tab[0xe5] = ("in", ("eAX", "Ib"))
+    tab[0xe6] = ("out", ("Ib", "AL"))
+    tab[0xe7] = ("out", ("Ib", "eAX"))
+    tab[0xe8] = ("call", ("Jz",))
+    tab[0xe9] = ("jmp", ("Jz",))
+    tab[0xea] = ("jmp", ("Ap",))
+    tab[0xeb] = ("jmp", ("Jb",))
+    tab[0xec] = ("in", ("AL", "DX"))
+    tab[0xed] = ("in", ("eAX", "DX"))
+    tab[0xee] = ("out", ("DX", "AL"))
+    tab[0xef] = ("out", ("DX", "eAX"))
+
+    tab[0xf1] = ("int1", ())
+    tab[0xf4] = ("hlt", ())
+    tab[0xf5] = ("cmc", ())
+    tab[0xf6] = ("/", GRP3B, None)
+    tab[0xf7] = ("/", GRP3V, None)
+    tab[0xf8] = ("clc", ())
+    tab[0xf9] = ("stc", ())
+    tab[0xfa] = ("cli", ())
+    tab[0xfb] = ("sti", ())
+    tab[0xfc] = ("cld", ())
+    tab[0xfd] = ("std", ())
+    tab[0xfe] = ("/", GRP4, None)
+    tab[0xff] = ("/", GRP5, None)
+
+    return tab
+
+
+# MMX/SSE opcodes without a dedicated operand layout all take a ModRM byte
+SSE_OPS = { 0x10 : "movups", 0x11 : "movups", 0x12 : "movlps",
+            0x13 : "movlps", 0x14 : "unpcklps", 0x15 : "unpckhps",
+            0x16 : "movhps", 0x17 : "movhps", 0x28 : "movaps",
+            0x29 : "movaps", 0x2a : "cvtpi2ps", 0x2b : "movntps",
+            0x2c : "cvttps2pi", 0x2d : "cvtps2pi", 0x2e : "ucomiss",
+            0x2f : "comiss", 0x50 : "movmskps", 0x51 : "sqrtps",
+            0x52 : "rsqrtps", 0x53 : "rcpps", 0x54 : "andps",
+            0x55 : "andnps", 0x56 : "orps", 0x57 : "xorps", 0x58 : "addps",
+            0x59 : "mulps", 0x5a : "cvtps2pd", 0x5b : "cvtdq2ps",
+            0x5c : "subps", 0x5d : "minps", 0x5e : "divps", 0x5f : "maxps",
+            0x60 : "punpcklbw", 0x61 : "punpcklwd", 0x62 : "punpckldq",
+            0x63 : "packsswb", 0x64 : "pcmpgtb", 0x65 : "pcmpgtw",
+            0x66 : "pcmpgtd", 0x67 : "packuswb", 0x68 : "punpckhbw",
+            0x69 : "punpckhwd", 0x6a : "punpckhdq", 0x6b : "packssdw",
+            0x6c : "punpcklqdq", 0x6d : "punpckhqdq", 0x6e : "movd",
+            0x6f : "movq", 0x74 : "pcmpeqb", 0x75 : "pcmpeqw",
+            0x76 : "pcmpeqd", 0x7c : "haddpd", 0x7d : "hsubpd",
+            0x7e : "movd", 0x7f : "movq", 0xd0 : "addsubpd",
+            0xd6 : "movq", 0xe6 : "cvttpd2dq", 0xe7 : "movntq",
+            0xf0 : "lddqu", 0xf7 : "maskmovq" }
+for _op in range(0xd1, 0x100):
+    SSE_OPS.setdefault(_op, "mmx")
+del SSE_OPS[0xff]
+
+GRP6 = [("sldt", ("Ew",)), ("str", ("Ew",)), ("lldt", ("Ew",)),
+        ("ltr", ("Ew",)), ("verr", ("Ew",)), ("verw", ("Ew",)), None, None]
+GRP7 = [("sgdt", ("M",)), ("sidt", ("M",)), ("lgdt", ("M",)),
+        ("lidt", ("M",)), ("smsw", ("Ew",)), None, ("lmsw", ("Ew",)),
+        ("invlpg", ("M",))]
+# 0f 01 with mod == 3 encodes whole instructions in the ModRM byte
+GRP7_REG = { 0xc1 : "vmcall", 0xc2 : "vmlaunch", 0xc3 : "vmresume",
+             0xc4 : "vmxoff", 0xc8 : "monitor", 0xc9 : "mwait",
+             0xd0 : "xgetbv", 0xd1 : "xsetbv", 0xf9 : "rdtscp" }
+GRP8 = [None] * 4 + [(m, ("Ev", "Ib")) for m in ["bt", "bts", "btr", "btc"]]
+GRP9 = [None, ("cmpxchg8b", ("M",)), None, None, None, None,
+        ("vmptrld", ("M",)), ("vmptrst", ("M",))]
+GRP12 = [None, None, ("psrlw", ("N", "Ib")), None, ("psraw", ("N", "Ib")),
+         None, ("psllw", ("N", "Ib")), None]
+GRP13 = [None, None, ("psrld", ("N", "Ib")), None, ("psrad", ("N", "Ib")),
+         None, ("pslld", ("N", "Ib")), None]
+GRP14 = [None, None, ("psrlq", ("N", "Ib")), ("psrldq", ("N", "Ib")),
+         None, None, ("psllq", ("N", "Ib")), ("pslldq", ("N", "Ib"))]
+GRP15 = [("fxsave", ("M",)), ("fxrstor", ("M",)), ("ldmxcsr", ("M",)),
+         ("stmxcsr", ("M",)), ("xsave", ("M",)), ("lfence", ("M",)),
+         ("mfence", ("M",)), ("clflush", ("M",))]
+GRP15_REG = { 5 : "lfence", 6 : "mfence", 7 : "sfence" }
+GRP16 = [("prefetchnta", ("M",)), ("prefetcht0", ("M",)),
+         ("prefetcht1", ("M",)), ("prefetcht2", ("M",))] + \
+        [("nop", ("Ev",))] * 4
+
+# valid three-byte opcodes: 0f 38 xx take a ModRM, 0f 3a xx take ModRM + Ib
+THREE_BYTE_38 = set(range(0x00, 0x0c) + [0x10, 0x14, 0x15, 0x17] +
+                    range(0x1c, 0x1f) + range(0x20, 0x26) +
+                    range(0x28, 0x2c) + range(0x30, 0x36) +
+                    range(0x37, 0x42) + [0x80, 0x81, 0xf0, 0xf1])
+THREE_BYTE_3A = set(range(0x08, 0x10) + range(0x14, 0x18) +
+                    range(0x20, 0x23) + range(0x40, 0x43) +
+                    [0x44] + range(0x60, 0x64))
+
+
+def _two_byte_table():
+    """Build the 0f-escaped opcode table"""
+    tab = [None] * 256
+
+    for op, mnem in SSE_OPS.items():
+        tab[op] = (mnem, ("V", "W"))
+
+    tab[0x00] = ("/", GRP6, None)
+    tab[0x01] = ("/", GRP7, None)
+    tab[0x02] = ("lar", ("Gv", "Ew"))
+    tab[0x03] = ("lsl", ("Gv", "Ew"))
+    tab[0x05] = ("syscall", ())
+    tab[0x06] = ("clts", ())
+    tab[0x07] = ("sysret", ())
+    tab[0x08] = ("invd", ())
+    tab[0x09] = ("wbinvd", ())
+    tab[0x0b] = ("ud2", ())
+    tab[0x0d] = ("prefetch", ("M",))
+    tab[0x0e] = ("femms", ())
+    tab[0x0f] = ("3dnow", ("P", "Q", "Ib"))
+    tab[0x18] = ("/", GRP16, None)
+    for op in range(0x19, 0x20):
+        tab[op] = ("nop", ("Ev",))
+    tab[0x20] = ("mov", ("R", "C"))
+    tab[0x21] = ("mov", ("R", "D"))
+    tab[0x22] = ("mov", ("C", "R"))
+    tab[0x23] = ("mov", ("D", "R"))
+    tab[0x30] = ("wrmsr", ())
+    tab[0x31] = ("rdtsc", ())
+    tab[0x32] = ("rdmsr", ())
+    tab[0x33] = ("rdpmc", ())
+    tab[0x34] = ("sysenter", ())
+    tab[0x35] = ("sysexit", ())
+    tab[0x37] = ("getsec", ())
+    for i, cond in enumerate(CC):
+        tab[0x40 + i] = ("cmov" + cond, ("Gv", "Ev"))
+        tab[0x80 + i] = (JCC[i], ("Jz",))
+        tab[0x90 + i] = ("set" + cond, ("Eb",))
+    tab[0x70] = ("pshufw", ("P", "Q", "Ib"))
+    tab[0x71] = ("/", GRP12, None)
+    tab[0x72] = ("/", GRP13, None)
+    tab[0x73] = ("/", GRP14, None)
+    tab[0x77] = ("emms", ())
+    tab[0x78] = ("vmread", ("Ed", "Gd"))
+    tab[0x79] = ("vmwrite", ("Gd", "Ed"))
+    tab[0xa0] = ("push", ("FS",))
+    tab[0xa1] = ("pop", ("FS",))
+    tab[0xa2] = ("cpuid", ())
+    tab[0xa3] = ("bt", ("Ev", "Gv"))
+    tab[0xa4] = ("shld", ("Ev", "Gv", "Ib"))
+    tab[0xa5] = ("shld", ("Ev", "Gv", "CL"))
+    tab[0xa8] = ("push", ("GS",))
+    tab[0xa9] = ("pop", ("GS",))
+    tab[0xaa] = ("rsm", ())
+    tab[0xab] = ("bts", ("Ev", "Gv"))
+    tab[0xac] = ("shrd", ("Ev", "Gv", "Ib"))
+    tab[0xad] = ("shrd", ("Ev", "Gv", "CL"))
+    tab[0xae] = ("/", GRP15, None)
+    tab[0xaf] = ("imul", ("Gv", "Ev"))
+    tab[0xb0] = ("cmpxchg", ("Eb", "Gb"))
+    tab[0xb1] = ("cmpxchg", ("Ev", "Gv"))
+    tab[0xb2] = ("lss", ("Gz", "Mp"))
+    tab[0xb3] = ("btr", ("Ev", "Gv"))
+    tab[0xb4] = ("lfs", ("Gz", "Mp"))
+    tab[0xb5] = ("lgs", ("Gz", "Mp"))
+    tab[0xb6] = ("movzx", ("Gv", "Eb"))
+    tab[0xb7] = ("movzx", ("Gv", "Ew"))
+    tab[0xb8] = ("popcnt", ("Gv", "Ev"))
+    tab[0xb9] = ("ud1", ("Gv", "Ev"))
+    tab[0xba] = ("/", GRP8, None)
+    tab[0xbb] = ("btc", ("Ev", "Gv"))
+    tab[0xbc] = ("bsf", ("Gv", "Ev"))
+    tab[0xbd] = ("bsr", ("Gv", "Ev"))
+    tab[0xbe] = ("movsx", ("Gv", "Eb"))
+    tab[0xbf] = ("movsx", ("Gv", "Ew"))
+    tab[0xc0] = ("xadd", ("Eb", "Gb"))
+    tab[0xc1] = ("xadd", ("Ev", "Gv"))
+    tab[0xc2] = ("cmpps", ("V", "W", "Ib"))
+    tab[0xc3] = ("movnti", ("M", "Gd"))
+    tab[0xc4] = ("pinsrw", ("P", "Ew", "Ib"))
+    tab[0xc5] = ("pextrw", ("Gd", "N", "Ib"))
+    tab[0xc6] = ("shufps", ("V", "W", "Ib"))
+    tab[0xc7] = ("/", GRP9, None)
+    for i in range(8):
+        tab[0xc8 + i] = ("bswap", ("Zd",))
+    return tab
+
+
+# x87 memory forms, indexed by [opcode - 0xd8][modrm.reg]
+FPU_MEM = [
+    ["fadd", "fmul", "fcom", "fcomp", "fsub", "fsubr", "fdiv", "fdivr"],
+    ["fld", None, "fst", "fstp", "fldenv", "fldcw", "fnstenv", "fnstcw"],
+    ["fiadd", "fimul", "ficom", "ficomp", "fisub", "fisubr", "fidiv",
+     "fidivr"],
+    ["fild", "fisttp", "fist", "fistp", None, "fld", None, "fstp"],
+    ["fadd", "fmul", "fcom", "fcomp", "fsub", "fsubr", "fdiv", "fdivr"],
+    ["fld", "fisttp", "fst", "fstp", "frstor", None, "fnsave", "fnstsw"],
+    ["fiadd", "fimul", "ficom", "ficomp", "fisub", "fisubr", "fidiv",
+     "fidivr"],
+    ["fild", "fisttp", "fist", "fistp", "fbld", "fild", "fbstp", "fistp"],
+]
+
+# x87 register forms: mnemonics for whole rows of eight (keyed by the
+# upper five bits of the ModRM byte) and for single ModRM values
+FPU_REG_ROW = {
+    0xd8 : ["fadd", "fmul", "fcom", "fcomp", "fsub", "fsubr", "fdiv",
+            "fdivr"],
+    0xd9 : ["fld", "fxch", None, None, None, None, None, None],
+    0xda : ["fcmovb", "fcmove", "fcmovbe", "fcmovu", None, None, None, None],
+    0xdb : ["fcmovnb", "fcmovne", "fcmovnbe", "fcmovnu", None, "fucomi",
+            "fcomi", None],
+    0xdc : ["fadd", "fmul", None, None, "fsubr", "fsub", "fdivr", "fdiv"],
+    0xdd : ["ffree", None, "fst", "fstp", "fucom", "fucomp", None, None],
+    0xde : ["faddp", "fmulp", None, None, "fsubrp", "fsubp", "fdivrp",
+            "fdivp"],
+    0xdf : ["ffreep", None, None, None, None, "fucomip", "fcomip", None],
+}
+FPU_REG_SINGLE = {
+    (0xd9, 0xd0) : "fnop", (0xd9, 0xe0) : "fchs", (0xd9, 0xe1) : "fabs",
+    (0xd9, 0xe4) : "ftst", (0xd9, 0xe5) : "fxam", (0xd9, 0xe8) : "fld1",
+    (0xd9, 0xe9) : "fldl2t", (0xd9, 0xea) : "fldl2e", (0xd9, 0xeb) : "fldpi",
+    (0xd9, 0xec) : "fldlg2", (0xd9, 0xed) : "fldln2", (0xd9, 0xee) : "fldz",
+    (0xd9, 0xf0) : "f2xm1", (0xd9, 0xf1) : "fyl2x", (0xd9, 0xf2) : "fptan",
+    (0xd9, 0xf3) : "fpatan", (0xd9, 0xf4) : "fxtract",
+    (0xd9, 0xf5) : "fprem1", (0xd9, 0xf6) : "fdecstp",
+    (0xd9, 0xf7) : "fincstp", (0xd9, 0xf8) : "fprem",
+    (0xd9, 0xf9) : "fyl2xp1", (0xd9, 0xfa) : "fsqrt",
+    (0xd9, 0xfb) : "fsincos", (0xd9, 0xfc) : "frndint",
+    (0xd9, 0xfd) : "fscale", (0xd9, 0xfe) : "fsin", (0xd9, 0xff) : "fcos",
+    (0xda, 0xe9) : "fucompp", (0xdb, 0xe2) : "fnclex",
+    (0xdb, 0xe3) : "fninit", (0xde, 0xd9) : "fcompp",
+    (0xdf, 0xe0) : "fnstsw",
+}
+
+# one-byte opcodes that are undefined in 64 bit mode (40 - 4f are REX)
+INVALID_64 = [0x06, 0x07, 0x0e, 0x16, 0x17, 0x1e, 0x1f, 0x27, 0x2f, 0x37,
+              0x3f, 0x60, 0x61, 0x62, 0x82, 0x9a, 0xc4, 0xc5, 0xce, 0xd4,
+              0xd5, 0xd6, 0xea]
+
+
+def _long_mode_table(one_byte):
+    """Derive the 64 bit mode variant of the primary opcode table"""
+    tab = list(one_byte)
+    for op in INVALID_64:
+        tab[op] = None
+    tab[0x63] = ("movsxd", ("Gv", "Ed"))
+    tab[0x9c] = ("pushfq", ())
+    tab[0x9d] = ("popfq", ())
+    tab[0xe3] = ("jrcxz", ("Jb",))
+    return tab
+
+
+ONE_BYTE = _one_byte_table()
+ONE_BYTE_64 = _long_mode_table(ONE_BYTE)
+TWO_BYTE = _two_byte_table()
+
+# mnemonics that change with a 64 bit operand size (REX.W)
+REX_W_MNEMONICS = { "cwde" : "cdqe", "cdq" : "cqo", "iretd" : "iretq",
+                    "insd" : "insq", "outsd" : "outsq", "movsd" : "movsq",
+                    "cmpsd" : "cmpsq", "stosd" : "stosq", "lodsd" : "lodsq",
+                    "scasd" : "scasq", "cmpxchg8b" : "cmpxchg16b" }
+
+SIZE_NAMES = { 8 : "byte", 16 : "word", 32 : "dword", 64 : "qword" }
+
+
+class Instruction(object):
+    """
+    A single decoded instruction
+    """
+    __slots__ = ("offset", "length", "end", "mnemonic", "operands", "prefix")
+
+    def __init__(self, offset, length, mnemonic, operands=None, prefix=""):
+        self.offset = offset
+        self.length = length
+        # first offset behind the instruction, read once per trie node
+        # and classified gadget
+        self.end = offset + length
+        self.mnemonic = mnemonic
+        self.operands = operands or []
+        self.prefix = prefix
+
+    @property
+    def valid(self):
+        """False for undefined or truncated encodings"""
+        return self.mnemonic != "invalid"
+
+    def __str__(self):
+        text = self.prefix + self.mnemonic
+        if self.operands:
+            text += " " + ", ".join(self.operands)
+        return text
+
+    def __repr__(self):
+        return "<Instruction %d+%d: %s>" % (self.offset, self.length, self)
+
+
+class _Truncated(Exception):
+    """Raised when an instruction runs past the end of the input"""
+    pass
+
+
+class _Invalid(Exception):
+    """Raised for undefined opcodes"""
+    pass
+
+
+class X86Decoder:
+    """
+    In-process x86 disassembler. Drop-in replacement for the UDCLI
+    backend without any fork/exec, temp file or text parsing.
+
+    mode is 32 for IA-32 code or 64 for x86-64 code.
+    """
+    name = "native"
+    # part of all cache keys, bumped whenever cached results were wrong
+    version = 3
+
+    def __init__(self, mode=32):
+        if mode not in (32, 64):
+            raise ValueError("Unsupported decoder mode: %s" % mode)
+        self.mode = mode
+        self._one_byte = ONE_BYTE_64 if mode == 64 else ONE_BYTE
+
+    def disassemble(self, data):
+        """
+        Disassemble a byte string, one text line per instruction
+        (the same format udcli -noff -nohex produces)
+        """
+        return [str(insn) for insn in self.instructions(data)]
+
+    def cleanup(self):
+        """
+        Nothing to clean up for the native decoder
+        """
+        pass
+
+    def instructions(self, data):
+        """
+        Decode a whole byte string into a list of Instructions
+        """
+        code = bytearray(data)
+        end = len(code)
+        pos = 0
+        ret = []
+        while pos < end:
+            insn = self.decode(code, pos, end)
+            ret += [insn]
+            pos = insn.end
+        return ret
+
+    def decode(self, code, pos=0, end=None):
+        """
+        Decode the single instruction at code[pos]. Bytes at or behind
+        end are not considered part of the input.
+
+        Undefined opcodes decode to 'invalid', consuming the bytes read so
+        far. Truncated instructions decode to 'invalid', consuming the rest
+        of the input.
+        """
+        if end is None:
+            end = len(code)
+        state = _DecodeState(code, pos, end, self.mode)
+        try:
+            mnemonic, operands = self._decode(state)
+        except _Truncated:
+            return Instruction(pos, end - pos, "invalid")
+        except _Invalid:
+            return Instruction(pos, max(state.pos - pos, 1), "invalid")
+        if state.opsize == 64 and mnemonic in REX_W_MNEMONICS:
+            mnemonic = REX_W_MNEMONICS[mnemonic]
+        prefix = ""
+        if state.lock:
+            prefix += "lock "
+        if state.rep and not state.escaped:
+            prefix += state.rep + " "
+        if state.opsize == 16 and state.opsize_unused and not operands:
+            prefix += "o16 "
+        return Instruction(pos, state.pos - pos, mnemonic, operands, prefix)
+
+    def _decode(self, state):
+        """
+        Decode prefixes, opcode and operands into (mnemonic, operands)
+        """
+        long_mode = state.mode == 64
+        while True:
+            byte = state.next()
+            if long_mode and byte & 0xf0 == 0x40:
+                # REX, only counts if the opcode follows right behind it
+                state.rex = byte
+                continue
+            if byte not in PREFIXES:
+                break
+            state.rex = 0
+            if state.pos - state.start >= MAX_INSN_LEN:
+                raise _Invalid()
+            if byte in PREFIX_SEG:
+                state.seg = PREFIX_SEG[byte]
+            elif byte == PREFIX_OPSIZE:
+                state.opsize = 16
+            elif byte == PREFIX_ADSIZE:
+                state.adsize = 32 if long_mode else 16
+            elif byte == PREFIX_LOCK:
+                state.lock = True
+            elif byte == PREFIX_REPNE:
+                state.rep = "repne"
+            else:
+                state.rep = "rep"
+        if state.rex:
+            state.set_rex()
+
+        if byte == 0x0f:
+            # f2/f3 select SSE variants here, they are no rep prefixes
+            state.escaped = True
+            byte = state.next()
+            if byte == 0x38 or byte == 0x3a:
+                return self._decode_three_byte(state, byte)
+            entry = TWO_BYTE[byte]
+        else:
+            entry = self._one_byte[byte]
+
+        if entry is None:
+            raise _Invalid()
+
+        state.opcode = byte
+        mnemonic = entry[0]
+        if mnemonic == "fpu":
+            return self._decode_fpu(state, byte)
+
+        if mnemonic == "/":
+            state.read_modrm()
+            if entry[1] is GRP7 and state.mod == 3:
+                if state.modrm in GRP7_REG:
+                    return (GRP7_REG[state.modrm], [])
+            if entry[1] is GRP15 and state.mod == 3:
+                if state.reg in GRP15_REG:
+                    return (GRP15_REG[state.reg], [])
+                raise _Invalid()
+            sub = entry[1][state.reg]
+            if sub is None:
+                raise _Invalid()
+            mnemonic, spec = sub
+            if spec is None:
+                spec = entry[2]
+        else:
+            spec = entry[1]
+
+        return (mnemonic, self._operands(state, spec))
+
+    def _decode_three_byte(self, state, escape):
+        """0f 38 xx and 0f 3a xx opcodes"""
+        byte = state.next()
+        state.opcode = byte
+        if escape == 0x38:
+            if byte not in THREE_BYTE_38:
+                raise _Invalid()
+            return ("sse4", self._operands(state, ("V", "W")))
+        if byte not in THREE_BYTE_3A:
+            raise _Invalid()
+        return ("sse4", self._operands(state, ("V", "W", "Ib")))
+
+    def _decode_fpu(self, state, opcode):
+        """x87 escape opcodes d8 - df"""
+        state.read_modrm()
+        if state.mod != 3:
+            mnemonic = FPU_MEM[opcode - 0xd8][state.reg]
+            if mnemonic is None:
+                raise _Invalid()
+            return (mnemonic, [self._memory(state, 0)])
+
+        mnemonic = FPU_REG_SINGLE.get((opcode, state.modrm))
+        if mnemonic is not None:
+            return (mnemonic, [])
+        mnemonic = FPU_REG_ROW[opcode][state.reg]
+        if mnemonic is None:
+            raise _Invalid()
+        return (mnemonic, ["st%d" % state.rm])
+
+    def _operands(self, state, spec):
+        """Decode (and consume) all operands for the given spec"""
+        if spec and state.modrm is None and _needs_modrm(spec):
+            state.read_modrm()
+
+        has_reg = False
+        for op in spec:
+            if op[0] in "GZSCDRVPN" or op in FIXED_REGS:
+                has_reg = True
+
+        operands = []
+        for op in spec:
+            operands += [self._operand(state, op, has_reg)]
+        return operands
+
+    def _operand(self, state, op, has_reg):
+        """Decode a single operand"""
+        if op in FIXED_REGS:
+            return self._fixed(state, op)
+        kind = op[0]
+        size = op[1:]
+
+        if kind == "E":
+            if state.mod == 3:
+                return self._register(state, size, state.rm + state.rex_b)
+            return self._memory(state, 0 if has_reg else
+                                self._size(state, size))
+        if kind == "M":
+            if state.mod == 3:
+                raise _Invalid()
+            return self._memory(state, 0)
+        if kind == "G":
+            return self._register(state, size, state.reg + state.rex_r)
+        if kind == "Z":
+            return self._register(state, size,
+                                  (state.opcode & 7) + state.rex_b)
+        if kind == "I":
+            return self._immediate(state, size)
+        if kind == "J":
+            rel = state.signed(self._size(state, size) / 8)
+            return "0x%x" % ((state.pos + rel) & state.address_mask)
+        if kind == "O":
+            addr = state.unsigned(state.adsize / 8)
+            return "%s[0x%x]" % (self._segment(state), addr)
+        if kind == "A":
+            offs = state.unsigned(state.opsize / 8)
+            seg = state.unsigned(2)
+            return "0x%x:0x%x" % (seg, offs)
+        if kind == "S":
+            if SEGREGS[state.reg] is None:
+                raise _Invalid()
+            return SEGREGS[state.reg]
+        if kind == "C":
+            return "cr%d" % (state.reg + state.rex_r)
+        if kind == "D":
+            return "dr%d" % (state.reg + state.rex_r)
+        if kind == "R":
+            if state.mode == 64:
+                return REGS64[state.rm + state.rex_b]
+            return REGS32[state.rm]
+        if kind == "V":
+            return "xmm%d" % (state.reg + state.rex_r)
+        if kind == "P":
+            return "mm%d" % state.reg
+        if kind == "N":
+            return "mm%d" % state.rm
+        if kind in "WQ":
+            if state.mod == 3:
+                if kind == "W":
+                    return "xmm%d" % (state.rm + state.rex_b)
+                return "mm%d" % state.rm
+            return self._memory(state, 0)
+        return self._fixed(state, op)
+
+    def _fixed(self, state, op):
+        """Fixed register operands named in the opcode table"""
+        if op == "eAX":
+            if state.opsize == 64:
+                return REGS64[0]
+            return REGS16[0] if state.opsize == 16 else REGS32[0]
+        if op == "DX":
+            return "dx"
+        if op in ("ES", "CS", "SS", "DS", "FS", "GS"):
+            return op.lower()
+        return op.lower()
+
+    def _size(self, state, size):
+        """Operand size in bits for a size suffix"""
+        if size == "b":
+            return 8
+        if size == "w":
+            return 16
+        if size == "d":
+            return 32
+        if size == "q":
+            return 64
+        if size == "v":
+            state.opsize_unused = False
+            return state.opsize
+        if size == "z":
+            state.opsize_unused = False
+            return min(state.opsize, 32)
+        if size == "s":
+            state.opsize_unused = False
+            if state.mode == 64 and state.opsize != 16:
+                return 64
+            return state.opsize
+        return 0
+
+    def _register(self, state, size, num):
+        """Name of general purpose register num for a size suffix"""
+        bits = self._size(state, size)
+        if bits == 8:
+            return REGS8_REX[num] if state.rex else REGS8[num]
+        if bits == 16:
+            return REGS16[num]
+        if bits == 64:
+            return REGS64[num]
+        return REGS32[num]
+
+    def _immediate(self, state, size):
+        """Immediate operand"""
+        if size == "1":
+            return "0x1"
+        if size == "b":
+            return "0x%x" % state.unsigned(1)
+        bits = self._size(state, size)
+        return "0x%x" % state.unsigned(bits / 8)
+
+    def _segment(self, state):
+        """Segment override prefix for memory operands"""
+        if state.seg:
+            return state.seg + ":"
+        return ""
+
+    def _memory(self, state, bits):
+        """
+        Memory operand encoded in ModRM (+ SIB + displacement). bits gives
+        the access size to annotate, 0 if it follows from other operands.
+        """
+        if state.adsize == 16:
+            addr = self._memory16(state)
+        else:
+            addr = self._memory32(state)
+        text = "%s[%s]" % (self._segment(state), addr)
+        if bits:
+            text = SIZE_NAMES[bits] + " " + text
+        return text
+
+    def _memory16(self, state):
+        """16 bit addressing forms (0x67 prefix)"""
+        if state.mod == 0 and state.rm == 6:
+            return "0x%x" % state.unsigned(2)
+        base = MODRM16[state.rm]
+        if state.mod == 1:
+            return base + _disp(state.signed(1))
+        if state.mod == 2:
+            return base + _disp(state.signed(2))
+        return base
+
+    def _memory32(self, state):
+        """32 and 64 bit addressing forms"""
+        regs = REGS64 if state.adsize == 64 else REGS32
+        base = index = None
+        scale = 1
+        disp = 0
+        if state.rm == 4:
+            sib = state.next()
+            scale = 1 << (sib >> 6)
+            if (sib >> 3) & 7 != 4 or state.rex_x:
+                index = regs[((sib >> 3) & 7) + state.rex_x]
+            if sib & 7 == 5 and state.mod == 0:
+                disp = state.unsigned(4)
+            else:
+                base = regs[(sib & 7) + state.rex_b]
+        elif state.rm == 5 and state.mod == 0:
+            if state.mode == 64:
+                # RIP-relative
+                base = "rip" if state.adsize == 64 else "eip"
+                disp = state.signed(4)
+            else:
+                disp = state.unsigned(4)
+        else:
+            base = regs[state.rm + state.rex_b]
+
+        if state.mod == 1:
+            disp = state.signed(1)
+        elif state.mod == 2:
+            disp = state.signed(4)
+        return _address(base, index, scale, disp)
+
+
+FIXED_REGS = set(["AL", "eAX", "CL", "DX", "ES", "CS", "SS", "DS",
+                  "FS", "GS"])
+
+
+def _needs_modrm(spec):
+    """Check if any operand of spec is encoded in a ModRM byte"""
+    for op in spec:
+        if op not in FIXED_REGS and op[0] in "EGMSCDRVWPQN":
+            return True
+    return False
+
+
+def _address(base, index, scale, disp):
+    """Format the inside of a memory operand"""
+    parts = []
+    if base:
+        parts += [base]
+    if index:
+        if scale > 1:
+            parts += ["%s*%d" % (index, scale)]
+        else:
+            parts += [index]
+    if not parts:
+        return "0x%x" % (disp & 0xffffffff)
+    return "+".join(parts) + _disp(disp)
+
+
+def _disp(value):
+    """Format a signed displacement"""
+    if value < 0:
+        return "-0x%x" % -value
+    if value > 0:
+        return "+0x%x" % value
+    return ""
+
+
+class _DecodeState:
+    """
+    Cursor and prefix state while decoding a single instruction
+    """
+    def __init__(self, code, pos, end, mode=32):
+        self.code = code
+        self.start = pos
+        self.pos = pos
+        self.end = end
+        self.mode = mode
+        self.address_mask = (1 << mode) - 1
+        self.seg = None
+        self.opsize = 32
+        self.opsize_unused = True
+        self.adsize = mode
+        self.rex = 0
+        self.rex_r = self.rex_x = self.rex_b = 0
+        self.lock = False
+        self.rep = None
+        self.escaped = False
+        self.opcode = None
+        self.modrm = None
+        self.modrm_pos = None
+        self.mod = self.reg = self.rm = 0
+
+    def next(self):
+        """Consume one byte"""
+        if self.pos - self.start >= MAX_INSN_LEN:
+            raise _Invalid()
+        if self.pos >= self.end:
+            raise _Truncated()
+        byte = self.code[self.pos]
+        self.pos += 1
+        return byte
+
+    def set_rex(self):
+        """Apply the REX prefix in front of the opcode"""
+        if self.rex & REX_W:
+            self.opsize = 64
+        self.rex_r = 8 if self.rex & REX_R else 0
+        self.rex_x = 8 if self.rex & REX_X else 0
+        self.rex_b = 8 if self.rex & REX_B else 0
+
+    def read_modrm(self):
+        """Consume the ModRM byte"""
+        self.modrm_pos = self.pos
+        self.modrm = self.next()
+        self.mod = self.modrm >> 6
+        self.reg = (self.modrm >> 3) & 7
+        self.rm = self.modrm & 7
+
+    def unsigned(self, size):
+        """Consume a little-endian unsigned value of size bytes"""
+        if self.pos + size - self.start > MAX_INSN_LEN:
+            raise _Invalid()
+        if self.pos + size > self.end:
+            raise _Truncated()
+        value = 0
+        for i in range(size):
+            value |= self.code[self.pos + i] << (8 * i)
+        self.pos += size
+        return value
+
+    def signed(self, size):
+        """Consume a little-endian signed value of size bytes"""
+        value = self.unsigned(size)
+        if value & (1 << (8 * size - 1)):
+            value -= 1 << (8 * size)
+        return value